@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, abort, request, jsonify
 import os
 from flask_cors import CORS
 import sqlite3
@@ -8,11 +8,12 @@ import sys
 # Fix Unicode emoji print statements crashing on Windows (cp1252 console)
 if sys.stdout.encoding and sys.stdout.encoding.lower() != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
+import database
 from database import DB_PATH  
 from nutrition_utils import (
     search_food_autocomplete, search_food_comprehensive, scale_food_nutrition,
     get_meal_suggestions, search_food_comprehensive_with_warnings, 
-    search_food_autocomplete_with_warnings
+    search_food_autocomplete_with_warnings, get_usda_status, get_dietary_restriction_warning
 )
 from database import (
     init_db, get_user_profile, get_daily_totals, get_meal_progress,
@@ -23,7 +24,7 @@ from database import (
     ensure_user_exists, get_day_display_info, get_daily_data_for_day, get_user_current_day,
     get_globally_disliked_foods,
     # Fitness database functions
-    add_workout_session, get_workout_history, get_exercise_performance_history,
+    add_workout_session, enqueue_workout_follow_ups, get_workout_history, get_exercise_performance_history,
     save_workout_plan, get_active_workout_plan, get_fitness_dashboard_data,
     get_fitness_goals, update_fitness_goal_progress, add_fitness_goal,
     get_combined_dashboard_data, init_fitness_tables,
@@ -45,6 +46,20 @@ from database import (
     get_today_vitals_logs
 )
 
+from streak_utils import advance_workout_streak
+from recommendation_cache import RECOMMENDATION_CACHE, invalidate_user_recommendations
+from app_cache import cache_metric_lines, get_cache, invalidate_tags
+from log_utils import get_logger
+from request_metrics import METRICS, gauge_lines, instrument_app, scrape_allowed
+from profiling import admin_token, instrument_profiling, is_admin, sampler_from_env
+from json_response import install_response_encoding
+from etag_utils import request_data, versioned
+from meal_pool import get_meal_pool
+from job_queue import JOBS
+from data_export import EXPORT_STATS, export_filename, export_mimetype, export_stream, parse_tables
+from exercise_analytics import progression_suggestions
+from dislike_matcher import get_dislike_matcher
+from meal_engine import get_meal_engine, get_meal_budget, get_user_meal_preferences
 from fitness_utils import (
     get_workout_recommendations, get_workout_plan, calculate_calories_burned,
     get_recovery_recommendations, generate_workout_stats, create_custom_workout,
@@ -53,13 +68,63 @@ from fitness_utils import (
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "nutrifit.db")
 
+# Dashboard fragments and leaderboards are shared across workers through the
+# app cache; workout and friend writes invalidate them, and the TTL bounds how
+# long friends' activity can lag on a leaderboard.
+DASHBOARD_CACHE = get_cache('dashboard', default_ttl=float(os.getenv("NUTRIFIT_DASHBOARD_CACHE_TTL", "60")))
+LEADERBOARD_CACHE = get_cache('leaderboard', default_ttl=float(os.getenv("NUTRIFIT_LEADERBOARD_CACHE_TTL", "60")))
+
+logger = get_logger("app")
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+metrics_enabled = os.getenv("NUTRIFIT_METRICS", "1") != "0"
+if metrics_enabled:
+    instrument_app(app)
+install_response_encoding(app, METRICS if metrics_enabled else None)  # orjson + gzip/brotli
+instrument_profiling(app, sampler_from_env())  # inert unless NUTRIFIT_ADMIN_TOKEN is set
+
+@app.before_request
+def start_job_workers():
+    # Started per process on its first request, so a preloading master never runs jobs
+    JOBS.start()
 
 @app.route("/api/hello")
 def hello():
     return jsonify({"message": "Hello from Flask!"})
 
+@app.route("/api/nutrition_status")
+def nutrition_status():
+    """USDA circuit breaker state and food search cache counters"""
+    return jsonify(get_usda_status())
+
+def usda_metric_lines():
+    """USDA breaker and cache counters for /metrics"""
+    status = get_usda_status()
+    breaker = status['breaker']
+    lines = gauge_lines('nutrifit_usda_circuit_state', 'USDA circuit breaker state (1 for the current one)',
+                        {(state,): int(breaker['state'] == state) for state in ('closed', 'open', 'half_open')},
+                        ('state',))
+    for key in ('calls', 'failures', 'slow_calls', 'rejected', 'times_opened'):
+        lines += gauge_lines(f'nutrifit_usda_breaker_{key}', f'USDA breaker {key.replace("_", " ")}',
+                             {(): breaker[key]})
+    for key in ('cache_hits', 'cache_misses', 'budget_exhausted', 'short_circuited', 'cache_size'):
+        lines += gauge_lines(f'nutrifit_usda_{key}', f'USDA {key.replace("_", " ")}', {(): status[key]})
+    return lines
+
+METRICS.add_collector(usda_metric_lines)
+METRICS.add_collector(cache_metric_lines)
+METRICS.add_collector(JOBS.metric_lines)
+METRICS.add_collector(EXPORT_STATS.render)
+
+@app.route("/metrics")
+def metrics():
+    """Per-endpoint latency, SQL and response-size histograms in the Prometheus text format"""
+    if not scrape_allowed(request.headers.get('Authorization'), request.remote_addr,
+                          is_admin(request.headers.get('X-Admin-Token')), admin_token() is not None):
+        abort(404)
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
 # Authentication endpoints
 @app.route("/api/signup", methods=["POST"])
 def signup():
@@ -142,12 +207,13 @@ def complete_profile():
     except ValueError as e:
         return jsonify({"error": "Invalid data format"}), 400
     except Exception as e:
-        print(f"Error completing profile: {e}")
+        logger.error("Error completing profile: %s", e)
         return jsonify({"error": "Failed to update profile"}), 500
 
-@app.route("/api/get_profile", methods=["POST"])
+@app.route("/api/get_profile", methods=["GET", "POST"])
+@versioned('profile')
 def get_profile():
-    data = request.json
+    data = request_data()
     user_id = data.get("user_id")
    
     if not user_id:
@@ -160,7 +226,7 @@ def get_profile():
        
         return jsonify(profile)
     except Exception as e:
-        print(f"Error fetching profile: {e}")
+        logger.error("Error fetching profile: %s", e)
         return jsonify({"error": "Failed to fetch profile"}), 500
 
 @app.route("/api/update_profile", methods=["POST"])
@@ -177,9 +243,33 @@ def update_profile():
         update_user_profile(user_id, update_data, partial_update=True)
         return jsonify({"success": True, "message": "Profile updated successfully"})
     except Exception as e:
-        print(f"Error updating profile: {e}")
+        logger.error("Error updating profile: %s", e)
         return jsonify({"error": "Failed to update profile"}), 500
 
+def add_custom_food_suggestions(suggestions, custom_foods, user_restrictions):
+    """Put the user's matching custom foods in front of autocomplete suggestions"""
+    for food in custom_foods:
+        food_item = {
+            'name': food['name'],
+            'source': 'user_custom',
+            'serving': food['serving']
+        }
+        # Add dietary warning for custom foods too
+        warning = get_dietary_restriction_warning(food['name'], user_restrictions) if user_restrictions else None
+        if warning:
+            food_item['dietary_warning'] = warning
+        suggestions.insert(0, food_item)
+    return suggestions
+
+def add_custom_food_results(results, custom_foods, user_restrictions):
+    """Put the user's matching custom foods in front of search results"""
+    for food in custom_foods:
+        warning = get_dietary_restriction_warning(food['name'], user_restrictions) if user_restrictions else None
+        if warning:
+            food['dietary_warning'] = warning
+        results.insert(0, food)
+    return results
+
 # Enhanced food search endpoints with USDA integration
 @app.route("/api/search_food_autocomplete", methods=["POST"])
 def search_food_autocomplete_endpoint():
@@ -199,28 +289,11 @@ def search_food_autocomplete_endpoint():
        
         # Add user's custom foods
         if user_id:
-            custom_foods = get_user_custom_foods(user_id, query)
-            for food in custom_foods:
-                # Add dietary warning for custom foods too
-                warning = None
-                if user_restrictions:
-                    from nutrition_utils import get_dietary_restriction_warning
-                    warning = get_dietary_restriction_warning(food['name'], user_restrictions)
-                
-                food_item = {
-                    'name': food['name'],
-                    'source': 'user_custom',
-                    'serving': food['serving']
-                }
-                
-                if warning:
-                    food_item['dietary_warning'] = warning
-                
-                suggestions.insert(0, food_item)
+            add_custom_food_suggestions(suggestions, get_user_custom_foods(user_id, query), user_restrictions)
        
         return jsonify(suggestions[:10])
     except Exception as e:
-        print(f"Error in autocomplete search: {e}")
+        logger.error("Error in autocomplete search: %s", e)
         return jsonify([])
     
 @app.route("/api/search_food", methods=["POST"])
@@ -241,20 +314,11 @@ def search_food_endpoint():
        
         # Add user's custom foods if they match
         if user_id:
-            custom_foods = get_user_custom_foods(user_id, query)
-            for food in custom_foods:
-                # Add dietary warning for custom foods
-                if user_restrictions:
-                    from nutrition_utils import get_dietary_restriction_warning
-                    warning = get_dietary_restriction_warning(food['name'], user_restrictions)
-                    if warning:
-                        food['dietary_warning'] = warning
-                
-                results.insert(0, food)
+            add_custom_food_results(results, get_user_custom_foods(user_id, query), user_restrictions)
        
         return jsonify(results)
     except Exception as e:
-        print(f"Error searching food: {e}")
+        logger.error("Error searching food: %s", e)
         return jsonify({"error": "Failed to search food"}), 500
 
 @app.route("/api/scale_food", methods=["POST"])
@@ -272,9 +336,23 @@ def scale_food():
         scaled_food = scale_food_nutrition(food_data, quantity, serving_size)
         return jsonify(scaled_food)
     except Exception as e:
-        print(f"Error scaling food: {e}")
+        logger.error("Error scaling food: %s", e)
         return jsonify({"error": "Failed to scale food"}), 500
 
+def suggest_meals(meal_type, user_id=None):
+    """Three suggestions for a meal, respecting the user's restrictions and dislikes"""
+    # Get user's dietary restrictions
+    user_restrictions = get_user_dietary_restrictions(user_id) if user_id else []
+    
+    # Get more suggestions initially to account for filtering
+    suggestions = get_meal_suggestions(meal_type, max_results=15, user_restrictions=user_restrictions)
+   
+    # Filter based on user preferences if available
+    if user_id:
+        # Skip globally disliked foods (case insensitive, either name containing the other)
+        return get_dislike_matcher(user_id).filter(suggestions, limit=3)
+    return suggestions[:3]
+
 # Enhanced meal suggestions with better filtering
 @app.route("/api/get_meal_suggestions", methods=["POST"])
 def get_meal_suggestions_endpoint():
@@ -283,45 +361,49 @@ def get_meal_suggestions_endpoint():
     user_id = data.get("user_id")
    
     try:
-        # Get user's dietary restrictions
-        user_restrictions = get_user_dietary_restrictions(user_id) if user_id else []
-        
-        # Get more suggestions initially to account for filtering
-        suggestions = get_meal_suggestions(meal_type, max_results=15, user_restrictions=user_restrictions)
-       
-        # Filter based on user preferences if available
-        if user_id:
-            from database import get_globally_disliked_foods
-           
-            # Get all globally disliked foods
-            disliked_foods = set(get_globally_disliked_foods(user_id))
-           
-            filtered_suggestions = []
-           
-            for suggestion in suggestions:
-                # Skip globally disliked foods (case insensitive)
-                suggestion_name_lower = suggestion['name'].lower()
-                is_disliked = any(
-                    disliked.lower() in suggestion_name_lower or
-                    suggestion_name_lower in disliked.lower()
-                    for disliked in disliked_foods
-                )
-               
-                if not is_disliked:
-                    filtered_suggestions.append(suggestion)
-               
-                # Stop when we have enough suggestions
-                if len(filtered_suggestions) >= 3:
-                    break
-           
-            return jsonify(filtered_suggestions[:3])
-       
-        return jsonify(suggestions[:3])
+        return jsonify(suggest_meals(meal_type, user_id))
     except Exception as e:
-        print(f"Error getting meal suggestions: {e}")
+        logger.error("Error getting meal suggestions: %s", e)
         return jsonify([])
 
 
+@app.route("/api/get_smart_meal_suggestions", methods=["POST"])
+def get_smart_meal_suggestions():
+    """Foods and food pairs that best fill the rest of a meal's calorie and macro budget"""
+    data = request.json
+    user_id = data.get("user_id")
+    meal_type = data.get("meal_type", "breakfast")
+    max_results = data.get("max_results", 5)
+
+    if not user_id:
+        return jsonify({"error": "User ID required"}), 400
+
+    try:
+        ensure_user_exists(user_id)
+        budget = get_meal_budget(user_id, meal_type)
+        if budget is None:
+            return jsonify({"error": "Invalid meal type"}), 400
+
+        user_restrictions = get_user_dietary_restrictions(user_id)
+        liked_foods, disliked_foods = get_user_meal_preferences(user_id, meal_type)
+        engine = get_meal_engine()
+
+        foods = engine.suggest(
+            budget, meal_type, max_results, user_restrictions, liked_foods, disliked_foods)
+        combinations = engine.suggest_combinations(
+            budget, meal_type, 3, user_restrictions, liked_foods, disliked_foods)
+
+        return jsonify({
+            "meal_type": meal_type,
+            "remaining": budget,
+            "foods": foods,
+            "combinations": combinations
+        })
+    except Exception as e:
+        logger.error("Error getting smart meal suggestions: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
 # Current meal management - OPTIMIZED
 @app.route("/api/add_food_to_meal", methods=["POST"])
 def add_food_to_meal():
@@ -339,7 +421,7 @@ def add_food_to_meal():
         add_food_to_current_meal(user_id, meal_type, food_data)
         return jsonify({"success": True, "message": "Food added to meal"})
     except Exception as e:
-        print(f"Error adding food to meal: {e}")
+        logger.error("Error adding food to meal: %s", e)
         return jsonify({"error": "Failed to add food to meal"}), 500
 
 @app.route("/api/remove_food_from_meal", methods=["POST"])
@@ -356,7 +438,7 @@ def remove_food_from_meal():
         remove_food_from_current_meal(user_id, meal_item_id)
         return jsonify({"success": True, "message": "Food removed from meal"})
     except Exception as e:
-        print(f"Error removing food from meal: {e}")
+        logger.error("Error removing food from meal: %s", e)
         return jsonify({"error": "Failed to remove food from meal"}), 500
 
 @app.route("/api/get_current_meal", methods=["POST"])
@@ -386,7 +468,7 @@ def get_current_meal():
             return jsonify(meals)
            
     except Exception as e:
-        print(f"Error getting current meal: {e}")
+        logger.error("Error getting current meal: %s", e)
         return jsonify({"error": "Failed to get current meal"}), 500
 
 # Food preferences
@@ -406,12 +488,13 @@ def update_food_preference_endpoint():
         update_food_preference(user_id, meal_type, food_name, liked)
         return jsonify({"success": True, "message": "Food preference updated"})
     except Exception as e:
-        print(f"Error updating food preference: {e}")
+        logger.error("Error updating food preference: %s", e)
         return jsonify({"error": "Failed to update food preference"}), 500
 
-@app.route("/api/get_food_preferences", methods=["POST"])
+@app.route("/api/get_food_preferences", methods=["GET", "POST"])
+@versioned('food_preferences')
 def get_food_preferences():
-    data = request.json
+    data = request_data()
     user_id = data.get("user_id")
    
     if not user_id:
@@ -424,7 +507,7 @@ def get_food_preferences():
             "meal_preferences": meal_preferences
         })
     except Exception as e:
-        print(f"Error fetching food preferences: {e}")
+        logger.error("Error fetching food preferences: %s", e)
         return jsonify({"error": "Failed to fetch preferences"}), 500
 
 # Custom foods
@@ -461,13 +544,14 @@ def add_custom_food():
     except ValueError:
         return jsonify({"error": "Invalid numeric values"}), 400
     except Exception as e:
-        print(f"Error adding custom food: {e}")
+        logger.error("Error adding custom food: %s", e)
         return jsonify({"error": "Failed to add custom food"}), 500
 
-@app.route("/api/get_custom_foods", methods=["POST"])
+@app.route("/api/get_custom_foods", methods=["GET", "POST"])
+@versioned('custom_foods')
 def get_custom_foods():
     """Get user's custom foods"""
-    data = request.json
+    data = request_data()
     user_id = data.get("user_id")
    
     if not user_id:
@@ -477,7 +561,7 @@ def get_custom_foods():
         custom_foods = get_user_custom_foods(user_id)
         return jsonify(custom_foods)
     except Exception as e:
-        print(f"Error fetching custom foods: {e}")
+        logger.error("Error fetching custom foods: %s", e)
         return jsonify({"error": "Failed to fetch custom foods"}), 500
 
 # OPTIMIZED Progress and summary endpoints
@@ -492,7 +576,7 @@ def get_daily_summary():
         daily_data = get_daily_totals(user_id)
         return jsonify(daily_data)
     except Exception as e:
-        print(f"Error fetching daily summary: {e}")
+        logger.error("Error fetching daily summary: %s", e)
         return jsonify({"error": "User not found"}), 404
 
 @app.route("/get_meal_progress", methods=["POST"])
@@ -506,7 +590,7 @@ def get_meal_progress_endpoint():
         meal_progress = get_meal_progress(user_id)
         return jsonify(meal_progress)
     except Exception as e:
-        print(f"Error fetching meal progress: {e}")
+        logger.error("Error fetching meal progress: %s", e)
         return jsonify({"error": "User not found"}), 404
 
 # SESSION-BASED Day management
@@ -523,7 +607,7 @@ def next_day():
             "message": f"Started day {new_day_number}"
         })
     except Exception as e:
-        print(f"Error resetting day: {e}")
+        logger.error("Error resetting day: %s", e)
         return jsonify({"error": "Failed to reset day"}), 500
 
 # SESSION-BASED History endpoints
@@ -541,7 +625,7 @@ def get_navigation_info():
         nav_info = get_day_display_info(user_id, target_day)
         return jsonify(nav_info)
     except Exception as e:
-        print(f"Error getting navigation info: {e}")
+        logger.error("Error getting navigation info: %s", e)
         return jsonify({"error": "Failed to get navigation info"}), 500
 
 @app.route("/api/get_day_data", methods=["POST"])
@@ -562,7 +646,7 @@ def get_day_data():
         day_data = get_daily_data_for_day(user_id, target_day)
         return jsonify(day_data)
     except Exception as e:
-        print(f"Error getting day data: {e}")
+        logger.error("Error getting day data: %s", e)
         return jsonify({"error": "Failed to get day data"}), 500
 
 @app.route("/api/get_daily_history", methods=["POST"])
@@ -579,7 +663,7 @@ def get_daily_history_endpoint():
         history = get_daily_history(user_id, days_back)
         return jsonify(history)
     except Exception as e:
-        print(f"Error fetching daily history: {e}")
+        logger.error("Error fetching daily history: %s", e)
         return jsonify({"error": "Failed to fetch daily history"}), 500
 
 @app.route("/api/get_meal_history", methods=["POST"])
@@ -635,7 +719,7 @@ def get_meal_history_endpoint():
             return jsonify(meals)
            
     except Exception as e:
-        print(f"Error fetching meal history: {e}")
+        logger.error("Error fetching meal history: %s", e)
         return jsonify({"error": "Failed to fetch meal history"}), 500
 
 @app.route("/api/get_meal_history_by_day", methods=["POST"])
@@ -656,9 +740,16 @@ def get_meal_history_by_day_endpoint():
         meals = get_meal_history_by_day(user_id, target_day)
         return jsonify(meals)
     except Exception as e:
-        print(f"Error fetching meal history by day: {e}")
+        logger.error("Error fetching meal history by day: %s", e)
         return jsonify({"error": "Failed to fetch meal history"}), 500
 
+def cached_fitness_dashboard(user_id):
+    """get_fitness_dashboard_data() through the dashboard cache, until the user's workouts change"""
+    from datetime import date
+    # Keyed by day since the weekly and monthly windows move at midnight
+    return DASHBOARD_CACHE.get_or_set(f"fitness:{user_id}:{date.today().isoformat()}",
+                                      lambda: get_fitness_dashboard_data(user_id), tags=[f"workouts:{user_id}"])
+
 # OPTIMIZED Homepage data endpoint
 @app.route("/api/get_dashboard_data", methods=["POST"])
 def get_dashboard_data():
@@ -677,7 +768,7 @@ def get_dashboard_data():
         current_day = get_user_current_day(user_id)
         
         # Get fitness data for combined dashboard
-        fitness_data = get_fitness_dashboard_data(user_id)
+        fitness_data = cached_fitness_dashboard(user_id)
        
         return jsonify({
             "profile": profile,
@@ -687,7 +778,7 @@ def get_dashboard_data():
             "fitness_data": fitness_data
         })
     except Exception as e:
-        print(f"Error fetching dashboard data: {e}")
+        logger.error("Error fetching dashboard data: %s", e)
         return jsonify({"error": "Failed to fetch dashboard data"}), 500
 
 # Legacy endpoints for backward compatibility
@@ -702,7 +793,7 @@ def get_daily_total():
         daily_data = get_daily_totals(user_id)
         return jsonify({"total_eaten": daily_data["total_eaten"]})
     except Exception as e:
-        print(f"Error fetching daily total: {e}")
+        logger.error("Error fetching daily total: %s", e)
         return jsonify({"error": "User not found"}), 404
 
 @app.route("/get_daily_nutrients", methods=["POST"])
@@ -716,7 +807,7 @@ def get_daily_nutrients():
         daily_data = get_daily_totals(user_id)
         return jsonify(daily_data["nutrients"])
     except Exception as e:
-        print(f"Error fetching daily nutrients: {e}")
+        logger.error("Error fetching daily nutrients: %s", e)
         return jsonify({"error": "User not found"}), 404
 
 @app.route("/get_suggestion", methods=["POST"])
@@ -731,7 +822,7 @@ def get_suggestion():
         suggestions = get_meal_suggestions(meal, max_results=3)
         return jsonify(suggestions)
     except Exception as e:
-        print(f"Error in get_suggestion: {e}")
+        logger.error("Error in get_suggestion: %s", e)
         return jsonify([])
 
 # Legacy feedback endpoint (now redirects to proper meal management)
@@ -767,7 +858,7 @@ def feedback():
 
         return jsonify({"status": "success"})
     except Exception as e:
-        print(f"Error processing feedback: {e}")
+        logger.error("Error processing feedback: %s", e)
         return jsonify({"error": "Failed to process feedback"}), 500
 
 # FITNESS ENDPOINTS
@@ -787,12 +878,14 @@ def get_workout_recommendations_endpoint():
         if not profile:
             return jsonify({"error": "User profile not found"}), 404
        
-        # Get workout recommendations
-        recommendations = get_workout_recommendations(profile)
+        # Get workout recommendations, reusing them until the user's inputs change
+        recommendations = RECOMMENDATION_CACHE.get_or_compute(
+            'recommendations', profile, lambda: get_workout_recommendations(profile)
+        )
        
         return jsonify(recommendations)
     except Exception as e:
-        print(f"Error getting workout recommendations: {e}")
+        logger.error("Error getting workout recommendations: %s", e)
         return jsonify({"error": "Failed to get workout recommendations"}), 500
 
 @app.route("/api/get_workout_plan", methods=["POST"])
@@ -810,11 +903,16 @@ def get_workout_plan_endpoint():
         if not profile:
             return jsonify({"error": "User profile not found"}), 404
        
-        workout_plan = get_workout_plan(profile, days_per_week)
+        recommendations = RECOMMENDATION_CACHE.get_or_compute(
+            'recommendations', profile, lambda: get_workout_recommendations(profile)
+        )
+        workout_plan = RECOMMENDATION_CACHE.get_or_compute(
+            'plan', profile, lambda: get_workout_plan(profile, days_per_week, recommendations), days_per_week
+        )
        
         return jsonify(workout_plan)
     except Exception as e:
-        print(f"Error getting workout plan: {e}")
+        logger.error("Error getting workout plan: %s", e)
         return jsonify({"error": "Failed to get workout plan"}), 500
 
 @app.route("/api/save_workout_plan", methods=["POST"])
@@ -832,7 +930,7 @@ def save_workout_plan_endpoint():
         plan_id = save_workout_plan(user_id, plan_name, plan_data)
         return jsonify({"success": True, "plan_id": plan_id})
     except Exception as e:
-        print(f"Error saving workout plan: {e}")
+        logger.error("Error saving workout plan: %s", e)
         return jsonify({"error": "Failed to save workout plan"}), 500
 
 @app.route("/api/get_active_workout_plan", methods=["POST"])
@@ -848,7 +946,7 @@ def get_active_workout_plan_endpoint():
         plan = get_active_workout_plan(user_id)
         return jsonify(plan)
     except Exception as e:
-        print(f"Error getting active workout plan: {e}")
+        logger.error("Error getting active workout plan: %s", e)
         return jsonify({"error": "Failed to get active workout plan"}), 500
 
 # Replace your existing complete_workout endpoint with this enhanced version
@@ -860,7 +958,7 @@ def complete_workout_endpoint():
     user_id = data.get("user_id")
     workout_data = data.get("workout_data")
     
-    print(f"🔍 Complete workout called with data: {data}")
+    logger.debug("Complete workout called with data: %s", data)
     
     if not all([user_id, workout_data]):
         return jsonify({"error": "User ID and workout data required"}), 400
@@ -868,13 +966,13 @@ def complete_workout_endpoint():
     try:
         # Handle date properly - ensure it's stored as a local date
         date_completed = workout_data.get('date_completed')
-        print(f"🔍 Original date_completed: {date_completed} (type: {type(date_completed)})")
+        logger.debug("Original date_completed: %s (type: %s)", date_completed, type(date_completed))
         
         if date_completed:
             # If date includes time, strip it to get just the date
             if 'T' in str(date_completed):
                 date_completed = str(date_completed).split('T')[0]
-                print(f"🔍 After T split: {date_completed}")
+                logger.debug("After T split: %s", date_completed)
             
             # Ensure it's in YYYY-MM-DD format and DON'T parse it as a datetime
             # Just validate the format and use as string
@@ -883,19 +981,19 @@ def complete_workout_endpoint():
                 # Validate format but don't convert
                 datetime.strptime(date_completed, '%Y-%m-%d')
                 final_date = date_completed  # Keep as string
-                print(f"🔍 Final date (as string): {final_date}")
+                logger.debug("Final date (as string): %s", final_date)
             except ValueError:
-                print(f"🔍 Date format invalid, using today")
+                logger.debug("Date format invalid, using today")
                 # If parsing fails, use today's date
                 final_date = datetime.now().date().strftime('%Y-%m-%d')
         else:
-            print(f"🔍 No date provided, using today")
+            logger.debug("No date provided, using today")
             # If no date provided, use today
             final_date = datetime.now().date().strftime('%Y-%m-%d')
         
         # Update workout_data with the final date
         workout_data['date_completed'] = final_date
-        print(f"🔍 Workout data with final date: {workout_data}")
+        logger.debug("Workout data with final date: %s", workout_data)
         
         # Calculate calories burned based on user profile if not provided
         profile = get_user_profile(user_id)
@@ -910,7 +1008,7 @@ def complete_workout_endpoint():
         # Save workout session
         session_id = add_workout_session(user_id, workout_data)
         
-        print(f"🔍 Workout saved with session_id: {session_id}")
+        logger.debug("Workout saved with session_id: %s", session_id)
         
         return jsonify({
             "success": True,
@@ -924,21 +1022,19 @@ def complete_workout_endpoint():
         })
         
     except Exception as e:
-        print(f"❌ Error completing workout: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error completing workout: %s", e)
         return jsonify({"error": f"Failed to record workout: {str(e)}"}), 500
 
 
 # Also update your add_workout_session function:
 def add_workout_session(user_id, workout_data):
     """Add a completed workout session with enhanced date debugging"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with database.connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Get the date - should already be clean YYYY-MM-DD string
         date_completed = workout_data.get('date_completed')
-        print(f"🔍 add_workout_session called with date: {date_completed}")
+        logger.debug("add_workout_session called with date: %s", date_completed)
         
         # Ensure date is a string in YYYY-MM-DD format
         if isinstance(date_completed, str):
@@ -946,7 +1042,7 @@ def add_workout_session(user_id, workout_data):
             if 'T' in date_completed:
                 date_completed = date_completed.split('T')[0]
         
-        print(f"🔍 Final date being inserted to DB: {date_completed}")
+        logger.debug("Final date being inserted to DB: %s", date_completed)
         
         c.execute("""
         INSERT INTO workout_sessions
@@ -965,7 +1061,9 @@ def add_workout_session(user_id, workout_data):
         ))
         
         workout_session_id = c.lastrowid
-        print(f"🔍 Workout inserted with ID: {workout_session_id}")
+        logger.debug("Workout inserted with ID: %s", workout_session_id)
+        
+        advance_workout_streak(c, user_id, date_completed)
         
         # Add exercise performance data if available
         if 'exercises' in workout_data and workout_data['exercises']:
@@ -989,7 +1087,10 @@ def add_workout_session(user_id, workout_data):
                 ))
         
         conn.commit()
-        return workout_session_id
+        invalidate_tags(f"workouts:{user_id}")
+    
+    enqueue_workout_follow_ups(user_id, workout_session_id, workout_data)
+    return workout_session_id
 
 @app.route("/api/get_workout_history", methods=["POST"])
 def get_workout_history_endpoint():
@@ -1005,7 +1106,7 @@ def get_workout_history_endpoint():
         history = get_workout_history(user_id, days_back)
         return jsonify(history)
     except Exception as e:
-        print(f"Error getting workout history: {e}")
+        logger.error("Error getting workout history: %s", e)
         return jsonify({"error": "Failed to get workout history"}), 500
 
 @app.route("/api/get_exercise_performance", methods=["POST"])
@@ -1023,9 +1124,24 @@ def get_exercise_performance_endpoint():
         performance = get_exercise_performance_history(user_id, exercise_name, days_back)
         return jsonify(performance)
     except Exception as e:
-        print(f"Error getting exercise performance: {e}")
+        logger.error("Error getting exercise performance: %s", e)
         return jsonify({"error": "Failed to get exercise performance"}), 500
 
+@app.route("/api/get_exercise_stats", methods=["POST"])
+def get_exercise_stats_endpoint():
+    """Per-exercise estimated 1RM, volume, personal bests and trend"""
+    data = request.json
+    user_id = data.get("user_id")
+    
+    if not user_id:
+        return jsonify({"error": "User ID required"}), 400
+    
+    try:
+        return jsonify(database.get_exercise_stats(user_id, data.get("exercise_name")))
+    except Exception as e:
+        logger.error("Error getting exercise stats: %s", e)
+        return jsonify({"error": "Failed to get exercise stats"}), 500
+
 # In your Flask app.py, enhance the get_fitness_dashboard endpoint
 
 def calculate_favorite_workout_type(workouts):
@@ -1054,91 +1170,62 @@ def get_fitness_dashboard_endpoint():
         return jsonify({"error": "User ID required"}), 400
     
     try:
-        # Get ALL workouts for the past 14 days (not just recent 5-10)
-        from datetime import datetime, timedelta
+        # Every workout from the past 14 days as /api/get_workout_history sends them, with the older key names too
+        all_workouts_14_days = [dict(workout,
+                                     workout_type=workout['type'],
+                                     duration_minutes=workout['duration'],
+                                     calories=workout['calories_burned'])
+                                for workout in get_workout_history(user_id, 14)]
         
-        # Get workouts from past 14 days
-        fourteen_days_ago = datetime.now() - timedelta(days=14)
+        # Weekly and monthly totals come from the (cached) aggregate queries
+        existing_dashboard = cached_fitness_dashboard(user_id)
+        weekly_stats = existing_dashboard['weekly_stats']
         
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            
-            # Get ALL workouts from past 14 days
-            c.execute("""
-            SELECT workout_name, workout_type, duration_minutes, calories_burned,
-                   difficulty_level, date_completed, notes, created_at
-            FROM workout_sessions
-            WHERE user_id = ? AND date_completed >= ?
-            ORDER BY date_completed DESC
-            """, (user_id, fourteen_days_ago.date()))
-            
-            all_workouts_14_days = []
-            for row in c.fetchall():
-                workout_date = row[5]  # date_completed
-                
-                # Handle date conversion properly
-                if isinstance(workout_date, str):
-                    try:
-                        # Parse YYYY-MM-DD format
-                        parsed_date = datetime.strptime(workout_date, '%Y-%m-%d')
-                    except ValueError:
-                        # Try other formats if needed
-                        parsed_date = datetime.fromisoformat(workout_date.replace('Z', '+00:00'))
-                else:
-                    parsed_date = datetime.strptime(str(workout_date), '%Y-%m-%d')
-                
-                all_workouts_14_days.append({
-                    'id': row[0] if len(row) > 8 else None,
-                    'name': row[0],
-                    'type': row[1],
-                    'workout_type': row[1],  # For compatibility
-                    'duration': row[2],
-                    'duration_minutes': row[2],  # For compatibility
-                    'calories_burned': row[3],
-                    'calories': row[3],  # For compatibility
-                    'difficulty_level': row[4],
-                    'intensity': row[4],  # For compatibility
-                    'date_completed': workout_date,
-                    'date': parsed_date,  # Proper date object for frontend
-                    'notes': row[6],
-                    'created_at': row[7]
-                })
-        
-        # Get existing dashboard data
-        existing_dashboard = get_fitness_dashboard_data(user_id)
-        
-        # Enhance with complete 14-day workout data
         enhanced_dashboard = {
             **existing_dashboard,
+            # This endpoint has always sent the unrounded weekly average
+            'weekly_stats': dict(weekly_stats, avg_duration=(
+                weekly_stats['total_duration'] / weekly_stats['workouts'] if weekly_stats['workouts'] else 0)),
             'all_workouts_14_days': all_workouts_14_days,  # NEW: Complete 14-day data
             'recent_workouts': all_workouts_14_days[:10],  # Most recent 10 for display
             'workout_count_14_days': len(all_workouts_14_days),  # NEW: Actual count
         }
         
-        # Calculate enhanced weekly stats based on actual data
-        week_ago = datetime.now() - timedelta(days=7)
-        weekly_workouts = [
-            w for w in all_workouts_14_days 
-            if w['date'] >= week_ago
-        ]
-        
-        enhanced_weekly_stats = {
-            'workouts': len(weekly_workouts),
-            'total_duration': sum(w['duration'] for w in weekly_workouts),
-            'total_calories': sum(w['calories_burned'] for w in weekly_workouts),
-            'avg_duration': sum(w['duration'] for w in weekly_workouts) / len(weekly_workouts) if weekly_workouts else 0
-        }
-        
-        enhanced_dashboard['weekly_stats'] = enhanced_weekly_stats
-        
         return jsonify(enhanced_dashboard)
         
     except Exception as e:
-        print(f"Error getting enhanced fitness dashboard: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error getting enhanced fitness dashboard: %s", e)
         return jsonify({"error": "Failed to get fitness dashboard"}), 500
 
+@app.route("/api/get_workout_analytics", methods=["POST"])
+def get_workout_analytics_endpoint():
+    """Workout count, minutes, calories and type mix per day, week or month over a date range"""
+    from datetime import date, timedelta
+    data = request.json
+    user_id = data.get("user_id")
+    bucket = data.get("bucket", "day")
+    
+    if not user_id:
+        return jsonify({"error": "User ID required"}), 400
+    
+    try:
+        end_date = date.fromisoformat(data["end_date"]) if data.get("end_date") else date.today()
+        start_date = (date.fromisoformat(data["start_date"]) if data.get("start_date")
+                      else end_date - timedelta(days=int(data.get("days_back", 30)) - 1))
+        database.workout_bucket_starts(start_date, end_date, bucket)  # validates before caching
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid range: {e}"}), 400
+    
+    try:
+        analytics = DASHBOARD_CACHE.get_or_set(
+            f"analytics:{user_id}:{bucket}:{start_date}:{end_date}",
+            lambda: database.get_workout_analytics(user_id, start_date, end_date, bucket),
+            tags=[f"workouts:{user_id}"])
+        return jsonify(analytics)
+    except Exception as e:
+        logger.error("Error getting workout analytics: %s", e)
+        return jsonify({"error": "Failed to get workout analytics"}), 500
+
 
 @app.route("/api/save_custom_workout", methods=["POST"])
 def save_custom_workout_endpoint():
@@ -1160,7 +1247,7 @@ def save_custom_workout_endpoint():
             "message": "Custom workout saved to your library!"
         })
     except Exception as e:
-        print(f"Error saving custom workout: {e}")
+        logger.error("Error saving custom workout: %s", e)
         return jsonify({"error": "Failed to save custom workout"}), 500
 
 
@@ -1179,7 +1266,7 @@ def get_workout_stats_endpoint():
         stats = generate_workout_stats(history, days_back)
         return jsonify(stats)
     except Exception as e:
-        print(f"Error getting workout stats: {e}")
+        logger.error("Error getting workout stats: %s", e)
         return jsonify({"error": "Failed to get workout stats"}), 500
 
 @app.route("/api/add_fitness_goal", methods=["POST"])
@@ -1198,7 +1285,7 @@ def add_fitness_goal_endpoint():
         goal_id = add_fitness_goal(user_id, goal_type, goal_value, target_date)
         return jsonify({"success": True, "goal_id": goal_id})
     except Exception as e:
-        print(f"Error adding fitness goal: {e}")
+        logger.error("Error adding fitness goal: %s", e)
         return jsonify({"error": "Failed to add fitness goal"}), 500
 
 @app.route("/api/get_fitness_goals", methods=["POST"])
@@ -1214,7 +1301,7 @@ def get_fitness_goals_endpoint():
         goals = get_fitness_goals(user_id)
         return jsonify(goals)
     except Exception as e:
-        print(f"Error getting fitness goals: {e}")
+        logger.error("Error getting fitness goals: %s", e)
         return jsonify({"error": "Failed to get fitness goals"}), 500
 
 @app.route("/api/update_fitness_goal", methods=["POST"])
@@ -1232,7 +1319,7 @@ def update_fitness_goal_endpoint():
         update_fitness_goal_progress(user_id, goal_id, current_value)
         return jsonify({"success": True, "message": "Goal progress updated"})
     except Exception as e:
-        print(f"Error updating fitness goal: {e}")
+        logger.error("Error updating fitness goal: %s", e)
         return jsonify({"error": "Failed to update fitness goal"}), 500
 
 @app.route("/api/get_combined_dashboard", methods=["POST"])
@@ -1248,7 +1335,7 @@ def get_combined_dashboard_endpoint():
         combined_data = get_combined_dashboard_data(user_id)
         return jsonify(combined_data)
     except Exception as e:
-        print(f"Error getting combined dashboard: {e}")
+        logger.error("Error getting combined dashboard: %s", e)
         return jsonify({"error": "Failed to get combined dashboard"}), 500
 
 @app.route("/api/get_progression_suggestions", methods=["POST"])
@@ -1257,6 +1344,7 @@ def get_progression_suggestions_endpoint():
     data = request.json
     user_id = data.get("user_id")
     workout_type = data.get("workout_type", "strength")
+    exercise_name = data.get("exercise_name")
    
     if not user_id:
         return jsonify({"error": "User ID required"}), 400
@@ -1268,10 +1356,12 @@ def get_progression_suggestions_endpoint():
        
         current_level = profile.get('fitness_experience', 'beginner')
         suggestions = get_workout_difficulty_progression(current_level, workout_type)
+        # Per-exercise advice from the user's own logged sets
+        exercises = progression_suggestions(database.get_exercise_stats(user_id, exercise_name))
        
-        return jsonify({"suggestions": suggestions})
+        return jsonify({"suggestions": suggestions, "exercises": exercises})
     except Exception as e:
-        print(f"Error getting progression suggestions: {e}")
+        logger.error("Error getting progression suggestions: %s", e)
         return jsonify({"error": "Failed to get progression suggestions"}), 500
 
 # Custom Workout Endpoints
@@ -1326,8 +1416,8 @@ def create_custom_workout_endpoint():
                 if not estimated_calories:
                     custom_workout_data['calories_burned'] = enhanced_workout.get('calories_burned', 200)
         
-        # Save as workout plan for easy access and integration with recommendations
-        plan_id = save_workout_plan(user_id, f"Custom: {workout_name}", custom_workout_data)
+        # Saved to the custom workout tables, which feed the recommendations
+        plan_id = database.save_custom_workout(user_id, custom_workout_data, is_active=True)
         
         return jsonify({
             "success": True,
@@ -1336,47 +1426,24 @@ def create_custom_workout_endpoint():
             "message": "Custom workout created successfully! It will now appear in your workout recommendations."
         })
     except Exception as e:
-        print(f"Error creating custom workout: {e}")
+        logger.error("Error creating custom workout: %s", e)
         return jsonify({"error": "Failed to create custom workout"}), 500
 
 
-@app.route("/api/get_user_custom_workouts", methods=["POST"])
+@app.route("/api/get_user_custom_workouts", methods=["GET", "POST"])
+@versioned('custom_workouts')
 def get_user_custom_workouts_endpoint():
     """Get all custom workouts for a user"""
-    data = request.json
+    data = request_data()
     user_id = data.get("user_id")
     
     if not user_id:
         return jsonify({"error": "User ID required"}), 400
     
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            c.execute("""
-            SELECT id, plan_name, plan_data, created_at, is_active
-            FROM workout_plans
-            WHERE user_id = ? AND plan_name LIKE 'Custom:%'
-            ORDER BY created_at DESC
-            """, (user_id,))
-            
-            custom_workouts = []
-            for row in c.fetchall():
-                try:
-                    plan_data = json.loads(row[2])
-                    custom_workouts.append({
-                        'id': row[0],
-                        'name': row[1].replace('Custom: ', ''),
-                        'workout_data': plan_data,
-                        'created_at': row[3],
-                        'is_active': row[4]
-                    })
-                except json.JSONDecodeError:
-                    print(f"Error parsing workout data for workout ID {row[0]}")
-                    continue
-            
-            return jsonify(custom_workouts)
+        return jsonify(database.get_user_custom_workouts(user_id))
     except Exception as e:
-        print(f"Error getting custom workouts: {e}")
+        logger.error("Error getting custom workouts: %s", e)
         return jsonify({"error": "Failed to get custom workouts"}), 500
 
 @app.route("/api/get_quick_workout_suggestions", methods=["POST"])
@@ -1389,12 +1456,8 @@ def get_quick_workout_suggestions():
     equipment = data.get("equipment", [])
     excluded_workouts = data.get("excluded_workouts", [])
 
-    print(f"🔍 Quick workout request:")
-    print(f"   User: {user_id}")
-    print(f"   Duration: {duration} min")
-    print(f"   Focus: {focus}")
-    print(f"   Equipment: {equipment}")
-    print(f"   Excluded: {excluded_workouts}")
+    logger.debug("Quick workout request: user=%s duration=%s focus=%s equipment=%s excluded=%s",
+                 user_id, duration, focus, equipment, excluded_workouts)
 
     if not user_id:
         return jsonify({"error": "User ID required"}), 400
@@ -1405,14 +1468,14 @@ def get_quick_workout_suggestions():
         
         profile = get_user_profile(user_id)
         if not profile:
-            print(f"⚠️ No profile found for user {user_id}, using defaults")
+            logger.warning("No profile found for user %s, using defaults", user_id)
             profile = {"fitness_experience": "beginner"}
         
         suggestions = get_quick_workout_suggestions(
             profile, duration, focus, equipment, excluded_workouts
         )
         
-        print(f"✅ Found {len(suggestions)} suggestions for user {user_id}")
+        logger.debug("Found %s suggestions for user %s", len(suggestions), user_id)
         
         # Filter out any None suggestions
         valid_suggestions = [s for s in suggestions if s and s.get('workout')]
@@ -1421,7 +1484,7 @@ def get_quick_workout_suggestions():
         
     except Exception as e:
         error_msg = f"Error getting suggestions: {str(e)}"
-        print(f"❌ {error_msg}")
+        logger.error("%s", error_msg)
         return jsonify({"error": error_msg}), 500
     
 @app.route("/api/quick_workout_feedback", methods=["POST"])
@@ -1432,10 +1495,7 @@ def quick_workout_feedback():
     workout_name = data.get("workout_name")
     liked = data.get("liked")
     
-    print(f"📝 Saving workout feedback:")
-    print(f"   User: {user_id}")
-    print(f"   Workout: {workout_name}")
-    print(f"   Liked: {liked}")
+    logger.debug("Saving workout feedback: user=%s workout=%s liked=%s", user_id, workout_name, liked)
     
     if not all([user_id, workout_name]) or liked is None:
         return jsonify({"error": "User ID, workout name, and preference required"}), 400
@@ -1453,7 +1513,7 @@ def quick_workout_feedback():
             "preference": preference
         })
     except Exception as e:
-        print(f"❌ Error saving workout feedback: {e}")
+        logger.error("Error saving workout feedback: %s", e)
         return jsonify({"error": "Failed to save workout preference"}), 500
 
 @app.route("/api/remove_workout_preference", methods=["POST"])
@@ -1467,20 +1527,21 @@ def remove_workout_preference():
         return jsonify({"error": "User ID and workout name required"}), 400
     
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with database.connect(DB_PATH) as conn:
             c = conn.cursor()
             c.execute("""
             DELETE FROM workout_preferences 
             WHERE user_id = ? AND workout_name = ?
             """, (user_id, workout_name))
             conn.commit()
+            invalidate_user_recommendations(user_id)
             
             if c.rowcount > 0:
                 return jsonify({"success": True, "message": "Preference removed"})
             else:
                 return jsonify({"error": "Preference not found"}), 404
     except Exception as e:
-        print(f"Error removing workout preference: {e}")
+        logger.error("Error removing workout preference: %s", e)
         return jsonify({"error": "Failed to remove preference"}), 500
     
 @app.route("/api/get_workout_preferences", methods=["POST"])
@@ -1495,10 +1556,10 @@ def get_workout_preferences():
     try:
         from database import get_user_workout_preferences
         preferences = get_user_workout_preferences(user_id)
-        print(f"✅ Retrieved workout preferences for user {user_id}: {len(preferences.get('liked', []))} liked, {len(preferences.get('disliked', []))} disliked")
+        logger.debug("Retrieved workout preferences for user %s: %s liked, %s disliked", user_id, len(preferences.get('liked', [])), len(preferences.get('disliked', [])))
         return jsonify(preferences)
     except Exception as e:
-        print(f"❌ Error fetching workout preferences: {e}")
+        logger.error("Error fetching workout preferences: %s", e)
         # Return empty preferences instead of error to not break the UI
         return jsonify({"liked": [], "disliked": []})
 
@@ -1514,23 +1575,13 @@ def delete_custom_workout():
         return jsonify({"error": "User ID and workout ID required"}), 400
     
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            
-            # Verify the workout belongs to the user before deleting
-            c.execute("""
-            DELETE FROM workout_plans 
-            WHERE id = ? AND user_id = ? AND plan_name LIKE 'Custom:%'
-            """, (workout_id, user_id))
-            
-            if c.rowcount == 0:
-                return jsonify({"error": "Workout not found or not authorized"}), 404
-            
-            conn.commit()
+        # Only deletes the workout if it belongs to the user
+        if not database.delete_custom_workout(user_id, workout_id):
+            return jsonify({"error": "Workout not found or not authorized"}), 404
         
         return jsonify({"success": True, "message": "Custom workout deleted successfully"})
     except Exception as e:
-        print(f"Error deleting custom workout: {e}")
+        logger.error("Error deleting custom workout: %s", e)
         return jsonify({"error": "Failed to delete custom workout"}), 500
     
 # Helper function to get user dietary restrictions
@@ -1547,7 +1598,7 @@ def get_user_dietary_restrictions(user_id):
                 return json.loads(restrictions)
         return []
     except Exception as e:
-        print(f"Error getting dietary restrictions: {e}")
+        logger.error("Error getting dietary restrictions: %s", e)
         return []
 
 @app.route("/api/get_dietary_restrictions", methods=["POST"])
@@ -1563,7 +1614,7 @@ def get_dietary_restrictions_endpoint():
         restrictions = get_user_dietary_restrictions(user_id)
         return jsonify({"dietary_restrictions": restrictions})
     except Exception as e:
-        print(f"Error getting dietary restrictions: {e}")
+        logger.error("Error getting dietary restrictions: %s", e)
         return jsonify({"dietary_restrictions": []})
 
 
@@ -1592,9 +1643,10 @@ def search_users_endpoint():
     return jsonify(users)
 
 
-@app.route("/api/get_friends", methods=["POST"])
+@app.route("/api/get_friends", methods=["GET", "POST"])
+@versioned('friends')
 def get_friends_endpoint():
-    data    = request.json or {}
+    data    = request_data()
     user_id = data.get("user_id")
     if not user_id:
         return jsonify([]), 400
@@ -1750,7 +1802,7 @@ def get_streak():
         streak_data = get_user_streak(user_id)
         return jsonify(streak_data), 200
     except Exception as e:
-        print(f"Error fetching streak: {e}")
+        logger.error("Error fetching streak: %s", e)
         return jsonify({"error": "Failed to fetch streak"}), 500
 
 @app.route("/api/get_badges", methods=["POST"])
@@ -1764,7 +1816,7 @@ def get_badges():
         badges = get_user_badges(user_id)
         return jsonify(badges), 200
     except Exception as e:
-        print(f"Error fetching badges: {e}")
+        logger.error("Error fetching badges: %s", e)
         return jsonify({"error": "Failed to fetch badges"}), 500
 
 @app.route("/api/get_user_stats", methods=["POST"])
@@ -1778,7 +1830,7 @@ def get_user_stats_endpoint():
         stats = get_user_stats(user_id)
         return jsonify(stats), 200
     except Exception as e:
-        print(f"Error fetching user stats: {e}")
+        logger.error("Error fetching user stats: %s", e)
         return jsonify({"error": "Failed to fetch user stats"}), 500
 
 @app.route("/api/get_weekly_challenges", methods=["POST"])
@@ -1826,7 +1878,7 @@ def send_message_endpoint():
         msg_id = send_message(sender_id, receiver_id, content)
         return jsonify({"success": True, "message_id": msg_id})
     except Exception as e:
-        print(f"Error sending message: {e}")
+        logger.error("Error sending message: %s", e)
         return jsonify({"error": "Failed to send message"}), 500
 
 @app.route("/api/get_messages", methods=["POST"])
@@ -1841,7 +1893,7 @@ def get_messages_endpoint():
         messages = get_messages(user_id, friend_id, limit)
         return jsonify(messages)
     except Exception as e:
-        print(f"Error fetching messages: {e}")
+        logger.error("Error fetching messages: %s", e)
         return jsonify({"error": "Failed to fetch messages"}), 500
 
 
@@ -1860,7 +1912,7 @@ def get_friend_activities_endpoint():
         activities = get_friend_activities(user_id, limit)
         return jsonify(activities)
     except Exception as e:
-        print(f"Error fetching friend activities: {e}")
+        logger.error("Error fetching friend activities: %s", e)
         return jsonify({"error": "Failed to fetch activities"}), 500
 
 @app.route("/api/get_friend_badges", methods=["POST"])
@@ -1873,7 +1925,7 @@ def get_friend_badges_endpoint():
         badges = get_friend_badges(friend_id)
         return jsonify(badges)
     except Exception as e:
-        print(f"Error fetching friend badges: {e}")
+        logger.error("Error fetching friend badges: %s", e)
         return jsonify({"error": "Failed to fetch badges"}), 500
 
 @app.route("/api/set_friend_reminder", methods=["POST"])
@@ -1889,7 +1941,7 @@ def set_friend_reminder_endpoint():
         reminder_id = set_friend_reminder(user_id, friend_id, message, remind_at)
         return jsonify({"success": True, "reminder_id": reminder_id})
     except Exception as e:
-        print(f"Error setting friend reminder: {e}")
+        logger.error("Error setting friend reminder: %s", e)
         return jsonify({"error": "Failed to set reminder"}), 500
 
 @app.route("/api/get_friend_reminders", methods=["POST"])
@@ -1906,7 +1958,7 @@ def get_friend_reminders_endpoint():
             reminders = get_reminders_you_set(friend_id)
         return jsonify(reminders)
     except Exception as e:
-        print(f"Error fetching friend reminders: {e}")
+        logger.error("Error fetching friend reminders: %s", e)
         return jsonify({"error": "Failed to fetch reminders"}), 500
 
 @app.route("/api/delete_reminder", methods=["POST"])
@@ -1942,10 +1994,12 @@ def get_friends_leaderboard_endpoint():
     if not user_id:
         return jsonify({"error": "user_id required"}), 400
     try:
-        leaderboard = get_friends_leaderboard(user_id, metric, limit)
+        leaderboard = LEADERBOARD_CACHE.get_or_set(f"{user_id}:{metric}:{limit}",
+                                                   lambda: get_friends_leaderboard(user_id, metric, limit),
+                                                   tags=[f"friends:{user_id}"])
         return jsonify(leaderboard)
     except Exception as e:
-        print(f"Error fetching leaderboard: {e}")
+        logger.error("Error fetching leaderboard: %s", e)
         return jsonify({"error": "Failed to fetch leaderboard"}), 500
 
 @app.route("/api/like_workout_from_friend", methods=["POST"])
@@ -1977,33 +2031,31 @@ def log_vitals_endpoint():
         value_data = data.get("value_data")
         date_logged = data.get("date_logged")
         
-        print(f"🔍 Vitals log request: user_id={user_id}, metric_type={metric_type}, value_data={value_data}")
+        logger.debug("Vitals log request: user_id=%s, metric_type=%s, value_data=%s", user_id, metric_type, value_data)
         
         if not user_id or not metric_type or value_data is None:
-            print(f"❌ Missing required fields: user_id={user_id}, metric_type={metric_type}, value_data={value_data}")
+            logger.warning("Missing required fields: user_id=%s, metric_type=%s, value_data=%s", user_id, metric_type, value_data)
             return jsonify({"error": "Missing required fields"}), 400
         
         # Check if database exists and is accessible
         try:
             import os
             if not os.path.exists(DB_PATH):
-                print(f"❌ Database file does not exist: {DB_PATH}")
+                logger.error("Database file does not exist: %s", DB_PATH)
                 return jsonify({"error": "Database not initialized"}), 500
         except Exception as db_error:
-            print(f"❌ Database access error: {db_error}")
+            logger.error("Database access error: %s", db_error)
             return jsonify({"error": "Database access error"}), 500
         
         log_id = log_vitals_data(user_id, metric_type, value_data, date_logged)
-        print(f"✅ Successfully logged vitals data with log_id: {log_id}")
+        logger.debug("Successfully logged vitals data with log_id: %s", log_id)
         return jsonify({
             "success": True,
             "log_id": log_id,
             "message": f"{metric_type} data logged successfully"
         })
     except Exception as e:
-        print(f"❌ Error in log_vitals_endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in log_vitals_endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/vitals/get_data", methods=["POST"])
@@ -2053,22 +2105,20 @@ def get_all_vitals_streaks_endpoint():
         data = request.json
         user_id = data.get("user_id")
         
-        print(f"🔍 Vitals get all streaks request: user_id={user_id}")
+        logger.debug("Vitals get all streaks request: user_id=%s", user_id)
         
         if not user_id:
-            print(f"❌ Missing user_id: {user_id}")
+            logger.warning("Missing user_id: %s", user_id)
             return jsonify({"error": "Missing user_id"}), 400
         
         streaks = get_all_vitals_streaks(user_id)
-        print(f"✅ Successfully retrieved streaks: {streaks}")
+        logger.debug("Successfully retrieved streaks: %s", streaks)
         return jsonify({
             "success": True,
             "streaks": streaks
         })
     except Exception as e:
-        print(f"❌ Error in get_all_vitals_streaks_endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_all_vitals_streaks_endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/vitals/get_summary", methods=["POST"])
@@ -2080,22 +2130,20 @@ def get_vitals_summary_endpoint():
         metric_type = data.get("metric_type")
         days_back = data.get("days_back", 7)
         
-        print(f"🔍 Vitals get summary request: user_id={user_id}, metric_type={metric_type}, days_back={days_back}")
+        logger.debug("Vitals get summary request: user_id=%s, metric_type=%s, days_back=%s", user_id, metric_type, days_back)
         
         if not user_id or not metric_type:
-            print(f"❌ Missing required fields: user_id={user_id}, metric_type={metric_type}")
+            logger.warning("Missing required fields: user_id=%s, metric_type=%s", user_id, metric_type)
             return jsonify({"error": "Missing required fields"}), 400
         
         summary = get_vitals_summary(user_id, metric_type, days_back)
-        print(f"✅ Successfully retrieved summary: {summary}")
+        logger.debug("Successfully retrieved summary: %s", summary)
         return jsonify({
             "success": True,
             "summary": summary
         })
     except Exception as e:
-        print(f"❌ Error in get_vitals_summary_endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_vitals_summary_endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/vitals/get_chart_data", methods=["POST"])
@@ -2107,22 +2155,20 @@ def get_vitals_chart_data_endpoint():
         metric_type = data.get("metric_type")
         range_key = data.get("range_key", "1w")
         
-        print(f"🔍 Vitals chart data request: user_id={user_id}, metric_type={metric_type}, range_key={range_key}")
+        logger.debug("Vitals chart data request: user_id=%s, metric_type=%s, range_key=%s", user_id, metric_type, range_key)
         
         if not user_id or not metric_type:
-            print(f"❌ Missing required fields: user_id={user_id}, metric_type={metric_type}")
+            logger.warning("Missing required fields: user_id=%s, metric_type=%s", user_id, metric_type)
             return jsonify({"error": "Missing required fields"}), 400
         
         chart_data = get_vitals_chart_data(user_id, metric_type, range_key)
-        print(f"✅ Successfully retrieved chart data: {len(chart_data)} data points")
+        logger.debug("Successfully retrieved chart data: %s data points", len(chart_data))
         return jsonify({
             "success": True,
             "chart_data": chart_data
         })
     except Exception as e:
-        print(f"❌ Error in get_vitals_chart_data_endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_vitals_chart_data_endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/vitals/create_custom_metric", methods=["POST"])
@@ -2149,10 +2195,11 @@ def create_custom_metric_endpoint():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/vitals/get_custom_metrics", methods=["POST"])
+@app.route("/api/vitals/get_custom_metrics", methods=["GET", "POST"])
+@versioned('custom_metrics')
 def get_custom_metrics_endpoint():
     """Get all custom metrics for a user"""
-    data = request.json
+    data = request_data()
     user_id = data.get("user_id")
     
     if not user_id:
@@ -2220,25 +2267,59 @@ def get_today_vitals_logs_endpoint():
         user_id = data.get("user_id")
         metric_type = data.get("metric_type")
         
-        print(f"🔍 Vitals get today logs request: user_id={user_id}, metric_type={metric_type}")
+        logger.debug("Vitals get today logs request: user_id=%s, metric_type=%s", user_id, metric_type)
         
         if not user_id or not metric_type:
-            print(f"❌ Missing required fields: user_id={user_id}, metric_type={metric_type}")
+            logger.warning("Missing required fields: user_id=%s, metric_type=%s", user_id, metric_type)
             return jsonify({"error": "Missing required fields"}), 400
         
         logs = get_today_vitals_logs(user_id, metric_type)
-        print(f"✅ Successfully retrieved today's logs: {logs}")
+        logger.debug("Successfully retrieved today's logs: %s", logs)
         return jsonify({
             "success": True,
             "logs": logs
         })
     except Exception as e:
-        print(f"❌ Error in get_today_vitals_logs_endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_today_vitals_logs_endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
-if __name__ == "__main__":
+@app.route("/api/export", methods=["GET", "POST"])
+def export_endpoint():
+    """Stream a user's meal, nutrition, workout, exercise and vitals history as NDJSON or CSV"""
+    from datetime import date
+    data = request_data()
+    user_id = data.get("user_id")
+    fmt = data.get("format", "ndjson")
+    zipped = str(data.get("zip", "")).lower() in ("1", "true")
+    
+    if not user_id:
+        return jsonify({"error": "User ID required"}), 400
+    
+    try:
+        tables = parse_tables(data.get("tables"))
+        body = export_stream(database.DB_PATH, user_id, fmt, tables, zipped)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    filename = export_filename(fmt, tables, zipped, date.today())
+    return Response(body, mimetype=export_mimetype(fmt, zipped),
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def init_database():
+    """Create or migrate the schema; run once per deployment, before any worker starts"""
     init_db()
     init_fitness_tables()
+    with sqlite3.connect(database.DB_PATH) as conn:
+        # Readers don't block the writer across worker processes; persists in the file
+        conn.execute("PRAGMA journal_mode=WAL")
+
+def warm_caches():
+    """Load the catalogs and compiled indexes every request shares"""
+    get_meal_pool()
+    get_meal_engine()
+
+if __name__ == "__main__":
+    # Development server; production runs gunicorn with gunicorn.conf.py
+    init_database()
+    warm_caches()
     app.run(debug=True, host="0.0.0.0", port=5001)
\ No newline at end of file
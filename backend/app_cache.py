@@ -0,0 +1,587 @@
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from log_utils import get_logger
+from request_metrics import gauge_lines
+
+# Application cache shared by the API's caches (USDA responses, workout
+# recommendations, dashboard fragments, the friends leaderboard).
+#
+#   cache = get_cache('dashboard', default_ttl=60)
+#   data = cache.get_or_set(f"fitness:{user_id}", lambda: load(user_id), tags=[f"workouts:{user_id}"])
+#   invalidate_tags(f"workouts:{user_id}")     # after the user's workouts change
+#
+# Backends:
+#   memory  bounded LRU per cache, private to the process (the default)
+#   sqlite  one SQLite file shared by every worker on the host
+#   redis   any server speaking the Redis protocol, shared across hosts; the
+#           client is built in (fake_redis.py is a local stand-in for tests)
+# Shared backends store pickled values, so point them only at stores this
+# deployment owns.
+#
+# Entries can carry a TTL and tags. Each tag has a random token in the
+# backend and an entry remembers the tokens it was computed under;
+# invalidating a tag gives it a new token, so every entry stored under the old
+# one misses from then on, in every worker. That includes entries whose
+# computation was still running when the tag was invalidated.
+#
+# Stampede protection: get_or_set lets one caller compute a missing key while
+# the others wait for its result - per key within a process, and through a
+# short-lived lock entry in the backend across processes (waiters give up and
+# compute themselves after NUTRIFIT_CACHE_LOCK_SECONDS).
+#
+# Environment:
+#   NUTRIFIT_CACHE_BACKEND       memory, sqlite or redis (default memory)
+#   NUTRIFIT_CACHE_PATH          SQLite file for the sqlite backend (default backend/nutrifit_cache.db)
+#   NUTRIFIT_CACHE_URL           redis://[:password@]host:port/db for the redis backend
+#   NUTRIFIT_CACHE_LOCK_SECONDS  how long a computation holds its key's lock (default 10)
+
+CACHE_BACKEND = os.getenv("NUTRIFIT_CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv("NUTRIFIT_CACHE_PATH", os.path.join(os.path.dirname(__file__), 'nutrifit_cache.db'))
+CACHE_URL = os.getenv("NUTRIFIT_CACHE_URL", "redis://127.0.0.1:6379/0")
+LOCK_SECONDS = float(os.getenv("NUTRIFIT_CACHE_LOCK_SECONDS", "10"))
+LOCK_POLL_SECONDS = 0.02
+DEFAULT_MAX_ENTRIES = 2048
+PURGE_EVERY_SETS = 256
+
+MISSING = object()
+
+logger = get_logger(__name__)
+
+
+def _new_token():
+    return uuid.uuid4().hex
+
+
+class NoStore:
+    """A get_or_set result to return without caching it (e.g. partial results)"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class MemoryBackend:
+    """Bounded LRU dict with per-entry expiry, private to the process"""
+
+    shared = False
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at or None)
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                return False
+        self.set(key, value, ttl)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def tag_tokens(self, tags):
+        with self._lock:
+            return {tag: self._tags.setdefault(tag, _new_token()) for tag in tags}
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = _new_token()
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.evictions = 0
+
+
+class SqliteBackend:
+    """Cache entries in a SQLite file, shared by the workers on one host"""
+
+    shared = True
+    evictions = 0
+
+    def __init__(self, path, namespace, timeout=5.0):
+        self.path = path
+        self.namespace = namespace
+        self.timeout = timeout
+        self._sets = 0
+        with sqlite3.connect(self.path, timeout=self.timeout) as conn:
+            c = conn.cursor()
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL
+            ) WITHOUT ROWID
+            """)
+            c.execute("""
+            CREATE TABLE IF NOT EXISTS cache_tags (
+                namespace TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                token TEXT NOT NULL,
+                PRIMARY KEY (namespace, tag)
+            ) WITHOUT ROWID
+            """)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expiry ON cache_entries(expires_at)")
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        with sqlite3.connect(self.path, timeout=self.timeout) as conn:
+            c = conn.cursor()
+            c.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (self._key(key),))
+            row = c.fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return MISSING
+        return pickle.loads(row[0])
+
+    def _write(self, key, value, ttl, only_if_absent):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        sql = """
+        INSERT INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+        """
+        params = [self._key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at]
+        if only_if_absent:
+            # An existing entry only counts if it hasn't expired
+            sql += "WHERE cache_entries.expires_at IS NOT NULL AND cache_entries.expires_at <= ?"
+            params.append(now)
+        with sqlite3.connect(self.path, timeout=self.timeout) as conn:
+            c = conn.cursor()
+            c.execute(sql, params)
+            written = c.rowcount > 0
+            self._sets += 1
+            if self._sets % PURGE_EVERY_SETS == 0:
+                c.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        return written
+
+    def set(self, key, value, ttl=None):
+        self._write(key, value, ttl, only_if_absent=False)
+
+    def add(self, key, value, ttl=None):
+        return self._write(key, value, ttl, only_if_absent=True)
+
+    def delete(self, key):
+        with sqlite3.connect(self.path, timeout=self.timeout) as conn:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (self._key(key),))
+
+    def _read_tags(self, c, tags):
+        c.execute(f"SELECT tag, token FROM cache_tags WHERE namespace = ? AND tag IN ({','.join('?' * len(tags))})",
+                  (self.namespace, *tags))
+        return dict(c.fetchall())
+
+    def tag_tokens(self, tags):
+        tags = list(tags)
+        with sqlite3.connect(self.path, timeout=self.timeout) as conn:
+            c = conn.cursor()
+            # Read first: a hit must not queue on the write lock; only unseen tags are written
+            tokens = self._read_tags(c, tags)
+            missing = [tag for tag in tags if tag not in tokens]
+            if missing:
+                c.executemany("INSERT OR IGNORE INTO cache_tags (namespace, tag, token) VALUES (?, ?, ?)",
+                              [(self.namespace, tag, _new_token()) for tag in missing])
+                tokens.update(self._read_tags(c, missing))  # another worker may have won the insert
+            return tokens
+
+    def invalidate_tags(self, tags):
+        with sqlite3.connect(self.path, timeout=self.timeout) as conn:
+            conn.executemany("""
+            INSERT INTO cache_tags (namespace, tag, token) VALUES (?, ?, ?)
+            ON CONFLICT(namespace, tag) DO UPDATE SET token = excluded.token
+            """, [(self.namespace, tag, _new_token()) for tag in tags])
+
+    def size(self):
+        with sqlite3.connect(self.path, timeout=self.timeout) as conn:
+            c = conn.cursor()
+            # ';' sorts right after ':', so this is every key with the namespace prefix
+            c.execute("""
+            SELECT COUNT(*) FROM cache_entries
+            WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)
+            """, (f"{self.namespace}:", f"{self.namespace};", time.time()))
+            return c.fetchone()[0]
+
+    def clear(self):
+        with sqlite3.connect(self.path, timeout=self.timeout) as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM cache_entries WHERE key >= ? AND key < ?",
+                      (f"{self.namespace}:", f"{self.namespace};"))
+            c.execute("DELETE FROM cache_tags WHERE namespace = ?", (self.namespace,))
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RespClient:
+    """Minimal Redis protocol (RESP2) client with one connection per thread"""
+
+    def __init__(self, url, timeout=1.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.strip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection opened before gunicorn forked belongs to the master
+        if conn is None or conn[2] != os.getpid():
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = self._local.conn = (sock, sock.makefile('rb'), os.getpid())
+            if self.password:
+                self._call(conn, 'AUTH', self.password)
+            if self.db:
+                self._call(conn, 'SELECT', self.db)
+        return conn
+
+    def _call(self, conn, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        conn[0].sendall(b''.join(parts))
+        return self._read(conn[1])
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RespError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            return None if length < 0 else reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._read(reader) for _ in range(length)]
+        raise RespError(f"Unexpected reply {line!r}")
+
+    def execute(self, *args):
+        """Send one command and return its reply; reconnects on the next call after a failure"""
+        try:
+            return self._call(self._connection(), *args)
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn[0].close()
+
+
+class RedisBackend:
+    """Cache entries in a Redis-protocol server, shared across hosts"""
+
+    shared = True
+    evictions = 0
+
+    def __init__(self, client, namespace, prefix='nutrifit:'):
+        self.client = client
+        self.namespace = namespace
+        self.prefix = f"{prefix}{namespace}:"
+        self.tag_prefix = f"{prefix}tag:{namespace}:"
+
+    def get(self, key):
+        value = self.client.execute('GET', self.prefix + key)
+        return MISSING if value is None else pickle.loads(value)
+
+    def _set(self, key, value, ttl, *flags):
+        args = ['SET', self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), *flags]
+        if ttl:
+            args += ['PX', max(1, int(ttl * 1000))]
+        return self.client.execute(*args) is not None
+
+    def set(self, key, value, ttl=None):
+        self._set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        return self._set(key, value, ttl, 'NX')
+
+    def delete(self, key):
+        self.client.execute('DEL', self.prefix + key)
+
+    def tag_tokens(self, tags):
+        tags = list(tags)
+        tokens = dict(zip(tags, self.client.execute('MGET', *[self.tag_prefix + tag for tag in tags])))
+        for tag, token in tokens.items():
+            if token is None:
+                token = _new_token().encode()
+                if self.client.execute('SET', self.tag_prefix + tag, token, 'NX') is None:
+                    token = self.client.execute('GET', self.tag_prefix + tag)
+                tokens[tag] = token
+        return {tag: token.decode() for tag, token in tokens.items()}
+
+    def invalidate_tags(self, tags):
+        for tag in tags:
+            self.client.execute('SET', self.tag_prefix + tag, _new_token())
+
+    def _scan(self, pattern):
+        cursor = '0'
+        while True:
+            cursor, keys = self.client.execute('SCAN', cursor, 'MATCH', pattern, 'COUNT', 500)
+            yield from keys
+            cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+            if cursor == '0':
+                return
+
+    def size(self):
+        return sum(1 for _ in self._scan(self.prefix + '*'))
+
+    def clear(self):
+        for pattern in (self.prefix + '*', self.tag_prefix + '*'):
+            keys = list(self._scan(pattern))
+            for start in range(0, len(keys), 500):
+                self.client.execute('DEL', *keys[start:start + 500])
+
+
+class Cache:
+    """One named cache: TTLs, tags and single-flight get_or_set over a backend"""
+
+    def __init__(self, backend, namespace='default', default_ttl=None, lock_seconds=LOCK_SECONDS):
+        self.backend = backend
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.lock_seconds = lock_seconds
+        self._key_locks = {}  # key -> [lock, users]
+        self._guard = threading.Lock()
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.hits = self.misses = self.sets = self.invalidations = self.lock_waits = self.errors = 0
+
+    def _backend_call(self, method, *args, default=None):
+        # A cache that can't be reached behaves as empty rather than failing the request
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            with self._guard:
+                self.errors += 1
+            logger.warning("Cache %s: %s failed: %s", self.namespace, method, e)
+            return default
+
+    def _lookup(self, key):
+        entry = self._backend_call('get', f"k:{key}", default=MISSING)
+        if entry is MISSING:
+            return MISSING
+        tokens, value = entry
+        if tokens and self._backend_call('tag_tokens', tokens.keys()) != tokens:
+            return MISSING
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        with self._guard:
+            if value is MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return value
+
+    def _store(self, key, value, ttl, tokens):
+        ttl = self.default_ttl if ttl is None else ttl
+        self._backend_call('set', f"k:{key}", (tokens, value), ttl)
+        with self._guard:
+            self.sets += 1
+
+    def set(self, key, value, ttl=None, tags=()):
+        tokens = self._backend_call('tag_tokens', tags, default={}) if tags else {}
+        self._store(key, value, ttl, tokens)
+
+    def delete(self, key):
+        self._backend_call('delete', f"k:{key}")
+
+    def invalidate_tags(self, *tags):
+        """Make every entry stored under any of tags miss"""
+        self._backend_call('invalidate_tags', tags)
+        with self._guard:
+            self.invalidations += 1
+
+    def _key_lock(self, key):
+        with self._guard:
+            holder = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            holder[1] += 1
+        return holder
+
+    def _release_key_lock(self, key, holder):
+        with self._guard:
+            holder[1] -= 1
+            if holder[1] == 0:
+                del self._key_locks[key]
+
+    def _wait_for_owner(self, key):
+        """Value another process is computing, or MISSING once it gives up or its lock lapses"""
+        with self._guard:
+            self.lock_waits += 1
+        deadline = time.monotonic() + self.lock_seconds
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_SECONDS)
+            value = self._lookup(key)
+            if value is not MISSING:
+                return value
+            if self._backend_call('get', f"l:{key}", default=MISSING) is MISSING:
+                break
+        return MISSING
+
+    def get_or_set(self, key, compute, ttl=None, tags=()):
+        """Cached value for key, or compute() stored under tags; concurrent misses compute once"""
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        holder = self._key_lock(key)
+        try:
+            with holder[0]:
+                # Whoever held the lock before us may have stored it
+                value = self._lookup(key)
+                if value is not MISSING:
+                    return value
+
+                # Tokens are read before computing so an invalidation meanwhile wins
+                tokens = self._backend_call('tag_tokens', tags, default={}) if tags else {}
+                owner = True
+                if self.backend.shared:
+                    owner = self._backend_call('add', f"l:{key}", os.getpid(), self.lock_seconds, default=True)
+                    if not owner:
+                        value = self._wait_for_owner(key)
+                        if value is not MISSING:
+                            return value
+                try:
+                    value = compute()
+                    if isinstance(value, NoStore):
+                        return value.value
+                    self._store(key, value, ttl, tokens)
+                    return value
+                finally:
+                    if owner and self.backend.shared:
+                        self._backend_call('delete', f"l:{key}")
+        finally:
+            self._release_key_lock(key, holder)
+
+    def clear(self):
+        """Drop every entry and tag in this cache and reset its counters"""
+        self._backend_call('clear')
+        with self._guard:
+            self._reset_counters()
+
+    def stats(self):
+        with self._guard:
+            lookups = self.hits + self.misses
+            counters = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'sets': self.sets,
+                'invalidations': self.invalidations,
+                'lock_waits': self.lock_waits,
+                'errors': self.errors,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+        return {'backend': type(self.backend).__name__, 'size': self._backend_call('size', default=0),
+                'evictions': self.backend.evictions, **counters}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+_redis_client = None
+
+
+def make_backend(namespace, max_entries=DEFAULT_MAX_ENTRIES, kind=None):
+    """Backend for a named cache as configured by NUTRIFIT_CACHE_BACKEND"""
+    global _redis_client
+    kind = kind or CACHE_BACKEND
+    if kind == 'sqlite':
+        return SqliteBackend(CACHE_PATH, namespace)
+    if kind == 'redis':
+        if _redis_client is None:
+            _redis_client = RespClient(CACHE_URL)
+        return RedisBackend(_redis_client, namespace)
+    if kind != 'memory':
+        logger.warning("Unknown NUTRIFIT_CACHE_BACKEND %r, using memory", kind)
+    return MemoryBackend(max_entries)
+
+
+def get_cache(namespace, max_entries=DEFAULT_MAX_ENTRIES, default_ttl=None):
+    """The process-wide Cache called namespace, created on first use"""
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = _caches[namespace] = Cache(make_backend(namespace, max_entries), namespace, default_ttl)
+        return cache
+
+
+def invalidate_tags(*tags):
+    """Invalidate tags in every named cache"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.invalidate_tags(*tags)
+
+
+def clear_caches():
+    """Empty every named cache and reset its counters"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.clear()
+
+
+def cache_metric_lines():
+    """Per-cache counters and sizes for /metrics"""
+    with _caches_lock:
+        stats = {(name,): cache.stats() for name, cache in _caches.items()}
+    lines = []
+    for key in ('hits', 'misses', 'sets', 'invalidations', 'lock_waits', 'errors', 'size', 'evictions'):
+        lines += gauge_lines(f'nutrifit_cache_{key}', f'Application cache {key.replace("_", " ")}',
+                             {name: values[key] for name, values in stats.items()}, ('cache',))
+    return lines
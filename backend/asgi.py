@@ -0,0 +1,278 @@
+import asyncio
+import contextvars
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import httpx
+
+from app import (
+    app, add_custom_food_results, add_custom_food_suggestions, get_user_dietary_restrictions, suggest_meals
+)
+from database import get_user_custom_foods
+from json_response import COMPRESSION, encode_body
+from log_utils import get_logger
+from nutrition_utils import merge_food_results, search_custom_foods, search_usda_foods_async
+from request_metrics import METRICS
+from wsgi import application as wsgi_application
+
+# ASGI entry point. The food search endpoints wait on the USDA API for most of
+# their time, which ties up a gthread worker thread per request; here they run
+# as coroutines instead, so one worker keeps many USDA calls in flight:
+#
+#   cd backend && gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+#   cd backend && uvicorn asgi:application --port 5001
+#
+# Served natively (async):
+#   POST /api/search_food_autocomplete   USDA search, restrictions and custom foods fetched concurrently
+#   POST /api/search_food                same, with the longer result list
+#   POST /api/get_meal_suggestions       pool lookup on the SQLite executor
+# Everything else goes to the Flask app from wsgi.py on a thread pool, so
+# the rest of the API behaves as it does under gunicorn's gthread worker.
+#
+# USDA calls go through one httpx.AsyncClient per event loop whose connection
+# pool caps concurrent upstream requests. SQLite work runs on a bounded thread
+# pool, with the request's context copied over so /metrics still attributes
+# SQL statements to the route.
+#
+# Environment:
+#   NUTRIFIT_DB_THREADS          threads for SQLite work from the async routes (default 8)
+#   NUTRIFIT_WSGI_THREADS        threads for requests handed to the Flask app (default 16)
+#   NUTRIFIT_USDA_CONNECTIONS    concurrent USDA connections per worker (default 20)
+
+JSON_HEADERS = [(b'content-type', b'application/json'), (b'access-control-allow-origin', b'*'),
+                (b'vary', b'Accept-Encoding')]
+_DONE = object()
+
+logger = get_logger(__name__)
+
+
+async def read_body(receive):
+    """The whole request body from an ASGI receive channel"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+def request_header(scope, name):
+    """First value of a request header (lowercase bytes name) as str, or None"""
+    for header, value in scope.get('headers', []):
+        if header == name:
+            return value.decode('latin-1')
+    return None
+
+
+def wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope with an already-read body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class AsgiApp:
+    """Async food search routes in front of the Flask app"""
+
+    def __init__(self, wsgi_app, db_threads=8, wsgi_threads=16, usda_connections=20, metrics=METRICS):
+        self.wsgi_app = wsgi_app
+        self.db_executor = ThreadPoolExecutor(db_threads, thread_name_prefix='asgi-db')
+        self.wsgi_executor = ThreadPoolExecutor(wsgi_threads, thread_name_prefix='asgi-wsgi')
+        self.usda_connections = usda_connections
+        self.metrics = metrics
+        self._client = None
+        self._client_loop = None
+        self.routes = {
+            '/api/search_food_autocomplete': self.search_food_autocomplete,
+            '/api/search_food': self.search_food,
+            '/api/get_meal_suggestions': self.get_meal_suggestions
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            handler = self.routes.get(scope['path']) if scope['method'] == 'POST' else None
+            if handler is None:
+                await self.call_wsgi(scope, receive, send)
+            else:
+                await self.call_route(handler, scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def usda_client(self):
+        """The httpx.AsyncClient for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            limits = httpx.Limits(max_connections=self.usda_connections,
+                                  max_keepalive_connections=self.usda_connections)
+            self._client = httpx.AsyncClient(limits=limits)
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = self._client_loop = None
+
+    async def run_db(self, func, *args):
+        """Run a blocking database call on the SQLite executor, in this request's context"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, partial(context.run, func, *args))
+
+    async def call_route(self, handler, scope, receive, send):
+        body = await read_body(receive)
+        token = self.metrics.start() if self.metrics is not None else None
+        status, content, encoding = 500, b'', None
+        try:
+            try:
+                data = app.json.loads(body) if body else {}
+            except ValueError:
+                status, payload = 400, {"error": "Invalid JSON"}
+            else:
+                status, payload = await handler(data)
+            accept_encoding = request_header(scope, b'accept-encoding') if COMPRESSION else None
+            content, encoding = encode_body(self.json_body(payload), accept_encoding, 'application/json', scope['path'])
+        except Exception as e:
+            logger.error("Error handling %s: %s", scope['path'], e)
+            status, content, encoding = 500, self.json_body({"error": "Internal server error"}), None
+        finally:
+            if token is not None:
+                self.metrics.finish(token, scope['path'], scope['method'], status, len(content))
+
+        headers = JSON_HEADERS + [(b'content-length', str(len(content)).encode())]
+        if encoding is not None:
+            headers.append((b'content-encoding', encoding.encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def json_body(self, payload):
+        """payload encoded the way the Flask app's jsonify encodes it"""
+        return app.json.response(payload).get_data()
+
+    async def _user_food_context(self, user_id, query):
+        """The user's dietary restrictions and matching custom foods"""
+        if not user_id:
+            return [], []
+        return await asyncio.gather(self.run_db(get_user_dietary_restrictions, user_id),
+                                    self.run_db(get_user_custom_foods, user_id, query))
+
+    async def search_food_autocomplete(self, data):
+        query = data.get("query", "").strip()
+        user_id = data.get("user_id")
+
+        if len(query) < 2:
+            return 200, []
+
+        try:
+            (user_restrictions, custom_foods), usda_results = await asyncio.gather(
+                self._user_food_context(user_id, query),
+                search_usda_foods_async(self.usda_client(), query, max_results=7)
+            )
+            suggestions = merge_food_results(search_custom_foods(query)[:3] + usda_results, 10, user_restrictions)
+            add_custom_food_suggestions(suggestions, custom_foods, user_restrictions)
+            return 200, suggestions[:10]
+        except Exception as e:
+            logger.error("Error in autocomplete search: %s", e)
+            return 200, []
+
+    async def search_food(self, data):
+        query = data.get("query", "").strip()
+        user_id = data.get("user_id")
+
+        if not query:
+            return 400, {"error": "Search query required"}
+
+        try:
+            (user_restrictions, custom_foods), usda_results = await asyncio.gather(
+                self._user_food_context(user_id, query),
+                search_usda_foods_async(self.usda_client(), query, max_results=12)
+            )
+            results = merge_food_results(search_custom_foods(query) + usda_results, 15, user_restrictions)
+            add_custom_food_results(results, custom_foods, user_restrictions)
+            return 200, results
+        except Exception as e:
+            logger.error("Error searching food: %s", e)
+            return 500, {"error": "Failed to search food"}
+
+    async def get_meal_suggestions(self, data):
+        try:
+            return 200, await self.run_db(suggest_meals, data.get("meal_type", "breakfast"), data.get("user_id"))
+        except Exception as e:
+            logger.error("Error getting meal suggestions: %s", e)
+            return 200, []
+
+    async def call_wsgi(self, scope, receive, send):
+        """Hand the request to the Flask app on the WSGI executor, streaming its body back"""
+        environ = wsgi_environ(scope, await read_body(receive))
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+            return lambda data: None
+
+        result = await loop.run_in_executor(self.wsgi_executor, self.wsgi_app, environ, start_response)
+        try:
+            chunks = iter(result)
+            chunk = await loop.run_in_executor(self.wsgi_executor, next, chunks, _DONE)
+            await send({'type': 'http.response.start', 'status': started['status'],
+                        'headers': started['headers']})
+            while chunk is not _DONE:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.wsgi_executor, next, chunks, _DONE)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.wsgi_executor, result.close)
+
+
+application = AsgiApp(
+    wsgi_application,
+    db_threads=int(os.getenv("NUTRIFIT_DB_THREADS", "8")),
+    wsgi_threads=int(os.getenv("NUTRIFIT_WSGI_THREADS", "16")),
+    usda_connections=int(os.getenv("NUTRIFIT_USDA_CONNECTIONS", "20")),
+    metrics=METRICS if os.getenv("NUTRIFIT_METRICS", "1") != "0" else None
+)
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from benchmarks.nutrition_bench import percentile
+from datagen import USER_PREFIX, generate_dataset, user_id_for
+from database import (
+    get_dashboard_data, get_meal_progress, add_food_to_current_meal, reset_day, get_vitals_chart_data,
+    get_friends_leaderboard, get_friend_activities, get_user_badges, get_user_profile
+)
+from fitness_utils import get_workout_recommendations, get_quick_workout_suggestions
+
+# Times the hot database and scoring paths on generated datasets at several
+# scales, saves the timings as a JSON baseline and fails when a later run is
+# slower than the baseline by more than a threshold.
+#
+#   cd backend && python -m benchmarks.db_bench --scale 1k --scale 100k --save-baseline
+#   cd backend && python -m benchmarks.db_bench --scale 1k --scale 100k      # exits 1 on a regression
+#
+# Datasets come from datagen and are cached in --data-dir per scale, seed and
+# day (the vitals chart is relative to today). Each run works on a copy, so the
+# writing targets (add_food_to_current_meal, reset_day) never touch the cache.
+
+# Roughly 13 generated rows per user per day
+SCALES = {
+    '1k': {'users': 3, 'days': 25},
+    '100k': {'users': 100, 'days': 75},
+    '1m': {'users': 500, 'days': 150}
+}
+DEFAULT_SCALES = ['1k', '100k']
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'nutrifit_bench')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines', 'db_bench.json')
+
+DEFAULT_THRESHOLD = 0.25   # fail when the median is 25% slower than the baseline...
+DEFAULT_MIN_DELTA_MS = 0.5  # ...and at least this much slower, so sub-millisecond noise passes
+
+SAMPLED_USERS = 20
+FOOD = {'name': 'Benchmark Oats', 'calories': 150, 'protein': 5, 'carbohydrates': 27, 'fat': 3,
+        'quantity': 1, 'serving_size': '1 cup', 'source': 'custom'}
+
+
+def dataset_path(scale, seed=0, data_dir=DEFAULT_DATA_DIR):
+    """Cached database for a scale, generated on first use"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{scale}_seed{seed}_{date.today().isoformat()}.db")
+    if not os.path.exists(path):
+        generate_dataset(path + '.tmp', seed=seed, **SCALES[scale])
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def count_rows(db_path):
+    """Total rows across the tables the generator fills"""
+    with sqlite3.connect(db_path) as conn:
+        c = conn.cursor()
+        total = 0
+        for table in ['users', 'user_preferences', 'friends', 'meal_history', 'daily_nutrition',
+                      'workout_sessions', 'exercise_performance', 'vitals_data', 'friend_activities',
+                      'friend_badges', 'messages', 'challenges']:
+            c.execute(f"SELECT COUNT(*) FROM {table}")
+            total += c.fetchone()[0]
+        return total
+
+
+def make_targets(user_ids, profiles, rng):
+    """name -> zero-argument callable, each call on the next sampled user"""
+    def rotating(func):
+        position = [0]
+
+        def call():
+            user_id = user_ids[position[0] % len(user_ids)]
+            position[0] += 1
+            return func(user_id)
+        return call
+
+    return {
+        'get_dashboard_data': rotating(get_dashboard_data),
+        'get_meal_progress': rotating(get_meal_progress),
+        'add_food_to_current_meal': rotating(
+            lambda user_id: add_food_to_current_meal(user_id, rng.choice(['breakfast', 'lunch', 'dinner']), FOOD)),
+        'reset_day': rotating(reset_day),
+        'get_vitals_chart_data': rotating(lambda user_id: get_vitals_chart_data(user_id, 'weight', '1y')),
+        'get_friends_leaderboard': rotating(lambda user_id: get_friends_leaderboard(user_id, 'workouts')),
+        'get_friend_activities': rotating(get_friend_activities),
+        'get_user_badges': rotating(get_user_badges),
+        'get_workout_recommendations': rotating(lambda user_id: get_workout_recommendations(profiles[user_id])),
+        'get_quick_workout_suggestions': rotating(
+            lambda user_id: get_quick_workout_suggestions(profiles[user_id], 30, 'full_body', [], []))
+    }
+
+
+def time_target(call, rounds, warmup=3):
+    """Run call warmup + rounds times; returns timing stats in ms"""
+    for _ in range(warmup):
+        call()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'rounds': rounds,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'max_ms': round(timings[-1], 3)
+    }
+
+
+def run_scale(scale, rounds=50, seed=0, data_dir=DEFAULT_DATA_DIR, targets=None):
+    """Time every target against a scratch copy of the scale's dataset"""
+    source = dataset_path(scale, seed, data_dir)
+    scratch_fd, scratch = tempfile.mkstemp(suffix='.db')
+    os.close(scratch_fd)
+    shutil.copyfile(source, scratch)
+    try:
+        with patch.object(database, 'DB_PATH', scratch):
+            users = SCALES[scale]['users']
+            rng = random.Random(seed)
+            user_ids = [user_id_for(i) for i in rng.sample(range(users), min(users, SAMPLED_USERS))]
+            profiles = {user_id: get_user_profile(user_id) for user_id in user_ids}
+
+            results = {}
+            for name, call in make_targets(user_ids, profiles, rng).items():
+                if targets and name not in targets:
+                    continue
+                results[name] = time_target(call, rounds)
+        return {'rows': count_rows(source), 'targets': results}
+    finally:
+        os.unlink(scratch)
+
+
+def run(scales=None, rounds=50, seed=0, data_dir=DEFAULT_DATA_DIR, targets=None):
+    """Benchmark each scale; returns a report dict"""
+    scales = scales or DEFAULT_SCALES
+    report = {'config': {'rounds': rounds, 'seed': seed, 'user_prefix': USER_PREFIX}, 'scales': {}}
+    for scale in scales:
+        report['scales'][scale] = run_scale(scale, rounds, seed, data_dir, targets)
+    return report
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """Regressions in report against baseline, as (scale, target, baseline ms, current ms)"""
+    regressions = []
+    for scale, current in report['scales'].items():
+        previous = baseline.get('scales', {}).get(scale, {}).get('targets', {})
+        for name, timing in current['targets'].items():
+            if name not in previous:
+                continue
+            before, after = previous[name]['median_ms'], timing['median_ms']
+            if after > before * (1 + threshold) and after - before >= min_delta_ms:
+                regressions.append((scale, name, before, after))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark database and scoring hot paths")
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES), help="dataset scale (repeatable)")
+    parser.add_argument('--rounds', type=int, default=50, help="timed calls per target")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', action='append', help="only run this target (repeatable)")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="where generated datasets are cached")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON to compare against or save")
+    parser.add_argument('--save-baseline', action='store_true', help="write this run as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown of the median, as a fraction")
+    parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS)
+    args = parser.parse_args()
+
+    report = run(args.scale, args.rounds, args.seed, args.data_dir, args.target)
+    baseline = None if args.save_baseline or not os.path.exists(args.baseline) else load_baseline(args.baseline)
+
+    print(f"{'scale':<7}{'target':<32}{'median':>10}{'p95':>10}{'baseline':>10}")
+    for scale, result in report['scales'].items():
+        previous = (baseline or {}).get('scales', {}).get(scale, {}).get('targets', {})
+        for name, timing in result['targets'].items():
+            before = previous.get(name, {}).get('median_ms', '-')
+            print(f"{scale:<7}{name:<32}{timing['median_ms']:>10}{timing['p95_ms']:>10}{before:>10}")
+
+    if args.save_baseline:
+        save_baseline(report, args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+    for scale, name, before, after in regressions:
+        print(f"REGRESSION {scale} {name}: {before}ms -> {after}ms")
+    if regressions:
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
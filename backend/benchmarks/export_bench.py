@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.db_bench import SCALES, DEFAULT_DATA_DIR, dataset_path
+from data_export import EXPORT_TABLES, export_stream
+from datagen import user_id_for
+
+# Streams every generated user's export in each format and reports rows/sec
+# and the peak Python memory of one export, per scale. Throughput should hold
+# and peak memory stay flat as the scales grow; a rising peak means something
+# is buffering the history.
+#
+#   cd backend && python -m benchmarks.export_bench --scale 1k --scale 1m
+#
+# Peak memory is measured with tracemalloc on a separate pass, since tracing
+# slows the encoders down.
+
+FORMATS = {
+    'ndjson': {'fmt': 'ndjson'},
+    'ndjson.zip': {'fmt': 'ndjson', 'zipped': True},
+    'csv.zip': {'fmt': 'csv', 'zipped': True}
+}
+
+
+def drain(db_path, user_id, **options):
+    """Bytes streamed by one export"""
+    return sum(len(chunk) for chunk in export_stream(db_path, user_id, **options))
+
+
+def count_user_rows(db_path, user_id):
+    with sqlite3.connect(db_path) as conn:
+        return sum(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id = ?", (user_id,)).fetchone()[0]
+                   for table in EXPORT_TABLES)
+
+
+def run_scale(scale, seed=0, data_dir=DEFAULT_DATA_DIR, batch_rows=None):
+    """Throughput and peak memory per format for one scale"""
+    db_path = dataset_path(scale, seed, data_dir)
+    user_ids = [user_id_for(index) for index in range(SCALES[scale]['users'])]
+    rows = sum(count_user_rows(db_path, user_id) for user_id in user_ids)
+    results = {}
+    for label, options in FORMATS.items():
+        start = time.perf_counter()
+        size = sum(drain(db_path, user_id, batch_rows=batch_rows, **options) for user_id in user_ids)
+        seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        drain(db_path, user_ids[0], batch_rows=batch_rows, **options)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[label] = {'rows': rows, 'bytes': size, 'seconds': round(seconds, 4),
+                          'rows_per_sec': round(rows / seconds) if seconds else 0, 'peak_kib': round(peak / 1024, 1)}
+    return {'users': len(user_ids), 'rows_per_user': round(rows / len(user_ids)), 'formats': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure export throughput and memory per scale")
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-rows', type=int)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--output', help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    report = {scale: run_scale(scale, args.seed, args.data_dir, args.batch_rows) for scale in args.scale or ['1k', '100k']}
+    print(f"{'scale':<8}{'format':<12}{'rows/user':>10}{'rows/sec':>11}{'MiB':>9}{'peak KiB':>10}")
+    for scale, result in report.items():
+        for label, figures in result['formats'].items():
+            print(f"{scale:<8}{label:<12}{result['rows_per_user']:>10}{figures['rows_per_sec']:>11}"
+                  f"{figures['bytes'] / 2 ** 20:>9.1f}{figures['peak_kib']:>10}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
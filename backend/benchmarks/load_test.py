@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from datetime import date
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import database
+import nutrition_utils
+from benchmarks.db_bench import SCALES, DEFAULT_DATA_DIR, dataset_path
+from benchmarks.nutrition_bench import summarize
+from datagen import DEFAULT_PASSWORD
+from fake_fdc import FakeFdcServer
+from fitness_utils import WORKOUT_CATALOG
+from nutrition_utils import COMMON_FOODS
+
+# HTTP load generator for the Flask API. Virtual users log in as generated
+# users and loop over journeys that mirror the React pages (nutrition, fitness,
+# vitals, friends), each from its own thread with a keep-alive session.
+# Latency percentiles, throughput and error rate are reported per endpoint.
+#
+#   cd backend && python -m benchmarks.load_test --users 16 --duration 30
+#   cd backend && python -m benchmarks.load_test --base-url http://127.0.0.1:5001 --users 32
+#
+# Without --base-url the app is served in-process on a copy of a datagen
+# dataset, with USDA calls going to the local fake FDC server, so nothing
+# touches the network. With --base-url the target server must already have
+# the generated users loaded (python datagen.py --db <its database>).
+
+# Relative weights; roughly how often each page is opened
+JOURNEY_WEIGHTS = {'nutrition': 4, 'fitness': 3, 'vitals': 2, 'friends': 2}
+
+VITAL_VALUES = {
+    'water': lambda rng: {'amount': rng.choice([8, 12, 16]), 'unit': 'oz'},
+    'steps': lambda rng: {'count': rng.randint(500, 4000)},
+    'mood': lambda rng: {'rating': rng.randint(1, 5), 'note': ''},
+    'weight': lambda rng: {'pounds': round(rng.uniform(120, 220), 1)}
+}
+
+
+class VirtualUser:
+    """One simulated client: a logged-in user walking through journeys"""
+
+    def __init__(self, client, base_url, username, rng, recorder, think_seconds=0.0):
+        self.client = client
+        self.base_url = base_url
+        self.username = username
+        self.rng = rng
+        self.recorder = recorder
+        self.think_seconds = think_seconds
+        self.user_id = None
+        self.friend_ids = []
+
+    def post(self, path, payload):
+        """POST JSON, recording latency and outcome under the path; returns parsed JSON or None"""
+        start = time.perf_counter()
+        try:
+            response = self.client.post(self.base_url + path, json=payload, timeout=30)
+            failed = response.status_code >= 400
+            body = None if failed else response.json()
+        except (requests.RequestException, ValueError):
+            failed, body = True, None
+        self.recorder.record(path, (time.perf_counter() - start) * 1000, failed)
+        if self.think_seconds:
+            time.sleep(self.rng.uniform(0, 2 * self.think_seconds))
+        return body
+
+    def login(self):
+        body = self.post('/api/login', {'username': self.username, 'password': DEFAULT_PASSWORD})
+        if not body:
+            return False
+        self.user_id = body['user_id']
+        friends = self.post('/api/get_friends', {'user_id': self.user_id}) or []
+        self.friend_ids = [friend['id'] for friend in friends]
+        return True
+
+    def nutrition(self):
+        """Type a food name into autocomplete, search it, add it to a meal, refresh progress"""
+        name = self.rng.choice(sorted(COMMON_FOODS))
+        for length in range(2, min(len(name), 6) + 1):
+            self.post('/api/search_food_autocomplete', {'user_id': self.user_id, 'query': name[:length]})
+        results = self.post('/api/search_food', {'user_id': self.user_id, 'query': name}) or []
+        food = results[0] if results else dict(COMMON_FOODS[name], name=name)
+        self.post('/api/add_food_to_meal', {
+            'user_id': self.user_id,
+            'meal_type': self.rng.choice(['breakfast', 'lunch', 'dinner', 'snacks']),
+            'food_data': {
+                'name': food.get('name', name), 'calories': food.get('calories', 0),
+                'protein': food.get('protein', 0), 'carbohydrates': food.get('carbohydrates', 0),
+                'fat': food.get('fat', 0), 'quantity': 1, 'serving_size': food.get('serving', '1 serving'),
+                'source': food.get('source', 'custom')
+            }
+        })
+        self.post('/get_meal_progress', {'user_id': self.user_id})
+
+    def fitness(self):
+        """Load recommendations, complete a workout, reload the dashboards"""
+        self.post('/api/get_workout_recommendations', {'user_id': self.user_id})
+        record = self.rng.choice(WORKOUT_CATALOG.records)
+        self.post('/api/complete_workout', {'user_id': self.user_id, 'workout_data': {
+            'name': record.name, 'type': record.workout_type or 'general', 'duration': record.duration or 30,
+            'intensity': record.intensity or 'moderate', 'date_completed': date.today().isoformat()
+        }})
+        self.post('/api/get_fitness_dashboard', {'user_id': self.user_id})
+        self.post('/api/get_dashboard_data', {'user_id': self.user_id})
+
+    def vitals(self):
+        """Log a metric, then load today's logs and the chart for it"""
+        metric = self.rng.choice(sorted(VITAL_VALUES))
+        self.post('/api/vitals/log', {'user_id': self.user_id, 'metric_type': metric,
+                                      'value_data': VITAL_VALUES[metric](self.rng)})
+        self.post('/api/vitals/get_today_logs', {'user_id': self.user_id, 'metric_type': metric})
+        self.post('/api/vitals/get_chart_data', {'user_id': self.user_id, 'metric_type': metric,
+                                                 'range_key': self.rng.choice(['1w', '1m', '1y'])})
+
+    def friends(self):
+        """Load the feed and leaderboard, open a conversation and reply"""
+        self.post('/api/get_friend_activities', {'user_id': self.user_id})
+        self.post('/api/get_friends_leaderboard', {'user_id': self.user_id,
+                                                   'metric': self.rng.choice(['streak', 'workouts'])})
+        if self.friend_ids:
+            friend_id = self.rng.choice(self.friend_ids)
+            self.post('/api/get_messages', {'user_id': self.user_id, 'friend_id': friend_id})
+            self.post('/api/send_message', {'user_id': self.user_id, 'friend_id': friend_id,
+                                            'content': 'Nice work today!'})
+
+    def run(self, deadline, iterations=None):
+        """Pick weighted journeys until the deadline or iteration count is reached"""
+        if not self.login():
+            return
+        names = sorted(JOURNEY_WEIGHTS)
+        weights = [JOURNEY_WEIGHTS[name] for name in names]
+        completed = 0
+        while time.monotonic() < deadline and (iterations is None or completed < iterations):
+            getattr(self, self.rng.choices(names, weights)[0])()
+            completed += 1
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and error collection"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, path, ms, failed):
+        with self._lock:
+            self.latencies[path].append(ms)
+            self.errors[path] += failed
+
+    def report(self, elapsed):
+        """summarize() per endpoint plus an overall row, with error rates"""
+        with self._lock:
+            endpoints = {}
+            for path in sorted(self.latencies):
+                endpoints[path] = summarize(self.latencies[path], self.errors[path], elapsed)
+            everything = [ms for values in self.latencies.values() for ms in values]
+            overall = summarize(everything, sum(self.errors.values()), elapsed)
+        for summary in [*endpoints.values(), overall]:
+            summary['error_rate'] = round(summary['errors'] / summary['requests'], 4) if summary['requests'] else 0.0
+        return endpoints, overall
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def serve_app(stack, scale, seed, data_dir, usda_latency_ms):
+    """Serve app.py in-process on a scratch dataset; returns its base URL"""
+    import app as app_module
+
+    scratch = os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), 'load_test.db')
+    shutil.copyfile(dataset_path(scale, seed, data_dir), scratch)
+
+    fdc = stack.enter_context(FakeFdcServer(latency_ms=usda_latency_ms, jitter_ms=usda_latency_ms / 2, seed=seed))
+    for target, name, value in [
+        (database, 'DB_PATH', scratch), (app_module, 'DB_PATH', scratch),
+        (nutrition_utils, 'USDA_API_KEY', 'load-test'),
+        (nutrition_utils, 'USDA_SEARCH_URL', f"{fdc.base_url}/foods/search"),
+        (nutrition_utils, 'USDA_FOOD_URL', f"{fdc.base_url}/food")
+    ]:
+        stack.enter_context(patch.object(target, name, value))
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True, request_handler=_QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, name='load-test-app', daemon=True)
+    thread.start()
+    stack.callback(thread.join)
+    stack.callback(server.shutdown)
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def run(base_url=None, users=8, duration=10.0, iterations=None, think_ms=0, scale='1k', seed=0,
+        data_dir=DEFAULT_DATA_DIR, usda_latency_ms=20):
+    """Drive the API with users concurrent virtual users; returns a report dict"""
+    recorder = Recorder()
+    with ExitStack() as stack:
+        if base_url is None:
+            base_url = serve_app(stack, scale, seed, data_dir, usda_latency_ms)
+        population = SCALES[scale]['users']
+
+        def virtual_user(number):
+            rng = random.Random(seed * 100003 + number)
+            with requests.Session() as client:
+                user = VirtualUser(client, base_url, f"synth_user_{number % population}", rng,
+                                   recorder, think_ms / 1000)
+                user.run(deadline, iterations)
+
+        start = time.perf_counter()
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=virtual_user, args=(n,), name=f'vu-{n}') for n in range(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    endpoints, overall = recorder.report(elapsed)
+    return {
+        'config': {'base_url': base_url, 'users': users, 'duration': duration, 'iterations': iterations,
+                   'think_ms': think_ms, 'scale': scale, 'seed': seed, 'usda_latency_ms': usda_latency_ms},
+        'elapsed_seconds': round(elapsed, 2),
+        'overall': overall,
+        'endpoints': endpoints
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Flask API with page-shaped user journeys")
+    parser.add_argument('--base-url', help="running server to test; default serves app.py in-process")
+    parser.add_argument('--users', type=int, default=8, help="concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run")
+    parser.add_argument('--iterations', type=int, help="stop each user after this many journeys")
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between requests")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k', help="dataset for the in-process server")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--usda-latency-ms', type=float, default=20, help="fake FDC latency for the in-process server")
+    parser.add_argument('--output', help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    report = run(args.base_url, args.users, args.duration, args.iterations, args.think_ms, args.scale,
+                 args.seed, args.data_dir, args.usda_latency_ms)
+
+    print(f"{'endpoint':<36}{'reqs':>7}{'rps':>8}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for path, summary in [*report['endpoints'].items(), ('TOTAL', report['overall'])]:
+        print(f"{path:<36}{summary['requests']:>7}{summary['throughput_rps']:>8}"
+              f"{summary['error_rate'] * 100:>7.1f}{summary['p50_ms']:>9}{summary['p95_ms']:>9}{summary['p99_ms']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
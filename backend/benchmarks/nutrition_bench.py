@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nutrition_utils
+from fake_fdc import FakeFdcServer
+from nutrition_utils import (
+    COMMON_FOODS, search_food_autocomplete_with_warnings, search_food_comprehensive_with_warnings,
+    get_meal_suggestions
+)
+
+# Drives the food search and suggestion paths against the local fake FDC
+# server at a fixed concurrency and reports latency percentiles per target.
+#
+#   cd backend && python -m benchmarks.nutrition_bench --latency-ms 80 --jitter-ms 40 --concurrency 16
+
+RESTRICTIONS = [[], [], ['vegetarian'], ['gluten_free'], ['vegan', 'nut_free']]
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner', 'snacks']
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors, elapsed):
+    """Count, throughput and p50/p95/p99 (ms) for one target"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0
+    }
+
+
+def make_targets(rng):
+    """name -> zero-argument callable issuing one randomized request"""
+    names = sorted(COMMON_FOODS)
+    words = sorted({word for name in names for word in name.split() if len(word) > 2})
+
+    def autocomplete():
+        word = rng.choice(words)
+        return search_food_autocomplete_with_warnings(word[:rng.randint(3, len(word))], rng.choice(RESTRICTIONS))
+
+    def comprehensive():
+        return search_food_comprehensive_with_warnings(rng.choice(names), rng.choice(RESTRICTIONS))
+
+    def suggestions():
+        return get_meal_suggestions(rng.choice(MEAL_TYPES), max_results=15, user_restrictions=rng.choice(RESTRICTIONS))
+
+    return {
+        'search_food_autocomplete_with_warnings': autocomplete,
+        'search_food_comprehensive_with_warnings': comprehensive,
+        'get_meal_suggestions': suggestions
+    }
+
+
+def run_target(call, requests, concurrency):
+    """Issue requests calls from concurrency threads; returns (latencies ms, errors, elapsed s)"""
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            call()
+            failed = False
+        except Exception:
+            failed = True
+        return (time.perf_counter() - start) * 1000, failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    return [ms for ms, _ in results], sum(failed for _, failed in results), elapsed
+
+
+def run(requests=200, concurrency=8, latency_ms=50, jitter_ms=25, error_rate=0.0, seed=0, targets=None):
+    """Benchmark each target against a fresh fake server; returns a report dict"""
+    rng = random.Random(seed)
+    report = {
+        'config': {
+            'requests': requests, 'concurrency': concurrency, 'latency_ms': latency_ms,
+            'jitter_ms': jitter_ms, 'error_rate': error_rate, 'seed': seed
+        },
+        'targets': {}
+    }
+
+    with FakeFdcServer(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate, seed=seed) as server:
+        with patch.object(nutrition_utils, 'USDA_API_KEY', 'benchmark'), \
+             patch.object(nutrition_utils, 'USDA_SEARCH_URL', f"{server.base_url}/foods/search"), \
+             patch.object(nutrition_utils, 'USDA_FOOD_URL', f"{server.base_url}/food"):
+            for name, call in make_targets(rng).items():
+                if targets and name not in targets:
+                    continue
+                call()  # warm-up: loads the meal pool, opens connections
+                server.reset_stats()
+                latencies, errors, elapsed = run_target(call, requests, concurrency)
+                summary = summarize(latencies, errors, elapsed)
+                summary['upstream'] = dict(server.requests)
+                report['targets'][name] = summary
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark food search against the fake FDC server")
+    parser.add_argument('--requests', type=int, default=200, help="calls per target")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=25)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', action='append', help="only run this target (repeatable)")
+    parser.add_argument('--output', help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    report = run(args.requests, args.concurrency, args.latency_ms, args.jitter_ms,
+                 args.error_rate, args.seed, args.target)
+
+    print(f"{'target':<42}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'upstream':>10}")
+    for name, summary in report['targets'].items():
+        upstream = summary['upstream']['search'] + summary['upstream']['food']
+        print(f"{name:<42}{summary['throughput_rps']:>8}{summary['p50_ms']:>9}"
+              f"{summary['p95_ms']:>9}{summary['p99_ms']:>9}{upstream:>10}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+import json_response
+from benchmarks.db_bench import SCALES, DEFAULT_DATA_DIR, dataset_path
+from datagen import user_id_for
+from flask.json.provider import DefaultJSONProvider
+from json_response import OrjsonProvider, compact_payload, compress
+
+# Measures what the response layer saves on the largest payloads: stdlib json
+# vs orjson serialization time, full vs compact schema size, and gzip/brotli
+# size and compression time, per endpoint, on a generated dataset.
+#
+#   cd backend && python -m benchmarks.response_bench --scale 100k
+#
+# Payloads are captured from the real endpoints through the Flask test client,
+# before serialization, so the encoders see the same Python objects jsonify does.
+
+ENDPOINTS = {
+    '/api/get_fitness_dashboard': lambda user_id: {'user_id': user_id},
+    '/api/get_workout_history': lambda user_id: {'user_id': user_id, 'days_back': 90},
+    '/api/get_daily_history': lambda user_id: {'user_id': user_id, 'days_back': 30},
+    '/api/vitals/get_chart_data': lambda user_id: {'user_id': user_id, 'metric_type': 'weight', 'range_key': '1y'},
+    '/api/get_dashboard_data': lambda user_id: {'user_id': user_id}
+}
+
+
+class _CapturingProvider(OrjsonProvider):
+    """Keeps the last object handed to jsonify"""
+
+    def response(self, *args, **kwargs):
+        self.captured = self._prepare_response_obj(args, kwargs)
+        return super().response(*args, **kwargs)
+
+
+def median_ms(call, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 4)
+
+
+def capture_payloads(scale, seed=0, data_dir=DEFAULT_DATA_DIR, user_index=0):
+    """path -> the object each endpoint passes to jsonify, for one generated user"""
+    import app as app_module
+
+    scratch = os.path.join(tempfile.mkdtemp(), 'response_bench.db')
+    shutil.copyfile(dataset_path(scale, seed, data_dir), scratch)
+    provider = _CapturingProvider(app_module.app)
+    user_id = user_id_for(user_index % SCALES[scale]['users'])
+    payloads = {}
+    try:
+        with patch.object(database, 'DB_PATH', scratch), patch.object(app_module, 'DB_PATH', scratch), \
+             patch.object(app_module.app, 'json', provider), app_module.app.test_client() as client:
+            for path, make_body in ENDPOINTS.items():
+                response = client.post(path, json=make_body(user_id))
+                if response.status_code == 200:
+                    payloads[path] = provider.captured
+    finally:
+        shutil.rmtree(os.path.dirname(scratch))
+    return payloads
+
+
+def measure(payload, provider, stdlib, rounds):
+    """Encoding time and size figures for one payload"""
+    body = provider.encode(payload)
+    result = {
+        'bytes': len(body),
+        'compact_bytes': len(provider.encode(compact_payload(payload))),
+        'stdlib_ms': median_ms(lambda: stdlib.dumps(payload, separators=(',', ':')).encode(), rounds),
+        'orjson_ms': median_ms(lambda: provider.encode(payload), rounds)
+    }
+    encodings = ['gzip'] + (['br'] if json_response.brotli is not None else [])
+    for encoding in encodings:
+        result[f'{encoding}_bytes'] = len(compress(body, encoding))
+        result[f'{encoding}_ms'] = median_ms(lambda: compress(body, encoding), rounds)
+    return result
+
+
+def run(scale='100k', rounds=50, seed=0, data_dir=DEFAULT_DATA_DIR):
+    """Measure every endpoint's payload; returns a report dict"""
+    import app as app_module
+
+    provider = OrjsonProvider(app_module.app)
+    stdlib = DefaultJSONProvider(app_module.app)
+    payloads = capture_payloads(scale, seed, data_dir)
+    return {
+        'config': {'scale': scale, 'rounds': rounds, 'seed': seed,
+                   'orjson': json_response.orjson is not None, 'brotli': json_response.brotli is not None},
+        'endpoints': {path: measure(payload, provider, stdlib, rounds) for path, payload in payloads.items()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure serialization and compression savings per endpoint")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='100k')
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--output', help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    report = run(args.scale, args.rounds, args.seed, args.data_dir)
+    print(f"{'endpoint':<30}{'bytes':>9}{'compact':>9}{'gzip':>8}{'br':>8}{'stdlib ms':>11}{'orjson ms':>11}{'gzip ms':>9}")
+    for path, result in report['endpoints'].items():
+        print(f"{path:<30}{result['bytes']:>9}{result['compact_bytes']:>9}{result['gzip_bytes']:>8}"
+              f"{result.get('br_bytes', '-'):>8}{result['stdlib_ms']:>11}{result['orjson_ms']:>11}{result['gzip_ms']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from log_utils import get_logger
+
+# Guards calls to a slow or flaky upstream (the USDA API). Recent calls are
+# kept in a sliding window; when too many of them failed or ran slow the
+# breaker opens and callers fail fast to their fallback instead of waiting on
+# timeouts. After a cool-down a limited number of probe calls are let through
+# (half-open): a healthy probe closes the breaker, a bad one re-opens it.
+#
+# latency_budget() bounds the total time a request may spend upstream across
+# all of its calls; each call's timeout is clipped to what is left.
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+logger = get_logger(__name__)
+
+_budget = threading.local()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the breaker is open"""
+
+
+class LatencyBudgetExceeded(Exception):
+    """Raised instead of calling the upstream once the request's time budget is spent"""
+
+
+@contextmanager
+def latency_budget(seconds):
+    """Limit upstream time for the enclosed block; nested budgets keep the earlier deadline"""
+    previous = getattr(_budget, 'deadline', None)
+    deadline = time.monotonic() + seconds
+    _budget.deadline = deadline if previous is None else min(previous, deadline)
+    try:
+        yield
+    finally:
+        _budget.deadline = previous
+
+
+def budget_remaining():
+    """Seconds left in the current latency budget, or None outside of one"""
+    deadline = getattr(_budget, 'deadline', None)
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def call_timeout(default):
+    """Timeout for the next upstream call: default, clipped to the remaining budget"""
+    remaining = budget_remaining()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise LatencyBudgetExceeded("Latency budget spent")
+    return min(default, remaining)
+
+
+class CircuitBreaker:
+    """Failure- and latency-rate circuit breaker with half-open probing"""
+
+    def __init__(self, name, failure_rate=0.5, slow_call_seconds=2.0, window=20, min_calls=5,
+                 open_seconds=30.0, half_open_probes=1, clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # True for a failed or slow call
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes = 0
+
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def _advance(self):
+        """Move an open breaker to half-open once the cool-down has passed"""
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+
+    def _transition(self, state):
+        logger.warning("Circuit %s: %s -> %s", self.name, self._state, state)
+        self._state = state
+        self._probes = 0
+        if state == OPEN:
+            self._opened_at = self._clock()
+            self.opened += 1
+        elif state == CLOSED:
+            self._outcomes.clear()
+
+    def allow(self):
+        """Reserve a call slot; False means fail fast"""
+        with self._lock:
+            self._advance()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, duration, failed=False):
+        """Record the outcome of a call made after allow()"""
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            self.calls += 1
+            self.failures += failed
+            self.slow_calls += slow and not failed
+            bad = failed or slow
+
+            if self._state == HALF_OPEN:
+                self._transition(OPEN if bad else CLOSED)
+                return
+            if self._state != CLOSED:
+                return
+
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= self.min_calls:
+                if sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                    self._transition(OPEN)
+
+    def release(self):
+        """Give back a slot from allow() whose call says nothing about upstream health"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def call(self, func, *args, **kwargs):
+        """Run func through the breaker, raising CircuitOpenError when it is open"""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(time.monotonic() - start, failed=True)
+            raise
+        self.record(time.monotonic() - start)
+        return result
+
+    def reset(self):
+        """Close the breaker and forget recent calls and counters"""
+        with self._lock:
+            self._state = CLOSED
+            self._outcomes.clear()
+            self._opened_at = None
+            self._probes = 0
+            self.calls = self.failures = self.slow_calls = self.rejected = self.opened = 0
+
+    def stats(self):
+        """Breaker state and call counters"""
+        with self._lock:
+            self._advance()
+            window = len(self._outcomes)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'calls': self.calls,
+                'failures': self.failures,
+                'slow_calls': self.slow_calls,
+                'rejected': self.rejected,
+                'times_opened': self.opened,
+                'window_calls': window,
+                'window_bad_rate': round(sum(self._outcomes) / window, 4) if window else 0.0,
+                'open_for_seconds': (round(self._clock() - self._opened_at, 1)
+                                     if self._state == OPEN else 0.0)
+            }
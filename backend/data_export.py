@@ -0,0 +1,227 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+
+from log_utils import get_logger
+from request_metrics import Counter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Streaming export of a user's full history for /api/export.
+#
+# Rows are read with fetchmany in batches of NUTRIFIT_EXPORT_BATCH_ROWS and
+# each batch is encoded and yielded before the next is read, so memory stays
+# flat however long the history is. Every table is read in the order of an
+# index that starts with user_id, so SQLite never sorts a user's rows in a
+# temp B-tree either. All tables come from one read transaction, i.e. one
+# snapshot; under WAL (init_database) that doesn't block writers.
+#
+# Formats: NDJSON, one object per row tagged with its table, or CSV, one file
+# per table with a header line. Either can be zipped; CSV of more than one
+# table must be, since the files can't share a header. Rows and seconds per
+# export are counted on /metrics, so rate(rows) / rate(seconds) is rows/sec.
+#
+#   curl 'localhost:5001/api/export?user_id=<id>&format=csv&zip=1' -o export.zip
+#   cd backend && python -m benchmarks.export_bench --scale 100k
+#
+# Environment:
+#   NUTRIFIT_EXPORT_BATCH_ROWS  rows fetched and encoded per chunk (default 500)
+#   NUTRIFIT_EXPORT_ZIP_LEVEL   deflate level for zipped exports, 1-9 (default 6)
+
+logger = get_logger(__name__)
+
+# table -> ORDER BY matching its user_id index
+EXPORT_TABLES = {
+    'meal_history': 'day_number, id',
+    'daily_nutrition': 'day_number',
+    'workout_sessions': 'date_completed, id',
+    'exercise_performance': 'id',
+    'vitals_data': 'date_logged, id'
+}
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+BATCH_ROWS = int(os.getenv("NUTRIFIT_EXPORT_BATCH_ROWS", "500"))
+ZIP_LEVEL = int(os.getenv("NUTRIFIT_EXPORT_ZIP_LEVEL", "6"))
+
+
+def parse_tables(value):
+    """List of export tables from a comma-separated string or a list; all of them when empty"""
+    if not value:
+        return list(EXPORT_TABLES)
+    tables = value.split(',') if isinstance(value, str) else list(value)
+    tables = [str(table).strip() for table in tables if str(table).strip()]
+    unknown = [table for table in tables if table not in EXPORT_TABLES]
+    if unknown:
+        raise ValueError(f"Unknown export table(s): {', '.join(unknown)}")
+    return list(dict.fromkeys(tables))
+
+
+def check_export(fmt, tables, zipped):
+    """Raise ValueError unless fmt, tables and zipped describe a streamable export"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt == 'csv' and len(tables) > 1 and not zipped:
+        raise ValueError("CSV exports of more than one table must be zipped")
+
+
+def export_mimetype(fmt, zipped):
+    return 'application/zip' if zipped else EXPORT_FORMATS[fmt]
+
+
+def export_filename(fmt, tables, zipped, today):
+    """Download name for an export made on today"""
+    name = tables[0] if fmt == 'csv' and len(tables) == 1 else 'nutrifit_export'
+    return f"{name}_{today.isoformat()}.{'zip' if zipped else fmt}"
+
+
+def select_rows(conn, table, user_id):
+    """Cursor over user_id's rows in table, in index order"""
+    return conn.execute(
+        f"SELECT * FROM {table} WHERE user_id = ? ORDER BY {EXPORT_TABLES[table]}", (str(user_id),))
+
+
+def iter_batches(cursor, batch_rows):
+    """Successive fetchmany batches from cursor"""
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            return
+        yield rows
+
+
+def _ndjson_line(record):
+    if orjson is not None:
+        return orjson.dumps(record, default=str, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(record, default=str, separators=(',', ':')).encode() + b"\n"
+
+
+def _ndjson_chunks(conn, user_id, tables, batch_rows, counts):
+    for table in tables:
+        cursor = select_rows(conn, table, user_id)
+        columns = [description[0] for description in cursor.description]
+        for rows in iter_batches(cursor, batch_rows):
+            counts[table] += len(rows)
+            yield b''.join(_ndjson_line({'table': table, **dict(zip(columns, row))}) for row in rows)
+
+
+def _csv_chunks(conn, user_id, table, batch_rows, counts):
+    cursor = select_rows(conn, table, user_id)
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(description[0] for description in cursor.description)
+    for rows in iter_batches(cursor, batch_rows):
+        counts[table] += len(rows)
+        writer.writerows(rows)
+        yield text.getvalue().encode()
+        text.seek(0)
+        text.truncate()
+    if text.tell():
+        yield text.getvalue().encode()  # header of a table with no rows
+
+
+class _ChunkSink:
+    """Write-only file the zip writer fills and the stream drains; unseekable, so zipfile streams"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_chunks(members):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, compresslevel=ZIP_LEVEL) as archive:
+        for name, chunks in members:
+            with archive.open(name, 'w', force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_stream(db_path, user_id, fmt='ndjson', tables=None, zipped=False, batch_rows=None):
+    """Generator of the export's bytes; raises ValueError now, before any row is read, if it's invalid"""
+    tables = parse_tables(tables)
+    check_export(fmt, tables, zipped)
+    return _export(db_path, user_id, fmt, tables, zipped, batch_rows or BATCH_ROWS)
+
+
+def _export(db_path, user_id, fmt, tables, zipped, batch_rows):
+    counts = dict.fromkeys(tables, 0)
+    start = time.perf_counter()
+    # A server may pull each chunk on a different thread (asgi.py's WSGI executor); only one pulls at a time
+    conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    try:
+        conn.execute("BEGIN")  # one snapshot across tables
+        if fmt == 'ndjson':
+            members = [('nutrifit_export.ndjson', _ndjson_chunks(conn, user_id, tables, batch_rows, counts))]
+        else:
+            members = [(f"{table}.csv", _csv_chunks(conn, user_id, table, batch_rows, counts)) for table in tables]
+
+        if zipped:
+            for data in _zip_chunks(members):
+                if data:
+                    yield data
+        else:
+            for _, chunks in members:
+                yield from chunks
+    finally:
+        conn.close()
+        seconds = time.perf_counter() - start
+        label = f"{fmt}.zip" if zipped else fmt
+        EXPORT_STATS.record(label, counts, seconds)
+        rows = sum(counts.values())
+        logger.info("Exported %d rows for user %s as %s in %.3fs (%.0f rows/s)",
+                    rows, user_id, label, seconds, rows / seconds if seconds else 0)
+
+
+class ExportStats:
+    """Export counters for /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.exports = Counter('nutrifit_export_streams_total', 'Exports streamed', ('format',))
+            self.rows = Counter('nutrifit_export_rows_total', 'Rows streamed by exports', ('table', 'format'))
+            self.seconds = Counter('nutrifit_export_seconds_total', 'Time spent streaming exports', ('format',))
+
+    def record(self, label, counts, seconds):
+        with self._lock:
+            self.exports.inc((label,))
+            for table, rows in counts.items():
+                self.rows.inc((table, label), rows)
+            self.seconds.inc((label,), round(seconds, 6))
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.exports, self.rows, self.seconds):
+                lines.extend(metric.render())
+            return lines
+
+
+EXPORT_STATS = ExportStats()
@@ -2,8 +2,19 @@ import sqlite3
 import json
 import os
 import sys
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import hashlib
+import time
+from streak_utils import advance_workout_streak, rebuild_workout_streak, read_workout_streak
+from app_cache import invalidate_tags
+from job_queue import JOBS, create_jobs_table, job
+from exercise_analytics import (
+    create_exercise_stats_table, has_new_sets, read_exercise_stats, update_exercise_stats
+)
+from recommendation_cache import invalidate_user_recommendations
+from dislike_matcher import invalidate_dislike_matcher
+from log_utils import get_logger
+from request_metrics import connection_factory
 
 # Fix Unicode emoji print statements crashing on Windows (cp1252 console)
 if sys.stdout.encoding and sys.stdout.encoding.lower() != 'utf-8':
@@ -11,13 +22,19 @@ if sys.stdout.encoding and sys.stdout.encoding.lower() != 'utf-8':
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "nutrifit.db")
 
+logger = get_logger(__name__)
+
+def connect(db_path, **kwargs):
+    """sqlite3 connection for the app's queries; SQL is traced while a request is being recorded"""
+    return sqlite3.connect(db_path, factory=connection_factory(), **kwargs)
+
 def hash_password(password):
     """Hash password with salt"""
     salt = "nutrifit_salt_2024"  # In production, use random salts per user
     return hashlib.sha256((password + salt).encode()).hexdigest()
 
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Add current_day column to users table
@@ -130,6 +147,11 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
         """)
+        
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_meal_history_user_day
+        ON meal_history (user_id, day_number)
+        """)
        
         # Food preferences table
         c.execute("""
@@ -244,9 +266,18 @@ def init_db():
             type TEXT NOT NULL,
             description TEXT,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            source_key TEXT,
             FOREIGN KEY(user_id) REFERENCES users(id)
         )
         """)
+        c.execute("PRAGMA table_info(friend_activities)")
+        if 'source_key' not in [column[1] for column in c.fetchall()]:
+            c.execute("ALTER TABLE friend_activities ADD COLUMN source_key TEXT")
+        # One feed entry per source, however often the job that writes it runs
+        c.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_friend_activities_source
+        ON friend_activities(source_key) WHERE source_key IS NOT NULL
+        """)
 
         # Friend badges/achievements table
         c.execute("""
@@ -290,6 +321,11 @@ def init_db():
         # Migrate existing vitals_data table to remove UNIQUE constraint if it exists
         migrate_vitals_data_table(c)
         
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vitals_data_user_date
+        ON vitals_data (user_id, date_logged)
+        """)
+        
         c.execute("""
         CREATE TABLE IF NOT EXISTS vitals_streaks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -320,8 +356,46 @@ def init_db():
         )
         """)
         
+        # Background jobs (job_queue.py)
+        create_jobs_table(c)
+        
+        # Per-user, per-resource versions behind the read endpoints' ETags
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            user_id TEXT NOT NULL,
+            resource TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (user_id, resource)
+        ) WITHOUT ROWID
+        """)
+        
         conn.commit()
-        print("Database initialized successfully")
+        logger.info("Database initialized successfully")
+
+# Resources with a data version; each write function that changes one bumps it
+DATA_VERSION_RESOURCES = ('profile', 'custom_foods', 'food_preferences', 'custom_workouts', 'custom_metrics', 'friends')
+
+def bump_data_version(conn, user_id, *resources):
+    """Move a user's resources to a new version, in the writer's transaction"""
+    # Seeded from the clock so versions don't repeat if the database is recreated
+    now = time.time_ns()
+    conn.executemany("""
+    INSERT INTO data_versions (user_id, resource, version) VALUES (?, ?, ?)
+    ON CONFLICT(user_id, resource) DO UPDATE SET version = MAX(version + 1, excluded.version)
+    """, [(str(user_id), resource, now) for resource in resources])
+
+def bump_friend_lists(conn, user_id):
+    """New friends-list version for everyone who has user_id as a friend"""
+    for (friend_id,) in conn.execute("SELECT user_id FROM friends WHERE friend_id = ?", (user_id,)).fetchall():
+        bump_data_version(conn, friend_id, 'friends')
+
+def get_data_version(user_id, resource):
+    """Current version of a user's resource (0 if it was never written)"""
+    with connect(DB_PATH) as conn:
+        c = conn.cursor()
+        c.execute("SELECT version FROM data_versions WHERE user_id = ? AND resource = ?", (str(user_id), resource))
+        row = c.fetchone()
+        return row[0] if row else 0
 
 def migrate_vitals_data_table(cursor):
     """Migrate vitals_data table to remove UNIQUE constraint if it exists"""
@@ -343,19 +417,47 @@ def migrate_vitals_data_table(cursor):
                     break
             
             if unique_index_name:
-                print(f"🔄 Removing UNIQUE constraint from vitals_data table: {unique_index_name}")
+                logger.debug("Removing UNIQUE constraint from vitals_data table: %s", unique_index_name)
                 cursor.execute(f"DROP INDEX {unique_index_name}")
-                print("✅ UNIQUE constraint removed successfully")
+                logger.debug("UNIQUE constraint removed successfully")
             else:
-                print("ℹ️ No UNIQUE constraint found on vitals_data table")
+                logger.debug("No UNIQUE constraint found on vitals_data table")
         else:
-            print("ℹ️ vitals_data table doesn't exist yet, no migration needed")
+            logger.debug("vitals_data table doesn't exist yet, no migration needed")
     except Exception as e:
-        print(f"⚠️ Warning: Could not migrate vitals_data table: {e}")
+        logger.warning("Could not migrate vitals_data table: %s", e)
+
+def migrate_custom_workout_plans(cursor):
+    """Move 'Custom:' rows of workout_plans into custom_workouts, keeping their ids"""
+    cursor.execute("""
+    SELECT id, user_id, plan_name, plan_data, is_active, created_at
+    FROM workout_plans
+    WHERE plan_name LIKE 'Custom:%'
+    """)
+    plans = cursor.fetchall()
+    moved = 0
+    for plan_id, user_id, plan_name, plan_data, is_active, created_at in plans:
+        try:
+            workout_data = json.loads(plan_data)
+        except (TypeError, json.JSONDecodeError):
+            logger.warning("Leaving custom workout plan %s in workout_plans: unreadable plan_data", plan_id)
+            continue
+        if not isinstance(workout_data, dict):
+            continue
+        workout_data.setdefault('name', plan_name.replace('Custom: ', '', 1))
+        # A fresh id if another custom workout already has this one
+        cursor.execute("SELECT 1 FROM custom_workouts WHERE id = ?", (plan_id,))
+        workout_id = None if cursor.fetchone() else plan_id
+        insert_custom_workout(cursor, user_id, workout_data, is_active=bool(is_active),
+                              workout_id=workout_id, created_at=created_at)
+        cursor.execute("DELETE FROM workout_plans WHERE id = ?", (plan_id,))
+        moved += 1
+    if moved:
+        logger.info("Migrated %d custom workout plans to custom_workouts", moved)
 
 def init_fitness_tables():
     """Initialize fitness-related database tables"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Existing tables...
@@ -406,6 +508,55 @@ def init_fitness_tables():
         )
         """)
         
+        # User-built workouts; kind separates them from other plans without a name prefix
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS custom_workouts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL DEFAULT 'custom',
+            name TEXT NOT NULL,
+            workout_type TEXT,
+            duration INTEGER,
+            calories_burned INTEGER,
+            intensity TEXT,
+            difficulty_level TEXT,
+            equipment TEXT, -- JSON array
+            muscle_groups TEXT, -- JSON array
+            extra TEXT, -- JSON object of any other workout fields
+            is_active BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """)
+        
+        # NUMERIC keeps values like '8-12' or '60s' as text and numbers as numbers
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS custom_workout_exercises (
+            workout_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            name TEXT,
+            sets NUMERIC,
+            reps NUMERIC,
+            rest NUMERIC,
+            details TEXT, -- JSON object of any other exercise fields
+            PRIMARY KEY (workout_id, position),
+            FOREIGN KEY (workout_id) REFERENCES custom_workouts (id)
+        )
+        """)
+        
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_custom_workouts_user_kind
+        ON custom_workouts (user_id, kind, created_at)
+        """)
+        
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_custom_workout_exercises_name
+        ON custom_workout_exercises (name)
+        """)
+        
+        # Move custom workouts saved as 'Custom:' JSON plans into the tables above
+        migrate_custom_workout_plans(c)
+        
         c.execute("""
         CREATE TABLE IF NOT EXISTS fitness_goals (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -420,6 +571,26 @@ def init_fitness_tables():
         )
         """)
         
+        # Per-user workout streaks, maintained by add_workout_session
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS workout_streaks (
+            user_id TEXT PRIMARY KEY,
+            current_streak INTEGER DEFAULT 0,
+            best_streak INTEGER DEFAULT 0,
+            last_active_date DATE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """)
+        
+        c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_workout_sessions_user_date
+        ON workout_sessions (user_id, date_completed)
+        """)
+        
+        # Per-exercise progression stats (exercise_analytics.py)
+        create_exercise_stats_table(c)
+        
         # NEW TABLE FOR WORKOUT PREFERENCES
         c.execute("""
         CREATE TABLE IF NOT EXISTS workout_preferences (
@@ -477,12 +648,12 @@ def init_fitness_tables():
         """)
         
         conn.commit()
-        print("Fitness and vitals tables initialized successfully")
+        logger.info("Fitness and vitals tables initialized successfully")
 
 
 def get_user_workout_preferences(user_id):
     """Get user's workout preferences (likes/dislikes) - ENHANCED VERSION"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         try:
@@ -498,16 +669,16 @@ def get_user_workout_preferences(user_id):
                 if preference in preferences:
                     preferences[preference].append(workout_name)
             
-            print(f"📊 Retrieved preferences for user {user_id}: {len(preferences['liked'])} liked, {len(preferences['disliked'])} disliked")
+            logger.debug("Retrieved preferences for user %s: %s liked, %s disliked", user_id, len(preferences['liked']), len(preferences['disliked']))
             return preferences
         
         except Exception as e:
-            print(f"❌ Error getting workout preferences: {e}")
+            logger.error("Error getting workout preferences: %s", e)
             return {'liked': [], 'disliked': []}
 
 def remove_workout_preference(user_id, workout_name):
     """Remove a workout preference"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         c.execute("""
@@ -517,13 +688,14 @@ def remove_workout_preference(user_id, workout_name):
         
         removed_count = c.rowcount
         conn.commit()
+        invalidate_user_recommendations(user_id)
         
-        print(f"🗑️ Removed {removed_count} preference(s) for workout '{workout_name}' for user {user_id}")
+        logger.debug("Removed %s preference(s) for workout '%s' for user %s", removed_count, workout_name, user_id)
         return removed_count > 0
 
 def get_all_disliked_workouts(user_id):
     """Get all workouts that the user has disliked - for filtering suggestions"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         try:
@@ -534,16 +706,16 @@ def get_all_disliked_workouts(user_id):
             """, (user_id,))
             
             disliked = [row[0] for row in c.fetchall()]
-            print(f"🚫 User {user_id} has disliked {len(disliked)} workouts")
+            logger.debug("User %s has disliked %s workouts", user_id, len(disliked))
             return disliked
         
         except Exception as e:
-            print(f"❌ Error getting disliked workouts: {e}")
+            logger.error("Error getting disliked workouts: %s", e)
             return []
         
 def get_user_current_day(user_id):
     """Get current day number for user"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("SELECT current_day FROM users WHERE id = ?", (user_id,))
         result = c.fetchone()
@@ -551,7 +723,7 @@ def get_user_current_day(user_id):
 
 def increment_user_day(user_id):
     """Increment user's current day and return new day number"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Get current day
@@ -560,6 +732,7 @@ def increment_user_day(user_id):
        
         # Update user's current day
         c.execute("UPDATE users SET current_day = ? WHERE id = ?", (new_day, user_id))
+        bump_data_version(conn, user_id, 'profile')
        
         conn.commit()
         return new_day
@@ -600,7 +773,7 @@ def get_day_display_info(user_id, target_day=None):
 # Update all existing functions to use day_number instead of date
 def ensure_user_exists(user_id):
     """Ensure user exists in database with default values"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Check if user exists
@@ -620,7 +793,7 @@ def ensure_user_exists(user_id):
 
 def add_food_to_current_meal(user_id, meal_type, food_data):
     """Add a food item to the current meal"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -647,7 +820,7 @@ def add_food_to_current_meal(user_id, meal_type, food_data):
 
 def get_current_meal_items(user_id, meal_type=None):
     """Get current meal items for today"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         if meal_type:
@@ -688,7 +861,7 @@ def update_daily_totals(user_id):
     """Update daily nutrition totals based on current meal items"""
     current_day = get_user_current_day(user_id)
    
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Calculate totals from current meal items
@@ -720,7 +893,7 @@ def get_daily_totals(user_id, target_day=None):
    
     current_day = get_user_current_day(user_id)
    
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # For current day, use current meal items; for past days, use daily_nutrition table
@@ -766,7 +939,7 @@ def save_current_meals_to_history(user_id):
     """Save current meal items to history and clear current meals"""
     current_day = get_user_current_day(user_id)
    
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Copy current meal items to history
@@ -797,7 +970,7 @@ def reset_day(user_id):
     new_day = increment_user_day(user_id)
    
     # Create new daily nutrition record for new day
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("""
         INSERT OR IGNORE INTO daily_nutrition (user_id, day_number)
@@ -812,7 +985,7 @@ def get_daily_history(user_id, days_back=14):
     current_day = get_user_current_day(user_id)
     start_day = max(1, current_day - days_back)
    
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -842,7 +1015,7 @@ def get_daily_data_for_day(user_id, target_day):
     """Get complete daily data for a specific day"""
     current_day = get_user_current_day(user_id)
    
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Get daily totals
@@ -894,7 +1067,7 @@ def get_daily_data_for_day(user_id, target_day):
 # Keep existing functions that don't need major changes
 def create_user(username, password, email=None):
     """Create a new user account"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Check if username already exists
@@ -929,7 +1102,7 @@ def create_user(username, password, email=None):
 
 def authenticate_user(username, password):
     """Authenticate user login"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         password_hash = hash_password(password)
        
@@ -983,7 +1156,7 @@ def calculate_calorie_goals(bmr, activity_level, fitness_goals):
 
 def update_user_profile(user_id, profile_data, partial_update=False):
     """Update user profile with dietary restrictions support"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Get current profile data if doing partial update
@@ -1036,7 +1209,7 @@ def update_user_profile(user_id, profile_data, partial_update=False):
                     fitness_goals
                 )
             except Exception as e:
-                print(f"Error calculating goals: {e}")
+                logger.error("Error calculating goals: %s", e)
                 # Keep existing goals if calculation fails
                 if current_profile:
                     calorie_goal = current_profile.get('calorie_goal')
@@ -1116,12 +1289,16 @@ def update_user_profile(user_id, profile_data, partial_update=False):
             UPDATE user_preferences SET {', '.join(pref_updates)}
             WHERE user_id = ?
             """, pref_values)
+        
+        bump_data_version(conn, user_id, 'profile')
+        bump_friend_lists(conn, user_id)  # friends see this user's name
        
         conn.commit()
+        invalidate_user_recommendations(user_id)
 
 def get_user_profile(user_id):
     """Get complete user profile data - ENHANCED for dietary restrictions"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Get user data including dietary restrictions from both tables
@@ -1165,7 +1342,7 @@ def get_user_profile(user_id):
 
 def get_user_dietary_restrictions(user_id):
     """Get user's dietary restrictions as a list"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Try to get from user_preferences first, then users table
@@ -1187,7 +1364,7 @@ def get_user_dietary_restrictions(user_id):
 
 def update_dietary_restrictions(user_id, restrictions):
     """Update user's dietary restrictions"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         restrictions_json = json.dumps(restrictions) if isinstance(restrictions, list) else restrictions
@@ -1200,12 +1377,13 @@ def update_dietary_restrictions(user_id, restrictions):
         c.execute("""
         UPDATE user_preferences SET dietary_restrictions = ? WHERE user_id = ?
         """, (restrictions_json, user_id))
+        bump_data_version(conn, user_id, 'profile')
         
         conn.commit()
         
 def get_meal_progress(user_id):
     """Get meal progress with current items and smart calorie allocations"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
 
         # Get user's daily calorie goal
@@ -1272,7 +1450,7 @@ def get_meal_progress(user_id):
 
 def remove_food_from_current_meal(user_id, meal_item_id):
     """Remove a food item from the current meal"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -1287,7 +1465,7 @@ def remove_food_from_current_meal(user_id, meal_item_id):
 
 def update_food_preference(user_id, meal_type, food_name, liked):
     """Update food preference (like/dislike)"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         if liked is not None:
@@ -1311,12 +1489,14 @@ def update_food_preference(user_id, meal_type, food_name, liked):
                 INSERT OR IGNORE INTO food_preferences (user_id, meal_type, food_name, preference)
                 VALUES (?, 'global', ?, 'disliked')
                 """, (user_id, food_name))
+            bump_data_version(conn, user_id, 'food_preferences')
            
         conn.commit()
+        invalidate_dislike_matcher(user_id)
 
 def get_user_food_preferences(user_id):
     """Get user's food likes and dislikes"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -1346,7 +1526,7 @@ def get_user_food_preferences(user_id):
 
 def get_globally_disliked_foods(user_id):
     """Get foods that user has globally disliked"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -1359,7 +1539,7 @@ def get_globally_disliked_foods(user_id):
 
 def add_user_custom_food(user_id, food_data):
     """Add a custom food for a user"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -1377,12 +1557,13 @@ def add_user_custom_food(user_id, food_data):
             food_data.get('serving_size', 'serving'),
             json.dumps(food_data.get('available_servings', ['serving']))
         ))
+        bump_data_version(conn, user_id, 'custom_foods')
        
         conn.commit()
 
 def get_user_custom_foods(user_id, search_query=None):
     """Get user's custom foods with optional search"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         if search_query:
@@ -1421,7 +1602,7 @@ def get_meal_history(user_id, target_day, meal_type=None):
     """Get meal history for a specific day and optionally a specific meal"""
     current_day = get_user_current_day(user_id)
    
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         if meal_type:
@@ -1466,7 +1647,7 @@ def get_meal_history_by_day(user_id, target_day):
 
 def add_workout_session(user_id, workout_data):
     """Add a completed workout session"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -1486,6 +1667,8 @@ def add_workout_session(user_id, workout_data):
         ))
        
         workout_session_id = c.lastrowid
+        
+        advance_workout_streak(c, user_id, workout_data.get('date_completed', datetime.now().date()))
        
         # Add exercise performance data if available
         if 'exercises' in workout_data:
@@ -1507,85 +1690,95 @@ def add_workout_session(user_id, workout_data):
                     workout_data.get('date_completed', datetime.now().date()),
                     exercise.get('notes', '')
                 ))
-       
-        # Add activity for workout completion directly to avoid database locking
-        workout_name = workout_data.get('name', 'workout')
-        duration = workout_data.get('duration', 0)
-        c.execute("""
-            INSERT INTO friend_activities (user_id, type, description)
-            VALUES (?, ?, ?)
-        """, (user_id, "workout", f"completed a {duration}-minute {workout_name} session"))
-        
-        # Check for calorie-based badges
-        c.execute("""
-            SELECT COALESCE(SUM(calories_burned), 0) FROM workout_sessions 
+
+        conn.commit()
+        invalidate_tags(f"workouts:{user_id}")
+    
+    # The feed entry and badge checks don't hold up the response
+    enqueue_workout_follow_ups(user_id, workout_session_id, workout_data)
+    return workout_session_id
+
+
+CALORIE_BADGES = [
+    (1000, "Calorie Burner", "Burned 1,000+ calories! You're on fire!"),
+    (5000, "Calorie Crusher", "Burned 5,000+ calories! Incredible dedication!"),
+    (10000, "Calorie Champion", "Burned 10,000+ calories! You're unstoppable!"),
+    (25000, "Calorie Legend", "Burned 25,000+ calories! You're a fitness legend!"),
+    (50000, "Calorie Master", "Burned 50,000+ calories! You're absolutely incredible!"),
+    (100000, "Calorie God", "Burned 100,000+ calories! You're a fitness deity!")
+]
+
+WORKOUT_BADGES = [
+    (5, "Workout Beginner", "Completed 5+ workouts! You're building great habits!"),
+    (10, "Workout Warrior", "Completed 10+ workouts! You're getting stronger!"),
+    (25, "Workout Regular", "Completed 25+ workouts! Consistency is your superpower!"),
+    (50, "Workout Master", "Completed 50+ workouts! You're absolutely dedicated!"),
+    (100, "Workout Legend", "Completed 100+ workouts! You're a fitness legend!"),
+    (250, "Workout Champion", "Completed 250+ workouts! You're unstoppable!")
+]
+
+
+def enqueue_workout_follow_ups(user_id, workout_session_id, workout_data):
+    """Queue the activity feed entry and badge check for a completed workout"""
+    workout_name = workout_data.get('name', 'workout')
+    duration = workout_data.get('duration', 0)
+    JOBS.enqueue('add_user_activity', {'user_id': user_id, 'activity_type': 'workout',
+                                       'description': f"completed a {duration}-minute {workout_name} session",
+                                       'source_key': f"workout_session:{workout_session_id}"})
+    # One waiting check covers any number of workouts logged before it runs
+    JOBS.enqueue('award_workout_badges', {'user_id': user_id}, unique_key=f"workout_badges:{user_id}")
+    if workout_data.get('exercises'):
+        JOBS.enqueue('refresh_exercise_stats', {'user_id': user_id}, unique_key=f"exercise_stats:{user_id}")
+
+
+@job('award_workout_badges')
+def award_workout_badges(user_id):
+    """Award the calorie and workout count badges the user has reached; returns the new badge names"""
+    with connect(DB_PATH) as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT COUNT(*), COALESCE(SUM(calories_burned), 0) FROM workout_sessions
             WHERE user_id = ?
         """, (user_id,))
-        total_calories = c.fetchone()[0] or 0
+        total_workouts, total_calories = c.fetchone()
         
-        # Get existing badges to avoid duplicates
-        c.execute("""
-            SELECT badge FROM friend_badges WHERE user_id = ?
-        """, (user_id,))
-        existing_badges = [row[0] for row in c.fetchall()]
-        
-        # Calorie milestone badges
-        calorie_badges = [
-            (1000, "Calorie Burner", "Burned 1,000+ calories! You're on fire!"),
-            (5000, "Calorie Crusher", "Burned 5,000+ calories! Incredible dedication!"),
-            (10000, "Calorie Champion", "Burned 10,000+ calories! You're unstoppable!"),
-            (25000, "Calorie Legend", "Burned 25,000+ calories! You're a fitness legend!"),
-            (50000, "Calorie Master", "Burned 50,000+ calories! You're absolutely incredible!"),
-            (100000, "Calorie God", "Burned 100,000+ calories! You're a fitness deity!")
-        ]
+        reached = [(name, description) for required, name, description in CALORIE_BADGES
+                   if (total_calories or 0) >= required]
+        reached += [(name, description) for required, name, description in WORKOUT_BADGES
+                    if total_workouts >= required]
         
-        for required_calories, badge_name, description in calorie_badges:
-            if total_calories >= required_calories and badge_name not in existing_badges:
-                c.execute("""
-                    INSERT INTO friend_badges (user_id, badge, description, earned_at)
-                    VALUES (?, ?, ?, ?)
-                """, (user_id, badge_name, description, datetime.now().isoformat()))
-                
+        awarded = []
+        for badge_name, description in reached:
+            # Insert-if-missing in one statement, so a repeated or concurrent run can't award twice
+            c.execute("""
+                INSERT INTO friend_badges (user_id, badge, description, earned_at)
+                SELECT ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM friend_badges WHERE user_id = ? AND badge = ?)
+            """, (user_id, badge_name, description, datetime.now().isoformat(), user_id, badge_name))
+            if c.rowcount:
                 c.execute("""
                     INSERT INTO friend_activities (user_id, type, description)
                     VALUES (?, ?, ?)
                 """, (user_id, "badge", f"earned the '{badge_name}' badge"))
+                awarded.append(badge_name)
         
-        # Progressive workout badges
-        c.execute("""
-            SELECT COUNT(*) FROM workout_sessions 
-            WHERE user_id = ?
-        """, (user_id,))
-        total_workouts = c.fetchone()[0]
-        
-        workout_badges = [
-            (5, "Workout Beginner", "Completed 5+ workouts! You're building great habits!"),
-            (10, "Workout Warrior", "Completed 10+ workouts! You're getting stronger!"),
-            (25, "Workout Regular", "Completed 25+ workouts! Consistency is your superpower!"),
-            (50, "Workout Master", "Completed 50+ workouts! You're absolutely dedicated!"),
-            (100, "Workout Legend", "Completed 100+ workouts! You're a fitness legend!"),
-            (250, "Workout Champion", "Completed 250+ workouts! You're unstoppable!")
-        ]
-        
-        for required_workouts, badge_name, description in workout_badges:
-            if total_workouts >= required_workouts and badge_name not in existing_badges:
-                c.execute("""
-                    INSERT INTO friend_badges (user_id, badge, description, earned_at)
-                    VALUES (?, ?, ?, ?)
-                """, (user_id, badge_name, description, datetime.now().isoformat()))
-                
-                c.execute("""
-                    INSERT INTO friend_activities (user_id, type, description)
-                    VALUES (?, ?, ?)
-                """, (user_id, "badge", f"earned the '{badge_name}' badge"))
-       
         conn.commit()
-        return workout_session_id
+        return awarded
+
 
+def _parse_workout_date(value):
+    """datetime for a date_completed value, or now if it can't be read"""
+    try:
+        if isinstance(value, str) and 'T' in value:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return datetime.strptime(str(value), '%Y-%m-%d')
+    except ValueError as e:
+        logger.warning("Date parsing error for %s: %s", value, e)
+        return datetime.now()  # Fallback
 
 def get_workout_history(user_id, days_back=30):
     """Get user's workout history with proper date handling"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         cutoff_date = datetime.now() - timedelta(days=days_back)
@@ -1597,48 +1790,27 @@ def get_workout_history(user_id, days_back=30):
         WHERE user_id = ? AND date_completed >= ?
         ORDER BY date_completed DESC, created_at DESC
         """, (user_id, cutoff_date.date()))
+        rows = c.fetchall()
        
-        workouts = []
-        for row in c.fetchall():
-            workout_date = row[6]  # date_completed
-            
-            # Handle different date formats
-            if isinstance(workout_date, str):
-                try:
-                    if 'T' in workout_date:
-                        # Handle ISO format
-                        parsed_date = datetime.fromisoformat(workout_date.replace('Z', '+00:00'))
-                    else:
-                        # Handle YYYY-MM-DD format
-                        parsed_date = datetime.strptime(workout_date, '%Y-%m-%d')
-                except ValueError as e:
-                    print(f"Date parsing error for {workout_date}: {e}")
-                    parsed_date = datetime.now()  # Fallback
-            else:
-                try:
-                    parsed_date = datetime.strptime(str(workout_date), '%Y-%m-%d')
-                except:
-                    parsed_date = datetime.now()  # Fallback
-            
-            workouts.append({
-                'id': row[0],
-                'name': row[1],
-                'type': row[2],
-                'duration': row[3],
-                'calories_burned': row[4],
-                'difficulty_level': row[5],
-                'intensity': row[5],  # For compatibility
-                'date': parsed_date,
-                'date_completed': workout_date,
-                'notes': row[7],
-                'created_at': row[8]
-            })
-       
-        return workouts
+        # Many workouts share a day; parse each distinct date once
+        dates = {value: _parse_workout_date(value) for value in {row[6] for row in rows}}
+        return [{
+            'id': row[0],
+            'name': row[1],
+            'type': row[2],
+            'duration': row[3],
+            'calories_burned': row[4],
+            'difficulty_level': row[5],
+            'intensity': row[5],  # For compatibility
+            'date': dates[row[6]],
+            'date_completed': row[6],
+            'notes': row[7],
+            'created_at': row[8]
+        } for row in rows]
 
 def get_exercise_performance_history(user_id, exercise_name=None, days_back=90):
     """Get performance history for exercises"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         cutoff_date = datetime.now() - timedelta(days=days_back)
@@ -1671,9 +1843,39 @@ def get_exercise_performance_history(user_id, exercise_name=None, days_back=90):
        
         return performances
 
+@job('refresh_exercise_stats')
+def refresh_exercise_stats(user_id):
+    """Fold new sets into the user's exercise stats and post any personal records; returns the records"""
+    with connect(DB_PATH) as conn:
+        c = conn.cursor()
+        if not has_new_sets(c, user_id):
+            return []
+        # Take the write lock before reading where the stats left off, so two
+        # refreshes can't both fold in the same sets
+        c.execute("BEGIN IMMEDIATE")
+        records = update_exercise_stats(c, user_id)
+        c.executemany("""
+            INSERT INTO friend_activities (user_id, type, description)
+            VALUES (?, ?, ?)
+        """, [(user_id, "record", f"set a personal record on {r['exercise_name']} "
+                                  f"(estimated 1RM {r['estimated_1rm_lb']:g} lb)") for r in records])
+        conn.commit()
+        return records
+
+def get_exercise_stats(user_id, exercise_name=None):
+    """Per-exercise progression stats, brought up to date first"""
+    refresh_exercise_stats(user_id)
+    with connect(DB_PATH) as conn:
+        return read_exercise_stats(conn.cursor(), user_id, exercise_name)
+
 def save_workout_plan(user_id, plan_name, plan_data):
     """Save a workout plan for the user"""
-    with sqlite3.connect(DB_PATH) as conn:
+    if plan_name.startswith('Custom:'):
+        # Older clients name custom workouts 'Custom: <name>'; they have their own tables now
+        workout_data = dict(plan_data, name=plan_data.get('name') or plan_name.replace('Custom: ', '', 1))
+        return save_custom_workout(user_id, workout_data, is_active=True)
+    
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Insert new plan (don't deactivate others for custom workouts)
@@ -1683,11 +1885,12 @@ def save_workout_plan(user_id, plan_name, plan_data):
         """, (user_id, plan_name, json.dumps(plan_data), True))
         
         conn.commit()
+        invalidate_user_recommendations(user_id)
         return c.lastrowid
 
 def get_active_workout_plan(user_id):
     """Get user's active workout plan"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -1710,44 +1913,29 @@ def get_active_workout_plan(user_id):
 
 def get_fitness_dashboard_data(user_id):
     """Get comprehensive fitness data for dashboard"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
-        # Get weekly workout stats
-        week_ago = datetime.now() - timedelta(days=7)
-        c.execute("""
-        SELECT COUNT(*) as workouts_this_week,
-               COALESCE(SUM(duration_minutes), 0) as total_duration,
-               COALESCE(SUM(calories_burned), 0) as total_calories,
-               COALESCE(AVG(duration_minutes), 0) as avg_duration
-        FROM workout_sessions
-        WHERE user_id = ? AND date_completed >= ?
-        """, (user_id, week_ago.date()))
-       
-        week_stats = c.fetchone()
-       
-        # Get monthly workout stats
-        month_ago = datetime.now() - timedelta(days=30)
+        # Weekly (today and the 6 days before) and monthly totals and the monthly type mix in one grouped pass
+        week_ago = (datetime.now() - timedelta(days=6)).date().isoformat()
+        month_ago = (datetime.now() - timedelta(days=30)).date().isoformat()
         c.execute("""
-        SELECT COUNT(*) as workouts_this_month,
-               COALESCE(SUM(duration_minutes), 0) as total_duration,
-               COALESCE(SUM(calories_burned), 0) as total_calories
-        FROM workout_sessions
-        WHERE user_id = ? AND date_completed >= ?
-        """, (user_id, month_ago.date()))
-       
-        month_stats = c.fetchone()
-       
-        # Get workout type distribution
-        c.execute("""
-        SELECT workout_type, COUNT(*) as count
+        SELECT workout_type,
+               COUNT(*),
+               COALESCE(SUM(duration_minutes), 0),
+               COALESCE(SUM(calories_burned), 0),
+               SUM(date_completed >= ?),
+               COALESCE(SUM(CASE WHEN date_completed >= ? THEN duration_minutes END), 0),
+               COALESCE(SUM(CASE WHEN date_completed >= ? THEN calories_burned END), 0)
         FROM workout_sessions
         WHERE user_id = ? AND date_completed >= ?
         GROUP BY workout_type
-        ORDER BY count DESC
-        """, (user_id, month_ago.date()))
+        ORDER BY COUNT(*) DESC
+        """, (week_ago, week_ago, week_ago, user_id, month_ago))
        
         workout_types = c.fetchall()
+        month_workouts, month_duration, month_calories, week_workouts, week_duration, week_calories = (
+            sum(row[i] for row in workout_types) for i in range(1, 7))
        
         # Get recent workouts
         c.execute("""
@@ -1762,15 +1950,15 @@ def get_fitness_dashboard_data(user_id):
        
         return {
             'weekly_stats': {
-                'workouts': week_stats[0] if week_stats else 0,
-                'total_duration': week_stats[1] if week_stats else 0,
-                'total_calories': week_stats[2] if week_stats else 0,
-                'avg_duration': round(week_stats[3]) if week_stats else 0
+                'workouts': week_workouts,
+                'total_duration': week_duration,
+                'total_calories': week_calories,
+                'avg_duration': round(week_duration / week_workouts) if week_workouts else 0
             },
             'monthly_stats': {
-                'workouts': month_stats[0] if month_stats else 0,
-                'total_duration': month_stats[1] if month_stats else 0,
-                'total_calories': month_stats[2] if month_stats else 0
+                'workouts': month_workouts,
+                'total_duration': month_duration,
+                'total_calories': month_calories
             },
             'workout_types': [{'type': row[0], 'count': row[1]} for row in workout_types],
             'recent_workouts': [{
@@ -1782,9 +1970,80 @@ def get_fitness_dashboard_data(user_id):
             } for row in recent_workouts]
         }
 
+# SQL for the first day of the bucket a workout falls in; weeks start on Monday
+WORKOUT_BUCKETS = {
+    'day': "DATE(date_completed)",
+    'week': "DATE(date_completed, 'weekday 0', '-6 days')",
+    'month': "DATE(date_completed, 'start of month')"
+}
+MAX_WORKOUT_BUCKETS = 1000
+
+def workout_bucket_starts(start_date, end_date, bucket):
+    """First day of every bucket overlapping start_date..end_date; ValueError for a bad range or bucket"""
+    if bucket not in WORKOUT_BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(WORKOUT_BUCKETS)}")
+    if end_date < start_date:
+        raise ValueError("end_date is before start_date")
+    
+    if bucket == 'day':
+        count = (end_date - start_date).days + 1
+    elif bucket == 'week':
+        start_date -= timedelta(days=start_date.weekday())
+        count = (end_date - start_date).days // 7 + 1
+    else:
+        start_date = start_date.replace(day=1)
+        count = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+    if count > MAX_WORKOUT_BUCKETS:
+        raise ValueError(f"Range covers {count} buckets; the most is {MAX_WORKOUT_BUCKETS}")
+    
+    if bucket == 'month':
+        months = [start_date.year * 12 + start_date.month - 1 + i for i in range(count)]
+        return [date(m // 12, m % 12 + 1, 1) for m in months]
+    step = 7 if bucket == 'week' else 1
+    return [start_date + timedelta(days=i * step) for i in range(count)]
+
+def get_workout_analytics(user_id, start_date, end_date, bucket='day'):
+    """Workouts, minutes, calories and type mix per day, week or month from start_date to end_date"""
+    starts = workout_bucket_starts(start_date, end_date, bucket)
+    buckets = {day.isoformat(): {'start': day.isoformat(), 'workouts': 0, 'minutes': 0, 'calories': 0, 'types': {}}
+               for day in starts}
+    
+    with connect(DB_PATH) as conn:
+        c = conn.cursor()
+        # One grouped pass; compares the raw column so the (user_id, date_completed) index applies
+        c.execute(f"""
+        SELECT {WORKOUT_BUCKETS[bucket]} AS bucket, COALESCE(NULLIF(workout_type, ''), 'other') AS type_name,
+               COUNT(*), COALESCE(SUM(duration_minutes), 0), COALESCE(SUM(calories_burned), 0)
+        FROM workout_sessions
+        WHERE user_id = ? AND date_completed >= ? AND date_completed < ?
+        GROUP BY bucket, type_name
+        """, (user_id, start_date.isoformat(), (end_date + timedelta(days=1)).isoformat()))
+        rows = c.fetchall()
+    
+    totals = {'workouts': 0, 'minutes': 0, 'calories': 0, 'types': {}}
+    for bucket_start, workout_type, count, minutes, calories in rows:
+        entry = buckets.get(bucket_start)
+        if entry is None:
+            continue  # unparseable date_completed
+        for target in (entry, totals):
+            target['workouts'] += count
+            target['minutes'] += minutes
+            target['calories'] += calories
+            target['types'][workout_type] = target['types'].get(workout_type, 0) + count
+    
+    totals['active_buckets'] = sum(1 for entry in buckets.values() if entry['workouts'])
+    totals['most_common_type'] = max(totals['types'], key=totals['types'].get) if totals['types'] else None
+    return {
+        'bucket': bucket,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'buckets': list(buckets.values()),
+        'totals': totals
+    }
+
 def get_fitness_goals(user_id):
     """Get user's fitness goals"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -1809,7 +2068,7 @@ def get_fitness_goals(user_id):
 
 def update_fitness_goal_progress(user_id, goal_id, current_value):
     """Update progress on a fitness goal"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         # Update current value
@@ -1837,7 +2096,7 @@ def update_fitness_goal_progress(user_id, goal_id, current_value):
 
 def add_fitness_goal(user_id, goal_type, goal_value, target_date):
     """Add a new fitness goal"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
        
         c.execute("""
@@ -1880,7 +2139,7 @@ def get_combined_dashboard_data(user_id):
 
 def save_workout_preference(user_id, workout_name, preference):
     """Save a workout preference (liked or disliked) - FIXED VERSION"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # First, remove any existing preference for this workout to avoid duplicates
@@ -1897,58 +2156,149 @@ def save_workout_preference(user_id, workout_name, preference):
         """, (user_id, workout_name, preference))
         
         conn.commit()
-        
-        print(f"✅ Saved workout preference: {workout_name} -> {preference} for user {user_id}")
+        invalidate_user_recommendations(user_id)
+        
+        logger.debug("Saved workout preference: %s -> %s for user %s", workout_name, preference, user_id)
+
+
+# custom_workouts columns holding workout_data keys of the same name (type is stored as workout_type)
+CUSTOM_WORKOUT_FIELDS = ('duration', 'calories_burned', 'intensity', 'difficulty_level')
+CUSTOM_WORKOUT_LISTS = ('equipment', 'muscle_groups')
+CUSTOM_EXERCISE_FIELDS = ('name', 'sets', 'reps', 'rest')
+
+
+def insert_custom_workout(cursor, user_id, workout_data, kind='custom', is_active=False,
+                          workout_id=None, created_at=None):
+    """Insert a custom workout and its exercises; returns the workout id"""
+    known = {'name', 'type', 'exercises'} | set(CUSTOM_WORKOUT_FIELDS) | set(CUSTOM_WORKOUT_LISTS)
+    extra = {key: value for key, value in workout_data.items() if key not in known}
+    lists = [json.dumps(workout_data[key]) if workout_data.get(key) is not None else None
+             for key in CUSTOM_WORKOUT_LISTS]
+    cursor.execute("""
+    INSERT INTO custom_workouts
+    (id, user_id, kind, name, workout_type, duration, calories_burned, intensity, difficulty_level,
+     equipment, muscle_groups, extra, is_active, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+    """, (workout_id, user_id, kind, workout_data.get('name', 'Custom Workout'), workout_data.get('type'),
+          *[workout_data.get(key) for key in CUSTOM_WORKOUT_FIELDS], *lists,
+          json.dumps(extra) if extra else None, is_active, created_at))
+    workout_id = cursor.lastrowid
+    
+    exercises = []
+    for position, exercise in enumerate(workout_data.get('exercises') or []):
+        if not isinstance(exercise, dict):
+            exercise = {'name': str(exercise)}
+        details = {key: value for key, value in exercise.items() if key not in CUSTOM_EXERCISE_FIELDS}
+        exercises.append((workout_id, position, *[exercise.get(key) for key in CUSTOM_EXERCISE_FIELDS],
+                          json.dumps(details) if details else None))
+    cursor.executemany("""
+    INSERT INTO custom_workout_exercises (workout_id, position, name, sets, reps, rest, details)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, exercises)
+    return workout_id
+
+
+CUSTOM_WORKOUT_COLUMNS = """w.id, w.name, w.workout_type, w.duration, w.calories_burned, w.intensity,
+    w.difficulty_level, w.equipment, w.muscle_groups, w.extra, w.created_at, w.is_active"""
+
+
+def load_custom_workouts(cursor, rows):
+    """workout_data dicts for custom_workouts rows selected with CUSTOM_WORKOUT_COLUMNS, in row order"""
+    if not rows:
+        return []
+    placeholders = ','.join('?' * len(rows))
+    cursor.execute(f"""
+    SELECT workout_id, name, sets, reps, rest, details
+    FROM custom_workout_exercises
+    WHERE workout_id IN ({placeholders})
+    ORDER BY workout_id, position
+    """, [row[0] for row in rows])
+    exercises = {}
+    for workout_id, *fields, details in cursor.fetchall():
+        exercise = {key: value for key, value in zip(CUSTOM_EXERCISE_FIELDS, fields) if value is not None}
+        exercise.update(json.loads(details) if details else {})
+        exercises.setdefault(workout_id, []).append(exercise)
+    
+    workouts = []
+    for row in rows:
+        workout_data = json.loads(row[9]) if row[9] else {}
+        workout_data['name'] = row[1]
+        if row[2] is not None:
+            workout_data['type'] = row[2]
+        workout_data['exercises'] = exercises.get(row[0], [])
+        for key, value in zip(CUSTOM_WORKOUT_FIELDS, row[3:7]):
+            if value is not None:
+                workout_data[key] = value
+        for key, value in zip(CUSTOM_WORKOUT_LISTS, row[7:9]):
+            if value is not None:
+                workout_data[key] = json.loads(value)
+        workouts.append(workout_data)
+    return workouts
 
 
 def get_user_custom_workouts(user_id):
     """Get all custom workouts for a user"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
-        c.execute("""
-        SELECT id, plan_name, plan_data, created_at, is_active
-        FROM workout_plans
-        WHERE user_id = ? AND plan_name LIKE 'Custom:%'
-        ORDER BY created_at DESC
+        c.execute(f"""
+        SELECT {CUSTOM_WORKOUT_COLUMNS}
+        FROM custom_workouts w
+        WHERE w.user_id = ? AND w.kind = 'custom'
+        ORDER BY w.created_at DESC, w.id DESC
         """, (user_id,))
+        rows = c.fetchall()
         
-        workouts = []
-        for row in c.fetchall():
-            try:
-                plan_data = json.loads(row[2])
-                workouts.append({
-                    'id': row[0],
-                    'name': row[1].replace('Custom: ', ''),
-                    'workout_data': plan_data,
-                    'created_at': row[3],
-                    'is_active': row[4]
-                })
-            except json.JSONDecodeError:
-                print(f"Error parsing workout data for workout ID {row[0]}")
-                continue
-        
-        return workouts
-
+        return [{
+            'id': row[0],
+            'name': row[1],
+            'workout_data': workout_data,
+            'created_at': row[10],
+            'is_active': row[11]
+        } for row, workout_data in zip(rows, load_custom_workouts(c, rows))]
+
+
+def get_compatible_custom_workouts(user_id, equipment_types, limit=5):
+    """A user's newest custom workouts that need no equipment or any of equipment_types"""
+    # Workouts saved without an equipment list count as needing none
+    types = ['none'] + sorted(set(equipment_types))
+    placeholders = ','.join('?' * len(types))
+    with connect(DB_PATH) as conn:
+        c = conn.cursor()
+        c.execute(f"""
+        SELECT {CUSTOM_WORKOUT_COLUMNS}
+        FROM custom_workouts w
+        WHERE w.user_id = ? AND w.kind = 'custom'
+          AND EXISTS (SELECT 1 FROM json_each(COALESCE(w.equipment, '["none"]'))
+                      WHERE value IN ({placeholders}))
+        ORDER BY w.created_at DESC, w.id DESC
+        LIMIT ?
+        """, (user_id, *types, limit))
+        return load_custom_workouts(c, c.fetchall())
 
 
 def delete_custom_workout(user_id, workout_id):
     """Delete a custom workout"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         c.execute("""
-        DELETE FROM workout_plans
-        WHERE id = ? AND user_id = ? AND plan_name LIKE 'Custom:%'
+        DELETE FROM custom_workouts
+        WHERE id = ? AND user_id = ? AND kind = 'custom'
         """, (workout_id, user_id))
+        deleted = c.rowcount > 0
+        if deleted:
+            c.execute("DELETE FROM custom_workout_exercises WHERE workout_id = ?", (workout_id,))
+        bump_data_version(conn, user_id, 'custom_workouts')
         
         conn.commit()
-        return c.rowcount > 0
+        invalidate_user_recommendations(user_id)
+        return deleted
 
 
 def save_workout_session(user_id, workout_data):
     """Save a completed workout session"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         c.execute("""
@@ -1969,6 +2319,8 @@ def save_workout_session(user_id, workout_data):
         
         workout_session_id = c.lastrowid
         
+        advance_workout_streak(c, user_id, workout_data.get('date_completed', datetime.now().strftime('%Y-%m-%d')))
+        
         # Save individual exercises if provided
         if 'exercises' in workout_data and workout_data['exercises']:
             for exercise in workout_data['exercises']:
@@ -1989,12 +2341,13 @@ def save_workout_session(user_id, workout_data):
                 ))
         
         conn.commit()
+        invalidate_tags(f"workouts:{user_id}")
         return workout_session_id
 
 
 def get_recent_workouts(user_id, limit=10):
     """Get recent workout sessions for a user"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         c.execute("""
@@ -2023,7 +2376,7 @@ def get_recent_workouts(user_id, limit=10):
 
 def get_workout_stats(user_id, days_back=30):
     """Get workout statistics for the dashboard"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Get stats for the specified time period
@@ -2049,23 +2402,19 @@ def get_workout_stats(user_id, days_back=30):
         }
 
 
-def save_custom_workout(user_id, workout_data):
-    """Save a custom workout plan"""
-    with sqlite3.connect(DB_PATH) as conn:
+def save_custom_workout(user_id, workout_data, is_active=False):
+    """Save a custom workout plan; returns its id"""
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
-        
-        # Convert workout data to JSON string
-        workout_json = json.dumps(workout_data)
-        
-        c.execute("""
-        INSERT INTO workout_plans
-        (user_id, plan_name, plan_data)
-        VALUES (?, ?, ?)
-        """, (user_id, f"Custom: {workout_data.get('name', 'Custom Workout')}", workout_json))
+        workout_id = insert_custom_workout(c, user_id, workout_data, is_active=is_active)
+        bump_data_version(conn, user_id, 'custom_workouts')
+    
+    invalidate_user_recommendations(user_id)
+    return workout_id
 
 def search_users(exclude_user_id, query):
     like = f"%{query}%"
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("""
         SELECT id, username, first_name, last_name
@@ -2091,7 +2440,7 @@ def search_users(exclude_user_id, query):
 
 def get_user_friends(user_id):
     """List your current friends."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("""
           SELECT u.id, u.username, u.first_name, u.last_name
@@ -2109,7 +2458,7 @@ def add_friend(user_id, friend_id):
     """Create a mutual friendship link."""
     if user_id == friend_id:
         return False, "Cannot friend yourself"
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         # Check existing
         c.execute("SELECT 1 FROM friends WHERE user_id=? AND friend_id=?", (user_id, friend_id))
@@ -2118,12 +2467,15 @@ def add_friend(user_id, friend_id):
         # Insert both directions
         c.execute("INSERT INTO friends (user_id, friend_id) VALUES (?, ?)", (user_id, friend_id))
         c.execute("INSERT INTO friends (user_id, friend_id) VALUES (?, ?)", (friend_id, user_id))
+        bump_data_version(conn, user_id, 'friends')
+        bump_data_version(conn, friend_id, 'friends')
         conn.commit()
+        invalidate_tags(f"friends:{user_id}", f"friends:{friend_id}")
         return True, "Friend added"
 
 def remove_friend(user_id, friend_id):
     """Tear down a friendship link."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         # Check existing
         c.execute("SELECT 1 FROM friends WHERE user_id=? AND friend_id=?", (user_id, friend_id))
@@ -2132,12 +2484,15 @@ def remove_friend(user_id, friend_id):
         # Delete both directions
         c.execute("DELETE FROM friends WHERE user_id=? AND friend_id=?", (user_id, friend_id))
         c.execute("DELETE FROM friends WHERE user_id=? AND friend_id=?", (friend_id, user_id))
+        bump_data_version(conn, user_id, 'friends')
+        bump_data_version(conn, friend_id, 'friends')
         conn.commit()
+        invalidate_tags(f"friends:{user_id}", f"friends:{friend_id}")
         return True, "Friend removed"
 
 def create_friend_challenge(creator_id, target_friend_id, title, description="", max_progress=100):
     """Create a new friend challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         # Check if they are friends
         c.execute("SELECT 1 FROM friends WHERE user_id=? AND friend_id=?", (creator_id, target_friend_id))
@@ -2153,7 +2508,7 @@ def create_friend_challenge(creator_id, target_friend_id, title, description="",
 
 def get_friend_challenges(user_id):
     """Get all friend challenges for a user (both sent and received)."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Get challenges sent to this user
@@ -2214,7 +2569,7 @@ def get_friend_challenges(user_id):
 
 def respond_to_friend_challenge(user_id, challenge_id, response):
     """Accept or decline a friend challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Verify this challenge belongs to the user
@@ -2242,7 +2597,7 @@ def respond_to_friend_challenge(user_id, challenge_id, response):
 
 def update_friend_challenge_progress(user_id, challenge_id, progress):
     """Update progress on a friend challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Verify this challenge belongs to the user (they can update if they're the target)
@@ -2282,7 +2637,7 @@ def update_friend_challenge_progress(user_id, challenge_id, progress):
 
 def get_friend_preferences(user_id, friend_id):
     """Get a friend's food and workout preferences."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Check if they are friends
@@ -2354,7 +2709,7 @@ def get_friend_preferences(user_id, friend_id):
 
 def create_challenge(user_id, title, description, deadline, max_progress):
     """Create a new personal challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("""
             INSERT INTO challenges (user_id, title, description, deadline, max_progress, progress)
@@ -2365,7 +2720,7 @@ def create_challenge(user_id, title, description, deadline, max_progress):
 
 def update_challenge_progress(user_id, challenge_id, progress):
     """Update progress for a personal challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Get current challenge info
@@ -2453,7 +2808,7 @@ def update_challenge_progress(user_id, challenge_id, progress):
 
 def delete_challenge(user_id, challenge_id):
     """Delete a personal challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("DELETE FROM challenges WHERE id = ? AND user_id = ?", (challenge_id, user_id))
         conn.commit()
@@ -2461,7 +2816,7 @@ def delete_challenge(user_id, challenge_id):
 
 def delete_friend_challenge(user_id, challenge_id):
     """Delete a friend challenge (only creator can delete)."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("DELETE FROM friend_challenges WHERE id = ? AND creator_id = ?", (challenge_id, user_id))
         conn.commit()
@@ -2469,7 +2824,7 @@ def delete_friend_challenge(user_id, challenge_id):
 
 def fetch_weekly_challenges(user_id: str) -> list:
     """Return all challenges (including custom) for this user."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("""
             SELECT id, title, description, completed, deadline, max_progress, progress
@@ -2493,7 +2848,7 @@ def fetch_weekly_challenges(user_id: str) -> list:
 
 def create_friend_challenge(creator_id, target_friend_id, title, description, max_progress, deadline):
     """Create a new friend challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         # Check if they are friends
         c.execute("SELECT 1 FROM friends WHERE user_id=? AND friend_id=?", (creator_id, target_friend_id))
@@ -2508,7 +2863,7 @@ def create_friend_challenge(creator_id, target_friend_id, title, description, ma
 
 def update_friend_challenge_progress(user_id, challenge_id, progress):
     """Update progress on a friend challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         # Verify this challenge belongs to the user (they can update if they're the target)
         c.execute("SELECT target_friend_id, max_progress, status FROM friend_challenges WHERE id = ?", (challenge_id,))
@@ -2541,7 +2896,7 @@ def update_friend_challenge_progress(user_id, challenge_id, progress):
 
 def get_friend_challenges_with_progress(user_id):
     """Get all friend challenges for a user, including their progress."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Get challenges sent to this user
@@ -2604,7 +2959,7 @@ def get_friend_challenges_with_progress(user_id):
 
 def get_challenge_progress(user_id, challenge_id):
     """Get the progress and deadline of a specific challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("""
             SELECT progress, deadline
@@ -2621,7 +2976,7 @@ def get_challenge_progress(user_id, challenge_id):
 
 def get_challenge_deadline(user_id, challenge_id):
     """Get the deadline of a specific challenge."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("""
             SELECT deadline
@@ -2635,9 +2990,7 @@ def get_challenge_deadline(user_id, challenge_id):
 
 def get_friends_leaderboard(user_id, metric='streak', limit=10):
     """Get leaderboard of friends by metric (streak, challenges, workouts)."""
-    import sqlite3
-    DB_PATH = __import__("os").path.join(__import__("os").path.dirname(__file__), "nutrifit.db")
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         # Get friend ids
         c.execute("SELECT friend_id FROM friends WHERE user_id = ?", (user_id,))
@@ -2688,7 +3041,7 @@ def get_friends_leaderboard(user_id, metric='streak', limit=10):
 
 def get_friend_activities(user_id, limit=20):
     """Get activities from friends for the activity feed."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Get activities from friends
@@ -2723,7 +3076,7 @@ def get_friend_badges(friend_id):
 
 def get_friend_reminders(user_id):
     """Get reminders sent TO the user by their friends."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute(
             """
@@ -2748,7 +3101,7 @@ def get_friend_reminders(user_id):
         ]
 
 def get_messages(user1_id, user2_id, limit=50):
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute(
             """
@@ -2773,7 +3126,7 @@ def get_messages(user1_id, user2_id, limit=50):
         return list(reversed(messages))  # Show oldest first
 
 def send_message(sender_id, receiver_id, content):
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute(
             "INSERT INTO messages (sender_id, receiver_id, content) VALUES (?, ?, ?)",
@@ -2785,7 +3138,7 @@ def send_message(sender_id, receiver_id, content):
 def set_friend_reminder(user_id, friend_id, message, remind_at):
     import sqlite3, os
     DB_PATH = os.path.join(os.path.dirname(__file__), "nutrifit.db")
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute(
             "INSERT INTO friend_reminders (user_id, friend_id, message, remind_at) VALUES (?, ?, ?, ?)",
@@ -2795,7 +3148,7 @@ def set_friend_reminder(user_id, friend_id, message, remind_at):
         return c.lastrowid
 
 def get_reminders_you_set(user_id):
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute(
             """
@@ -2821,7 +3174,7 @@ def get_reminders_you_set(user_id):
 
 def delete_reminder(reminder_id, user_id):
     """Delete a reminder (only the user who set it can delete it)."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("DELETE FROM friend_reminders WHERE id = ? AND user_id = ?", (reminder_id, user_id))
         conn.commit()
@@ -2829,54 +3182,36 @@ def delete_reminder(reminder_id, user_id):
 
 def delete_reminder_received(reminder_id, user_id):
     """Delete a reminder received by the user (only the recipient can delete it)."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("DELETE FROM friend_reminders WHERE id = ? AND friend_id = ?", (reminder_id, user_id))
         conn.commit()
         return c.rowcount > 0
 
 def get_user_streak(user_id):
-    """Get user's current and best streak from the database."""
-    with sqlite3.connect(DB_PATH) as conn:
+    """Get user's current and best workout streak from the workout_streaks table."""
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
-        # Get current streak (current_day from users table)
-        c.execute("SELECT current_day FROM users WHERE id = ?", (user_id,))
-        result = c.fetchone()
-        current_streak = result[0] if result else 1
-        
-        # Calculate actual consecutive days streak
-        c.execute("""
-            SELECT COUNT(DISTINCT date_completed) as consecutive_days
-            FROM (
-                SELECT date_completed,
-                       ROW_NUMBER() OVER (ORDER BY date_completed DESC) as rn,
-                       DATE(date_completed, '-' || ROW_NUMBER() OVER (ORDER BY date_completed DESC) || ' days') as expected_date
-                FROM workout_sessions 
-                WHERE user_id = ?
-                ORDER BY date_completed DESC
-            ) t
-            WHERE date_completed = expected_date
-        """, (user_id,))
-        
-        actual_streak_result = c.fetchone()
-        actual_streak = actual_streak_result[0] if actual_streak_result else 0
-        
-        # Use the higher of current_day or actual streak
-        current_streak = max(current_streak, actual_streak)
-        
-        # For now, use current_day as best streak too
-        # In a real app, you'd track best streak separately
-        best_streak = current_streak
+        streak = read_workout_streak(c, user_id)
         
         return {
-            "current": current_streak,
-            "best": best_streak
+            "current": streak['current_streak'],
+            "best": streak['best_streak'],
+            "last_active_date": streak['last_active_date']
         }
 
+def rebuild_user_streak(user_id):
+    """Recompute a user's workout streak from history (use after editing or deleting sessions)."""
+    with connect(DB_PATH) as conn:
+        c = conn.cursor()
+        streak = rebuild_workout_streak(c, user_id)
+        conn.commit()
+        return streak
+
 def get_user_badges(user_id):
     """Get user's earned badges from the database."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Get badges from friend_badges table
@@ -2901,8 +3236,7 @@ def get_user_badges(user_id):
         
         # Check for new badges to award
         current_day = get_user_current_day(user_id)
-        streak_info = get_user_streak(user_id)
-        current_streak = streak_info["current"]
+        current_streak = read_workout_streak(c, user_id)['current_streak']
         
         # Streak-based badges
         streak_badges = [
@@ -3028,7 +3362,7 @@ def get_user_badges(user_id):
 
 def get_user_stats(user_id):
     """Get comprehensive user statistics for the overview page."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Get challenges completed
@@ -3066,15 +3400,17 @@ def get_user_stats(user_id):
             "friendsCount": friends_count
         }
 
-def add_user_activity(user_id, activity_type, description):
-    """Add a user activity to the friend_activities table."""
-    with sqlite3.connect(DB_PATH) as conn:
+@job('add_user_activity')
+def add_user_activity(user_id, activity_type, description, source_key=None):
+    """Add a user activity to the friend_activities table; only once per source_key, when given."""
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
+        # A job can run more than once; the unique source_key makes a repeat a no-op
         c.execute("""
-            INSERT INTO friend_activities (user_id, type, description)
-            VALUES (?, ?, ?)
-        """, (user_id, activity_type, description))
+            INSERT OR IGNORE INTO friend_activities (user_id, type, description, source_key)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, activity_type, description, source_key))
 
 def get_dashboard_data(user_id):
     """Get comprehensive dashboard data for a user"""
@@ -3161,9 +3497,9 @@ def log_vitals_data(user_id, metric_type, value_data, date_logged=None):
     
     current_timestamp = datetime.now()
     
-    print(f"🗄️ Logging vitals data: user_id={user_id}, metric_type={metric_type}, value_data={value_data}, date_logged={date_logged}, timestamp={current_timestamp}")
+    logger.debug("Logging vitals data: user_id=%s, metric_type=%s, value_data=%s, date_logged=%s, timestamp=%s", user_id, metric_type, value_data, date_logged, current_timestamp)
     
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Store the vitals data with current timestamp - now allows multiple entries per day
@@ -3177,14 +3513,14 @@ def log_vitals_data(user_id, metric_type, value_data, date_logged=None):
         
         conn.commit()
         log_id = c.lastrowid
-        print(f"✅ Successfully stored vitals data with log_id: {log_id}")
+        logger.debug("Successfully stored vitals data with log_id: %s", log_id)
         return log_id
 
 def get_today_vitals_logs(user_id, metric_type):
     """Get all vitals logs for today for a specific metric"""
     today = datetime.now().date()
     
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         c.execute("""
@@ -3207,7 +3543,7 @@ def get_today_vitals_logs(user_id, metric_type):
 
 def get_vitals_data(user_id, metric_type, start_date=None, end_date=None):
     """Get vitals data for a user within a date range - now returns all entries per day"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         query = """
@@ -3248,7 +3584,7 @@ def update_vitals_streak(user_id, metric_type, date_logged, conn=None):
     """Update streak for a vitals metric"""
     if conn is None:
         # If no connection provided, create one
-        with sqlite3.connect(DB_PATH) as db_conn:
+        with connect(DB_PATH) as db_conn:
             return update_vitals_streak(user_id, metric_type, date_logged, db_conn)
     
     c = conn.cursor()
@@ -3299,7 +3635,7 @@ def update_vitals_streak(user_id, metric_type, date_logged, conn=None):
 
 def get_vitals_streak(user_id, metric_type):
     """Get current streak for a vitals metric"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         c.execute("""
@@ -3323,7 +3659,7 @@ def get_vitals_streak(user_id, metric_type):
 
 def get_all_vitals_streaks(user_id):
     """Get all vitals streaks for a user"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         c.execute("""
@@ -3344,7 +3680,7 @@ def get_all_vitals_streaks(user_id):
 
 def create_custom_metric(user_id, metric_name, metric_type, unit=None, target_value=None, options=None):
     """Create a custom vitals metric"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         options_json = json.dumps(options) if options else None
@@ -3353,13 +3689,14 @@ def create_custom_metric(user_id, metric_name, metric_type, unit=None, target_va
         INSERT INTO custom_metrics (user_id, metric_name, metric_type, unit, target_value, options)
         VALUES (?, ?, ?, ?, ?, ?)
         """, (user_id, metric_name, metric_type, unit, target_value, options_json))
+        bump_data_version(conn, user_id, 'custom_metrics')
         
         conn.commit()
         return c.lastrowid
 
 def get_custom_metrics(user_id):
     """Get all custom metrics for a user"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         c.execute("""
@@ -3386,7 +3723,7 @@ def get_custom_metrics(user_id):
 
 def update_custom_metric(user_id, metric_id, updates):
     """Update a custom metric"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         set_clauses = []
@@ -3409,6 +3746,7 @@ def update_custom_metric(user_id, metric_id, updates):
             SET {', '.join(set_clauses)}
             WHERE id = ? AND user_id = ?
             """, values)
+            bump_data_version(conn, user_id, 'custom_metrics')
             
             conn.commit()
             return True
@@ -3417,7 +3755,7 @@ def update_custom_metric(user_id, metric_id, updates):
 
 def delete_custom_metric(user_id, metric_id):
     """Delete a custom metric (soft delete by setting is_active to False)"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         c.execute("""
@@ -3425,13 +3763,14 @@ def delete_custom_metric(user_id, metric_id):
         SET is_active = FALSE
         WHERE id = ? AND user_id = ?
         """, (metric_id, user_id))
+        bump_data_version(conn, user_id, 'custom_metrics')
         
         conn.commit()
         return c.rowcount > 0
 
 def get_vitals_summary(user_id, metric_type, days_back=7):
     """Get vitals summary for dashboard"""
-    with sqlite3.connect(DB_PATH) as conn:
+    with connect(DB_PATH) as conn:
         c = conn.cursor()
         
         # Get recent data
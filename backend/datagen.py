@@ -0,0 +1,450 @@
+import argparse
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import database
+from database import hash_password
+from fitness_utils import WORKOUT_CATALOG
+from log_utils import get_logger
+from nutrition_utils import COMMON_FOODS
+from streak_utils import rebuild_workout_streak
+
+# Synthetic data for load and scale testing. Generates users with profiles,
+# a friend graph, months of meal history, workouts with per-exercise
+# performance, vitals logs, messages, activities, badges and challenges, and
+# bulk-loads them with executemany in one transaction per chunk of users.
+#
+#   python datagen.py --users 2000 --days 180 --seed 7 --db /tmp/nutrifit_load.db
+#
+# Output is deterministic for a given seed, user count, day count, config and
+# --end-date. Generated users have ids starting with USER_PREFIX and the
+# password DEFAULT_PASSWORD; re-running replaces them and leaves other users alone.
+
+USER_PREFIX = 'synth_'
+# Matches generated ids with `LIKE ? ESCAPE '\'`; '_' is a LIKE wildcard, and 'synthia' isn't ours
+USER_PATTERN = USER_PREFIX.replace('_', '\\_') + '%'
+DEFAULT_PASSWORD = 'password123'
+
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner', 'snacks']
+VITAL_METRICS = ['water', 'sleep', 'steps', 'weight', 'mood']
+HOME_EQUIPMENT = ['dumbbells', 'resistance_bands', 'kettlebell', 'yoga_mat', 'pull_up_bar', 'jump_rope']
+FITNESS_GOALS = ['weight_loss', 'muscle_building', 'endurance', 'flexibility', 'general_health']
+TRAINING_STYLES = ['weightlifting', 'bodyweight', 'cardio', 'hiit', 'yoga', 'running', 'cycling']
+EXPERIENCE_LEVELS = ['beginner', 'intermediate', 'advanced']
+ACTIVITY_LEVELS = ['sedentary', 'lightly_active', 'moderately_active', 'very_active']
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Avery', 'Jamie', 'Quinn']
+LAST_NAMES = ['Smith', 'Lee', 'Patel', 'Garcia', 'Kim', 'Nguyen', 'Brown', 'Khan', 'Lopez', 'Silva']
+MESSAGES = ['Nice workout!', 'Want to train tomorrow?', 'How was your run?', 'Keep it up!',
+            'What did you have for lunch?', 'New PR today!', 'Rest day for me', 'See you at the gym']
+CHALLENGES = [('10k Steps', 'Walk 10,000 steps a day', 7), ('Hydration Hero', 'Drink 64oz of water daily', 14),
+              ('Workout Streak', 'Work out 5 days in a row', 5), ('Protein Goal', 'Hit your protein goal', 10)]
+WORKOUT_BADGES = [(5, 'Workout Beginner'), (10, 'Workout Warrior'), (25, 'Workout Regular'),
+                  (50, 'Workout Master'), (100, 'Workout Legend'), (250, 'Workout Champion')]
+
+# Means and rates the generator draws from; override any of them with --config
+DEFAULT_CONFIG = {
+    'friends_per_user': 8,          # Poisson mean, before links are made mutual
+    'items_per_meal': 1.6,          # Poisson mean, at least one item when the meal is eaten
+    'meal_skip_rate': {'breakfast': 0.15, 'lunch': 0.05, 'dinner': 0.02, 'snacks': 0.4},
+    'workouts_per_week': 3.5,
+    'vitals_log_rate': {'water': 0.8, 'sleep': 0.7, 'steps': 0.9, 'weight': 0.3, 'mood': 0.5},
+    'messages_per_friend': 3,       # Poisson mean per friendship
+    'challenges_per_user': 2,       # Poisson mean
+    'challenge_completion_rate': 0.4
+}
+
+logger = get_logger(__name__)
+
+
+def user_id_for(index):
+    return f"{USER_PREFIX}{index:07d}"
+
+
+def merge_config(overrides=None):
+    """DEFAULT_CONFIG with overrides applied; nested rate dicts are merged key by key"""
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    for key, value in (overrides or {}).items():
+        if key not in config:
+            raise ValueError(f"Unknown generator setting: {key}")
+        if isinstance(config[key], dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+class DatasetGenerator:
+    """Builds synthetic rows for a range of users and bulk-inserts them"""
+
+    def __init__(self, users, days, seed=0, config=None, end_date=None):
+        self.users = users
+        self.days = days
+        self.seed = seed
+        self.config = merge_config(config)
+        self.end_date = end_date or date.today()
+        self.start_date = self.end_date - timedelta(days=days - 1)
+        self.start = datetime.combine(self.start_date, datetime.min.time())
+        self.password_hash = hash_password(DEFAULT_PASSWORD)
+
+        catalog = sorted(COMMON_FOODS.items())
+        self.foods = [(name.title(), food['serving']) for name, food in catalog]
+        self.nutrition = np.array([[food[n] for n in ('calories', 'protein', 'carbohydrates', 'fat')]
+                                   for _, food in catalog], dtype=float)
+        self.workouts = [r for r in WORKOUT_CATALOG.records if r.duration]
+        self.quantities = np.array([0.5, 1.0, 1.0, 1.0, 1.5, 2.0])
+
+    def _rng(self, index, stream):
+        """Independent generator per user and table, so chunking doesn't change the output"""
+        return np.random.default_rng([self.seed, index, stream])
+
+    def _day(self, day_number):
+        return self.start_date + timedelta(days=int(day_number) - 1)
+
+    def _stamp(self, day_number, second):
+        moment = self.start + timedelta(days=int(day_number) - 1, seconds=second)
+        return moment.isoformat(sep=' ')
+
+    def _timestamp(self, day_number, rng):
+        return self._stamp(day_number, int(rng.integers(6 * 3600, 23 * 3600)))
+
+    def user_rows(self, index):
+        rng = self._rng(index, 0)
+        user_id = user_id_for(index)
+        gender = 'male' if rng.random() < 0.5 else 'female'
+        calorie_goal = int(rng.normal(2300 if gender == 'male' else 1900, 250))
+        protein = max(120, int(calorie_goal * 0.25 / 4))
+        fat = int(calorie_goal * 0.25 / 9)
+        carbs = int((calorie_goal - protein * 4 - fat * 9) / 4)
+        restrictions = ['vegetarian'] if rng.random() < 0.1 else []
+        created_at = self.start.isoformat(sep=' ')
+
+        user = (
+            user_id, f"synth_user_{index}", self.password_hash, f"synth{index}@example.com",
+            FIRST_NAMES[index % len(FIRST_NAMES)], LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)],
+            str(date(1970, 1, 1) + timedelta(days=int(rng.integers(0, 365 * 35)))), gender,
+            round(float(rng.normal(170, 10)), 1), round(float(rng.normal(170, 30)), 1),
+            ACTIVITY_LEVELS[rng.integers(len(ACTIVITY_LEVELS))], calorie_goal, protein, carbs, fat,
+            self.days + 1, True, created_at, json.dumps(restrictions)
+        )
+
+        has_gym = bool(rng.random() < 0.5)
+        equipment = ('gym_membership_full_access' if has_gym else
+                     ','.join(sorted(rng.choice(HOME_EQUIPMENT, size=rng.integers(0, 4), replace=False))))
+        preferences = (
+            user_id, has_gym, equipment, ['nutrition', 'fitness', 'both'][rng.integers(3)],
+            json.dumps(sorted(rng.choice(FITNESS_GOALS, size=rng.integers(1, 3), replace=False).tolist())),
+            json.dumps(restrictions),
+            json.dumps(sorted(rng.choice(TRAINING_STYLES, size=rng.integers(1, 4), replace=False).tolist())),
+            int(rng.integers(2, 7)), int(rng.choice([20, 30, 45, 60])),
+            EXPERIENCE_LEVELS[rng.integers(3)], ['minimal', 'moderate', 'extensive'][rng.integers(3)],
+            EXPERIENCE_LEVELS[rng.integers(3)], ['low', 'medium', 'high'][rng.integers(3)]
+        )
+        return user, preferences
+
+    def friend_rows(self, index):
+        """Friend links from this user; both directions, as add_friend stores them"""
+        if self.users < 2:
+            return []
+        rng = self._rng(index, 1)
+        count = min(self.users - 1, int(rng.poisson(self.config['friends_per_user'])))
+        others = rng.choice(self.users - 1, size=count, replace=False)
+        others = others + (others >= index)  # skip self
+        rows = []
+        for other in others:
+            rows.append((user_id_for(index), user_id_for(int(other))))
+            rows.append((user_id_for(int(other)), user_id_for(index)))
+        return rows
+
+    def meal_rows(self, index):
+        rng = self._rng(index, 2)
+        user_id = user_id_for(index)
+        rows = []
+        for m, meal_type in enumerate(MEAL_TYPES):
+            eaten = rng.random(self.days) >= self.config['meal_skip_rate'][meal_type]
+            counts = np.where(eaten, np.maximum(1, rng.poisson(self.config['items_per_meal'], self.days)), 0)
+            total = int(counts.sum())
+            foods = rng.integers(len(self.foods), size=total)
+            quantities = self.quantities[rng.integers(len(self.quantities), size=total)]
+            day_numbers = np.repeat(np.arange(1, self.days + 1), counts)
+            nutrition = np.round(self.nutrition[foods] * quantities[:, None], 1).tolist()
+            seconds = rng.integers(6 * 3600, 23 * 3600, size=total).tolist()
+            for day_number, food_index, quantity, values, second in zip(
+                    day_numbers.tolist(), foods.tolist(), quantities.tolist(), nutrition, seconds):
+                name, serving = self.foods[food_index]
+                rows.append((
+                    user_id, day_number, meal_type, name, quantity, serving, *values, 'custom',
+                    self._stamp(day_number, second)
+                ))
+        return rows
+
+    def workout_rows(self, index, first_session_id):
+        """(sessions, exercise rows, activity rows, badge rows) with explicit session ids"""
+        rng = self._rng(index, 3)
+        user_id = user_id_for(index)
+        active = np.flatnonzero(rng.random(self.days) < self.config['workouts_per_week'] / 7) + 1
+        sessions, exercises, activities, badges = [], [], [], []
+        strength = 1.0 + rng.random()  # per-user strength multiplier
+
+        for offset, day_number in enumerate(active):
+            record = self.workouts[rng.integers(len(self.workouts))]
+            session_id = first_session_id + offset
+            day = str(self._day(day_number))
+            timestamp = self._timestamp(day_number, rng)
+            sessions.append((
+                session_id, user_id, record.name, record.workout_type or 'general', record.duration,
+                int(record.calories_burned or record.duration * 7), record.intensity, day, '', timestamp
+            ))
+            progress = 1 + 0.004 * day_number  # slow progressive overload
+            for exercise in record.workout.get('exercises', []):
+                weight = round(float(20 * strength * progress * rng.uniform(0.9, 1.1)), 1)
+                exercises.append((
+                    user_id, session_id, exercise.get('name', ''), int(exercise.get('sets', 3)),
+                    int(rng.integers(6, 15)), weight, int(rng.choice([30, 45, 60, 90])),
+                    int(rng.integers(1, 6)), day, '', timestamp
+                ))
+            activities.append((user_id, 'workout', f"completed a {record.duration}-minute {record.name} session",
+                               timestamp))
+
+        for required, badge in WORKOUT_BADGES:
+            if len(active) >= required:
+                earned_day = int(active[required - 1])
+                earned_at = self._timestamp(earned_day, rng)
+                badges.append((user_id, badge, f"Completed {required}+ workouts!", earned_at))
+                activities.append((user_id, 'badge', f"earned the '{badge}' badge", earned_at))
+
+        return sessions, exercises, activities, badges
+
+    def vitals_rows(self, index):
+        rng = self._rng(index, 4)
+        user_id = user_id_for(index)
+        weight = float(rng.normal(170, 30))
+        rows = []
+        for metric in VITAL_METRICS:
+            logged = np.flatnonzero(rng.random(self.days) < self.config['vitals_log_rate'][metric]) + 1
+            for day_number in logged:
+                if metric == 'water':
+                    value = {'amount': int(rng.integers(16, 100)), 'unit': 'oz'}
+                elif metric == 'sleep':
+                    value = {'hours': int(rng.integers(5, 10)), 'minutes': int(rng.choice([0, 15, 30, 45]))}
+                elif metric == 'steps':
+                    value = {'count': int(rng.gamma(4, 2000))}
+                elif metric == 'weight':
+                    weight += float(rng.normal(-0.05, 0.6))
+                    value = {'pounds': round(weight, 1)}
+                else:
+                    value = {'rating': int(rng.integers(1, 6)), 'note': ''}
+                rows.append((user_id, metric, str(self._day(day_number)), json.dumps(value),
+                             self._timestamp(day_number, rng)))
+        return rows
+
+    def social_rows(self, index, friend_rows):
+        """(messages, challenges, challenge activities) for one user"""
+        rng = self._rng(index, 5)
+        user_id = user_id_for(index)
+        messages = []
+        for sender, receiver in friend_rows:
+            if sender != user_id:
+                continue
+            for _ in range(int(rng.poisson(self.config['messages_per_friend']))):
+                day_number = int(rng.integers(1, self.days + 1))
+                messages.append((sender, receiver, MESSAGES[rng.integers(len(MESSAGES))],
+                                 self._timestamp(day_number, rng)))
+
+        challenges, activities = [], []
+        for _ in range(int(rng.poisson(self.config['challenges_per_user']))):
+            title, description, max_progress = CHALLENGES[rng.integers(len(CHALLENGES))]
+            day_number = int(rng.integers(1, self.days + 1))
+            created_at = self._timestamp(day_number, rng)
+            deadline = str(self._day(day_number) + timedelta(days=max_progress))
+            completed = bool(rng.random() < self.config['challenge_completion_rate'])
+            progress = max_progress if completed else int(rng.integers(0, max_progress))
+            challenges.append((user_id, title, description, completed, created_at, deadline, max_progress, progress))
+            if completed:
+                activities.append((user_id, 'challenge', f"completed the '{title}' challenge", created_at))
+        return messages, challenges, activities
+
+
+@contextmanager
+def _database_path(path):
+    """Temporarily point the database module at another file"""
+    previous = database.DB_PATH
+    database.DB_PATH = path
+    try:
+        yield
+    finally:
+        database.DB_PATH = previous
+
+
+def _clear_synthetic_users(c):
+    """Remove previously generated users and everything hanging off them"""
+    for table, column in [
+        ('exercise_performance', 'user_id'), ('exercise_stats', 'user_id'), ('workout_sessions', 'user_id'),
+        ('workout_streaks', 'user_id'),
+        ('meal_history', 'user_id'), ('daily_nutrition', 'user_id'), ('vitals_data', 'user_id'),
+        ('friend_activities', 'user_id'), ('friend_badges', 'user_id'), ('challenges', 'user_id'),
+        ('messages', 'sender_id'), ('friends', 'user_id'), ('friends', 'friend_id'),
+        ('user_preferences', 'user_id'), ('data_versions', 'user_id'), ('users', 'id')
+    ]:
+        c.execute(f"DELETE FROM {table} WHERE {column} LIKE ? ESCAPE '\\'", (USER_PATTERN,))
+
+
+def generate_dataset(db_path=None, users=100, days=90, seed=0, config=None, end_date=None, chunk_size=500):
+    """Populate db_path (default database.DB_PATH) with synthetic users; returns row counts per table"""
+    db_path = db_path or database.DB_PATH
+    with _database_path(db_path):
+        database.init_db()
+        database.init_fitness_tables()
+
+    generator = DatasetGenerator(users, days, seed, config, end_date)
+    counts = {}
+    started = time.perf_counter()
+
+    def insert(c, table, sql, rows):
+        if rows:
+            c.executemany(sql, rows)
+            counts[table] = counts.get(table, 0) + c.rowcount  # friends skips duplicate links
+
+    with sqlite3.connect(db_path) as conn:
+        # Bulk load: no fsync per statement; the database is rebuildable from the seed
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA journal_mode = MEMORY")
+        c = conn.cursor()
+        _clear_synthetic_users(c)
+        conn.commit()
+
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM workout_sessions")
+        next_session_id = c.fetchone()[0] + 1
+
+        for chunk_start in range(0, users, chunk_size):
+            chunk = range(chunk_start, min(users, chunk_start + chunk_size))
+            user_rows, preference_rows, friend_rows, meal_rows, vitals_rows = [], [], [], [], []
+            session_rows, exercise_rows, activity_rows, badge_rows = [], [], [], []
+            message_rows, challenge_rows = [], []
+
+            for index in chunk:
+                user, preferences = generator.user_rows(index)
+                user_rows.append(user)
+                preference_rows.append(preferences)
+                friends = generator.friend_rows(index)
+                friend_rows.extend(friends)
+                meal_rows.extend(generator.meal_rows(index))
+                vitals_rows.extend(generator.vitals_rows(index))
+
+                sessions, exercises, activities, badges = generator.workout_rows(index, next_session_id)
+                next_session_id += len(sessions)
+                session_rows.extend(sessions)
+                exercise_rows.extend(exercises)
+                activity_rows.extend(activities)
+                badge_rows.extend(badges)
+
+                messages, challenges, challenge_activities = generator.social_rows(index, friends)
+                message_rows.extend(messages)
+                challenge_rows.extend(challenges)
+                activity_rows.extend(challenge_activities)
+
+            insert(c, 'users', """
+            INSERT INTO users
+            (id, username, password_hash, email, first_name, last_name, date_of_birth, gender,
+             height_cm, weight_lb, activity_level, calorie_goal, protein_goal, carbs_goal, fat_goal,
+             current_day, profile_completed, created_at, dietary_restrictions)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, user_rows)
+            # Fresh versions, so ETags handed out for the previous generation don't match
+            for user in user_rows:
+                database.bump_data_version(conn, user[0], 'profile', 'friends')
+            insert(c, 'user_preferences', """
+            INSERT INTO user_preferences
+            (user_id, has_gym_membership, available_equipment, primary_focus, fitness_goals,
+             dietary_restrictions, training_styles, workout_frequency, workout_duration,
+             fitness_experience, meal_prep_time, cooking_skill, budget_preference)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, preference_rows)
+            insert(c, 'friends', "INSERT OR IGNORE INTO friends (user_id, friend_id) VALUES (?, ?)", friend_rows)
+            insert(c, 'meal_history', """
+            INSERT INTO meal_history
+            (user_id, day_number, meal_type, food_name, quantity, serving_size,
+             calories, protein, carbohydrates, fat, source, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, meal_rows)
+            insert(c, 'workout_sessions', """
+            INSERT INTO workout_sessions
+            (id, user_id, workout_name, workout_type, duration_minutes, calories_burned,
+             difficulty_level, date_completed, notes, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, session_rows)
+            insert(c, 'exercise_performance', """
+            INSERT INTO exercise_performance
+            (user_id, workout_session_id, exercise_name, sets, reps, weight_lb,
+             rest_seconds, difficulty, date_performed, notes, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, exercise_rows)
+            insert(c, 'vitals_data', """
+            INSERT INTO vitals_data (user_id, metric_type, date_logged, value_data, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """, vitals_rows)
+            insert(c, 'friend_activities', """
+            INSERT INTO friend_activities (user_id, type, description, timestamp) VALUES (?, ?, ?, ?)
+            """, activity_rows)
+            insert(c, 'friend_badges', """
+            INSERT INTO friend_badges (user_id, badge, description, earned_at) VALUES (?, ?, ?, ?)
+            """, badge_rows)
+            insert(c, 'messages', """
+            INSERT INTO messages (sender_id, receiver_id, content, timestamp) VALUES (?, ?, ?, ?)
+            """, message_rows)
+            insert(c, 'challenges', """
+            INSERT INTO challenges
+            (user_id, title, description, completed, created_at, deadline, max_progress, progress)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, challenge_rows)
+
+            for user in user_rows:
+                rebuild_workout_streak(c, user[0])
+            conn.commit()
+            logger.info("Generated users %s-%s of %s", chunk.start, chunk.stop - 1, users)
+
+        # Daily totals are derived from the meal history rather than generated separately
+        c.execute("""
+        INSERT OR REPLACE INTO daily_nutrition
+        (user_id, day_number, total_calories, total_protein, total_carbohydrates, total_fat)
+        SELECT user_id, day_number, SUM(calories), SUM(protein), SUM(carbohydrates), SUM(fat)
+        FROM meal_history WHERE user_id LIKE ? ESCAPE '\\'
+        GROUP BY user_id, day_number
+        """, (USER_PATTERN,))
+        counts['daily_nutrition'] = c.rowcount
+        conn.commit()
+
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a NutriFit database with synthetic users")
+    parser.add_argument('--db', default=database.DB_PATH, help="database file to populate")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--days', type=int, default=90, help="days of history per user")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--end-date', type=date.fromisoformat, help="last day of history (default today)")
+    parser.add_argument('--config', help="JSON file overriding DEFAULT_CONFIG distributions")
+    parser.add_argument('--chunk-size', type=int, default=500, help="users generated per transaction")
+    args = parser.parse_args()
+
+    config = None
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+
+    counts = generate_dataset(args.db, args.users, args.days, args.seed, config, args.end_date, args.chunk_size)
+    seconds = counts.pop('seconds')
+    total = sum(counts.values())
+    print(f"Wrote {total:,} rows to {args.db} in {seconds}s")
+    for table, count in sorted(counts.items()):
+        print(f"  {table:<22}{count:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from collections import deque
+
+from recommendation_cache import RecommendationCache
+
+# A suggestion is hidden when one of the user's dislikes appears in its name
+# ("chicken" hides "Grilled Chicken") or its name appears in a dislike ("Rice"
+# is hidden by "fried rice"). Both checks are compiled once per user: an
+# Aho-Corasick automaton finds any dislike inside a name in one pass over the
+# name, and a set of every dislike substring answers the reverse direction with
+# one lookup. Compiled matchers are cached until update_food_preference runs.
+
+DEFAULT_MAX_MATCHERS = 1024
+
+
+def normalize_food_name(name):
+    """Lowercase and collapse whitespace so names compare the same way everywhere"""
+    return ' '.join((name or '').lower().split())
+
+
+class AhoCorasick:
+    """Automaton answering "does the text contain any of the patterns?" in one pass"""
+
+    def __init__(self, patterns):
+        # State 0 is the root; goto[s] maps a character to the next state
+        self.goto = [{}]
+        self.fail = [0]
+        self.terminal = [False]
+
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.terminal.append(False)
+                state = next_state
+            self.terminal[state] = True
+
+        # Breadth-first fail links; a state is terminal if any suffix of it is a pattern
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.terminal[next_state] = self.terminal[next_state] or self.terminal[self.fail[next_state]]
+
+    def __len__(self):
+        return len(self.goto)
+
+    def search(self, text):
+        """True if any pattern occurs in text"""
+        goto, fail, terminal = self.goto, self.fail, self.terminal
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if terminal[state]:
+                return True
+        return False
+
+
+class DislikeMatcher:
+    """Compiled dislike list for one user"""
+
+    def __init__(self, disliked_foods):
+        self.dislikes = frozenset(filter(None, map(normalize_food_name, disliked_foods)))
+        self.automaton = AhoCorasick(self.dislikes)
+
+        # Reverse containment index: every substring of every dislike
+        contained = set()
+        for dislike in self.dislikes:
+            for start in range(len(dislike)):
+                for end in range(start + 1, len(dislike) + 1):
+                    contained.add(dislike[start:end])
+        self.contained = frozenset(contained)
+
+    def __len__(self):
+        return len(self.dislikes)
+
+    def matches(self, food_name):
+        """True if the food should be hidden from this user"""
+        if not self.dislikes:
+            return False
+        name = normalize_food_name(food_name)
+        return name in self.contained or self.automaton.search(name)
+
+    def filter(self, foods, limit=None):
+        """Foods (dicts with a 'name') that don't match, stopping after limit of them"""
+        kept = []
+        for food in foods:
+            if not self.matches(food['name']):
+                kept.append(food)
+                if limit is not None and len(kept) >= limit:
+                    break
+        return kept
+
+
+# Compiled automata stay in process memory rather than the shared cache backend
+DISLIKE_MATCHERS = RecommendationCache(max_entries=DEFAULT_MAX_MATCHERS)
+
+
+def get_dislike_matcher(user_id):
+    """Cached matcher over the user's disliked foods"""
+    from database import get_globally_disliked_foods
+    return DISLIKE_MATCHERS.get_or_compute(
+        'dislikes', {'id': user_id}, lambda: DislikeMatcher(get_globally_disliked_foods(user_id)))
+
+
+def invalidate_dislike_matcher(user_id):
+    """Forget a user's compiled dislikes after their food preferences change"""
+    DISLIKE_MATCHERS.invalidate(user_id)
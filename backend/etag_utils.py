@@ -0,0 +1,64 @@
+import functools
+import hashlib
+
+from flask import current_app, request
+
+from database import get_data_version
+from json_response import SCHEMA_HEADER, encoded_etags, wants_compact
+
+# Conditional requests for read endpoints whose data rarely changes.
+#
+# database.py keeps a version per user and resource (data_versions table);
+# the write functions bump it in the same transaction as the change. A
+# @versioned(resource) endpoint derives a strong ETag from that version, and a
+# request whose If-None-Match matches gets 304 after a single version lookup,
+# without running the endpoint. GET (user_id in the query string) lets
+# browsers revalidate on their own; POST callers can send If-None-Match too.
+#
+#   GET /api/get_custom_foods?user_id=...   -> 200 with ETag: "..."
+#   same request with If-None-Match: "..."  -> 304 until the user adds a food
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+def request_data():
+    """Query arguments for GET and HEAD, the JSON body otherwise"""
+    if request.method in ('GET', 'HEAD'):
+        return request.args
+    return request.json or {}
+
+
+def data_etag(user_id, resource):
+    """Strong ETag for the current version of a user's resource in the requested schema"""
+    version = get_data_version(user_id, resource)
+    variant = 'compact' if wants_compact() else 'full'
+    return hashlib.sha1(f"{resource}:{user_id}:{version}:{variant}".encode()).hexdigest()[:24]
+
+
+def _cacheable(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    response.vary.update(['Accept-Encoding', SCHEMA_HEADER])
+    return response
+
+
+def versioned(resource):
+    """Tag an endpoint's 200 responses with resource's ETag and answer a matching If-None-Match with 304"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = request_data().get('user_id')
+            if not user_id:
+                return view(*args, **kwargs)
+
+            etag = data_etag(user_id, resource)
+            for candidate in encoded_etags(etag):
+                if request.if_none_match.contains_weak(candidate):
+                    return _cacheable(current_app.response_class(status=304), candidate)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _cacheable(response, etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,354 @@
+import os
+from datetime import date, datetime
+
+import numpy as np
+
+# Per-exercise progression stats over exercise_performance, kept in the
+# exercise_stats table:
+#
+#   has_new_sets(cursor, user_id)           cheap check before taking the write lock
+#   update_exercise_stats(cursor, user_id)   fold new sets in; returns new personal records
+#   read_exercise_stats(cursor, user_id)     one dict per exercise
+#   progression_suggestions(stats)           next-session advice from those dicts
+#
+# Sets are scored by estimated 1RM (Epley: weight * (1 + reps / 30)), or by
+# reps for bodyweight exercises. exercise_performance is append-only, so each
+# stats row keeps running totals and bests plus the id of the last set folded
+# in; an update reads only the sets past that id, then refits the trend slope
+# (least squares over each day's best score) from the trend window of the
+# exercises that changed. The work follows the new sets and the window, not
+# the length of the history.
+#
+# Environment:
+#   NUTRIFIT_PROGRESSION_WINDOW_DAYS   days of history the trend covers (default 84)
+
+TREND_WINDOW_DAYS = int(os.getenv("NUTRIFIT_PROGRESSION_WINDOW_DAYS", "84"))
+EPLEY_MAX_REPS = 15  # Higher-rep sets are scored as if they were 15 reps
+PLATEAU_PERCENT_PER_WEEK = 0.5
+MIN_TREND_DAYS = 3
+RETURNING_AFTER_DAYS = 21
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Day numbers (days since 1970-01-01) for a date_performed value
+EPOCH_DAY_SQL = "CAST(julianday(DATE(date_performed)) - 2440587.5 AS INTEGER)"
+# Sets the stats can use; unnamed or undated sets are skipped
+USABLE_SET_SQL = "exercise_name != '' AND DATE(date_performed) IS NOT NULL"
+
+STATS_COLUMNS = (
+    'exercise_name', 'metric', 'sessions', 'total_sets', 'total_reps', 'total_volume_lb',
+    'best_e1rm_lb', 'best_e1rm_date', 'best_weight_lb', 'best_reps', 'last_performed',
+    'last_weight_lb', 'last_reps', 'trend_per_week', 'trend_percent_per_week', 'trend_days',
+    'last_performance_id'
+)
+
+
+def create_exercise_stats_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS exercise_stats (
+        user_id TEXT NOT NULL,
+        exercise_name TEXT NOT NULL,
+        metric TEXT NOT NULL, -- 'e1rm_lb', or 'reps' for bodyweight exercises
+        sessions INTEGER NOT NULL DEFAULT 0,
+        total_sets REAL NOT NULL DEFAULT 0,
+        total_reps REAL NOT NULL DEFAULT 0,
+        total_volume_lb REAL NOT NULL DEFAULT 0,
+        best_e1rm_lb REAL NOT NULL DEFAULT 0,
+        best_e1rm_date DATE,
+        best_weight_lb REAL NOT NULL DEFAULT 0,
+        best_reps REAL NOT NULL DEFAULT 0,
+        last_performed DATE,
+        last_weight_lb REAL,
+        last_reps REAL,
+        trend_per_week REAL NOT NULL DEFAULT 0, -- metric units per week
+        trend_percent_per_week REAL NOT NULL DEFAULT 0,
+        trend_days INTEGER NOT NULL DEFAULT 0, -- training days the trend was fitted on
+        last_performance_id INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, exercise_name)
+    )
+    """)
+    # New sets by id (the rowid rides along in the index) and trend windows by date
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_exercise_performance_user ON exercise_performance(user_id)")
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_exercise_performance_user_exercise
+    ON exercise_performance (user_id, exercise_name, date_performed)
+    """)
+
+
+def estimated_1rm(weight, reps):
+    """Epley one-rep max estimate per set; 0 for sets without weight or reps"""
+    weight = np.asarray(weight, dtype=float)
+    reps = np.asarray(reps, dtype=float)
+    e1rm = np.where(reps > 1, weight * (1 + np.minimum(reps, EPLEY_MAX_REPS) / 30.0), weight)
+    return np.where((weight > 0) & (reps > 0), e1rm, 0.0)
+
+
+def day_to_date(day):
+    return date.fromordinal(int(day) + EPOCH_ORDINAL).isoformat()
+
+
+def _last_in_group(groups, *keys):
+    """Index of each group's row with the largest keys, compared in order; groups are numbered 0..k-1"""
+    order = np.lexsort(keys[::-1] + (groups,))
+    ends = np.flatnonzero(np.diff(groups[order])) if len(order) > 1 else np.array([], dtype=int)
+    return order[np.append(ends, len(order) - 1)]
+
+
+def group_slopes(groups, x, y, n_groups):
+    """Least-squares slope of y on x per group; 0 for groups with fewer than two distinct x"""
+    n = np.bincount(groups, minlength=n_groups).astype(float)
+    sx = np.bincount(groups, x, n_groups)
+    sy = np.bincount(groups, y, n_groups)
+    sxx = np.bincount(groups, x * x, n_groups)
+    sxy = np.bincount(groups, x * y, n_groups)
+    denominator = n * sxx - sx * sx
+    slopes = np.zeros(n_groups)
+    np.divide(n * sxy - sx * sy, denominator, out=slopes, where=denominator > 1e-9)
+    means = np.divide(sy, n, out=np.zeros(n_groups), where=n > 0)
+    return slopes, means, n.astype(int)
+
+
+def summarize_sets(names, session_ids, days, sets, reps, weight):
+    """Per-exercise totals, bests and latest top set for a batch of sets, keyed by exercise name"""
+    exercises, groups = np.unique(np.asarray(names, dtype=object).astype(str), return_inverse=True)
+    k = len(exercises)
+    sets, reps, weight = (np.asarray(a, dtype=float) for a in (sets, reps, weight))
+    days = np.asarray(days, dtype=np.int64)
+    e1rm = estimated_1rm(weight, reps)
+
+    sessions = np.unique(np.column_stack([groups, np.asarray(session_ids, dtype=np.int64)]), axis=0)
+    session_counts = np.bincount(sessions[:, 0], minlength=k)
+    total_sets = np.bincount(groups, sets, k)
+    total_reps = np.bincount(groups, sets * reps, k)
+    total_volume = np.bincount(groups, sets * reps * weight, k)
+    weighted = np.bincount(groups, (weight > 0).astype(float), k) > 0
+
+    best_e1rm = _last_in_group(groups, e1rm, -days)  # the first day the best was reached
+    best_weight = _last_in_group(groups, weight)
+    best_reps = _last_in_group(groups, reps)
+    # Latest day's top set: by e1rm, or by reps for bodyweight work
+    latest = _last_in_group(groups, days, np.where(weight > 0, e1rm, reps))
+
+    return {
+        str(name): {
+            'metric': 'e1rm_lb' if weighted[i] else 'reps',
+            'sessions': int(session_counts[i]),
+            'total_sets': float(total_sets[i]),
+            'total_reps': float(total_reps[i]),
+            'total_volume_lb': round(float(total_volume[i]), 1),
+            'best_e1rm_lb': round(float(e1rm[best_e1rm[i]]), 1),
+            'best_e1rm_date': day_to_date(days[best_e1rm[i]]),
+            'best_weight_lb': float(weight[best_weight[i]]),
+            'best_reps': float(reps[best_reps[i]]),
+            'last_day': int(days[latest[i]]),
+            'last_weight_lb': float(weight[latest[i]]),
+            'last_reps': float(reps[latest[i]])
+        }
+        for i, name in enumerate(exercises)
+    }
+
+
+def fit_trends(names, days, reps, weight, metrics, end_days):
+    """Trend of each exercise's daily best score over the window ending at its end_days entry"""
+    exercises = sorted(metrics)
+    index = {name: i for i, name in enumerate(exercises)}
+    groups = np.array([index[name] for name in names], dtype=np.int64)
+    days, reps, weight = (np.asarray(a, dtype=float) for a in (days, reps, weight))
+    weighted = np.array([metrics[name] == 'e1rm_lb' for name in exercises])
+    end = np.array([end_days[name] for name in exercises], dtype=float)
+
+    # Weighted exercises are tracked by e1rm over their weighted sets only
+    keep = (days > end[groups] - TREND_WINDOW_DAYS) & (days <= end[groups]) & ((weight > 0) == weighted[groups])
+    groups, days, reps, weight = groups[keep], days[keep], reps[keep], weight[keep]
+    score = np.where(weight > 0, estimated_1rm(weight, reps), reps)
+
+    # Best score per exercise and day, then one point per training day
+    span = TREND_WINDOW_DAYS + 1
+    keys, inverse = np.unique(groups * span + (days - (end[groups] - TREND_WINDOW_DAYS)), return_inverse=True)
+    daily_best = np.zeros(len(keys))
+    np.maximum.at(daily_best, inverse, score)
+    day_groups = (keys // span).astype(np.int64)
+    weeks = (keys % span) / 7.0
+
+    slopes, means, counts = group_slopes(day_groups, weeks, daily_best, len(exercises))
+    percent = np.divide(slopes * 100, means, out=np.zeros(len(exercises)), where=means > 0)
+    return {
+        name: {
+            'trend_per_week': round(float(slopes[i]), 3),
+            'trend_percent_per_week': round(float(percent[i]), 3),
+            'trend_days': int(counts[i])
+        }
+        for i, name in enumerate(exercises)
+    }
+
+
+def merge_summary(current, new):
+    """Fold a batch summary into a stored stats row (or None); returns (row, new best e1rm or None)"""
+    if current is None:
+        merged = dict(new)
+        merged['last_performed'] = day_to_date(new['last_day'])
+        return merged, None
+
+    merged = dict(current)
+    for key in ('sessions', 'total_sets', 'total_reps', 'total_volume_lb'):
+        merged[key] = current[key] + new[key]
+    merged['best_weight_lb'] = max(current['best_weight_lb'], new['best_weight_lb'])
+    merged['best_reps'] = max(current['best_reps'], new['best_reps'])
+    if new['metric'] == 'e1rm_lb':
+        merged['metric'] = 'e1rm_lb'
+
+    record = None
+    if new['best_e1rm_lb'] > current['best_e1rm_lb']:
+        merged['best_e1rm_lb'] = new['best_e1rm_lb']
+        merged['best_e1rm_date'] = new['best_e1rm_date']
+        if current['best_e1rm_lb'] > 0:
+            record = current['best_e1rm_lb']
+    elif new['best_e1rm_lb'] == current['best_e1rm_lb'] and (
+            current['best_e1rm_date'] is None or new['best_e1rm_date'] < current['best_e1rm_date']):
+        merged['best_e1rm_date'] = new['best_e1rm_date']  # a back-dated set reached it first
+
+    # Back-dated sets don't replace the latest session
+    new_last = day_to_date(new['last_day'])
+    if current['last_performed'] is None or new_last >= current['last_performed']:
+        merged['last_performed'] = new_last
+        merged['last_weight_lb'] = new['last_weight_lb']
+        merged['last_reps'] = new['last_reps']
+    return merged, record
+
+
+def read_exercise_stats(cursor, user_id, exercise_name=None):
+    """Stored stats for a user's exercises, most recently trained first"""
+    query = f"SELECT {', '.join(STATS_COLUMNS)} FROM exercise_stats WHERE user_id = ?"
+    params = [user_id]
+    if exercise_name:
+        query += " AND exercise_name = ?"
+        params.append(exercise_name)
+    cursor.execute(query + " ORDER BY last_performed DESC, exercise_name", params)
+    return [dict(zip(STATS_COLUMNS, row)) for row in cursor.fetchall()]
+
+
+def has_new_sets(cursor, user_id):
+    """True if sets were logged since the user's stats were last updated"""
+    cursor.execute(f"""
+    SELECT (SELECT MAX(id) FROM exercise_performance WHERE user_id = ? AND {USABLE_SET_SQL})
+         > (SELECT COALESCE(MAX(last_performance_id), 0) FROM exercise_stats WHERE user_id = ?)
+    """, (user_id, user_id))
+    return bool(cursor.fetchone()[0])
+
+
+def update_exercise_stats(cursor, user_id):
+    """Fold sets logged since the last update into exercise_stats; returns the new personal records"""
+    cursor.execute("SELECT COALESCE(MAX(last_performance_id), 0) FROM exercise_stats WHERE user_id = ?",
+                   (user_id,))
+    last_id = cursor.fetchone()[0]
+    cursor.execute(f"""
+    SELECT id, exercise_name, COALESCE(workout_session_id, 0), {EPOCH_DAY_SQL},
+           CAST(COALESCE(sets, 0) AS REAL), CAST(COALESCE(reps, 0) AS REAL), CAST(COALESCE(weight_lb, 0) AS REAL)
+    FROM exercise_performance
+    WHERE user_id = ? AND id > ? AND {USABLE_SET_SQL}
+    ORDER BY id
+    """, (user_id, last_id))
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+
+    ids, names, session_ids, days, sets, reps, weight = zip(*rows)
+    summaries = summarize_sets(names, session_ids, days, sets, reps, weight)
+    current = {stats['exercise_name']: stats for stats in read_exercise_stats(cursor, user_id)}
+
+    merged, records = {}, []
+    for name, summary in summaries.items():
+        merged[name], previous_best = merge_summary(current.get(name), summary)
+        if previous_best is not None:
+            records.append({
+                'exercise_name': name,
+                'estimated_1rm_lb': merged[name]['best_e1rm_lb'],
+                'previous_best_lb': previous_best,
+                'date': merged[name]['best_e1rm_date']
+            })
+
+    # Refit the trends of the exercises that changed, each over the window ending at its latest set
+    end_days = {name: (date.fromisoformat(str(stats['last_performed'])[:10]).toordinal() - EPOCH_ORDINAL)
+                for name, stats in merged.items()}
+    placeholders = ','.join('?' * len(merged))
+    since = day_to_date(min(end_days.values()) - TREND_WINDOW_DAYS)
+    cursor.execute(f"""
+    SELECT exercise_name, {EPOCH_DAY_SQL}, CAST(COALESCE(reps, 0) AS REAL), CAST(COALESCE(weight_lb, 0) AS REAL)
+    FROM exercise_performance
+    WHERE user_id = ? AND exercise_name IN ({placeholders}) AND date_performed >= ?
+      AND DATE(date_performed) IS NOT NULL
+    """, (user_id, *merged, since))
+    window = cursor.fetchall()
+    if window:
+        trends = fit_trends(*zip(*window), {name: stats['metric'] for name, stats in merged.items()}, end_days)
+        for name, trend in trends.items():
+            merged[name].update(trend)
+
+    high_water = max(ids)
+    cursor.executemany(f"""
+    INSERT OR REPLACE INTO exercise_stats (user_id, {', '.join(STATS_COLUMNS)}, updated_at)
+    VALUES (?, {', '.join('?' * len(STATS_COLUMNS))}, CURRENT_TIMESTAMP)
+    """, [
+        (user_id, name, *[stats.get(column, 0) for column in STATS_COLUMNS[1:-1]], high_water)
+        for name, stats in merged.items()
+    ])
+    return records
+
+
+def _round_weight(weight_lb):
+    """Nearest loadable weight: 2.5 lb steps"""
+    return round(weight_lb / 2.5) * 2.5
+
+
+def progression_suggestions(stats, today=None):
+    """Next-session advice for each exercise, from its stats"""
+    today = today or datetime.now().date()
+    suggestions = []
+    for exercise in stats:
+        name = exercise['exercise_name']
+        weight = exercise['last_weight_lb'] or 0
+        reps = int(exercise['last_reps'] or 0)
+        last = date.fromisoformat(str(exercise['last_performed'])[:10])
+        days_since = (today - last).days
+        trend = exercise['trend_percent_per_week']
+        bodyweight = exercise['metric'] == 'reps'
+        next_weight, next_reps = weight, reps
+
+        if days_since > RETURNING_AFTER_DAYS:
+            status = 'returning'
+            next_weight = _round_weight(weight * 0.9)
+            message = f"It's been {days_since} days since your last {name}. Ease back in"
+        elif exercise['trend_days'] < MIN_TREND_DAYS:
+            status = 'new'
+            message = f"Log a few more {name} sessions to see a trend. Repeat your last set"
+        elif trend > PLATEAU_PERCENT_PER_WEEK:
+            status = 'progressing'
+            if bodyweight:
+                next_reps = reps + 1
+            else:
+                next_weight = weight + (5 if weight >= 100 else 2.5)
+            message = f"{name} is up {trend:.1f}% a week. Keep adding load"
+        elif trend < -2 * PLATEAU_PERCENT_PER_WEEK:
+            status = 'declining'
+            message = f"{name} is down {-trend:.1f}% a week. Hold the weight and check sleep and rest days"
+        else:
+            status = 'plateau'
+            if bodyweight:
+                message = f"{name} has stalled. Try a harder variation or slower reps"
+            else:
+                next_weight = _round_weight(weight * 0.9)
+                message = f"{name} has stalled. Deload for a week, then build back up"
+
+        suggestion = {
+            'exercise_name': name,
+            'status': status,
+            'message': message + (f": {next_reps} reps" if bodyweight else f": {next_weight:g} lb x {next_reps}"),
+            'next_weight_lb': None if bodyweight else next_weight,
+            'next_reps': next_reps,
+            'days_since': days_since,
+            'trend_percent_per_week': trend
+        }
+        if not bodyweight:
+            suggestion['estimated_1rm_lb'] = exercise['best_e1rm_lb']
+        suggestions.append(suggestion)
+    return suggestions
@@ -0,0 +1,292 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from log_utils import get_logger
+from nutrition_utils import COMMON_FOODS, MEAL_SUGGESTIONS, MEAL_NUTRITION_ESTIMATES, DEFAULT_NUTRITION_ESTIMATE
+
+# Local stand-in for the USDA FoodData Central API, so food search can be
+# tested and benchmarked without the network or a USDA_API_KEY. It serves the
+# two routes nutrition_utils uses (foods/search and food/<fdcId>) over a
+# generated corpus, with optional latency, jitter and error injection.
+#
+#   python fake_fdc.py --port 8765 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+#   USDA_API_BASE=http://127.0.0.1:8765/fdc/v1 USDA_API_KEY=fake python app.py
+
+API_PREFIX = '/fdc/v1'
+
+NUTRIENT_IDS = {'calories': 1008, 'protein': 1003, 'fat': 1004, 'carbohydrates': 1005}
+NUTRIENT_INFO = {
+    1008: ('Energy', 'KCAL'),
+    1003: ('Protein', 'G'),
+    1004: ('Total lipid (fat)', 'G'),
+    1005: ('Carbohydrate, by difference', 'G')
+}
+
+# (suffix, data type, nutrition multiplier) for the variants generated per food
+CORPUS_VARIANTS = [
+    ('', 'Survey (FNDDS)', 1.0),
+    (', raw', 'SR Legacy', 0.9),
+    (', cooked', 'Foundation', 1.1)
+]
+# Entries the USDA filter is expected to drop
+NOISE_PREFIXES = ['Baby food', 'Restaurant']
+
+FIRST_FDC_ID = 100000
+
+logger = get_logger(__name__)
+
+
+def _word_set(text):
+    return set(re.findall(r'[a-z0-9]+', text.lower()))
+
+
+def build_corpus(seed=0):
+    """FDC-shaped food records for COMMON_FOODS and every meal suggestion"""
+    rng = random.Random(seed)
+    bases = {}
+    for name, food in COMMON_FOODS.items():
+        bases[name] = {n: food[n] for n in NUTRIENT_IDS}
+    for meal_type, names in MEAL_SUGGESTIONS.items():
+        ranges = MEAL_NUTRITION_ESTIMATES.get(meal_type)
+        for name in names:
+            key = name.lower()
+            if key in bases:
+                continue
+            if ranges:
+                bases[key] = {n: rng.uniform(low, high) for n, (low, high) in ranges.items()}
+            else:
+                bases[key] = dict(DEFAULT_NUTRITION_ESTIMATE)
+
+    corpus = []
+    for name, nutrition in bases.items():
+        description = name.capitalize()
+        for suffix, data_type, factor in CORPUS_VARIANTS:
+            corpus.append((description + suffix, data_type, {n: v * factor for n, v in nutrition.items()}))
+        prefix = NOISE_PREFIXES[zlib.crc32(name.encode()) % len(NOISE_PREFIXES)]
+        corpus.append((f"{prefix}, {name}", 'SR Legacy', nutrition))
+
+    return [
+        {
+            'fdcId': FIRST_FDC_ID + i,
+            'description': description,
+            'dataType': data_type,
+            'nutrition': {n: round(v, 1) for n, v in nutrition.items()}
+        }
+        for i, (description, data_type, nutrition) in enumerate(corpus)
+    ]
+
+
+def load_corpus(path):
+    """Corpus saved with --dump-corpus (a JSON list of build_corpus records)"""
+    with open(path) as f:
+        return json.load(f)
+
+
+class FakeFdcServer:
+    """Threaded FDC-compatible HTTP server over an in-memory corpus"""
+
+    def __init__(self, corpus=None, host='127.0.0.1', port=0, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, api_key=None, seed=None):
+        self.corpus = corpus if corpus is not None else build_corpus()
+        self.by_id = {food['fdcId']: food for food in self.corpus}
+        self.index = {}
+        for position, food in enumerate(self.corpus):
+            for word in _word_set(food['description']):
+                self.index.setdefault(word, []).append(position)
+
+        self.api_key = api_key
+        self.configure(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate, seed=seed)
+        self.requests = {'search': 0, 'food': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+        self.httpd = ThreadingHTTPServer((host, port), _FakeFdcHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def configure(self, latency_ms=None, jitter_ms=None, error_rate=None, seed=None):
+        """Change fault injection while the server is running"""
+        if latency_ms is not None:
+            self.latency_ms = latency_ms
+        if jitter_ms is not None:
+            self.jitter_ms = jitter_ms
+        if error_rate is not None:
+            self.error_rate = error_rate
+        if seed is not None or not hasattr(self, '_rng'):
+            self._rng = random.Random(seed)
+
+    def reset_stats(self):
+        """Zero the request counters"""
+        with self._lock:
+            for key in self.requests:
+                self.requests[key] = 0
+
+    def start(self):
+        """Serve from a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-fdc', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key):
+        with self._lock:
+            self.requests[key] += 1
+
+    def _fault(self):
+        """Sleep for the configured latency; True if this request should fail"""
+        with self._lock:
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+            fail = self._rng.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return fail
+
+    def search(self, query, page_size=50, data_types=None):
+        """foods/search response: foods matching any query word, most matches first"""
+        hits = {}
+        for word in _word_set(query):
+            for position in self.index.get(word, ()):
+                hits[position] = hits.get(position, 0) + 1
+        ranked = sorted(hits, key=lambda position: (-hits[position], position))
+
+        foods = []
+        for position in ranked:
+            food = self.corpus[position]
+            if data_types and food['dataType'] not in data_types:
+                continue
+            foods.append({
+                'fdcId': food['fdcId'],
+                'description': food['description'],
+                'dataType': food['dataType'],
+                'foodNutrients': [
+                    {'nutrientId': NUTRIENT_IDS[n], 'nutrientName': NUTRIENT_INFO[NUTRIENT_IDS[n]][0],
+                     'unitName': NUTRIENT_INFO[NUTRIENT_IDS[n]][1], 'value': value}
+                    for n, value in food['nutrition'].items()
+                ]
+            })
+        return {'totalHits': len(foods), 'currentPage': 1, 'foods': foods[:page_size]}
+
+    def food(self, fdc_id):
+        """food/<fdcId> response, or None if the id isn't in the corpus"""
+        food = self.by_id.get(fdc_id)
+        if food is None:
+            return None
+        return {
+            'fdcId': food['fdcId'],
+            'description': food['description'],
+            'dataType': food['dataType'],
+            'foodNutrients': [
+                {'nutrient': {'id': NUTRIENT_IDS[n], 'name': NUTRIENT_INFO[NUTRIENT_IDS[n]][0],
+                              'unitName': NUTRIENT_INFO[NUTRIENT_IDS[n]][1].lower()},
+                 'amount': value}
+                for n, value in food['nutrition'].items()
+            ]
+        }
+
+
+class _FakeFdcHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else None
+
+        if path == '/foods/search':
+            fake._count('search')
+        elif path and path.startswith('/food/'):
+            fake._count('food')
+        else:
+            return self._send(404, {'error': 'Not found'})
+
+        if fake.api_key and params.get('api_key', [None])[0] != fake.api_key:
+            return self._send(403, {'error': 'API_KEY_INVALID'})
+        if fake._fault():
+            fake._count('errors')
+            return self._send(500, {'error': 'Injected failure'})
+
+        if path == '/foods/search':
+            page_size = int(params.get('pageSize', ['50'])[0])
+            return self._send(200, fake.search(params.get('query', [''])[0], page_size, params.get('dataType')))
+
+        try:
+            food = fake.food(int(path[len('/food/'):]))
+        except ValueError:
+            food = None
+        if food is None:
+            return self._send(404, {'error': 'Food not found'})
+        return self._send(200, food)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (timed out) while we were sleeping
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local FoodData Central stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0, help="added to every response")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="extra random latency, 0 to this")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument('--api-key', help="reject requests without this api_key")
+    parser.add_argument('--seed', type=int, help="seed for latency and error injection")
+    parser.add_argument('--corpus', help="JSON corpus to serve instead of the generated one")
+    parser.add_argument('--dump-corpus', metavar='PATH', help="write the generated corpus and exit")
+    args = parser.parse_args()
+
+    if args.dump_corpus:
+        with open(args.dump_corpus, 'w') as f:
+            json.dump(build_corpus(), f, indent=2)
+        print(f"Wrote corpus to {args.dump_corpus}")
+        return
+
+    corpus = load_corpus(args.corpus) if args.corpus else None
+    server = FakeFdcServer(corpus, args.host, args.port, args.latency_ms, args.jitter_ms,
+                           args.error_rate, args.api_key, args.seed)
+    print(f"Fake FDC serving {len(server.corpus)} foods at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+
+from log_utils import get_logger
+
+# Local stand-in for a Redis server, so the redis cache backend (app_cache.py)
+# can be tested and tried across workers without installing Redis. It speaks
+# RESP2 and implements the commands the backend sends: PING, AUTH, SELECT,
+# GET, SET (NX/PX/EX), MGET, DEL, SCAN, DBSIZE and FLUSHDB. One keyspace;
+# expired keys disappear on access.
+#
+#   python fake_redis.py --port 6390
+#   NUTRIFIT_CACHE_BACKEND=redis NUTRIFIT_CACHE_URL=redis://127.0.0.1:6390/0 python app.py
+
+logger = get_logger(__name__)
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()  # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if not args:
+                return
+            self.wfile.write(self.server.fake.run(args))
+
+
+def _encode(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, bool):
+        return b'+OK\r\n' if reply else b'$-1\r\n'
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    if isinstance(reply, list):
+        return b'*%d\r\n' % len(reply) + b''.join(_encode(item) for item in reply)
+    if isinstance(reply, Exception):
+        return b'-ERR %s\r\n' % str(reply).encode()
+    return b'+%s\r\n' % str(reply).encode()
+
+
+class FakeRedisServer:
+    """Threaded Redis-protocol server over an in-memory dict"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.data = {}  # key -> (value, expires_at or None)
+        self.commands = {}
+        self._lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer((host, port), _RespHandler, bind_and_activate=False)
+        self.server.allow_reuse_address = True
+        self.server.daemon_threads = True
+        self.server.server_bind()
+        self.server.server_activate()
+        self.server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            entry = None
+        return entry
+
+    def run(self, args):
+        """One command's encoded reply"""
+        name = args[0].decode().upper()
+        with self._lock:
+            self.commands[name] = self.commands.get(name, 0) + 1
+            try:
+                handler = getattr(self, f"cmd_{name.lower()}", None)
+                if handler is None:
+                    return _encode(ValueError(f"unknown command '{name}'"))
+                return _encode(handler(*args[1:]))
+            except (TypeError, ValueError) as e:
+                return _encode(ValueError(str(e) or 'syntax error'))
+
+    def cmd_ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    def cmd_auth(self, *args):
+        return 'OK'
+
+    def cmd_select(self, db):
+        return 'OK'
+
+    def cmd_get(self, key):
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    def cmd_mget(self, *keys):
+        return [self.cmd_get(key) for key in keys]
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() if option.isalpha() else option for option in options]
+        expires_at = None
+        for unit, scale in ((b'PX', 0.001), (b'EX', 1.0)):
+            if unit in options:
+                expires_at = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+        if b'NX' in options and self._live(key) is not None:
+            return None
+        self.data[key] = (value, expires_at)
+        return True
+
+    def cmd_del(self, *keys):
+        return sum(1 for key in keys if self._live(key) is not None and self.data.pop(key))
+
+    def cmd_scan(self, cursor, *options):
+        options = list(options)
+        pattern = options[options.index(b'MATCH') + 1].decode() if b'MATCH' in options else '*'
+        keys = [key for key in list(self.data) if self._live(key) and fnmatch.fnmatchcase(key.decode(), pattern)]
+        return [b'0', keys]
+
+    def cmd_dbsize(self):
+        return sum(1 for key in list(self.data) if self._live(key))
+
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        return 'OK'
+
+    def start(self):
+        """Serve from a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-redis', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in for the application cache")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+
+    server = FakeRedisServer(args.host, args.port)
+    logger.info("Fake Redis listening on %s", server.url)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
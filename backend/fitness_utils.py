@@ -1,6 +1,13 @@
 import random
+from collections import Counter
 from datetime import datetime, timedelta
 import json
+import numpy as np
+from workout_catalog import compile_workout_catalog, MAIN_SOURCE, QUICK_SOURCE
+from workout_scoring import WorkoutScorer, infer_workout_type, top_k
+from log_utils import get_logger, SAMPLED
+
+logger = get_logger(__name__)
 
 # EXPANDED QUICK WORKOUT DATABASE 
 QUICK_WORKOUT_DATABASE = {
@@ -1254,6 +1261,22 @@ EQUIPMENT_MAPPING = {
     'gym_membership_full_access': ['gym_full', 'dumbbells', 'bodyweight', 'exercise_bike', 'treadmill']
 }
 
+# Muscle groups a strength workout must hit to count toward a quick-workout focus
+FOCUS_MUSCLE_GROUPS = {
+    'upper_body': ['chest', 'shoulders', 'arms', 'back'],
+    'lower_body': ['quads', 'glutes', 'hamstrings', 'calves'],
+    'core': ['core']
+}
+
+# Compiled once at import; recommenders select candidates from its indexes
+WORKOUT_CATALOG = compile_workout_catalog(
+    WORKOUT_DATABASE, QUICK_WORKOUT_DATABASE, BASIC_UNIVERSAL_WORKOUTS,
+    EQUIPMENT_MAPPING, FOCUS_MUSCLE_GROUPS
+)
+
+# Batch scorer over the catalog; reseed() it for reproducible scores in tests
+WORKOUT_SCORER = WorkoutScorer(WORKOUT_CATALOG)
+
 
 def get_workout_recommendations(user_profile, preferences=None, custom_workouts=None):
     """Get personalized workout recommendations based on user profile and equipment - INCLUDES CUSTOM WORKOUTS"""
@@ -1287,179 +1310,155 @@ def get_workout_recommendations(user_profile, preferences=None, custom_workouts=
             if equipment in EQUIPMENT_MAPPING:
                 available_workout_types.update(EQUIPMENT_MAPPING[equipment])
 
-    print(f"DEBUG: User training styles: {training_styles}")
-    print(f"DEBUG: Available workout types: {available_workout_types}")
-    print(f"DEBUG: Experience level: {experience}")
+    logger.debug("User training styles: %s", training_styles)
+    logger.debug("Available workout types: %s", available_workout_types)
+    logger.debug("Experience level: %s", experience)
+
+    # Cardio and flexibility workouts need one of these types, or no equipment at all
+    equipped_workouts = WORKOUT_CATALOG.equipped(available_workout_types)
    
     # ADD CUSTOM WORKOUTS FIRST (if any exist)
     if user_id:
         try:
-            import sqlite3
-            import json
-            from database import DB_PATH
+            from database import get_compatible_custom_workouts
             
-            with sqlite3.connect(DB_PATH) as conn:
-                c = conn.cursor()
-                c.execute("""
-                SELECT plan_name, plan_data, created_at
-                FROM workout_plans
-                WHERE user_id = ? AND plan_name LIKE 'Custom:%'
-                ORDER BY created_at DESC
-                """, (user_id,))
+            # Only the newest five the user has the equipment for
+            for plan_data in get_compatible_custom_workouts(user_id, available_workout_types, limit=5):
+                # Format custom workout for recommendations
+                custom_workout = {
+                    'name': plan_data.get('name', 'Custom Workout'),
+                    'type': plan_data.get('type', 'strength'),
+                    'duration': plan_data.get('duration', 30),
+                    'calories_burned': plan_data.get('calories_burned', 200),
+                    'intensity': plan_data.get('intensity', 'moderate'),
+                    'equipment': plan_data.get('equipment', ['none']),
+                    'muscle_groups': plan_data.get('muscle_groups', ['custom']),
+                    'exercises': plan_data.get('exercises', []),
+                    'difficulty_level': plan_data.get('difficulty_level', 'moderate'),
+                    'created_by_user': True
+                }
                 
-                custom_count = 0
-                for row in c.fetchall():
-                    if custom_count >= 5:  # Limit custom workouts
-                        break
-                        
-                    plan_name = row[0]
-                    plan_data = json.loads(row[1])
-                    
-                    # Format custom workout for recommendations
-                    custom_workout = {
-                        'name': plan_data.get('name', plan_name.replace('Custom: ', '')),
-                        'type': plan_data.get('type', 'strength'),
-                        'duration': plan_data.get('duration', 30),
-                        'calories_burned': plan_data.get('calories_burned', 200),
-                        'intensity': plan_data.get('intensity', 'moderate'),
-                        'equipment': plan_data.get('equipment', ['none']),
-                        'muscle_groups': plan_data.get('muscle_groups', ['custom']),
-                        'exercises': plan_data.get('exercises', []),
-                        'difficulty_level': plan_data.get('difficulty_level', 'moderate'),
-                        'created_by_user': True
-                    }
-                    
-                    # Check if user has required equipment for custom workout
-                    workout_equipment = custom_workout.get('equipment', ['none'])
-                    equipment_available = (any(eq in available_workout_types for eq in workout_equipment) or
-                                         'none' in workout_equipment or
-                                         any(eq == 'none' for eq in workout_equipment))
-                    
-                    if equipment_available:
-                        recommendations.append({
-                            'type': custom_workout.get('type', 'strength'),
-                            'category': 'custom',
-                            'workout': custom_workout,
-                            'match_score': calculate_match_score(custom_workout, user_profile, available_workout_types) + 10  # Bonus for custom workouts
-                        })
-                        custom_count += 1
-                        print(f"DEBUG: Added custom workout: {custom_workout.get('name', 'Custom Workout')}")
+                recommendations.append({
+                    'type': custom_workout.get('type', 'strength'),
+                    'category': 'custom',
+                    'workout': custom_workout,
+                    'match_score': calculate_match_score(custom_workout, user_profile, available_workout_types) + 10  # Bonus for custom workouts
+                })
+                logger.debug("Added custom workout: %s", custom_workout.get('name', 'Custom Workout'), extra=SAMPLED)
                         
         except Exception as e:
-            print(f"DEBUG: Error fetching custom workouts: {e}")
+            logger.warning("Error fetching custom workouts: %s", e)
    
     # STRENGTH WORKOUTS - Include if user wants strength training OR no preferences specified
     include_strength = (not training_styles or
                        any(style in training_styles for style in ['weightlifting', 'strength_training', 'bodyweight', 'powerlifting']))
    
     if include_strength:
-        print("DEBUG: Including strength workouts")
-        strength_workouts = WORKOUT_DATABASE['strength'].get(experience, {})
-       
-        for workout_type in available_workout_types:
-            if workout_type in strength_workouts:
-                workouts = strength_workouts[workout_type]
-                if isinstance(workouts, list):
-                    for workout in workouts:
-                        # More lenient duration matching
-                        duration_diff = abs(workout['duration'] - workout_duration)
-                        if duration_diff <= 25:  # Allow 25 minute difference
-                            recommendations.append({
-                                'type': 'strength',
-                                'category': workout_type,
-                                'workout': workout,
-                                'match_score': calculate_match_score(workout, user_profile, available_workout_types)
-                            })
-                            print(f"DEBUG: Added strength workout: {workout['name']}")
+        logger.debug("Including strength workouts")
+        # Strength categories are equipment types; allow a 25 minute duration difference
+        entries = WORKOUT_CATALOG.select(
+            WORKOUT_CATALOG.lookup(MAIN_SOURCE, 'strength', experience),
+            WORKOUT_CATALOG.in_categories(MAIN_SOURCE, available_workout_types),
+            WORKOUT_CATALOG.within_duration(MAIN_SOURCE, workout_duration, 25)
+        )
+        scores = WORKOUT_SCORER.match_scores(user_profile, available_workout_types, [e.id for e in entries])
+        for entry, score in zip(entries, scores):
+            recommendations.append({
+                'type': 'strength',
+                'category': entry.category,
+                'workout': entry.workout,
+                'match_score': int(score)
+            })
+            logger.debug("Added strength workout: %s", entry.name, extra=SAMPLED)
    
     # CARDIO WORKOUTS - Include if user wants cardio OR no preferences specified
     include_cardio = (not training_styles or
                      any(style in training_styles for style in ['cardio', 'running', 'hiit', 'cycling', 'swimming']))
    
     if include_cardio:
-        print("DEBUG: Including cardio workouts")
-        cardio_workouts = WORKOUT_DATABASE['cardio'].get(experience, [])
-       
-        for workout in cardio_workouts:
-            workout_equipment = workout.get('equipment', ['none'])
-            # Check if user has the required equipment
-            equipment_available = (any(eq in available_workout_types for eq in workout_equipment) or
-                                 'none' in workout_equipment or
-                                 any(eq == 'none' for eq in workout_equipment))
-           
-            if equipment_available:
-                duration_diff = abs(workout['duration'] - workout_duration)
-                if duration_diff <= 20:  # Allow 20 minute difference for cardio
-                    recommendations.append({
-                        'type': 'cardio',
-                        'workout': workout,
-                        'match_score': calculate_match_score(workout, user_profile, available_workout_types)
-                    })
-                    print(f"DEBUG: Added cardio workout: {workout['name']}")
+        logger.debug("Including cardio workouts")
+        # Allow 20 minute difference for cardio
+        entries = WORKOUT_CATALOG.select(
+            WORKOUT_CATALOG.lookup(MAIN_SOURCE, 'cardio', experience),
+            equipped_workouts,
+            WORKOUT_CATALOG.within_duration(MAIN_SOURCE, workout_duration, 20)
+        )
+        scores = WORKOUT_SCORER.match_scores(user_profile, available_workout_types, [e.id for e in entries])
+        for entry, score in zip(entries, scores):
+            recommendations.append({
+                'type': 'cardio',
+                'workout': entry.workout,
+                'match_score': int(score)
+            })
+            logger.debug("Added cardio workout: %s", entry.name, extra=SAMPLED)
    
     # FLEXIBILITY/YOGA WORKOUTS - Include if user wants flexibility OR no preferences specified
     include_flexibility = (not training_styles or
                           any(style in training_styles for style in ['yoga', 'pilates', 'stretching', 'flexibility']))
    
     if include_flexibility:
-        print("DEBUG: Including flexibility workouts")
-        flexibility_workouts = WORKOUT_DATABASE['flexibility'].get(experience, [])
-       
-        for workout in flexibility_workouts:
-            workout_equipment = workout.get('equipment', ['none'])
-            equipment_available = (any(eq in available_workout_types for eq in workout_equipment) or
-                                 'none' in workout_equipment or
-                                 any(eq == 'none' for eq in workout_equipment))
-           
-            if equipment_available:
-                recommendations.append({
-                    'type': 'flexibility',
-                    'workout': workout,
-                    'match_score': calculate_match_score(workout, user_profile, available_workout_types)
-                })
-                print(f"DEBUG: Added flexibility workout: {workout['name']}")
+        logger.debug("Including flexibility workouts")
+        entries = WORKOUT_CATALOG.select(
+            WORKOUT_CATALOG.lookup(MAIN_SOURCE, 'flexibility', experience),
+            equipped_workouts
+        )
+        scores = WORKOUT_SCORER.match_scores(user_profile, available_workout_types, [e.id for e in entries])
+        for entry, score in zip(entries, scores):
+            recommendations.append({
+                'type': 'flexibility',
+                'workout': entry.workout,
+                'match_score': int(score)
+            })
+            logger.debug("Added flexibility workout: %s", entry.name, extra=SAMPLED)
    
     # If no training styles specified, ensure we have at least one of each type
     if not training_styles:
-        print("DEBUG: No training styles specified, ensuring variety")
+        logger.debug("No training styles specified, ensuring variety")
        
         # Ensure at least one strength workout
         if not any(rec['type'] == 'strength' for rec in recommendations):
-            bodyweight_workouts = WORKOUT_DATABASE['strength'].get(experience, {}).get('bodyweight', [])
+            bodyweight_workouts = WORKOUT_CATALOG.select(
+                WORKOUT_CATALOG.lookup(MAIN_SOURCE, 'strength', experience),
+                WORKOUT_CATALOG.in_categories(MAIN_SOURCE, ['bodyweight'])
+            )
             if bodyweight_workouts:
                 recommendations.append({
                     'type': 'strength',
                     'category': 'bodyweight',
-                    'workout': bodyweight_workouts[0],
+                    'workout': bodyweight_workouts[0].workout,
                     'match_score': 75
                 })
-                print("DEBUG: Added fallback strength workout")
+                logger.debug("Added fallback strength workout")
        
         # Ensure at least one cardio workout
         if not any(rec['type'] == 'cardio' for rec in recommendations):
-            cardio_workouts = WORKOUT_DATABASE['cardio'].get(experience, [])
-            bodyweight_cardio = [w for w in cardio_workouts if 'none' in w.get('equipment', [])]
+            bodyweight_cardio = WORKOUT_CATALOG.select(
+                WORKOUT_CATALOG.lookup(MAIN_SOURCE, 'cardio', experience),
+                WORKOUT_CATALOG.equipped([])
+            )
             if bodyweight_cardio:
                 recommendations.append({
                     'type': 'cardio',
-                    'workout': bodyweight_cardio[0],
+                    'workout': bodyweight_cardio[0].workout,
                     'match_score': 75
                 })
-                print("DEBUG: Added fallback cardio workout")
+                logger.debug("Added fallback cardio workout")
        
         # Ensure at least one flexibility workout
         if not any(rec['type'] == 'flexibility' for rec in recommendations):
-            flexibility_workouts = WORKOUT_DATABASE['flexibility'].get(experience, [])
-            basic_flexibility = [w for w in flexibility_workouts if 'none' in w.get('equipment', [])]
+            basic_flexibility = WORKOUT_CATALOG.select(
+                WORKOUT_CATALOG.lookup(MAIN_SOURCE, 'flexibility', experience),
+                WORKOUT_CATALOG.equipped([])
+            )
             if basic_flexibility:
                 recommendations.append({
                     'type': 'flexibility',
-                    'workout': basic_flexibility[0],
+                    'workout': basic_flexibility[0].workout,
                     'match_score': 75
                 })
-                print("DEBUG: Added fallback flexibility workout")
+                logger.debug("Added fallback flexibility workout")
 
-    print(f"DEBUG: Total recommendations before sorting: {len(recommendations)}")
+    logger.debug("Total recommendations before sorting: %s", len(recommendations))
    
     # Sort by match score (custom workouts will rank higher due to bonus)
     recommendations.sort(key=lambda x: x['match_score'], reverse=True)
@@ -1506,9 +1505,9 @@ def get_workout_recommendations(user_profile, preferences=None, custom_workouts=
             if rec not in diverse_recommendations:
                 diverse_recommendations.append(rec)
    
-    print(f"DEBUG: Final recommendations by type: {dict(type_counts)}")
-    print(f"DEBUG: Custom workouts included: {custom_count}")
-    print(f"DEBUG: Total final recommendations: {len(diverse_recommendations)}")
+    logger.debug("Final recommendations by type: %s", type_counts)
+    logger.debug("Custom workouts included: %s", custom_count)
+    logger.debug("Total final recommendations: %s", len(diverse_recommendations))
    
     # Shuffle within each type to add variety (but keep custom workouts at top)
     custom_recs = [r for r in diverse_recommendations if r.get('category') == 'custom']
@@ -1569,20 +1568,8 @@ def calculate_match_score(workout, user_profile, available_equipment):
     # Training style alignment (max 25 points)
     training_styles = user_profile.get('training_styles', [])
     
-    # Get workout type from the recommendation
-    workout_type = None
-    if hasattr(workout, 'get'):
-        workout_type = workout.get('type')
-    
-    # If workout_type is not in the workout dict, infer from context
-    if not workout_type:
-        if 'exercises' in workout:
-            workout_type = 'strength'
-        elif 'instructions' in workout:
-            if any(word in workout.get('name', '').lower() for word in ['cardio', 'running', 'bike', 'hiit']):
-                workout_type = 'cardio'
-            else:
-                workout_type = 'flexibility'
+    # Get workout type from the recommendation, or infer it from context
+    workout_type = infer_workout_type(workout)
     
     if training_styles:
         if 'weightlifting' in training_styles and (workout_type == 'strength' or 'exercises' in workout):
@@ -1652,12 +1639,13 @@ def calculate_match_score(workout, user_profile, available_equipment):
    
     return min(score, 100)  # Cap at 100
 
-def get_workout_plan(user_profile, days_per_week=None):
+def get_workout_plan(user_profile, days_per_week=None, recommendations=None):
     """Generate a weekly workout plan with proper variety - ENHANCED"""
     if not days_per_week:
         days_per_week = user_profile.get('workout_frequency', 3)
    
-    recommendations = get_workout_recommendations(user_profile)
+    if recommendations is None:
+        recommendations = get_workout_recommendations(user_profile)
    
     if not recommendations:
         return []
@@ -1834,8 +1822,8 @@ def generate_workout_stats(workout_history, days_back=30):
     avg_calories = total_calories / total_workouts if total_workouts > 0 else 0
    
     # Find most common workout type
-    workout_types = [w['type'] for w in recent_workouts]
-    most_common_type = max(set(workout_types), key=workout_types.count) if workout_types else "None"
+    type_counts = Counter(w['type'] for w in recent_workouts)
+    most_common_type = type_counts.most_common(1)[0][0] if type_counts else "None"
    
     # Calculate consistency score (percentage of days with workouts)
     days_with_workouts = len(set(w['date'].date() for w in recent_workouts))
@@ -2019,83 +2007,82 @@ def get_quick_workout_suggestions(user_profile, duration, focus, equipment, excl
     # 1. GET USER PREFERENCES AND FILTER OUT DISLIKED WORKOUTS FIRST
     user_id = user_profile.get('id') if user_profile else None
     disliked_workouts = set()
+    liked_workouts = set()
     
     if user_id:
         try:
             from database import get_user_workout_preferences
             preferences = get_user_workout_preferences(user_id)
             disliked_workouts = set(preferences.get('disliked', []))
-            print(f"🚫 User has {len(disliked_workouts)} disliked workouts: {list(disliked_workouts)}")
+            liked_workouts = set(preferences.get('liked', []))
+            logger.debug("User has %s disliked workouts: %s", len(disliked_workouts), disliked_workouts)
         except Exception as e:
-            print(f"⚠️ Error getting user preferences: {e}")
+            logger.warning("Error getting user preferences: %s", e)
             disliked_workouts = set()
     
     # Combine excluded workouts with user's dislikes
     all_excluded = set(excluded_workouts) | disliked_workouts
-    print(f"🚫 Total excluded workouts: {len(all_excluded)}")
+    logger.debug("Total excluded workouts: %s", len(all_excluded))
     
     # 2. GET WORKOUTS FROM QUICK WORKOUT DATABASE WITH EXACT DURATION MATCHING
     
-    # Map duration to exact keys in our database
-    duration_key = f'{duration}_min'
+    # Candidates come from the precompiled catalog: workouts the user has the
+    # equipment for, minus anything excluded or disliked
+    equipped_workouts = WORKOUT_CATALOG.equipped(equipment)
+    excluded_ids = WORKOUT_CATALOG.named(all_excluded)
+    focus_workouts = WORKOUT_CATALOG.in_categories(QUICK_SOURCE, [focus])
+    exact_duration_workouts = WORKOUT_CATALOG.within_duration(QUICK_SOURCE, duration, 0)
     
-    # Get workouts from quick workout database
-    focus_workouts = QUICK_WORKOUT_DATABASE.get(focus, {})
-    exact_duration_workouts = focus_workouts.get(duration_key, [])
+    entries = WORKOUT_CATALOG.select(focus_workouts, exact_duration_workouts, equipped_workouts,
+                                     exclude=excluded_ids)
+    scores = WORKOUT_SCORER.quick_scores(user_profile, duration, [e.id for e in entries])
+    for entry, score in zip(entries, scores):
+        suggestions.append({
+            'workout': entry.workout,
+            'score': int(score),
+            'match_reason': get_match_reason(entry.workout, duration, focus, equipment),
+            'source': 'quick_database'
+        })
     
-    # Filter by equipment availability and preferences
-    for workout in exact_duration_workouts:
-        workout_equipment = workout.get('equipment', ['none'])
-        
-        # Skip if workout is disliked or excluded
-        if workout['name'] in all_excluded:
-            print(f"⏭️ Skipping excluded/disliked workout: {workout['name']}")
-            continue
-        
-        # Check if user has required equipment
-        if ('none' in workout_equipment or 
-            (equipment and any(eq in equipment for eq in workout_equipment)) or
-            (not equipment and 'none' in workout_equipment)):
+    # 3. ALSO CHECK OTHER DURATION CATEGORIES FOR CLOSE MATCHES (±5 minutes)
+    close_duration_workouts = WORKOUT_CATALOG.within_duration(QUICK_SOURCE, duration, 5) - exact_duration_workouts
+    
+    entries = WORKOUT_CATALOG.select(focus_workouts, close_duration_workouts, equipped_workouts,
+                                     exclude=excluded_ids)
+    scores = WORKOUT_SCORER.quick_scores(user_profile, duration, [e.id for e in entries])
+    for entry, score in zip(entries, scores):
+        workout = entry.workout
+        suggestions.append({
+            'workout': workout,
+            'score': int(score) - 5,  # Small penalty for inexact match
+            'match_reason': f"Close match ({workout['duration']} min) • " + get_match_reason(workout, duration, focus, equipment),
+            'source': 'quick_database'
+        })
+    
+    # 4. GET COMPATIBLE WORKOUTS FROM MAIN WORKOUT DATABASE (only if we need more suggestions)
+    experience = user_profile.get('fitness_experience', 'beginner') if user_profile else 'beginner'
+    suggested_names = {s['workout']['name'] for s in suggestions}
+    
+    # Allow 10 minute flexibility for main database workouts
+    main_duration_workouts = WORKOUT_CATALOG.within_duration(MAIN_SOURCE, duration, 10)
+    
+    def add_main_workouts(entries, label):
+        entries = [entry for entry in entries if entry.name not in suggested_names]
+        scores = WORKOUT_SCORER.quick_scores(user_profile, duration, [e.id for e in entries])
+        for entry, base_score in zip(entries, scores):
+            workout = entry.workout
+            # Calculate penalty for duration mismatch, 2 points per minute off
+            duration_penalty = abs(workout['duration'] - duration) * 2
             
             suggestions.append({
                 'workout': workout,
-                'score': calculate_quick_workout_score(workout, user_profile, duration),
-                'match_reason': get_match_reason(workout, duration, focus, equipment),
-                'source': 'quick_database'
+                'score': max(0, int(base_score) - duration_penalty),
+                'match_reason': f"From {label} training • " + get_match_reason(workout, duration, focus, equipment),
+                'source': 'main_database'
             })
+            suggested_names.add(entry.name)
     
-    # 3. ALSO CHECK OTHER DURATION CATEGORIES FOR CLOSE MATCHES (±5 minutes)
-    all_duration_keys = ['10_min', '15_min', '20_min', '30_min', '45_min']
-    target_durations = {
-        '10_min': 10, '15_min': 15, '20_min': 20, '30_min': 30, '45_min': 45
-    }
-    
-    for dur_key in all_duration_keys:
-        if dur_key != duration_key:  # Skip the exact match we already checked
-            dur_value = target_durations[dur_key]
-            if abs(dur_value - duration) <= 5:  # Within 5 minutes
-                close_workouts = focus_workouts.get(dur_key, [])
-                for workout in close_workouts:
-                    # Skip if workout is disliked or excluded
-                    if workout['name'] in all_excluded:
-                        continue
-                        
-                    workout_equipment = workout.get('equipment', ['none'])
-                    if ('none' in workout_equipment or 
-                        (equipment and any(eq in equipment for eq in workout_equipment)) or
-                        (not equipment and 'none' in workout_equipment)):
-                        
-                        suggestions.append({
-                            'workout': workout,
-                            'score': calculate_quick_workout_score(workout, user_profile, duration) - 5,  # Small penalty for inexact match
-                            'match_reason': f"Close match ({workout['duration']} min) • " + get_match_reason(workout, duration, focus, equipment),
-                            'source': 'quick_database'
-                        })
-    
-    # 4. GET COMPATIBLE WORKOUTS FROM MAIN WORKOUT DATABASE (only if we need more suggestions)
     if len(suggestions) < 5:
-        experience = user_profile.get('fitness_experience', 'beginner') if user_profile else 'beginner'
-        
         # Map focus areas to workout types
         if focus == 'full_body':
             workout_types = ['strength', 'cardio']
@@ -2106,153 +2093,55 @@ def get_quick_workout_suggestions(user_profile, duration, focus, equipment, excl
         else:
             workout_types = ['strength', 'cardio']
         
-        # Search main workout database
         for workout_type in workout_types:
             if workout_type == 'strength' and focus != 'cardio':
-                # Get strength workouts
-                strength_workouts = WORKOUT_DATABASE.get('strength', {}).get(experience, {})
-                
-                for equipment_type, workouts in strength_workouts.items():
-                    if isinstance(workouts, list):
-                        for workout in workouts:
-                            # Skip if workout is disliked or excluded
-                            if workout['name'] in all_excluded:
-                                continue
-                                
-                            # Check EXACT duration first, then allow small differences
-                            duration_diff = abs(workout['duration'] - duration)
-                            if duration_diff <= 10:  # Allow 10 minute flexibility for main database
-                                # Check equipment compatibility
-                                workout_equipment = workout.get('equipment', ['none'])
-                                equipment_compatible = (
-                                    'none' in workout_equipment or
-                                    (equipment and any(eq in equipment for eq in workout_equipment)) or
-                                    (not equipment and 'none' in workout_equipment)
-                                )
-                                
-                                if (equipment_compatible and
-                                    workout['name'] not in [s['workout']['name'] for s in suggestions]):
-                                    
-                                    # Check if workout matches focus area
-                                    focus_match = True
-                                    if focus == 'upper_body':
-                                        focus_match = any(muscle in workout.get('muscle_groups', []) 
-                                                        for muscle in ['chest', 'shoulders', 'arms', 'back'])
-                                    elif focus == 'lower_body':
-                                        focus_match = any(muscle in workout.get('muscle_groups', []) 
-                                                        for muscle in ['quads', 'glutes', 'hamstrings', 'calves'])
-                                    elif focus == 'core':
-                                        focus_match = 'core' in workout.get('muscle_groups', [])
-                                    
-                                    if focus_match:
-                                        # Calculate penalty for duration mismatch
-                                        duration_penalty = duration_diff * 2  # 2 points per minute off
-                                        base_score = calculate_quick_workout_score(workout, user_profile, duration)
-                                        
-                                        suggestions.append({
-                                            'workout': workout,
-                                            'score': max(0, base_score - duration_penalty),
-                                            'match_reason': f"From {workout_type} training • " + get_match_reason(workout, duration, focus, equipment),
-                                            'source': 'main_database'
-                                        })
+                # Strength workouts must also hit the focus area's muscle groups
+                add_main_workouts(WORKOUT_CATALOG.select(
+                    WORKOUT_CATALOG.lookup(MAIN_SOURCE, 'strength', experience),
+                    main_duration_workouts, equipped_workouts, WORKOUT_CATALOG.for_focus(focus),
+                    exclude=excluded_ids
+                ), workout_type)
             
             elif workout_type == 'cardio':
-                # Get cardio workouts
-                cardio_workouts = WORKOUT_DATABASE.get('cardio', {}).get(experience, [])
-                
-                for workout in cardio_workouts:
-                    # Skip if workout is disliked or excluded
-                    if workout['name'] in all_excluded:
-                        continue
-                        
-                    # Check duration compatibility
-                    duration_diff = abs(workout['duration'] - duration)
-                    if duration_diff <= 10:
-                        # Check equipment compatibility
-                        workout_equipment = workout.get('equipment', ['none'])
-                        equipment_compatible = (
-                            'none' in workout_equipment or
-                            (equipment and any(eq in equipment for eq in workout_equipment)) or
-                            (not equipment and 'none' in workout_equipment)
-                        )
-                        
-                        if (equipment_compatible and 
-                            workout['name'] not in [s['workout']['name'] for s in suggestions]):
-                            
-                            duration_penalty = duration_diff * 2
-                            base_score = calculate_quick_workout_score(workout, user_profile, duration)
-                            
-                            suggestions.append({
-                                'workout': workout,
-                                'score': max(0, base_score - duration_penalty),
-                                'match_reason': f"From cardio training • " + get_match_reason(workout, duration, focus, equipment),
-                                'source': 'main_database'
-                            })
+                add_main_workouts(WORKOUT_CATALOG.select(
+                    WORKOUT_CATALOG.lookup(MAIN_SOURCE, 'cardio', experience),
+                    main_duration_workouts, equipped_workouts,
+                    exclude=excluded_ids
+                ), 'cardio')
     
     # 5. ADD FLEXIBILITY WORKOUTS IF REQUESTED
     if focus == 'flexibility':
-        flexibility_workouts = WORKOUT_DATABASE.get('flexibility', {}).get(
-            user_profile.get('fitness_experience', 'beginner') if user_profile else 'beginner', []
-        )
-        
-        for workout in flexibility_workouts:
-            # Skip if workout is disliked or excluded
-            if workout['name'] in all_excluded:
-                continue
-                
-            duration_diff = abs(workout['duration'] - duration)
-            if duration_diff <= 10:
-                workout_equipment = workout.get('equipment', ['none'])
-                equipment_compatible = (
-                    'none' in workout_equipment or
-                    (equipment and any(eq in equipment for eq in workout_equipment))
-                )
-                
-                if (equipment_compatible and 
-                    workout['name'] not in [s['workout']['name'] for s in suggestions]):
-                    
-                    duration_penalty = duration_diff * 2
-                    base_score = calculate_quick_workout_score(workout, user_profile, duration)
-                    
-                    suggestions.append({
-                        'workout': workout,
-                        'score': max(0, base_score - duration_penalty),
-                        'match_reason': f"From flexibility training • " + get_match_reason(workout, duration, focus, equipment),
-                        'source': 'main_database'
-                    })
+        add_main_workouts(WORKOUT_CATALOG.select(
+            WORKOUT_CATALOG.lookup(MAIN_SOURCE, 'flexibility', experience),
+            main_duration_workouts, equipped_workouts,
+            exclude=excluded_ids
+        ), 'flexibility')
     
-    # 6. Score and sort workouts (prioritize exact duration matches and user preferences)
-    suggestions.sort(key=lambda x: x['score'], reverse=True)
+    # 6. Rank workouts by score (prioritize exact duration matches and user preferences)
+    ranking_scores = np.array([s['score'] for s in suggestions])
+    exact_positions = np.flatnonzero([s['workout']['duration'] == duration for s in suggestions])
+    close_positions = np.flatnonzero([s['workout']['duration'] != duration for s in suggestions])
     
     # Apply user likes bonus
-    if user_id:
-        try:
-            from database import get_user_workout_preferences
-            preferences = get_user_workout_preferences(user_id)
-            liked_workouts = set(preferences.get('liked', []))
-            
-            # Boost score for liked workouts
-            for suggestion in suggestions:
-                if suggestion['workout']['name'] in liked_workouts:
-                    suggestion['score'] += 15  # Boost liked workouts
-                    suggestion['match_reason'] = "❤️ You liked this workout • " + suggestion['match_reason']
-        except:
-            pass
+    for suggestion in suggestions:
+        if suggestion['workout']['name'] in liked_workouts:
+            suggestion['score'] += 15  # Boost liked workouts
+            suggestion['match_reason'] = "❤️ You liked this workout • " + suggestion['match_reason']
     
     # Return top suggestions with variety, prioritizing exact duration matches
     final_suggestions = []
-    exact_matches = [s for s in suggestions if s['workout']['duration'] == duration]
-    close_matches = [s for s in suggestions if s['workout']['duration'] != duration]
     
-    # Add exact matches first
-    final_suggestions.extend(exact_matches[:6])
+    # Add the best exact matches first
+    for i in exact_positions[top_k(ranking_scores[exact_positions], 6)]:
+        final_suggestions.append(suggestions[i])
     
-    # Fill remaining slots with close matches if needed
+    # Fill remaining slots with the best close matches if needed
     remaining_slots = 8 - len(final_suggestions)
     if remaining_slots > 0:
-        final_suggestions.extend(close_matches[:remaining_slots])
+        for i in close_positions[top_k(ranking_scores[close_positions], remaining_slots)]:
+            final_suggestions.append(suggestions[i])
     
-    print(f"✅ Returning {len(final_suggestions)} filtered suggestions (excluded {len(all_excluded)} workouts)")
+    logger.debug("Returning %s filtered suggestions (excluded %s workouts)", len(final_suggestions), len(all_excluded))
     return final_suggestions[:8]  # Return up to 8 suggestions
 
 def calculate_quick_workout_score(workout, user_profile, target_duration):
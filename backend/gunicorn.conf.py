@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import sqlite3
+
+# Production gunicorn settings. Run from backend/:
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# Worker and thread counts come from the CPU count unless WEB_CONCURRENCY /
+# GUNICORN_THREADS say otherwise. Requests are mostly short SQLite queries
+# and scoring, so each worker runs a few threads (gthread) and the worker count
+# tracks the cores; SQLite serializes writers, so more processes don't help.
+#
+# The async food search app (asgi.py) runs under the same settings with
+# -k uvicorn.workers.UvicornWorker asgi:application; GUNICORN_THREADS doesn't
+# apply there, its thread pools are sized by NUTRIFIT_DB_THREADS and
+# NUTRIFIT_WSGI_THREADS.
+#
+# Reloading: kill -HUP <master> starts fresh workers and retires the old ones
+# gracefully (graceful_timeout), re-reading this file. The app is preloaded,
+# so HUP does not pick up code changes; for a code deploy send USR2 (start a
+# new master) and then WINCH/TERM to the old one.
+#
+# Environment:
+#   PORT                    listen port (default 5001)
+#   WEB_CONCURRENCY         worker processes (default: CPU count, 2 to 8)
+#   GUNICORN_THREADS        threads per worker (default 4)
+#   GUNICORN_TIMEOUT        seconds before a stuck worker is restarted (default 60)
+#   GUNICORN_MAX_REQUESTS   recycle a worker after this many requests (default 2000, 0 = never)
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))  # respects container CPU pinning
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+def default_workers(cpus=None):
+    return max(2, min(8, cpus or _cpu_count()))
+
+
+wsgi_app = 'wsgi:application'
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', default_workers()))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+preload_app = True
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('NUTRIFIT_LOG_LEVEL', 'info').lower()
+
+
+def on_starting(server):
+    """Master process, once, before the app is loaded or any worker forks"""
+    from app import init_database
+    init_database()
+    server.log.info("Database ready")
+
+
+def post_fork(server, worker):
+    """Each worker: check it can reach the database with its own connection"""
+    # Connections are opened per call, so nothing opened by the master is
+    # carried across the fork; this only fails fast on a missing or locked DB
+    import database
+    with sqlite3.connect(database.DB_PATH, timeout=10) as conn:
+        conn.execute("SELECT 1 FROM users LIMIT 1")
+    server.log.info("Worker %s ready", worker.pid)
@@ -0,0 +1,360 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from log_utils import get_logger
+from request_metrics import Counter, Histogram, DURATION_BUCKETS, gauge_lines
+
+# Background jobs for work a request doesn't need to wait for (badge checks,
+# activity feed entries, meal pool hydration).
+#
+#   @job('award_workout_badges')
+#   def award_workout_badges(user_id): ...
+#
+#   JOBS.enqueue('award_workout_badges', {'user_id': user_id}, unique_key=f"badges:{user_id}")
+#
+# Jobs are rows in the jobs table of the app database, so they survive
+# restarts. Worker threads in each process claim due jobs with a lease; a job
+# whose worker dies is claimed again once its lease runs out, so a job can run
+# more than once and handlers must be safe to repeat. Failures are retried
+# with exponential backoff up to max_attempts, then left as 'failed'; so is a
+# job whose lease runs out on its last attempt.
+# unique_key skips enqueueing while an identical job is still waiting.
+#
+# Threads start with the first request in each process (never in the gunicorn
+# master); jobs enqueued elsewhere wait in the table for a worker.
+# `python job_queue.py work` runs a standalone worker and
+# `python job_queue.py stats` prints the queue.
+#
+# Environment:
+#   NUTRIFIT_JOBS_MODE           thread (default), or sync to run jobs inline as they are enqueued (tests)
+#   NUTRIFIT_JOB_THREADS         worker threads per process (default 2)
+#   NUTRIFIT_JOB_POLL_SECONDS    how often idle workers look for due jobs (default 1)
+#   NUTRIFIT_JOB_LEASE_SECONDS   how long a claimed job may run before others may claim it (default 300)
+
+JOB_HANDLERS = {}
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 600.0
+DONE_RETENTION_SECONDS = 24 * 3600
+PURGE_EVERY_SECONDS = 600
+
+logger = get_logger(__name__)
+
+
+def job(name):
+    """Register a function as the handler for jobs called name; it gets the payload as keyword arguments"""
+    def decorator(func):
+        JOB_HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def create_jobs_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        unique_key TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        run_at REAL NOT NULL,
+        locked_by TEXT,
+        locked_until REAL,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(status, run_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_unique_key ON jobs(unique_key, status)")
+
+
+class JobQueue:
+    """SQLite-backed job queue with in-process worker threads"""
+
+    def __init__(self, db_path=None, threads=2, poll_interval=1.0, lease_seconds=300.0, synchronous=False):
+        self._db_path = db_path
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.synchronous = synchronous
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._workers = []
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._last_purge = 0.0
+        self.pid = None
+        self.reset_metrics()
+
+    @property
+    def db_path(self):
+        if self._db_path is not None:
+            return self._db_path
+        import database
+        return database.DB_PATH
+
+    def reset_metrics(self):
+        with self._metrics_lock:
+            self.outcomes = Counter('nutrifit_jobs_processed_total', 'Jobs run, by outcome', ('job', 'outcome'))
+            self.durations = Histogram('nutrifit_job_duration_seconds', 'Time spent running a job', ('job',),
+                                       DURATION_BUCKETS)
+
+    def enqueue(self, name, payload=None, delay=0.0, max_attempts=DEFAULT_MAX_ATTEMPTS, unique_key=None):
+        """Queue a job to run after delay seconds; returns its id (the waiting one's, for a repeated unique_key)"""
+        if name not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job {name!r}")
+        now = time.time()
+        with sqlite3.connect(self.db_path, timeout=10) as conn:
+            c = conn.cursor()
+            if unique_key is not None:
+                c.execute("SELECT id FROM jobs WHERE unique_key = ? AND status = 'queued' LIMIT 1", (unique_key,))
+                row = c.fetchone()
+                if row:
+                    return row[0]
+            c.execute("""
+            INSERT INTO jobs (name, payload, unique_key, max_attempts, run_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, json.dumps(payload or {}), unique_key, max_attempts, now + delay, now))
+            job_id = c.lastrowid
+
+        if self.synchronous:
+            if not delay:
+                self.run_pending(job_id=job_id)
+        else:
+            self._wake.set()
+        return job_id
+
+    def claim(self, job_id=None, now=None):
+        """Lease one due job (or job_id if it's due) to the caller; returns (id, name, payload, attempts, token) or None"""
+        now = time.time() if now is None else now
+        due = "((status = 'queued' AND run_at <= ?) OR (status = 'running' AND locked_until <= ?))"
+        with sqlite3.connect(self.db_path, timeout=10) as conn:
+            c = conn.cursor()
+            while True:
+                # Look before locking, so idle polls don't take SQLite's write lock
+                if job_id is None:
+                    c.execute(f"SELECT id, name, status, attempts, max_attempts FROM jobs WHERE {due} "
+                              "ORDER BY run_at LIMIT 1", (now, now))
+                else:
+                    c.execute(f"SELECT id, name, status, attempts, max_attempts FROM jobs WHERE id = ? AND {due}",
+                              (job_id, now, now))
+                row = c.fetchone()
+                if row is None:
+                    return None
+                if row[2] == 'running' and row[3] >= row[4]:
+                    # Its worker died on the last attempt; don't run it again
+                    self._abandoned(c, row[0], row[1], row[3], now)
+                    conn.commit()
+                    if job_id is not None:
+                        return None
+                    continue
+                token = uuid.uuid4().hex
+                c.execute(f"""
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?, locked_until = ?
+                WHERE id = ? AND {due} AND (status = 'queued' OR attempts < max_attempts)
+                """, (token, now + self.lease_seconds, row[0], now, now))
+                conn.commit()
+                if c.rowcount == 1:
+                    c.execute("SELECT id, name, payload, attempts FROM jobs WHERE id = ?", (row[0],))
+                    claimed = c.fetchone()
+                    return claimed[0], claimed[1], json.loads(claimed[2]), claimed[3], token
+                if job_id is not None:
+                    return None
+                # Another worker claimed it first; look again
+
+    def _abandoned(self, cursor, job_id, name, attempts, now):
+        cursor.execute("""
+        UPDATE jobs SET status = 'failed', finished_at = ?, locked_until = NULL, last_error = ?
+        WHERE id = ? AND status = 'running' AND locked_until <= ? AND attempts >= max_attempts
+        """, (now, 'lease expired on the final attempt', job_id, now))
+        if cursor.rowcount:
+            logger.error("Job %s (%s) failed after %d attempts: lease expired on the final attempt",
+                         job_id, name, attempts)
+            with self._metrics_lock:
+                self.outcomes.inc((name, 'failed'))
+
+    def execute(self, claimed, now=None):
+        """Run a claimed job and record the outcome: done, retry, failed, or lost if its lease ran out first"""
+        job_id, name, payload, attempts, token = claimed
+        start = time.perf_counter()
+        try:
+            handler = JOB_HANDLERS.get(name)
+            if handler is None:
+                raise LookupError(f"No handler registered for job {name!r}")
+            handler(**payload)
+        except Exception as e:
+            outcome = self._failed(job_id, name, attempts, token, e, now)
+        else:
+            with sqlite3.connect(self.db_path, timeout=10) as conn:
+                c = conn.cursor()
+                c.execute("""
+                UPDATE jobs SET status = 'done', finished_at = ?, locked_until = NULL, last_error = NULL
+                WHERE id = ? AND locked_by = ?
+                """, (time.time(), job_id, token))
+                outcome = 'done' if c.rowcount else 'lost'
+        if outcome == 'lost':
+            logger.warning("Job %s (%s) outlived its lease; another worker has it now", job_id, name)
+        with self._metrics_lock:
+            self.outcomes.inc((name, outcome))
+            self.durations.observe((name,), time.perf_counter() - start)
+        return outcome
+
+    def _failed(self, job_id, name, attempts, token, error, now=None):
+        now = time.time() if now is None else now
+        with sqlite3.connect(self.db_path, timeout=10) as conn:
+            c = conn.cursor()
+            c.execute("SELECT max_attempts FROM jobs WHERE id = ?", (job_id,))
+            row = c.fetchone()
+            if row and attempts < row[0]:
+                delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+                c.execute("""
+                UPDATE jobs SET status = 'queued', run_at = ?, locked_until = NULL, last_error = ?
+                WHERE id = ? AND locked_by = ?
+                """, (now + delay, repr(error), job_id, token))
+                if not c.rowcount:
+                    return 'lost'
+                logger.warning("Job %s (%s) failed on attempt %d, retrying in %.0fs: %s",
+                               job_id, name, attempts, delay, error)
+                return 'retry'
+            c.execute("""
+            UPDATE jobs SET status = 'failed', finished_at = ?, locked_until = NULL, last_error = ?
+            WHERE id = ? AND locked_by = ?
+            """, (now, repr(error), job_id, token))
+            if not c.rowcount:
+                return 'lost'
+        logger.error("Job %s (%s) failed after %d attempts: %s", job_id, name, attempts, error)
+        return 'failed'
+
+    def run_pending(self, limit=None, job_id=None, now=None):
+        """Run due jobs in the calling thread until none are left (or limit); returns how many ran"""
+        ran = 0
+        while limit is None or ran < limit:
+            claimed = self.claim(job_id=job_id, now=now)
+            if claimed is None:
+                break
+            self.execute(claimed, now)
+            ran += 1
+            if job_id is not None:
+                break
+        return ran
+
+    def purge(self, older_than=DONE_RETENTION_SECONDS):
+        """Delete finished jobs older than older_than seconds (failed ones are kept for inspection)"""
+        with sqlite3.connect(self.db_path, timeout=10) as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM jobs WHERE status = 'done' AND finished_at < ?", (time.time() - older_than,))
+            return c.rowcount
+
+    @property
+    def running(self):
+        return any(worker.is_alive() for worker in self._workers) and self.pid == os.getpid()
+
+    def start(self):
+        """Start the worker threads in this process (a forked worker needs its own start)"""
+        if self.synchronous or self.running:
+            return self
+        with self._start_lock:
+            if self.running:
+                return self
+            self._stop.clear()
+            self.pid = os.getpid()
+            self._workers = [threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                             for i in range(self.threads)]
+            for worker in self._workers:
+                worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self.pid == os.getpid():
+            for worker in self._workers:
+                worker.join(timeout)
+        self._workers = []
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.claim()
+                if claimed is not None:
+                    self.execute(claimed)
+                    continue
+                if time.monotonic() - self._last_purge > PURGE_EVERY_SECONDS:
+                    self._last_purge = time.monotonic()
+                    self.purge()
+            except Exception as e:
+                logger.error("Job worker failed: %s", e)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def stats(self):
+        """Job counts by status and the age of the oldest due job"""
+        now = time.time()
+        with sqlite3.connect(self.db_path, timeout=10) as conn:
+            c = conn.cursor()
+            c.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            counts = dict(c.fetchall())
+            c.execute("SELECT MIN(run_at) FROM jobs WHERE status = 'queued' AND run_at <= ?", (now,))
+            oldest = c.fetchone()[0]
+        return {
+            'counts': {status: counts.get(status, 0) for status in ('queued', 'running', 'done', 'failed')},
+            'oldest_due_seconds': round(now - oldest, 3) if oldest else 0.0,
+            'workers': len(self._workers) if self.running else 0
+        }
+
+    def metric_lines(self):
+        """Queue depth and per-job outcomes for /metrics"""
+        try:
+            stats = self.stats()
+        except sqlite3.Error as e:  # e.g. a database without the jobs table yet
+            logger.warning("Could not read job queue stats: %s", e)
+            stats = {'counts': {}, 'oldest_due_seconds': 0.0, 'workers': 0}
+        lines = gauge_lines('nutrifit_jobs', 'Jobs in the queue table by status',
+                            {(status,): count for status, count in stats['counts'].items()}, ('status',))
+        lines += gauge_lines('nutrifit_jobs_oldest_due_seconds', 'How long the oldest due job has waited',
+                             {(): stats['oldest_due_seconds']})
+        lines += gauge_lines('nutrifit_job_workers', 'Job worker threads in this process', {(): stats['workers']})
+        with self._metrics_lock:
+            lines += self.outcomes.render() + self.durations.render()
+        return lines
+
+
+JOBS = JobQueue(
+    threads=int(os.getenv("NUTRIFIT_JOB_THREADS", "2")),
+    poll_interval=float(os.getenv("NUTRIFIT_JOB_POLL_SECONDS", "1")),
+    lease_seconds=float(os.getenv("NUTRIFIT_JOB_LEASE_SECONDS", "300")),
+    synchronous=os.getenv("NUTRIFIT_JOBS_MODE", "thread") == "sync"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run or inspect the background job queue")
+    parser.add_argument('command', choices=['work', 'stats'])
+    args = parser.parse_args()
+
+    import database  # registers the handlers
+    import meal_pool  # noqa: F401
+    if args.command == 'stats':
+        print(json.dumps(JOBS.stats(), indent=2))
+        return
+
+    JOBS.synchronous = False
+    JOBS.start()
+    logger.info("Working jobs from %s with %d threads", database.DB_PATH, JOBS.threads)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        JOBS.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import gzip
+import os
+import threading
+import time
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_accept_header
+
+from request_metrics import Counter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response encoding for the Flask app.
+#
+# OrjsonProvider replaces Flask's stdlib JSON provider, so jsonify and
+# request.json go through orjson. Output decodes to the same JSON as the stdlib
+# provider's (sorted keys, dates as HTTP dates, compact unless debugging) but
+# isn't always byte-identical: orjson writes non-ASCII as raw UTF-8 where the
+# stdlib escapes it ("jalapeño" vs "jalape\u00f1o") and writes 1e16 for 1e+16.
+# Anything orjson can't encode falls back to the stdlib encoder.
+#
+# Compact schema: clients opting in with ?schema=compact or the header
+# X-Nutrifit-Schema: compact get payloads without the compatibility aliases
+# (workout_type, duration_minutes, calories, intensity) wherever the canonical
+# key (type, duration, calories_burned, difficulty_level) holds the same value.
+#
+# Compression: JSON and text bodies of at least NUTRIFIT_COMPRESS_MIN_BYTES
+# are sent with brotli (when installed) or gzip, whichever the client's
+# Accept-Encoding prefers. Bytes before and after encoding and the time spent
+# serializing and compressing are counted per endpoint on /metrics. Strong
+# ETags get the coding appended ("v1" -> "v1-gzip") since the bytes differ.
+#
+# Environment:
+#   NUTRIFIT_COMPRESSION         0 to never compress responses (default 1)
+#   NUTRIFIT_COMPRESS_MIN_BYTES  smallest body worth compressing (default 1024)
+#   NUTRIFIT_GZIP_LEVEL          gzip level, 1-9 (default 6)
+#   NUTRIFIT_BROTLI_QUALITY      brotli quality, 0-11 (default 5)
+
+COMPACT_ALIASES = {
+    'workout_type': 'type',
+    'duration_minutes': 'duration',
+    'calories': 'calories_burned',
+    'intensity': 'difficulty_level'
+}
+SCHEMA_HEADER = 'X-Nutrifit-Schema'
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/csv', 'application/x-ndjson')
+
+COMPRESSION = os.getenv("NUTRIFIT_COMPRESSION", "1") != "0"
+COMPRESS_MIN_BYTES = int(os.getenv("NUTRIFIT_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("NUTRIFIT_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("NUTRIFIT_BROTLI_QUALITY", "5"))
+
+
+def compact_payload(value):
+    """value without alias keys that duplicate their canonical key"""
+    if isinstance(value, dict):
+        return {
+            key: compact_payload(item) for key, item in value.items()
+            if not (key in COMPACT_ALIASES and COMPACT_ALIASES[key] in value
+                    and value[COMPACT_ALIASES[key]] == item)
+        }
+    if isinstance(value, (list, tuple)):
+        return [compact_payload(item) for item in value]
+    return value
+
+
+def wants_compact():
+    """True if the current request opted into the compact schema"""
+    from flask import has_request_context, request
+
+    if not has_request_context():
+        return False
+    return 'compact' in (request.args.get('schema'), request.headers.get(SCHEMA_HEADER))
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider encoding with orjson, or stdlib json when it isn't installed"""
+
+    def _options(self, pretty):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def encode(self, obj, pretty=False):
+        """obj as UTF-8 JSON bytes"""
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._options(pretty))
+            except TypeError:
+                pass  # e.g. integers past 64 bits; let the stdlib encoder try
+        dump_args = {'indent': 2} if pretty else {'separators': (',', ':')}
+        return super().dumps(obj, **dump_args).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or orjson is None:
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs or orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        compact = wants_compact()
+        if compact:
+            obj = compact_payload(obj)
+
+        start = time.perf_counter()
+        body = self.encode(obj, pretty=self.compact is False or (self.compact is None and self._app.debug))
+        RESPONSE_STATS.add_encode_time(time.perf_counter() - start)
+
+        response = self._app.response_class(body + b"\n", mimetype=self.mimetype)
+        if compact:
+            response.headers[SCHEMA_HEADER] = 'compact'
+        return response
+
+
+def choose_encoding(accept_encoding):
+    """'br', 'gzip' or None, whichever available coding the Accept-Encoding value prefers"""
+    accepted = parse_accept_header(accept_encoding or '')
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best = max(available, key=lambda encoding: (accepted.quality(encoding), encoding == 'br'))
+    return best if accepted.quality(best) > 0 else None
+
+
+def encoded_etags(etag):
+    """etag and the variants the compression hook gives it, one per content coding"""
+    return [etag] + [f"{etag}-{encoding}" for encoding in ('gzip', 'br')]
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def encode_body(body, accept_encoding, mimetype, endpoint, min_bytes=None):
+    """(body, content coding or None) for a response; records the sizes and time for endpoint"""
+    min_bytes = COMPRESS_MIN_BYTES if min_bytes is None else min_bytes
+    encoding = None
+    if len(body) >= min_bytes and mimetype in COMPRESSIBLE_MIMETYPES:
+        encoding = choose_encoding(accept_encoding)
+
+    sent, seconds = body, 0.0
+    if encoding is not None:
+        start = time.perf_counter()
+        compressed = compress(body, encoding)
+        seconds = time.perf_counter() - start
+        if len(compressed) < len(body):
+            sent = compressed
+        else:
+            encoding = None
+    RESPONSE_STATS.record(endpoint, encoding or 'identity', len(body), len(sent), seconds)
+    return sent, encoding
+
+
+class ResponseStats:
+    """Per-endpoint serialization and compression counters for /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            route = ('endpoint',)
+            self.identity_bytes = Counter('nutrifit_http_response_identity_bytes_total',
+                                          'Response bytes before compression', route)
+            self.sent_bytes = Counter('nutrifit_http_response_sent_bytes_total',
+                                      'Response bytes after compression', ('endpoint', 'encoding'))
+            self.encode_seconds = Counter('nutrifit_http_response_encode_seconds_total',
+                                          'Time spent serializing JSON responses', route)
+            self.compress_seconds = Counter('nutrifit_http_response_compress_seconds_total',
+                                            'Time spent compressing responses', route)
+
+    def add_encode_time(self, seconds):
+        """Serialization time for the response this thread is building"""
+        self._pending.seconds = getattr(self._pending, 'seconds', 0.0) + seconds
+
+    def record(self, endpoint, encoding, identity_size, sent_size, compress_seconds):
+        encode_seconds, self._pending.seconds = getattr(self._pending, 'seconds', 0.0), 0.0
+        with self._lock:
+            self.identity_bytes.inc((endpoint,), identity_size)
+            self.sent_bytes.inc((endpoint, encoding), sent_size)
+            self.encode_seconds.inc((endpoint,), round(encode_seconds, 6))
+            self.compress_seconds.inc((endpoint,), round(compress_seconds, 6))
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.identity_bytes, self.sent_bytes, self.encode_seconds, self.compress_seconds):
+                lines.extend(metric.render())
+            return lines
+
+
+RESPONSE_STATS = ResponseStats()
+
+
+def install_response_encoding(app, metrics=None):
+    """Use OrjsonProvider for app and compress its responses; stats go to metrics' /metrics"""
+    from flask import request
+
+    app.json_provider_class = OrjsonProvider
+    app.json = OrjsonProvider(app)
+    if metrics is not None:
+        metrics.add_collector(RESPONSE_STATS.render)
+
+    if not COMPRESSION:
+        return app
+
+    @app.after_request
+    def _compress_response(response):
+        if response.direct_passthrough or response.is_streamed:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        accept_encoding = None
+        if response.status_code not in (204, 304) and 'Content-Encoding' not in response.headers:
+            accept_encoding = request.headers.get('Accept-Encoding')
+            if response.mimetype in COMPRESSIBLE_MIMETYPES:
+                response.vary.add('Accept-Encoding')
+
+        body, encoding = encode_body(response.get_data(), accept_encoding, response.mimetype, endpoint)
+        if encoding is not None:
+            response.set_data(body)
+            response.headers['Content-Encoding'] = encoding
+            etag, weak = response.get_etag()
+            if etag and not weak:
+                # A strong ETag names exact bytes, so each coding gets its own
+                response.set_etag(f"{etag}-{encoding}")
+        return response
+
+    return app
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Backend logging setup. Modules log through get_logger(__name__) with lazy
+# %-style arguments, so a disabled level costs one isEnabledFor check and no
+# string formatting. Output goes to stdout as text or one JSON object per line.
+#
+# Environment:
+#   NUTRIFIT_LOG_LEVEL         DEBUG / INFO / WARNING / ERROR (default INFO)
+#   NUTRIFIT_LOG_FORMAT        text or json (default text)
+#   NUTRIFIT_LOG_SAMPLE_EVERY  keep 1 in N per-item debug lines (default 10)
+
+LOGGER_NAMESPACE = 'nutrifit'
+DEFAULT_SAMPLE_EVERY = 10
+
+# Pass as extra= on per-item debug lines (one per candidate, row, etc.) so they
+# are sampled instead of logged every time
+SAMPLED = {'sampled': True}
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'sampled'}
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects, including any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Let through one in every `every` sampled records from each call site"""
+
+    def __init__(self, every=DEFAULT_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, int(every))
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False):
+            return True
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(site, 0)
+            self._counts[site] = count + 1
+        if count % self.every:
+            return False
+        if self.every > 1:
+            record.sample_every = self.every
+        return True
+
+
+def configure_logging(level=None, fmt=None, sample_every=None, stream=None):
+    """(Re)configure the backend's log handler; arguments override the environment"""
+    global _configured
+
+    level = level or os.environ.get('NUTRIFIT_LOG_LEVEL', 'INFO')
+    fmt = fmt or os.environ.get('NUTRIFIT_LOG_FORMAT', 'text')
+    if sample_every is None:
+        sample_every = os.environ.get('NUTRIFIT_LOG_SAMPLE_EVERY', DEFAULT_SAMPLE_EVERY)
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    handler.addFilter(SamplingFilter(sample_every))
+
+    with _configure_lock:
+        root = logging.getLogger(LOGGER_NAMESPACE)
+        for old_handler in list(root.handlers):
+            root.removeHandler(old_handler)
+        root.addHandler(handler)
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        root.propagate = False
+        _configured = True
+
+    return root
+
+
+def get_logger(name):
+    """Logger for a backend module, e.g. get_logger(__name__) -> nutrifit.<module>"""
+    if not _configured:
+        configure_logging()
+    if not name.startswith(LOGGER_NAMESPACE + '.'):
+        name = f"{LOGGER_NAMESPACE}.{name}"
+    return logging.getLogger(name)
@@ -0,0 +1,302 @@
+import threading
+
+import numpy as np
+
+from database import get_meal_progress, get_user_profile, get_user_food_preferences
+from meal_pool import get_meal_pool, restrictions_to_mask, food_restriction_mask
+from nutrition_utils import COMMON_FOODS
+from workout_scoring import top_k
+
+# Suggestions that fit what's left of a meal's budget. The food catalog is
+# encoded once as NumPy arrays (nutrients, category, restriction and meal
+# masks); ranking a user's options is then a handful of array expressions over
+# the whole catalog, and pairs are scored by broadcasting over the best singles.
+
+NUTRIENTS = ('calories', 'protein', 'carbohydrates', 'fat')
+
+# Daily macro goals used when the profile doesn't have them (same as the dashboard)
+DEFAULT_MACRO_GOALS = {'protein': 150, 'carbohydrates': 250, 'fat': 70}
+
+# How much a unit of normalized gap costs, per nutrient
+FIT_WEIGHTS = np.array([1.0, 0.8, 0.5, 0.5])
+# Going over budget costs more than falling short; extra protein barely matters
+OVERSHOOT_WEIGHTS = np.array([2.0, 0.5, 1.0, 1.5])
+# Smallest gap used for normalizing, so a nearly closed budget doesn't blow up the cost
+GAP_FLOORS = np.array([100.0, 10.0, 15.0, 5.0])
+
+LIKED_BONUS = 15
+MEAL_BONUS = 5
+COMBINATION_POOL = 40  # pairs are built from this many of the best single foods
+
+UNDESIRED_KEYWORDS = ["school lunch", "cafeteria", "nfs", "baby food", "infant"]
+
+CATEGORIES = ['protein', 'starch', 'vegetable', 'fruit', 'dairy', 'snack', 'breakfast_special', 'fat', 'mixed']
+CATEGORY_CODES = {name: code for code, name in enumerate(CATEGORIES)}
+
+MEAL_CATEGORIES = {
+    'breakfast': ['breakfast_special', 'protein', 'dairy'],
+    'lunch': ['protein', 'starch', 'vegetable'],
+    'dinner': ['protein', 'starch', 'vegetable'],
+    'snacks': ['snack', 'fruit', 'protein']
+}
+MEAL_TYPES = list(MEAL_CATEGORIES)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def infer_food_category(food):
+    """Food category: the explicit 'category', else the macro supplying most of its calories"""
+    category = food.get('category')
+    if category in CATEGORY_CODES:
+        return category
+
+    protein_kcal = 4 * (food.get('protein') or 0)
+    carbs_kcal = 4 * (food.get('carbohydrates') or 0)
+    fat_kcal = 9 * (food.get('fat') or 0)
+    total = protein_kcal + carbs_kcal + fat_kcal
+    if total <= 0:
+        return 'mixed'
+    if protein_kcal / total >= 0.35:
+        return 'protein'
+    if fat_kcal / total >= 0.5:
+        return 'fat'
+    if carbs_kcal / total >= 0.5:
+        return 'starch'
+    return 'mixed'
+
+
+class FoodCatalog:
+    """Column arrays over a list of foods, plus a name index"""
+
+    def __init__(self, foods, meal_types=None):
+        self.foods = tuple(foods)
+        meal_types = meal_types or [()] * len(self.foods)
+
+        # One contiguous row per nutrient, so scoring streams through each column
+        self.nutrients = np.array(
+            [[float(food.get(n) or 0) for food in self.foods] for n in NUTRIENTS],
+            dtype=np.float64).reshape(len(NUTRIENTS), -1)
+        self.category = np.array(
+            [CATEGORY_CODES[infer_food_category(food)] for food in self.foods], dtype=np.int8)
+        self.restriction_mask = np.array(
+            [food_restriction_mask(food.get('query'), food['name']) for food in self.foods], dtype=np.int64)
+        self.meal_mask = np.array(
+            [sum(1 << MEAL_TYPES.index(m) for m in set(meals) if m in MEAL_TYPES) for meals in meal_types],
+            dtype=np.int64)
+        self.excluded = np.array(
+            [any(keyword in food['name'].lower() for keyword in UNDESIRED_KEYWORDS) for food in self.foods],
+            dtype=bool)
+
+        # Meal-appropriate bonus per meal type: a fitting category, or pooled for that meal
+        self.meal_bonus = {}
+        for bit, meal_type in enumerate(MEAL_TYPES):
+            codes = [CATEGORY_CODES[c] for c in MEAL_CATEGORIES[meal_type]]
+            appropriate = np.isin(self.category, codes) | ((self.meal_mask >> bit) & 1).astype(bool)
+            self.meal_bonus[meal_type] = MEAL_BONUS * appropriate.astype(np.float64)
+
+        self.name_index = {}
+        for i, food in enumerate(self.foods):
+            self.name_index.setdefault(food['name'].lower(), []).append(i)
+
+    def __len__(self):
+        return len(self.foods)
+
+    @classmethod
+    def from_meal_pool(cls, pool):
+        """Catalog of every pooled suggestion and common food, each listed once"""
+        foods = []
+        meal_types = []
+        seen = {}
+
+        for meal_type, (entries, _) in pool.meals.items():
+            for entry in entries:
+                key = entry['name'].lower()
+                if key not in seen:
+                    seen[key] = len(foods)
+                    foods.append(entry)
+                    meal_types.append([])
+                meal_types[seen[key]].append(meal_type)
+
+        for name in COMMON_FOODS:
+            if name not in seen:
+                seen[name] = len(foods)
+                foods.append(dict(COMMON_FOODS[name], name=name.title(), source='custom'))
+                meal_types.append([])
+
+        return cls(foods, meal_types)
+
+    def indices(self, names):
+        """Catalog indices of the foods with any of the given names (case-insensitive)"""
+        found = []
+        for name in names or ():
+            found.extend(self.name_index.get(name.lower(), ()))
+        return np.array(found, dtype=np.intp)
+
+
+def budget_vector(budget):
+    """Remaining-budget dict as an array in NUTRIENTS order"""
+    return np.array([float(budget.get(n) or 0) for n in NUTRIENTS])
+
+
+def fit_costs(totals, budget):
+    """Cost of the gap left after eating each column of totals; 0 means the budget is exactly met"""
+    scale = np.maximum(np.abs(budget), GAP_FLOORS)
+    cost = np.zeros(totals.shape[1:])
+    gap = np.empty_like(cost)
+    square = np.empty_like(cost)
+    # Per nutrient: w * gap^2, plus w * (overshoot - 1) * gap^2 where the gap is negative
+    for k in range(len(NUTRIENTS)):
+        np.multiply(totals[k], -1.0 / scale[k], out=gap)
+        gap += budget[k] / scale[k]
+        np.multiply(gap, gap, out=square)
+        square *= FIT_WEIGHTS[k]
+        cost += square
+        np.minimum(gap, 0.0, out=gap)
+        np.multiply(gap, gap, out=square)
+        square *= FIT_WEIGHTS[k] * (OVERSHOOT_WEIGHTS[k] - 1.0)
+        cost += square
+    return cost
+
+
+def fit_scores(totals, budget):
+    """Fit against the budget on a 0-100 scale"""
+    return 100.0 / (1.0 + fit_costs(totals, budget))
+
+
+class MealSuggestionEngine:
+    """Ranks catalog foods, and pairs of them, by how well they fill a meal's budget"""
+
+    def __init__(self, catalog, pool=None):
+        self.catalog = catalog
+        self.pool = pool  # the MealPool the catalog was built from, if any
+
+    def bonuses(self, meal_type, liked_foods=None):
+        """Per-food bonus points for liked and meal-appropriate foods"""
+        catalog = self.catalog
+        bonus = catalog.meal_bonus.get(meal_type)
+        bonus = np.zeros(len(catalog)) if bonus is None else bonus.copy()
+        liked = catalog.indices(liked_foods)
+        if len(liked):
+            bonus[liked] += LIKED_BONUS
+        return bonus
+
+    def allowed(self, user_restrictions=None, disliked_foods=None):
+        """Mask of foods the user can be offered"""
+        catalog = self.catalog
+        allowed = ~catalog.excluded
+        allowed &= (catalog.restriction_mask & restrictions_to_mask(user_restrictions)) == 0
+        disliked = catalog.indices(disliked_foods)
+        if len(disliked):
+            allowed[disliked] = False
+        return allowed
+
+    def score(self, budget, meal_type=None, user_restrictions=None, liked_foods=None, disliked_foods=None):
+        """Score every catalog food; foods that can't be offered score -inf"""
+        scores = fit_scores(self.catalog.nutrients, budget_vector(budget))
+        scores += self.bonuses(meal_type, liked_foods)
+        return np.where(self.allowed(user_restrictions, disliked_foods), scores, -np.inf)
+
+    def suggest(self, budget, meal_type=None, max_results=5, user_restrictions=None,
+                liked_foods=None, disliked_foods=None):
+        """Top single foods for the remaining budget"""
+        scores = self.score(budget, meal_type, user_restrictions, liked_foods, disliked_foods)
+        best = top_k(scores, min(max_results, int(np.isfinite(scores).sum())))
+        return [self._food_result(i, scores[i], budget) for i in best]
+
+    def suggest_combinations(self, budget, meal_type=None, max_results=3, user_restrictions=None,
+                             liked_foods=None, disliked_foods=None):
+        """Top pairs of different foods for the remaining budget"""
+        budget_vec = budget_vector(budget)
+        bonus = self.bonuses(meal_type, liked_foods)
+        allowed = self.allowed(user_restrictions, disliked_foods)
+
+        # Each half of a good pair covers about half the budget
+        halves = np.where(allowed, fit_scores(self.catalog.nutrients, budget_vec / 2) + bonus, -np.inf)
+        pool = top_k(halves, min(COMBINATION_POOL, int(allowed.sum())))
+        if len(pool) < 2:
+            return []
+
+        first, second = np.triu_indices(len(pool), k=1)
+        first, second = pool[first], pool[second]
+        totals = self.catalog.nutrients[:, first] + self.catalog.nutrients[:, second]
+        scores = fit_scores(totals, budget_vec) + (bonus[first] + bonus[second]) / 2
+
+        results = []
+        for i in top_k(scores, max_results):
+            pair_totals = totals[:, i]
+            results.append({
+                'foods': [self._public(first[i]), self._public(second[i])],
+                'totals': {n: round(float(v), 1) for n, v in zip(NUTRIENTS, pair_totals)},
+                'score': round(float(scores[i]), 2),
+                'remaining_after': self._remaining_after(budget, pair_totals)
+            })
+        return results
+
+    def _public(self, i):
+        food = dict(self.catalog.foods[i])
+        food.pop('query', None)
+        return food
+
+    def _food_result(self, i, score, budget):
+        food = self._public(i)
+        food['score'] = round(float(score), 2)
+        food['remaining_after'] = self._remaining_after(budget, self.catalog.nutrients[:, i])
+        return food
+
+    @staticmethod
+    def _remaining_after(budget, totals):
+        return {n: round(float(v), 1) for n, v in zip(NUTRIENTS, budget_vector(budget) - totals)}
+
+
+def get_meal_budget(user_id, meal_type):
+    """Calories and macros still left for a meal today, from meal progress and the user's goals"""
+    progress = get_meal_progress(user_id).get(meal_type)
+    if progress is None:
+        return None
+
+    profile = get_user_profile(user_id) or {}
+    calorie_goal = profile.get('calorie_goal') or 2000
+    share = progress['calories_allocated'] / calorie_goal if calorie_goal else 0
+    goals = {
+        'protein': profile.get('protein_goal') or DEFAULT_MACRO_GOALS['protein'],
+        'carbohydrates': profile.get('carbs_goal') or DEFAULT_MACRO_GOALS['carbohydrates'],
+        'fat': profile.get('fat_goal') or DEFAULT_MACRO_GOALS['fat']
+    }
+
+    budget = {'calories': progress['calories_remaining']}
+    for nutrient, goal in goals.items():
+        budget[nutrient] = round(goal * share - progress[f'{nutrient}_eaten'], 1)
+    return budget
+
+
+def budget_from_calories(calories):
+    """Budget for a calorie amount, with macros split like the default daily goals"""
+    share = (calories or 0) / 2000
+    budget = {'calories': calories or 0}
+    for nutrient, goal in DEFAULT_MACRO_GOALS.items():
+        budget[nutrient] = round(goal * share, 1)
+    return budget
+
+
+def get_user_meal_preferences(user_id, meal_type):
+    """(liked, disliked) food names for a meal; global dislikes count for every meal"""
+    _, meal_preferences = get_user_food_preferences(user_id)
+    for_meal = meal_preferences.get(meal_type, {})
+    liked = list(for_meal.get('liked', []))
+    disliked = list(for_meal.get('disliked', []))
+    disliked.extend(meal_preferences.get('global', {}).get('disliked', []))
+    return liked, disliked
+
+
+def get_meal_engine():
+    """Process-wide engine over the current meal pool, rebuilt if the pool is replaced"""
+    global _engine
+    pool = get_meal_pool()
+    engine = _engine
+    if engine is None or engine.pool is not pool:
+        with _engine_lock:
+            if _engine is None or _engine.pool is not pool:
+                _engine = MealSuggestionEngine(FoodCatalog.from_meal_pool(pool), pool)
+            engine = _engine
+    return engine
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+import nutrition_utils
+from job_queue import JOBS, job
+from log_utils import get_logger
+from nutrition_utils import (
+    MEAL_SUGGESTIONS, COMMON_FOODS, DIETARY_RESTRICTIONS, MEAL_NUTRITION_ESTIMATES,
+    DEFAULT_NUTRITION_ESTIMATE, check_dietary_restrictions, search_usda_foods
+)
+
+# Meal suggestions are served from a pool with nutrition hydrated ahead of time,
+# so a suggestion request never touches the network. `python meal_pool.py build`
+# looks every MEAL_SUGGESTIONS entry up (COMMON_FOODS, then USDA) and writes the
+# result to MEAL_POOL_PATH. At runtime the pool is loaded from that file, or
+# built offline from COMMON_FOODS and meal-type estimates if it doesn't exist.
+# With a USDA key configured, an offline pool also queues the
+# hydrate_meal_pool job, which writes the artifact in the background; every
+# process swaps its offline pool for the artifact once it appears. If the job
+# can't be queued yet (e.g. the jobs table doesn't exist), it is retried at
+# most every HYDRATION_RETRY_SECONDS while the pool stays offline.
+
+MEAL_POOL_PATH = os.getenv("MEAL_POOL_PATH", os.path.join(os.path.dirname(__file__), "meal_pool.json"))
+MEAL_POOL_VERSION = 1
+HYDRATION_RETRY_SECONDS = 30
+
+# One bit per dietary restriction; a food's mask has the bits it violates
+RESTRICTION_BITS = {name: 1 << i for i, name in enumerate(DIETARY_RESTRICTIONS)}
+
+logger = get_logger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+_hydration = {'queued': False, 'attempted_at': None}
+
+
+def restrictions_to_mask(user_restrictions):
+    """Bitmask for a list of restriction names; unknown names are ignored"""
+    mask = 0
+    for restriction in user_restrictions or []:
+        mask |= RESTRICTION_BITS.get(restriction, 0)
+    return mask
+
+
+def food_restriction_mask(*names):
+    """Bitmask of the restrictions violated by any of the given food names"""
+    mask = 0
+    for restriction, bit in RESTRICTION_BITS.items():
+        if any(name and check_dietary_restrictions(name, [restriction])[0] for name in names):
+            mask |= bit
+    return mask
+
+
+def common_food_entry(food_name):
+    """Suggestion entry for a food in COMMON_FOODS"""
+    food_data = COMMON_FOODS[food_name.lower()]
+    return {
+        'name': food_name.title(),
+        'calories': food_data['calories'],
+        'protein': food_data['protein'],
+        'carbohydrates': food_data['carbohydrates'],
+        'fat': food_data['fat'],
+        'serving': food_data['serving'],
+        'source': 'custom',
+        'available_servings': [food_data['serving'], 'serving', 'cup', 'piece']
+    }
+
+
+def estimated_food_entry(food_name, meal_type):
+    """Suggestion entry using the midpoint of the meal type's typical nutrition"""
+    ranges = MEAL_NUTRITION_ESTIMATES.get(meal_type)
+    if ranges:
+        estimate = {nutrient: (low + high) // 2 for nutrient, (low, high) in ranges.items()}
+    else:
+        estimate = DEFAULT_NUTRITION_ESTIMATE
+    return {
+        'name': food_name.title(),
+        'calories': estimate['calories'],
+        'protein': float(estimate['protein']),
+        'carbohydrates': float(estimate['carbohydrates']),
+        'fat': float(estimate['fat']),
+        'serving': 'serving',
+        'source': 'estimated',
+        'available_servings': ['serving', 'cup', 'piece']
+    }
+
+
+def hydrate_meal_suggestions(use_usda=False):
+    """Look up nutrition for every MEAL_SUGGESTIONS entry, keyed by meal type"""
+    meals = {}
+    usda_cache = {}
+
+    for meal_type, food_names in MEAL_SUGGESTIONS.items():
+        entries = []
+        for food_name in food_names:
+            if food_name.lower() in COMMON_FOODS:
+                entry = common_food_entry(food_name)
+            else:
+                entry = None
+                if use_usda:
+                    if food_name not in usda_cache:
+                        results = search_usda_foods(food_name, max_results=1)
+                        usda_cache[food_name] = results[0] if results else None
+                    entry = usda_cache[food_name]
+                if entry is None:
+                    entry = estimated_food_entry(food_name, meal_type)
+            # Keep the suggestion name too: USDA entries are renamed to the USDA description
+            entries.append(dict(entry, query=food_name))
+        meals[meal_type] = entries
+
+    return meals
+
+
+class MealPool:
+    """In-memory suggestion pool: per meal type, entries plus restriction masks"""
+
+    def __init__(self, meals):
+        self.offline = False
+        self.meals = {}
+        for meal_type, entries in meals.items():
+            entries = tuple(entries)
+            masks = np.array(
+                [food_restriction_mask(e.get('query'), e['name']) for e in entries], dtype=np.int64)
+            self.meals[meal_type] = (entries, masks)
+
+    def suggest(self, meal_type, max_results=10, user_restrictions=None):
+        """Random sample of up to max_results foods that respect the user's restrictions"""
+        entries, masks = self.meals.get(meal_type) or self.meals['snacks']
+        allowed = np.flatnonzero((masks & restrictions_to_mask(user_restrictions)) == 0)
+        chosen = random.sample(allowed.tolist(), min(max_results, len(allowed)))
+
+        suggestions = []
+        for i in chosen:
+            suggestion = dict(entries[i])
+            suggestion.pop('query', None)
+            suggestions.append(suggestion)
+        return suggestions
+
+
+def save_meal_pool(meals, path=None):
+    """Write hydrated suggestions to the pool artifact"""
+    path = path or MEAL_POOL_PATH
+    with open(path, 'w') as f:
+        json.dump({
+            'version': MEAL_POOL_VERSION,
+            'built_at': datetime.now().isoformat(),
+            'meals': meals
+        }, f, indent=2)
+    return path
+
+
+def load_meal_pool(path=None):
+    """Load the pool artifact, or build the pool offline if there isn't a usable one"""
+    path = path or MEAL_POOL_PATH
+    meals = None
+
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                artifact = json.load(f)
+            if artifact.get('version') == MEAL_POOL_VERSION:
+                meals = artifact['meals']
+            else:
+                logger.warning("Ignoring meal pool %s with version %s", path, artifact.get('version'))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Could not read meal pool %s: %s", path, e)
+
+    if meals is None:
+        logger.info("Building meal suggestion pool offline (no artifact at %s)", path)
+        meals = hydrate_meal_suggestions(use_usda=False)
+
+    pool = MealPool(meals)
+    # Only a missing artifact is waited for; an unreadable one needs a rebuild
+    pool.offline = not os.path.exists(path)
+    return pool
+
+
+@job('hydrate_meal_pool')
+def hydrate_meal_pool(path=None):
+    """Build the pool artifact with USDA lookups and switch this process to it"""
+    meals = hydrate_meal_suggestions(use_usda=True)
+    path = save_meal_pool(meals, path)
+    reset_meal_pool(MealPool(meals))
+    logger.info("Hydrated meal pool written to %s", path)
+
+
+def queue_hydration():
+    """Queue a USDA hydration of the pool artifact, if a USDA key is configured"""
+    if not nutrition_utils.USDA_API_KEY:
+        return None
+    _hydration['attempted_at'] = time.monotonic()
+    try:
+        job_id = JOBS.enqueue('hydrate_meal_pool', unique_key='hydrate_meal_pool')
+    except Exception as e:
+        logger.warning("Could not queue meal pool hydration: %s", e)
+        return None
+    _hydration['queued'] = True
+    return job_id
+
+
+def _hydration_due():
+    attempted_at = _hydration['attempted_at']
+    return not _hydration['queued'] and (
+        attempted_at is None or time.monotonic() - attempted_at >= HYDRATION_RETRY_SECONDS)
+
+
+def get_meal_pool():
+    """Process-wide meal pool, loaded on first use and reloaded once a hydrated artifact appears"""
+    global _pool
+    pool = _pool
+    if pool is None or (pool.offline and os.path.exists(MEAL_POOL_PATH)):
+        with _pool_lock:
+            if _pool is pool:
+                _pool = load_meal_pool()
+            pool = _pool
+    if pool.offline and _hydration_due():
+        queue_hydration()
+        pool = _pool  # already hydrated when jobs run synchronously
+    return pool
+
+
+def reset_meal_pool(pool=None):
+    """Replace (or drop, so it reloads) the process-wide meal pool"""
+    global _pool
+    with _pool_lock:
+        _pool = pool
+        if pool is None:
+            _hydration.update(queued=False, attempted_at=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the meal suggestion pool artifact")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--output', default=MEAL_POOL_PATH, help="where to write the pool JSON")
+    parser.add_argument('--offline', action='store_true', help="skip USDA lookups and use estimates")
+    args = parser.parse_args()
+
+    meals = hydrate_meal_suggestions(use_usda=not args.offline)
+    path = save_meal_pool(meals, args.output)
+    counts = {meal: len(entries) for meal, entries in meals.items()}
+    print(f"Wrote meal pool to {path}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,51 @@
+import asyncio
 import os
+import httpx
 import requests
 from dotenv import load_dotenv
 from typing import List, Dict
 import re
 import random
+import threading
+import time
+from app_cache import NoStore, get_cache
+from log_utils import get_logger
+from request_metrics import record_external_call
+from circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, LatencyBudgetExceeded, latency_budget, call_timeout
+)
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 # USDA API Configuration
 USDA_API_KEY = os.getenv("USDA_API_KEY")
-USDA_SEARCH_URL = "https://api.nal.usda.gov/fdc/v1/foods/search"
-USDA_FOOD_URL = "https://api.nal.usda.gov/fdc/v1/food"
+# Override to point at another FDC-compatible server, e.g. the local fake_fdc.py
+USDA_API_BASE = os.getenv("USDA_API_BASE", "https://api.nal.usda.gov/fdc/v1").rstrip('/')
+USDA_SEARCH_URL = f"{USDA_API_BASE}/foods/search"
+USDA_FOOD_URL = f"{USDA_API_BASE}/food"
+
+# Resilience: each USDA call times out after USDA_CALL_TIMEOUT seconds, a whole
+# search gets USDA_REQUEST_BUDGET seconds across its calls, and the breaker
+# stops calling USDA (searches fall back to COMMON_FOODS and cached results)
+# while calls keep failing or running slow. Responses are kept in the shared
+# app cache for USDA_CACHE_TTL seconds.
+USDA_CALL_TIMEOUT = float(os.getenv("USDA_CALL_TIMEOUT", "4"))
+USDA_REQUEST_BUDGET = float(os.getenv("USDA_REQUEST_BUDGET", "3"))
+USDA_CACHE_SIZE = 2048
+USDA_CACHE_TTL = float(os.getenv("USDA_CACHE_TTL", str(24 * 3600)))
+
+USDA_BREAKER = CircuitBreaker(
+    'usda',
+    failure_rate=0.5,
+    slow_call_seconds=float(os.getenv("USDA_SLOW_CALL_SECONDS", "2")),
+    open_seconds=float(os.getenv("USDA_BREAKER_OPEN_SECONDS", "30"))
+)
+
+USDA_CACHE = get_cache('usda', USDA_CACHE_SIZE, default_ttl=USDA_CACHE_TTL)
+_usda_counters_lock = threading.Lock()
+_usda_counters = {'budget_exhausted': 0, 'short_circuited': 0}
 
 # Enhanced meal-specific food database
 MEAL_SUGGESTIONS = {
@@ -286,53 +321,300 @@ def filter_usda_results(foods: List[Dict]) -> List[Dict]:
     return filtered[:10]
 
 
+def _count_usda(counter):
+    with _usda_counters_lock:
+        _usda_counters[counter] += 1
+
+
+def _search_cache_key(query: str, max_results: int) -> str:
+    return f"search:{max_results}:{query.lower().strip()}"
+
+
+def clear_usda_cache():
+    """Drop cached USDA responses and reset the USDA counters"""
+    USDA_CACHE.clear()
+    with _usda_counters_lock:
+        for counter in _usda_counters:
+            _usda_counters[counter] = 0
+
+
+def get_usda_status() -> Dict:
+    """Circuit breaker state plus cache and fallback counters for the USDA API"""
+    cache = USDA_CACHE.stats()
+    with _usda_counters_lock:
+        counters = dict(_usda_counters)
+    return {'breaker': USDA_BREAKER.stats(), 'cache_hits': cache['hits'], 'cache_misses': cache['misses'],
+            'cache_size': cache['size'], **counters}
+
+
+def usda_get(url: str, params: Dict) -> Dict:
+    """GET a USDA endpoint through the circuit breaker and current latency budget"""
+    timeout = call_timeout(USDA_CALL_TIMEOUT)
+    if not USDA_BREAKER.allow():
+        raise CircuitOpenError("USDA circuit is open")
+
+    start = time.monotonic()
+    try:
+        response = requests.get(url, params=params, timeout=timeout)
+    except requests.Timeout as e:
+        if timeout < USDA_CALL_TIMEOUT:
+            # Our own budget cut the call short; that's no verdict on USDA
+            USDA_BREAKER.release()
+            raise LatencyBudgetExceeded("Latency budget spent waiting on USDA") from e
+        USDA_BREAKER.record(time.monotonic() - start, failed=True)
+        raise
+    except requests.RequestException:
+        USDA_BREAKER.record(time.monotonic() - start, failed=True)
+        raise
+    finally:
+        record_external_call(time.monotonic() - start)
+    # Client errors (unknown food id, bad key) say nothing about upstream health
+    USDA_BREAKER.record(time.monotonic() - start, failed=response.status_code >= 500)
+    response.raise_for_status()
+    return response.json()
+
+
+def usda_search_params(query: str) -> Dict:
+    """Query parameters for a USDA foods/search call"""
+    return {
+        'api_key': USDA_API_KEY,
+        'query': query,
+        'dataType': ['Survey (FNDDS)', 'SR Legacy', 'Foundation'],
+        'pageSize': 25,  # Get more to filter from
+        'requireAllWords': False
+    }
+
+
+def parse_usda_nutrition(data: Dict) -> Dict:
+    """Calories and macros from a USDA food detail response; {} when it has none"""
+    nutrients = {}
+    nutrient_map = {
+        '1008': 'calories',    # Energy (kcal)
+        '1003': 'protein',     # Protein
+        '1005': 'carbohydrates',  # Carbohydrate
+        '1004': 'fat'          # Total lipid (fat)
+    }
+    
+    for nutrient in data.get('foodNutrients', []):
+        nutrient_id = str(nutrient.get('nutrient', {}).get('id', ''))
+        if nutrient_id in nutrient_map:
+            amount = nutrient.get('amount', 0)
+            if amount is not None and amount > 0:  # Only positive values
+                nutrients[nutrient_map[nutrient_id]] = round(amount, 1)
+    
+    # Ensure all nutrients are present with reasonable defaults
+    for key in ['calories', 'protein', 'carbohydrates', 'fat']:
+        if key not in nutrients:
+            nutrients[key] = 0.0
+            
+    # Skip foods with no meaningful nutrition data
+    if nutrients['calories'] == 0 and nutrients['protein'] == 0 and nutrients['carbohydrates'] == 0 and nutrients['fat'] == 0:
+        nutrients = {}
+    return nutrients
+
+
+def usda_food_result(food: Dict, nutrition: Dict):
+    """Search result for a USDA food and its nutrition, or None if it has no calories"""
+    if not nutrition or nutrition.get('calories', 0) <= 0:  # Only include foods with calories
+        return None
+    return {
+        'name': clean_food_name(food.get('description', '')),
+        'calories': nutrition.get('calories', 0),
+        'protein': nutrition.get('protein', 0),
+        'carbohydrates': nutrition.get('carbohydrates', 0),
+        'fat': nutrition.get('fat', 0),
+        'serving': 'serving',
+        'source': 'usda',
+        'fdc_id': food.get('fdcId'),
+        'available_servings': ['serving', 'cup', 'piece', 'oz']
+    }
+
+
 def search_usda_foods(query: str, max_results: int = 10) -> List[Dict]:
     """Search USDA database for foods"""
     if not USDA_API_KEY:
-        print("No USDA API key found")
+        logger.warning("No USDA API key found")
         return []
     
+    # Concurrent searches for the same query wait for one upstream search
+    results = USDA_CACHE.get_or_set(_search_cache_key(query, max_results),
+                                    lambda: _search_usda_upstream(query, max_results))
+    return [dict(food) for food in results]
+
+
+def _search_usda_upstream(query: str, max_results: int):
+    """USDA search results, wrapped in NoStore unless complete"""
+    with latency_budget(USDA_REQUEST_BUDGET):
+        try:
+            data = usda_get(USDA_SEARCH_URL, usda_search_params(query))
+            
+            foods = data.get('foods', [])
+            if not foods:
+                return NoStore([])
+                
+            # Filter weird results
+            filtered_foods = filter_usda_results(foods)
+            
+            results = []
+            complete = True
+            for food in filtered_foods[:max_results]:
+                # Get detailed nutrition info
+                try:
+                    nutrition = _fetch_usda_nutrition(food.get('fdcId'))
+                except (CircuitOpenError, LatencyBudgetExceeded) as e:
+                    # Out of time or upstream is failing: keep what we have
+                    _count_usda('short_circuited' if isinstance(e, CircuitOpenError) else 'budget_exhausted')
+                    complete = False
+                    break
+                except Exception as e:
+                    logger.error("Error getting USDA nutrition for %s: %s", food.get('fdcId'), e)
+                    complete = False
+                    continue
+                result = usda_food_result(food, nutrition)
+                if result:
+                    results.append(result)
+            
+            # Partial results are served but not cached
+            return results if complete else NoStore(results)
+            
+        except CircuitOpenError:
+            _count_usda('short_circuited')
+            logger.debug("USDA circuit open, skipping search for %r", query)
+            return NoStore([])
+        except LatencyBudgetExceeded:
+            _count_usda('budget_exhausted')
+            return NoStore([])
+        except Exception as e:
+            logger.error("Error searching USDA: %s", e)
+            return NoStore([])
+
+
+def _fetch_usda_nutrition(fdc_id) -> Dict:
+    """Nutrition for a USDA food, from cache or the API; raises on upstream errors"""
+    def fetch():
+        return parse_usda_nutrition(usda_get(f"{USDA_FOOD_URL}/{fdc_id}", {'api_key': USDA_API_KEY}))
+    return dict(USDA_CACHE.get_or_set(f"food:{fdc_id}", fetch))
+
+
+# Async variants for the ASGI app (asgi.py). They share the cache, breaker and
+# counters with the functions above, take an httpx.AsyncClient, and fetch a
+# search's detail records concurrently instead of one after another. The
+# latency budget is an explicit deadline since threading.local doesn't follow
+# coroutines.
+
+def _deadline_timeout(deadline) -> float:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise LatencyBudgetExceeded("Latency budget spent")
+    return min(USDA_CALL_TIMEOUT, remaining)
+
+
+async def usda_get_async(client, url: str, params: Dict, deadline: float) -> Dict:
+    """usda_get() over an httpx.AsyncClient, bounded by deadline (a time.monotonic() value)"""
+    timeout = _deadline_timeout(deadline)
+    if not USDA_BREAKER.allow():
+        raise CircuitOpenError("USDA circuit is open")
+
+    start = time.monotonic()
     try:
-        params = {
-            'api_key': USDA_API_KEY,
-            'query': query,
-            'dataType': ['Survey (FNDDS)', 'SR Legacy', 'Foundation'],
-            'pageSize': 25,  # Get more to filter from
-            'requireAllWords': False
-        }
-        
-        response = requests.get(USDA_SEARCH_URL, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        foods = data.get('foods', [])
+        response = await client.get(url, params=params, timeout=timeout)
+    except asyncio.CancelledError:
+        # The search ran out of budget waiting on this call
+        USDA_BREAKER.release()
+        raise
+    except httpx.TimeoutException as e:
+        if timeout < USDA_CALL_TIMEOUT:
+            USDA_BREAKER.release()
+            raise LatencyBudgetExceeded("Latency budget spent waiting on USDA") from e
+        USDA_BREAKER.record(time.monotonic() - start, failed=True)
+        raise
+    except httpx.HTTPError:
+        USDA_BREAKER.record(time.monotonic() - start, failed=True)
+        raise
+    finally:
+        record_external_call(time.monotonic() - start)
+    USDA_BREAKER.record(time.monotonic() - start, failed=response.status_code >= 500)
+    response.raise_for_status()
+    return response.json()
+
+
+async def _usda_cache_call(method, *args):
+    # SQLite and Redis cache backends block on I/O; keep them off the event loop
+    if not USDA_CACHE.backend.shared:
+        return getattr(USDA_CACHE, method)(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, getattr(USDA_CACHE, method), *args)
+
+
+async def _fetch_usda_nutrition_async(client, fdc_id, deadline) -> Dict:
+    cache_key = f"food:{fdc_id}"
+    cached = await _usda_cache_call('get', cache_key)
+    if cached is not None:
+        return dict(cached)
+
+    data = await usda_get_async(client, f"{USDA_FOOD_URL}/{fdc_id}", {'api_key': USDA_API_KEY}, deadline)
+    nutrients = parse_usda_nutrition(data)
+    await _usda_cache_call('set', cache_key, dict(nutrients))
+    return nutrients
+
+
+async def search_usda_foods_async(client, query: str, max_results: int = 10) -> List[Dict]:
+    """search_usda_foods() with the detail lookups made concurrently"""
+    if not USDA_API_KEY:
+        logger.warning("No USDA API key found")
+        return []
+
+    cache_key = _search_cache_key(query, max_results)
+    cached = await _usda_cache_call('get', cache_key)
+    if cached is not None:
+        return [dict(food) for food in cached]
+
+    deadline = time.monotonic() + USDA_REQUEST_BUDGET
+    try:
+        data = await usda_get_async(client, USDA_SEARCH_URL, usda_search_params(query), deadline)
+        foods = filter_usda_results(data.get('foods', []))[:max_results]
         if not foods:
             return []
-            
-        # Filter weird results
-        filtered_foods = filter_usda_results(foods)
-        
+
+        tasks = [asyncio.ensure_future(_fetch_usda_nutrition_async(client, food.get('fdcId'), deadline))
+                 for food in foods]
+        done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            _count_usda('budget_exhausted')
+
         results = []
-        for food in filtered_foods[:max_results]:
-            # Get detailed nutrition info
-            nutrition = get_usda_nutrition(food.get('fdcId'))
-            if nutrition and nutrition.get('calories', 0) > 0:  # Only include foods with calories
-                results.append({
-                    'name': clean_food_name(food.get('description', '')),
-                    'calories': nutrition.get('calories', 0),
-                    'protein': nutrition.get('protein', 0),
-                    'carbohydrates': nutrition.get('carbohydrates', 0),
-                    'fat': nutrition.get('fat', 0),
-                    'serving': 'serving',
-                    'source': 'usda',
-                    'fdc_id': food.get('fdcId'),
-                    'available_servings': ['serving', 'cup', 'piece', 'oz']
-                })
-        
+        complete = not pending
+        for food, task in zip(foods, tasks):
+            if task not in done:
+                continue
+            error = task.exception()
+            if error is not None:
+                if isinstance(error, (CircuitOpenError, LatencyBudgetExceeded)):
+                    _count_usda('short_circuited' if isinstance(error, CircuitOpenError) else 'budget_exhausted')
+                else:
+                    logger.error("Error getting USDA nutrition for %s: %s", food.get('fdcId'), error)
+                complete = False
+                continue
+            result = usda_food_result(food, task.result())
+            if result:
+                results.append(result)
+
+        # Partial results are served but not cached
+        if complete:
+            await _usda_cache_call('set', cache_key, [dict(food) for food in results])
         return results
-        
+
+    except CircuitOpenError:
+        _count_usda('short_circuited')
+        logger.debug("USDA circuit open, skipping search for %r", query)
+        return []
+    except LatencyBudgetExceeded:
+        _count_usda('budget_exhausted')
+        return []
     except Exception as e:
-        print(f"Error searching USDA: {e}")
+        logger.error("Error searching USDA: %s", e)
         return []
 
 
@@ -342,41 +624,11 @@ def get_usda_nutrition(fdc_id: str) -> Dict:
         return {}
     
     try:
-        url = f"{USDA_FOOD_URL}/{fdc_id}"
-        params = {'api_key': USDA_API_KEY}
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        nutrients = {}
-        nutrient_map = {
-            '1008': 'calories',    # Energy (kcal)
-            '1003': 'protein',     # Protein
-            '1005': 'carbohydrates',  # Carbohydrate
-            '1004': 'fat'          # Total lipid (fat)
-        }
-        
-        for nutrient in data.get('foodNutrients', []):
-            nutrient_id = str(nutrient.get('nutrient', {}).get('id', ''))
-            if nutrient_id in nutrient_map:
-                amount = nutrient.get('amount', 0)
-                if amount is not None and amount > 0:  # Only positive values
-                    nutrients[nutrient_map[nutrient_id]] = round(amount, 1)
-        
-        # Ensure all nutrients are present with reasonable defaults
-        for key in ['calories', 'protein', 'carbohydrates', 'fat']:
-            if key not in nutrients:
-                nutrients[key] = 0.0
-                
-        # Skip foods with no meaningful nutrition data
-        if nutrients['calories'] == 0 and nutrients['protein'] == 0 and nutrients['carbohydrates'] == 0 and nutrients['fat'] == 0:
-            return {}
-                
-        return nutrients
-        
+        return _fetch_usda_nutrition(fdc_id)
+    except (CircuitOpenError, LatencyBudgetExceeded):
+        return {}
     except Exception as e:
-        print(f"Error getting USDA nutrition for {fdc_id}: {e}")
+        logger.error("Error getting USDA nutrition for %s: %s", fdc_id, e)
         return {}
 
 
@@ -424,31 +676,34 @@ def search_custom_foods(query: str) -> List[Dict]:
     return results
 
 
+def merge_food_results(results: List[Dict], limit: int, user_restrictions=None) -> List[Dict]:
+    """First result per name (case-insensitive), with dietary warnings, up to limit"""
+    seen_names = set()
+    unique_results = []
+    for result in results:
+        name_key = result['name'].lower()
+        if name_key not in seen_names:
+            seen_names.add(name_key)
+            
+            # Add dietary restriction warning if applicable
+            if user_restrictions:
+                warning = get_dietary_restriction_warning(result['name'], user_restrictions)
+                if warning:
+                    result['dietary_warning'] = warning
+            
+            unique_results.append(result)
+    
+    return unique_results[:limit]
+
+
 def search_food_autocomplete(query: str) -> List[Dict]:
     """Get autocomplete suggestions from all sources"""
     if len(query) < 2:
         return []
     
-    suggestions = []
-    
-    # Search custom foods first (fast)
-    custom_results = search_custom_foods(query)
-    suggestions.extend(custom_results[:3])
-    
-    # Search USDA (comprehensive)
-    usda_results = search_usda_foods(query, max_results=7)
-    suggestions.extend(usda_results)
-    
-    # Remove duplicates and return top 10
-    seen_names = set()
-    unique_suggestions = []
-    for suggestion in suggestions:
-        name_key = suggestion['name'].lower()
-        if name_key not in seen_names:
-            seen_names.add(name_key)
-            unique_suggestions.append(suggestion)
-    
-    return unique_suggestions[:10]
+    # Custom foods first (fast), then USDA (comprehensive)
+    suggestions = search_custom_foods(query)[:3] + search_usda_foods(query, max_results=7)
+    return merge_food_results(suggestions, 10)
 
 
 def search_food_comprehensive(query: str) -> List[Dict]:
@@ -456,26 +711,9 @@ def search_food_comprehensive(query: str) -> List[Dict]:
     if not query.strip():
         return []
     
-    all_results = []
-    
-    # Search all sources
-    custom_results = search_custom_foods(query)
-    usda_results = search_usda_foods(query, max_results=12)
-    
     # Combine with priority: custom first, then USDA
-    all_results.extend(custom_results)
-    all_results.extend(usda_results)
-    
-    # Remove duplicates
-    seen_names = set()
-    unique_results = []
-    for result in all_results:
-        name_key = result['name'].lower()
-        if name_key not in seen_names:
-            seen_names.add(name_key)
-            unique_results.append(result)
-    
-    return unique_results[:15]
+    results = search_custom_foods(query) + search_usda_foods(query, max_results=12)
+    return merge_food_results(results, 15)
 
 
 def create_display_name(food_name: str, quantity: float, serving: str) -> str:
@@ -539,99 +777,42 @@ def scale_food_nutrition(food_data: Dict, quantity: float, serving_size: str = N
     return result
 
 
-def get_meal_suggestions(meal_type: str, max_results: int = 10) -> List[Dict]:
-    """Get meal-appropriate food suggestions with more variety"""
-    # Get suggestions from our enhanced meal database
-    meal_foods = MEAL_SUGGESTIONS.get(meal_type, MEAL_SUGGESTIONS['snacks'])
-    
-    # Shuffle for variety and take more than requested to account for filtering
-    available_foods = meal_foods.copy()
-    random.shuffle(available_foods)
-    
-    suggestions = []
-    
-    # Try to get nutrition data for each suggestion
-    for food_name in available_foods[:max_results * 2]:  # Get more to filter from
-        # First check if it's in our common foods database
-        if food_name.lower() in COMMON_FOODS:
-            food_data = COMMON_FOODS[food_name.lower()]
-            suggestions.append({
-                'name': food_name.title(),
-                'calories': food_data['calories'],
-                'protein': food_data['protein'],
-                'carbohydrates': food_data['carbohydrates'],
-                'fat': food_data['fat'],
-                'serving': food_data['serving'],
-                'source': 'custom',
-                'available_servings': [food_data['serving'], 'serving', 'cup', 'piece']
-            })
-        else:
-            # Try to search for it in USDA database
-            usda_results = search_usda_foods(food_name, max_results=1)
-            if usda_results:
-                suggestions.append(usda_results[0])
-            else:
-                # Fallback with estimated nutrition for common items
-                suggestions.append({
-                    'name': food_name.title(),
-                    'calories': estimate_calories_by_meal(meal_type),
-                    'protein': estimate_protein_by_meal(meal_type),
-                    'carbohydrates': estimate_carbs_by_meal(meal_type),
-                    'fat': estimate_fat_by_meal(meal_type),
-                    'serving': 'serving',
-                    'source': 'estimated',
-                    'available_servings': ['serving', 'cup', 'piece']
-                })
-        
-        # Stop when we have enough good suggestions
-        if len(suggestions) >= max_results:
-            break
-    
-    return suggestions[:max_results]
+# Typical per-item nutrition ranges by meal type, for foods we have no data for
+MEAL_NUTRITION_ESTIMATES = {
+    'breakfast': {'calories': (200, 400), 'protein': (8, 20), 'carbohydrates': (15, 40), 'fat': (5, 15)},
+    'lunch': {'calories': (300, 500), 'protein': (15, 30), 'carbohydrates': (25, 50), 'fat': (8, 20)},
+    'dinner': {'calories': (350, 600), 'protein': (20, 35), 'carbohydrates': (30, 60), 'fat': (10, 25)},
+    'snacks': {'calories': (100, 250), 'protein': (3, 12), 'carbohydrates': (8, 25), 'fat': (2, 12)}
+}
+
+DEFAULT_NUTRITION_ESTIMATE = {'calories': 250, 'protein': 15, 'carbohydrates': 25, 'fat': 10}
+
+
+def _estimate_by_meal(meal_type: str, nutrient: str) -> int:
+    """Random estimate of a nutrient within the meal type's typical range"""
+    if meal_type not in MEAL_NUTRITION_ESTIMATES:
+        return DEFAULT_NUTRITION_ESTIMATE[nutrient]
+    return random.randint(*MEAL_NUTRITION_ESTIMATES[meal_type][nutrient])
 
 
 def estimate_calories_by_meal(meal_type: str) -> int:
     """Estimate calories based on meal type"""
-    estimates = {
-        'breakfast': random.randint(200, 400),
-        'lunch': random.randint(300, 500),
-        'dinner': random.randint(350, 600),
-        'snacks': random.randint(100, 250)
-    }
-    return estimates.get(meal_type, 250)
+    return _estimate_by_meal(meal_type, 'calories')
 
 
 def estimate_protein_by_meal(meal_type: str) -> float:
     """Estimate protein based on meal type"""
-    estimates = {
-        'breakfast': random.randint(8, 20),
-        'lunch': random.randint(15, 30),
-        'dinner': random.randint(20, 35),
-        'snacks': random.randint(3, 12)
-    }
-    return float(estimates.get(meal_type, 15))
+    return float(_estimate_by_meal(meal_type, 'protein'))
 
 
 def estimate_carbs_by_meal(meal_type: str) -> float:
     """Estimate carbs based on meal type"""
-    estimates = {
-        'breakfast': random.randint(15, 40),
-        'lunch': random.randint(25, 50),
-        'dinner': random.randint(30, 60),
-        'snacks': random.randint(8, 25)
-    }
-    return float(estimates.get(meal_type, 25))
+    return float(_estimate_by_meal(meal_type, 'carbohydrates'))
 
 
 def estimate_fat_by_meal(meal_type: str) -> float:
     """Estimate fat based on meal type"""
-    estimates = {
-        'breakfast': random.randint(5, 15),
-        'lunch': random.randint(8, 20),
-        'dinner': random.randint(10, 25),
-        'snacks': random.randint(2, 12)
-    }
-    return float(estimates.get(meal_type, 10))
+    return float(_estimate_by_meal(meal_type, 'fat'))
 
 
 def check_dietary_restrictions(food_name, user_restrictions):
@@ -714,65 +895,11 @@ def get_dietary_restriction_warning(food_name, user_restrictions):
     
     return None
 
-# Update the existing get_meal_suggestions function
 def get_meal_suggestions(meal_type: str, max_results: int = 10, user_restrictions=None) -> List[Dict]:
     """Get meal-appropriate food suggestions with dietary restriction filtering"""
-    # Get suggestions from our enhanced meal database
-    meal_foods = MEAL_SUGGESTIONS.get(meal_type, MEAL_SUGGESTIONS['snacks'])
-    
-    # Shuffle for variety and take more than requested to account for filtering
-    available_foods = meal_foods.copy()
-    random.shuffle(available_foods)
-    
-    suggestions = []
-    
-    # Try to get nutrition data for each suggestion
-    for food_name in available_foods[:max_results * 3]:  # Get more to account for filtering
-        # Check dietary restrictions first
-        if user_restrictions:
-            is_restricted, _, _ = check_dietary_restrictions(food_name, user_restrictions)
-            if is_restricted:
-                continue  # Skip restricted foods
-        
-        # First check if it's in our common foods database
-        if food_name.lower() in COMMON_FOODS:
-            food_data = COMMON_FOODS[food_name.lower()]
-            suggestions.append({
-                'name': food_name.title(),
-                'calories': food_data['calories'],
-                'protein': food_data['protein'],
-                'carbohydrates': food_data['carbohydrates'],
-                'fat': food_data['fat'],
-                'serving': food_data['serving'],
-                'source': 'custom',
-                'available_servings': [food_data['serving'], 'serving', 'cup', 'piece']
-            })
-        else:
-            # Try to search for it in USDA database
-            usda_results = search_usda_foods(food_name, max_results=1)
-            if usda_results:
-                # Double-check USDA results for restrictions
-                usda_food = usda_results[0]
-                if not user_restrictions or not check_dietary_restrictions(usda_food['name'], user_restrictions)[0]:
-                    suggestions.append(usda_food)
-            else:
-                # Fallback with estimated nutrition for common items
-                suggestions.append({
-                    'name': food_name.title(),
-                    'calories': estimate_calories_by_meal(meal_type),
-                    'protein': estimate_protein_by_meal(meal_type),
-                    'carbohydrates': estimate_carbs_by_meal(meal_type),
-                    'fat': estimate_fat_by_meal(meal_type),
-                    'serving': 'serving',
-                    'source': 'estimated',
-                    'available_servings': ['serving', 'cup', 'piece']
-                })
-        
-        # Stop when we have enough good suggestions
-        if len(suggestions) >= max_results:
-            break
-    
-    return suggestions[:max_results]
+    # Sampled from the precomputed pool, so no USDA calls happen per request
+    from meal_pool import get_meal_pool
+    return get_meal_pool().suggest(meal_type, max_results, user_restrictions)
 
 # Update search functions to include restriction warnings
 def search_food_comprehensive_with_warnings(query: str, user_restrictions=None) -> List[Dict]:
@@ -780,63 +907,15 @@ def search_food_comprehensive_with_warnings(query: str, user_restrictions=None)
     if not query.strip():
         return []
     
-    all_results = []
-    
-    # Search all sources
-    custom_results = search_custom_foods(query)
-    usda_results = search_usda_foods(query, max_results=12)
-    
     # Combine with priority: custom first, then USDA
-    all_results.extend(custom_results)
-    all_results.extend(usda_results)
-    
-    # Remove duplicates
-    seen_names = set()
-    unique_results = []
-    for result in all_results:
-        name_key = result['name'].lower()
-        if name_key not in seen_names:
-            seen_names.add(name_key)
-            
-            # Add dietary restriction warning if applicable
-            if user_restrictions:
-                warning = get_dietary_restriction_warning(result['name'], user_restrictions)
-                if warning:
-                    result['dietary_warning'] = warning
-            
-            unique_results.append(result)
-    
-    return unique_results[:15]
+    results = search_custom_foods(query) + search_usda_foods(query, max_results=12)
+    return merge_food_results(results, 15, user_restrictions)
 
 def search_food_autocomplete_with_warnings(query: str, user_restrictions=None) -> List[Dict]:
     """Get autocomplete suggestions with dietary warnings"""
     if len(query) < 2:
         return []
     
-    suggestions = []
-    
-    # Search custom foods first (fast)
-    custom_results = search_custom_foods(query)
-    suggestions.extend(custom_results[:3])
-    
-    # Search USDA (comprehensive)
-    usda_results = search_usda_foods(query, max_results=7)
-    suggestions.extend(usda_results)
-    
-    # Remove duplicates and add warnings
-    seen_names = set()
-    unique_suggestions = []
-    for suggestion in suggestions:
-        name_key = suggestion['name'].lower()
-        if name_key not in seen_names:
-            seen_names.add(name_key)
-            
-            # Add dietary restriction warning if applicable
-            if user_restrictions:
-                warning = get_dietary_restriction_warning(suggestion['name'], user_restrictions)
-                if warning:
-                    suggestion['dietary_warning'] = warning
-            
-            unique_suggestions.append(suggestion)
-    
-    return unique_suggestions[:10]
\ No newline at end of file
+    # Custom foods first (fast), then USDA (comprehensive)
+    suggestions = search_custom_foods(query)[:3] + search_usda_foods(query, max_results=7)
+    return merge_food_results(suggestions, 10, user_restrictions)
@@ -0,0 +1,241 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from log_utils import get_logger
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+# On-demand profiling for production, off unless NUTRIFIT_ADMIN_TOKEN is set.
+#
+# Per request: send X-Profile (or ?__profile=) with X-Admin-Token and the
+# request runs under a profiler. The mode picks what happens to the result:
+#   text   the response body is replaced by cProfile stats (top functions)
+#   store  the normal response is returned; a .prof file is written to
+#          NUTRIFIT_PROFILE_DIR and named in the X-Profile-File header
+#   html   pyinstrument's HTML report instead of the body (if installed)
+# One request is profiled at a time; others run normally with X-Profile: busy.
+#
+# Sampling: with NUTRIFIT_SAMPLER_INTERVAL_MS set, a background thread reads
+# every thread's stack at that interval and writes the counts in folded format
+# (flamegraph.pl, speedscope) to NUTRIFIT_PROFILE_DIR every
+# NUTRIFIT_SAMPLER_WINDOW_SECONDS. GET /api/admin/stack_samples returns the
+# current window.
+
+PROFILE_MODES = ('text', 'store', 'html')
+TEXT_STATS_LIMIT = 60
+MAX_STACK_DEPTH = 64
+
+logger = get_logger(__name__)
+
+
+def admin_token():
+    return os.getenv("NUTRIFIT_ADMIN_TOKEN") or None
+
+
+def is_admin(token):
+    """True if token matches the configured admin token (never true when none is set)"""
+    expected = admin_token()
+    return bool(expected and token and hmac.compare_digest(expected.encode(), token.encode()))
+
+
+def profile_dir():
+    return os.getenv("NUTRIFIT_PROFILE_DIR", os.path.join(os.path.dirname(__file__), 'profiles'))
+
+
+def cprofile_text(profiler, limit=TEXT_STATS_LIMIT):
+    """Top functions by cumulative time, as pstats prints them"""
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold_stack(frame, max_depth=MAX_STACK_DEPTH):
+    """Root-first 'a;b;c' string for a frame, the folded flamegraph format"""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """Background thread counting folded stacks of every other thread"""
+
+    def __init__(self, interval=0.01, window_seconds=60.0, output_dir=None):
+        self.interval = interval
+        self.window_seconds = window_seconds
+        self.output_dir = output_dir
+        self.samples = Counter()
+        self.window_started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.pid = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and self.pid == os.getpid()
+
+    def start(self):
+        """Start sampling in this process (a forked worker needs its own start)"""
+        if self.running:
+            return self
+        self._stop.clear()
+        self.pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self.pid == os.getpid():
+            self._thread.join()
+        self._thread = None
+
+    def sample(self):
+        """Take one sample of every thread except the sampler"""
+        own = threading.get_ident()
+        stacks = [fold_stack(frame) for ident, frame in sys._current_frames().items() if ident != own]
+        with self._lock:
+            self.samples.update(stacks)
+
+    def folded(self):
+        """Current window as folded lines ('stack count'), most frequent first"""
+        with self._lock:
+            return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def flush(self):
+        """Write the current window to output_dir and start a new one; returns the file path"""
+        with self._lock:
+            samples, self.samples = self.samples, Counter()
+            started, self.window_started = self.window_started, time.time()
+        if not samples or not self.output_dir:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir,
+                            f"stacks-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}.folded")
+        with open(path, 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in samples.most_common())
+        return path
+
+    def _run(self):
+        next_flush = time.monotonic() + self.window_seconds
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+                if time.monotonic() >= next_flush:
+                    self.flush()
+                    next_flush = time.monotonic() + self.window_seconds
+            except Exception as e:
+                logger.error("Stack sampler failed: %s", e)
+
+
+def sampler_from_env():
+    """StackSampler configured from the environment, or None when sampling is off"""
+    interval_ms = float(os.getenv("NUTRIFIT_SAMPLER_INTERVAL_MS", "0"))
+    if interval_ms <= 0 or not admin_token():
+        return None
+    return StackSampler(interval=interval_ms / 1000,
+                        window_seconds=float(os.getenv("NUTRIFIT_SAMPLER_WINDOW_SECONDS", "60")),
+                        output_dir=profile_dir())
+
+
+_profile_lock = threading.Lock()
+
+
+def instrument_profiling(app, sampler=None):
+    """Add the admin-gated request profiler, and start sampler on each process's first request"""
+    from flask import Response, abort, g, jsonify, request
+
+    def requested_mode():
+        mode = request.headers.get('X-Profile') or request.args.get('__profile')
+        if not mode:
+            return None
+        if not is_admin(request.headers.get('X-Admin-Token')):
+            return None
+        return mode if mode in PROFILE_MODES else 'text'
+
+    @app.before_request
+    def _start_profile():
+        if sampler is not None and not sampler.running:
+            sampler.start()
+
+        mode = requested_mode()
+        if mode is None:
+            return None
+        if not _profile_lock.acquire(blocking=False):
+            g.profile_busy = True
+            return None
+        if mode == 'html' and PyinstrumentProfiler is None:
+            _profile_lock.release()
+            return jsonify({"error": "pyinstrument is not installed"}), 400
+
+        profiler = PyinstrumentProfiler() if mode == 'html' else cProfile.Profile()
+        g.profile = (mode, profiler)
+        if mode == 'html':
+            profiler.start()
+        else:
+            profiler.enable()
+        return None
+
+    @app.after_request
+    def _finish_profile(response):
+        if g.pop('profile_busy', False):
+            response.headers['X-Profile'] = 'busy'
+            return response
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        mode, profiler = profile
+        try:
+            if mode == 'html':
+                profiler.stop()
+                return Response(profiler.output_html(), mimetype='text/html')
+            profiler.disable()
+            if mode == 'text':
+                return Response(cprofile_text(profiler), mimetype='text/plain')
+
+            os.makedirs(profile_dir(), exist_ok=True)
+            name = f"{request.endpoint or 'unmatched'}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"
+            profiler.dump_stats(os.path.join(profile_dir(), name))
+            response.headers['X-Profile-File'] = name
+            return response
+        finally:
+            _profile_lock.release()
+
+    @app.teardown_request
+    def _abandon_profile(exc):
+        # after_request didn't run; make sure the profiler and the lock are released
+        profile = g.pop('profile', None)
+        if profile is not None:
+            mode, profiler = profile
+            if mode == 'html':
+                profiler.stop()
+            else:
+                profiler.disable()
+            _profile_lock.release()
+
+    @app.route("/api/admin/stack_samples")
+    def stack_samples():
+        """Folded stack counts for the sampler's current window"""
+        if not is_admin(request.headers.get('X-Admin-Token')) or sampler is None:
+            abort(404)
+        return Response(sampler.folded(), mimetype='text/plain')
+
+    return sampler
@@ -0,0 +1,62 @@
+import hashlib
+import json
+
+from app_cache import Cache, MemoryBackend, get_cache
+
+# Workout recommendations and plans only change when the user's profile,
+# custom workouts or workout preferences change. Results are cached per user
+# under a hash of the profile (plus any extra arguments), tagged with the
+# user, and the database write functions for those inputs call
+# invalidate_user_recommendations. RECOMMENDATION_CACHE lives in the
+# configured app_cache backend, so workers share results and invalidations.
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+class RecommendationCache:
+    """Per-user cache of recommendation results over an app_cache.Cache (a private LRU by default)"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, cache=None):
+        self.max_entries = max_entries
+        self.cache = cache if cache is not None else Cache(MemoryBackend(max_entries), 'recommendations')
+
+    @staticmethod
+    def make_key(kind, user_profile, *args):
+        """Hash the recommendation kind, profile and extra arguments into a cache key"""
+        payload = json.dumps([kind, user_profile, args], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_or_compute(self, kind, user_profile, compute, *args):
+        """Return the cached result for these inputs, computing and storing it on a miss"""
+        # Profiles can carry the id as int or str depending on the caller
+        user_id = str(user_profile.get('id')) if user_profile else None
+        return self.cache.get_or_set(self.make_key(kind, user_profile, *args), compute, tags=[f"user:{user_id}"])
+
+    def invalidate(self, user_id):
+        """Drop every cached result for a user"""
+        self.cache.invalidate_tags(f"user:{user_id}")
+
+    def clear(self):
+        """Drop all cached results and reset the counters"""
+        self.cache.clear()
+
+    def stats(self):
+        """Cache size and hit-rate metrics"""
+        stats = self.cache.stats()
+        return {
+            'size': stats['size'],
+            'max_entries': self.max_entries,
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'evictions': stats['evictions'],
+            'invalidations': stats['invalidations'],
+            'hit_rate': stats['hit_rate']
+        }
+
+
+RECOMMENDATION_CACHE = RecommendationCache(cache=get_cache('recommendations', DEFAULT_MAX_ENTRIES))
+
+
+def invalidate_user_recommendations(user_id):
+    """Forget cached recommendations and plans after a user's inputs change"""
+    RECOMMENDATION_CACHE.invalidate(user_id)
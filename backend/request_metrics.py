@@ -0,0 +1,337 @@
+import bisect
+import contextvars
+import hmac
+import os
+import sqlite3
+import threading
+import time
+
+from log_utils import get_logger
+
+# Per-request instrumentation for the Flask app. For every request we record
+# wall time, how many SQL statements ran and how long they took, how many
+# external HTTP calls were made and how long they took, and the response size.
+# Values are aggregated per route into histograms served at /metrics in the
+# Prometheus text format.
+#
+# SQL is captured on the app's own connections only: database.connect() asks
+# connection_factory() for its connection class, and while a request is being
+# recorded that is one registering a set_trace_callback hook (statement count)
+# and timing cursor execute/fetch calls (SQL time). sqlite3.connect itself is
+# left alone, so the cache backend, job queue and export streams aren't
+# counted. The slow-request log lists parameterized SQL, never bound values.
+#
+# /metrics answers admins (X-Admin-Token), scrapers sending NUTRIFIT_METRICS_TOKEN
+# as a bearer token, and, only while neither token is configured, loopback
+# clients, so a local dev server can be scraped without setup.
+#
+# Environment:
+#   NUTRIFIT_METRICS          1 to record requests, 0 to turn it off (default 1)
+#   NUTRIFIT_SLOW_REQUEST_MS  log requests slower than this with their SQL (default 0, off)
+#   NUTRIFIT_METRICS_TOKEN    bearer token for scraping /metrics (default unset)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+MAX_CAPTURED_STATEMENTS = 200  # per request, for the slow-request log
+STATEMENT_PREVIEW = 300
+
+logger = get_logger(__name__)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestRecord:
+    """What one request spent its time on"""
+
+    __slots__ = ('started', 'sql_statements', 'sql_seconds', 'external_calls', 'external_seconds', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.external_calls = 0
+        self.external_seconds = 0.0
+        self.statements = []
+
+    def traced(self, sql):
+        """sqlite3 trace callback; counts every statement SQLite runs, including BEGIN/COMMIT"""
+        self.sql_statements += 1
+
+    def executed(self, sql):
+        """Keep the parameterized SQL a cursor ran (values never reach the slow-request log)"""
+        if len(self.statements) < MAX_CAPTURED_STATEMENTS:
+            self.statements.append(sql)
+
+
+def current_record():
+    """The RequestRecord for the request being handled, or None"""
+    return _current.get()
+
+
+def record_external_call(seconds):
+    """Count an outbound HTTP call against the current request"""
+    record = _current.get()
+    if record is not None:
+        record.external_calls += 1
+        record.external_seconds += seconds
+
+
+class _TracedCursor(sqlite3.Cursor):
+    """Cursor adding its execute/fetch time to the owning request"""
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            record = self.connection.record
+            if record is not None:
+                record.sql_seconds += time.perf_counter() - start
+
+    def _statement(self, method, sql, *args):
+        record = self.connection.record
+        if record is not None:
+            record.executed(sql)
+        return self._timed(method, sql, *args)
+
+    def execute(self, sql, *args):
+        return self._statement(sqlite3.Cursor.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._statement(sqlite3.Cursor.executemany, sql, *args)
+
+    def executescript(self, sql):
+        return self._statement(sqlite3.Cursor.executescript, sql)
+
+    def fetchone(self):
+        return self._timed(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(sqlite3.Cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(sqlite3.Cursor.fetchall)
+
+
+class _TracedConnection(sqlite3.Connection):
+    """Connection bound to the request that opened it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.record = _current.get()
+        if self.record is not None:
+            self.set_trace_callback(self.record.traced)
+
+    def cursor(self, factory=_TracedCursor):
+        return super().cursor(factory)
+
+
+def metrics_token():
+    return os.getenv("NUTRIFIT_METRICS_TOKEN") or None
+
+
+def scrape_allowed(authorization, remote_addr, admin, admin_configured):
+    """True if a /metrics request may read the metrics"""
+    if admin:
+        return True
+    token = metrics_token()
+    if token:
+        return hmac.compare_digest((authorization or '').encode(), f"Bearer {token}".encode())
+    return not admin_configured and remote_addr in ('127.0.0.1', '::1')
+
+
+def connection_factory():
+    """sqlite3 connection class for a connection opened now: traced while a request is recorded"""
+    return _TracedConnection if _current.get() is not None else sqlite3.Connection
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Prometheus histogram keyed by label values"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [per-bucket counts, sum, count]
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _labels(self.label_names + ('le',), label_values + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label_names + ('le',), label_values + ('+Inf',))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter keyed by label values"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+
+    def inc(self, label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+
+def gauge_lines(name, help_text, samples, label_names=()):
+    """Text-format lines for a gauge; samples maps label value tuples (or ()) to numbers"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for label_values, value in sorted(samples.items()):
+        lines.append(f"{name}{_labels(label_names, label_values)} {_number(value)}")
+    return lines
+
+
+class RequestMetrics:
+    """Aggregated request measurements and the /metrics renderer"""
+
+    def __init__(self, slow_request_ms=0):
+        self.slow_request_ms = slow_request_ms
+        self._lock = threading.Lock()
+        self._collectors = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            route = ('endpoint',)
+            self.requests = Counter('nutrifit_http_requests_total', 'Requests handled',
+                                    ('endpoint', 'method', 'status'))
+            self.duration = Histogram('nutrifit_http_request_duration_seconds', 'Wall time per request',
+                                      ('endpoint', 'method'), DURATION_BUCKETS)
+            self.sql_statements = Histogram('nutrifit_http_request_sql_statements', 'SQL statements per request',
+                                            route, COUNT_BUCKETS)
+            self.sql_duration = Histogram('nutrifit_http_request_sql_seconds', 'SQL execute and fetch time per request',
+                                          route, DURATION_BUCKETS)
+            self.external_calls = Histogram('nutrifit_http_request_external_calls',
+                                            'Outbound HTTP calls per request', route, COUNT_BUCKETS)
+            self.external_duration = Histogram('nutrifit_http_request_external_seconds',
+                                               'Outbound HTTP time per request', route, DURATION_BUCKETS)
+            self.response_size = Histogram('nutrifit_http_response_size_bytes', 'Response body size',
+                                           route, SIZE_BUCKETS)
+            self.slow_requests = Counter('nutrifit_http_slow_requests_total',
+                                         'Requests over the slow-request threshold', route)
+
+    def add_collector(self, collector):
+        """Register a callable returning extra text-format lines for /metrics"""
+        self._collectors.append(collector)
+
+    def start(self):
+        """Begin recording the current request; returns a token for finish()"""
+        return _current.set(RequestRecord())
+
+    def finish(self, token, endpoint, method, status, response_size=None):
+        """Record the request started with token and stop tracing it"""
+        record = _current.get()
+        _current.reset(token)
+        if record is None:
+            return None
+        seconds = time.perf_counter() - record.started
+        status_class = f"{status // 100}xx"
+
+        with self._lock:
+            self.requests.inc((endpoint, method, status_class))
+            self.duration.observe((endpoint, method), seconds)
+            self.sql_statements.observe((endpoint,), record.sql_statements)
+            self.sql_duration.observe((endpoint,), record.sql_seconds)
+            self.external_calls.observe((endpoint,), record.external_calls)
+            self.external_duration.observe((endpoint,), record.external_seconds)
+            if response_size is not None:
+                self.response_size.observe((endpoint,), response_size)
+            slow = self.slow_request_ms and seconds * 1000 >= self.slow_request_ms
+            if slow:
+                self.slow_requests.inc((endpoint,))
+
+        if slow:
+            logger.warning(
+                "Slow request %s %s: %.1fms, %d SQL statements in %.1fms, %d external calls in %.1fms\n%s",
+                method, endpoint, seconds * 1000, record.sql_statements, record.sql_seconds * 1000,
+                record.external_calls, record.external_seconds * 1000,
+                '\n'.join('  ' + ' '.join(sql.split())[:STATEMENT_PREVIEW] for sql in record.statements)
+            )
+        return record
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.duration, self.sql_statements, self.sql_duration,
+                           self.external_calls, self.external_duration, self.response_size, self.slow_requests):
+                lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error("Metrics collector failed: %s", e)
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = RequestMetrics(slow_request_ms=float(os.getenv("NUTRIFIT_SLOW_REQUEST_MS", "0")))
+
+
+def instrument_app(app, metrics=METRICS):
+    """Record every request app handles into metrics"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_metrics():
+        g.request_metrics_token = metrics.start()
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        token = g.pop('request_metrics_token', None)
+        if token is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            size = None if response.is_streamed else response.calculate_content_length()
+            metrics.finish(token, endpoint, request.method, response.status_code, size)
+        return response
+
+    @app.teardown_request
+    def _abandon_request_metrics(exc):
+        # after_request didn't run (the response failed to build); don't leak the record
+        token = g.pop('request_metrics_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    return metrics
@@ -0,0 +1,133 @@
+from datetime import datetime, date, timedelta
+
+# Workout streaks are stored per user in the workout_streaks table and advanced
+# incrementally as sessions are logged, so reading a streak is a single lookup.
+# Anything the incremental path can't follow (back-dated sessions, deletions)
+# falls back to rebuild_workout_streak, a gaps-and-islands pass over history.
+
+
+def to_streak_date(value):
+    """Normalize a date_completed value (date, datetime or ISO string) to a date"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value).split('T')[0][:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def rebuild_workout_streak(cursor, user_id):
+    """Recompute a user's streak row from workout_sessions using gaps-and-islands"""
+    # Consecutive days share the same (julianday - row_number) value, so each
+    # group is one unbroken run of workout days.
+    cursor.execute("""
+    WITH days AS (
+        SELECT DISTINCT DATE(date_completed) AS day
+        FROM workout_sessions
+        WHERE user_id = ? AND DATE(date_completed) IS NOT NULL
+    ),
+    islands AS (
+        SELECT day, julianday(day) - ROW_NUMBER() OVER (ORDER BY day) AS grp
+        FROM days
+    )
+    SELECT MAX(day) AS last_day, COUNT(*) AS length
+    FROM islands
+    GROUP BY grp
+    ORDER BY last_day DESC
+    """, (user_id,))
+
+    runs = cursor.fetchall()
+    if runs:
+        last_active_date, current_streak = runs[0]
+        best_streak = max(length for _, length in runs)
+    else:
+        last_active_date, current_streak, best_streak = None, 0, 0
+
+    cursor.execute("""
+    INSERT OR REPLACE INTO workout_streaks
+    (user_id, current_streak, best_streak, last_active_date, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    """, (user_id, current_streak, best_streak, last_active_date))
+
+    return {
+        'current_streak': current_streak,
+        'best_streak': best_streak,
+        'last_active_date': last_active_date
+    }
+
+
+def advance_workout_streak(cursor, user_id, date_completed):
+    """Fold a newly logged workout day into the user's streak row"""
+    workout_date = to_streak_date(date_completed)
+    if workout_date is None:
+        return None
+
+    cursor.execute("""
+    SELECT current_streak, best_streak, last_active_date
+    FROM workout_streaks
+    WHERE user_id = ?
+    """, (user_id,))
+    row = cursor.fetchone()
+
+    # No row yet (existing user) or a back-dated session: recompute from history
+    last_date = to_streak_date(row[2]) if row else None
+    if row is None or last_date is None or workout_date < last_date:
+        return rebuild_workout_streak(cursor, user_id)
+
+    current_streak, best_streak = row[0], row[1]
+    days_diff = (workout_date - last_date).days
+
+    if days_diff == 0:
+        return {
+            'current_streak': current_streak,
+            'best_streak': best_streak,
+            'last_active_date': last_date.isoformat()
+        }
+    elif days_diff == 1:
+        current_streak += 1
+    else:
+        current_streak = 1
+
+    best_streak = max(best_streak, current_streak)
+
+    cursor.execute("""
+    UPDATE workout_streaks
+    SET current_streak = ?, best_streak = ?, last_active_date = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = ?
+    """, (current_streak, best_streak, workout_date.isoformat(), user_id))
+
+    return {
+        'current_streak': current_streak,
+        'best_streak': best_streak,
+        'last_active_date': workout_date.isoformat()
+    }
+
+
+def read_workout_streak(cursor, user_id, today=None):
+    """Read a user's streak, treating a run that ended before yesterday as broken"""
+    cursor.execute("""
+    SELECT current_streak, best_streak, last_active_date
+    FROM workout_streaks
+    WHERE user_id = ?
+    """, (user_id,))
+    row = cursor.fetchone()
+
+    if row:
+        streak = {
+            'current_streak': row[0],
+            'best_streak': row[1],
+            'last_active_date': row[2]
+        }
+    else:
+        streak = rebuild_workout_streak(cursor, user_id)
+
+    today = today or datetime.now().date()
+    last_date = to_streak_date(streak['last_active_date'])
+    if last_date is None or (today - last_date).days > 1:
+        streak['current_streak'] = 0
+
+    return streak
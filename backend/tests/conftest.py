@@ -7,9 +7,36 @@ from unittest.mock import patch
 # Add the parent directory to the Python path so we can import our modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Background jobs run inline as they are enqueued, so tests see their effects
+os.environ.setdefault("NUTRIFIT_JOBS_MODE", "sync")
+
 from app import app
 import database
 from database import DB_PATH
+from recommendation_cache import RECOMMENDATION_CACHE
+from dislike_matcher import DISLIKE_MATCHERS
+import nutrition_utils
+import meal_pool
+from fake_fdc import FakeFdcServer
+from request_metrics import METRICS
+from json_response import RESPONSE_STATS
+import app_cache
+from job_queue import JOBS
+from data_export import EXPORT_STATS
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Start each test with empty caches and metrics and a closed USDA breaker (test users can share ids)"""
+    RECOMMENDATION_CACHE.clear()
+    app_cache.clear_caches()
+    DISLIKE_MATCHERS.clear()
+    nutrition_utils.clear_usda_cache()
+    nutrition_utils.USDA_BREAKER.reset()
+    METRICS.reset()
+    RESPONSE_STATS.reset()
+    JOBS.reset_metrics()
+    EXPORT_STATS.reset()
+    yield
 
 @pytest.fixture
 def client():
@@ -70,4 +97,18 @@ def sample_user_profile():
         'fat_goal': 80,
         'fitness_goals': ['muscle_building', 'strength'],
         'dietary_restrictions': ['vegetarian']
-    }
\ No newline at end of file
+    }
+
+@pytest.fixture
+def fake_fdc(tmp_path):
+    """Local FoodData Central stand-in with nutrition_utils pointed at it"""
+    with FakeFdcServer(seed=0) as server:
+        # With a key set an offline meal pool hydrates itself; keep the artifact out of the tree
+        with patch.object(meal_pool, 'MEAL_POOL_PATH', str(tmp_path / 'meal_pool.json')), \
+             patch.object(nutrition_utils, 'USDA_API_KEY', 'test-key'), \
+             patch.object(nutrition_utils, 'USDA_SEARCH_URL', f"{server.base_url}/foods/search"), \
+             patch.object(nutrition_utils, 'USDA_FOOD_URL', f"{server.base_url}/food"):
+            try:
+                yield server
+            finally:
+                meal_pool.reset_meal_pool()
@@ -123,6 +123,559 @@ class TestNutritionEndpoints:
         data = json.loads(response.data)
         assert 'total_eaten' in data
         assert 'nutrients' in data
+    
+    def test_get_meal_suggestions_without_network(self, client, tmp_path):
+        """Test meal suggestions come from the pool and respect restrictions with no USDA calls"""
+        import meal_pool
+        
+        meals = meal_pool.hydrate_meal_suggestions(use_usda=False)
+        artifact = meal_pool.save_meal_pool(meals, str(tmp_path / 'meal_pool.json'))
+        meal_pool.reset_meal_pool(meal_pool.load_meal_pool(artifact))
+        
+        try:
+            with patch('nutrition_utils.requests.get', side_effect=AssertionError("network call")):
+                response = client.post('/api/get_meal_suggestions',
+                                     data=json.dumps({'meal_type': 'dinner'}),
+                                     content_type='application/json')
+            
+                assert response.status_code == 200
+                data = json.loads(response.data)
+                assert 0 < len(data) <= 15
+                assert all(food['calories'] > 0 for food in data)
+            
+                pool = meal_pool.get_meal_pool()
+                vegan = pool.suggest('dinner', max_results=50, user_restrictions=['vegan'])
+                assert vegan
+                assert not any('chicken' in food['name'].lower() or 'salmon' in food['name'].lower()
+                               for food in vegan)
+        finally:
+            meal_pool.reset_meal_pool()
+
+    def test_offline_meal_pool_is_hydrated_by_a_job(self, client, fake_fdc, tmp_path):
+        """Test an offline pool queues the USDA hydration job and is replaced by its artifact"""
+        import meal_pool
+        
+        artifact = tmp_path / 'meal_pool.json'
+        meal_pool.reset_meal_pool()
+        try:
+            with patch.object(meal_pool, 'MEAL_POOL_PATH', str(artifact)):
+                pool = meal_pool.get_meal_pool()
+                assert artifact.exists()
+                assert not pool.offline
+                sources = {entry['source'] for entries, _ in pool.meals.values() for entry in entries}
+                assert 'usda' in sources and 'estimated' not in sources
+        finally:
+            meal_pool.reset_meal_pool()
+
+    def test_offline_meal_pool_retries_queueing_hydration(self, tmp_path):
+        """Test a failed enqueue (e.g. no jobs table yet) is retried while the pool stays offline"""
+        import sqlite3
+        import meal_pool
+        import nutrition_utils
+        
+        meal_pool.reset_meal_pool()
+        enqueue = Mock(side_effect=[sqlite3.OperationalError('no such table: jobs'), 7])
+        try:
+            with patch.object(meal_pool, 'MEAL_POOL_PATH', str(tmp_path / 'meal_pool.json')), \
+                 patch.object(nutrition_utils, 'USDA_API_KEY', 'test-key'), \
+                 patch.object(meal_pool.JOBS, 'enqueue', enqueue):
+                assert meal_pool.get_meal_pool().offline
+                meal_pool.get_meal_pool()
+                assert enqueue.call_count == 1  # throttled
+                with patch.object(meal_pool, 'HYDRATION_RETRY_SECONDS', 0):
+                    meal_pool.get_meal_pool()
+                    meal_pool.get_meal_pool()
+                assert enqueue.call_count == 2  # queued once, then left to the job
+        finally:
+            meal_pool.reset_meal_pool()
+    
+    def test_get_smart_meal_suggestions(self, client):
+        """Test budget-aware suggestions follow what is left of the meal"""
+        signup_response = client.post('/api/signup',
+                                    data=json.dumps({'username': 'testuser', 'password': 'password123'}),
+                                    content_type='application/json')
+        user_id = json.loads(signup_response.data)['user_id']
+        
+        def suggest():
+            response = client.post('/api/get_smart_meal_suggestions',
+                                 data=json.dumps({'user_id': user_id, 'meal_type': 'dinner'}),
+                                 content_type='application/json')
+            assert response.status_code == 200
+            return json.loads(response.data)
+        
+        before = suggest()
+        assert len(before['foods']) == 5
+        assert before['combinations']
+        assert all('query' not in food for food in before['foods'])
+        
+        client.post('/api/add_food_to_meal',
+                   data=json.dumps({'user_id': user_id, 'meal_type': 'dinner', 'food_data': {
+                       'name': 'Steak', 'calories': 600, 'protein': 50,
+                       'carbohydrates': 0, 'fat': 40, 'quantity': 1, 'serving_size': '300g'}}),
+                   content_type='application/json')
+        after = suggest()
+        assert after['remaining']['calories'] == before['remaining']['calories'] - 600
+        assert after['foods'][0]['calories'] < before['foods'][0]['calories']
+        
+        response = client.post('/api/get_smart_meal_suggestions',
+                             data=json.dumps({'meal_type': 'dinner'}),
+                             content_type='application/json')
+        assert response.status_code == 400
+
+    def test_search_food_against_fake_fdc(self, client, fake_fdc):
+        """Test food search merges common foods with USDA results from the local FDC stand-in"""
+        response = client.post('/api/search_food',
+                             data=json.dumps({'query': 'salmon'}),
+                             content_type='application/json')
+        
+        assert response.status_code == 200
+        results = json.loads(response.data)
+        sources = {food['source'] for food in results}
+        assert sources == {'custom', 'usda'}
+        assert all('salmon' in food['name'].lower() for food in results)
+        assert not any('baby food' in food['name'].lower() for food in results)
+        assert fake_fdc.requests['search'] == 1
+        assert fake_fdc.requests['food'] > 0
+    
+    def test_autocomplete_survives_upstream_errors(self, client, fake_fdc):
+        """Test autocomplete still returns common foods when every USDA call fails"""
+        fake_fdc.configure(error_rate=1.0)
+        
+        response = client.post('/api/search_food_autocomplete',
+                             data=json.dumps({'query': 'egg'}),
+                             content_type='application/json')
+        
+        assert response.status_code == 200
+        results = json.loads(response.data)
+        assert results
+        assert all(food['source'] == 'custom' for food in results)
+        assert fake_fdc.requests['errors'] == 1
+
+class TestUsdaResilience:
+    """Test the circuit breaker, latency budget and cache around USDA calls"""
+    
+    def test_breaker_opens_and_probes(self):
+        """Test the breaker trips on failures and closes after a healthy half-open probe"""
+        from circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN, HALF_OPEN, CLOSED
+        
+        now = [0.0]
+        breaker = CircuitBreaker('test', min_calls=4, open_seconds=10, clock=lambda: now[0])
+        for failed in [False, True, False, True]:
+            assert breaker.allow()
+            breaker.record(0.1, failed=failed)
+        assert breaker.state == OPEN
+        
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: 'never called')
+        assert breaker.stats()['rejected'] == 1
+        
+        now[0] = 10.0
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()  # only one probe at a time
+        breaker.record(5.0)  # slow probe counts as bad
+        assert breaker.state == OPEN
+        
+        now[0] = 20.0
+        assert breaker.call(lambda: 'ok') == 'ok'
+        assert breaker.state == CLOSED
+        assert breaker.stats()['times_opened'] == 2
+    
+    def test_search_fails_fast_while_upstream_is_down(self, client, fake_fdc):
+        """Test searches stop calling USDA once the breaker opens and still return common foods"""
+        import nutrition_utils
+        fake_fdc.configure(error_rate=1.0)
+        
+        for query in ['apple', 'banana', 'bread', 'cheese', 'yogurt']:
+            nutrition_utils.search_food_comprehensive_with_warnings(query)
+        assert nutrition_utils.USDA_BREAKER.state == 'open'
+        calls_when_opened = fake_fdc.requests['search']
+        
+        response = client.post('/api/search_food_autocomplete',
+                             data=json.dumps({'query': 'egg'}),
+                             content_type='application/json')
+        results = json.loads(response.data)
+        assert results and all(food['source'] == 'custom' for food in results)
+        assert fake_fdc.requests['search'] == calls_when_opened
+        
+        status = json.loads(client.get('/api/nutrition_status').data)
+        assert status['breaker']['state'] == 'open'
+        assert status['short_circuited'] >= 1
+    
+    def test_latency_budget_returns_partial_results(self, fake_fdc):
+        """Test a slow upstream is cut off at the request budget and partial results aren't cached"""
+        import time
+        import nutrition_utils
+        fake_fdc.configure(latency_ms=60)
+        
+        with patch.object(nutrition_utils, 'USDA_REQUEST_BUDGET', 0.25), \
+             patch.object(nutrition_utils.USDA_BREAKER, 'slow_call_seconds', 10):
+            start = time.monotonic()
+            results = nutrition_utils.search_usda_foods('chicken', max_results=7)
+            elapsed = time.monotonic() - start
+        
+        assert elapsed < 0.6
+        assert len(results) < 7
+        assert nutrition_utils.get_usda_status()['budget_exhausted'] == 1
+        assert nutrition_utils.get_usda_status()['cache_size'] < 7
+    
+    def test_budget_clipped_timeout_is_not_an_upstream_failure(self, fake_fdc):
+        """Test a call cut short by our own budget leaves the breaker's counts and probe slot alone"""
+        import nutrition_utils
+        from circuit_breaker import CircuitBreaker, LatencyBudgetExceeded, latency_budget, HALF_OPEN
+        fake_fdc.configure(latency_ms=300)
+        
+        with latency_budget(0.1), pytest.raises(LatencyBudgetExceeded):
+            nutrition_utils.usda_get(nutrition_utils.USDA_SEARCH_URL, nutrition_utils.usda_search_params('rice'))
+        assert nutrition_utils.USDA_BREAKER.stats()['failures'] == 0
+        
+        now = [0.0]
+        breaker = CircuitBreaker('test', min_calls=1, open_seconds=10, clock=lambda: now[0])
+        breaker.allow()
+        breaker.record(0.1, failed=True)
+        now[0] = 10.0
+        assert breaker.allow() and not breaker.allow()
+        breaker.release()
+        assert breaker.state == HALF_OPEN and breaker.allow()
+    
+    def test_repeated_search_served_from_cache(self, fake_fdc):
+        """Test a completed search is answered from cache without calling USDA again"""
+        import nutrition_utils
+        
+        first = nutrition_utils.search_usda_foods('salmon', max_results=3)
+        upstream_calls = dict(fake_fdc.requests)
+        first[0]['dietary_warning'] = 'mutated by caller'
+        second = nutrition_utils.search_usda_foods('salmon', max_results=3)
+        
+        assert fake_fdc.requests == upstream_calls
+        assert [food['name'] for food in second] == [food['name'] for food in first]
+        assert 'dietary_warning' not in second[0]
+
+class TestRequestMetrics:
+    """Test per-endpoint instrumentation and the /metrics endpoint"""
+    
+    def _sample(self, text, name):
+        for line in text.splitlines():
+            if line.startswith(name + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return None
+    
+    def test_metrics_count_sql_per_endpoint(self, client):
+        """Test requests show up as histograms with their SQL statement counts"""
+        response = client.post('/api/signup', data=json.dumps({'username': 'metricuser', 'password': 'password123'}),
+                               content_type='application/json')
+        user_id = json.loads(response.data)['user_id']
+        client.post('/api/get_dashboard_data', data=json.dumps({'user_id': user_id}),
+                    content_type='application/json')
+        
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        text = response.data.decode()
+        
+        label = '{endpoint="/api/get_dashboard_data"}'
+        assert self._sample(text, f'nutrifit_http_request_sql_statements_count{label}') == 1
+        assert self._sample(text, f'nutrifit_http_request_sql_statements_sum{label}') >= 5
+        assert self._sample(text, f'nutrifit_http_request_sql_seconds_sum{label}') > 0
+        assert self._sample(text, f'nutrifit_http_response_size_bytes_sum{label}') > 0
+        assert ('nutrifit_http_requests_total{endpoint="/api/signup",method="POST",status="2xx"} 1') in text
+        assert 'nutrifit_http_request_duration_seconds_bucket{endpoint="/api/signup",method="POST",le="+Inf"} 1' in text
+        assert 'nutrifit_usda_circuit_state{state="closed"} 1' in text
+    
+    def test_only_app_connections_are_traced(self, test_db):
+        """Test tracing comes from database.connect, not a patched sqlite3.connect"""
+        import sqlite3
+        import database
+        from request_metrics import METRICS
+        
+        token = METRICS.start()
+        try:
+            conn = database.connect(test_db)
+            conn.cursor().execute("SELECT 1").fetchall()
+            conn.close()
+            plain = sqlite3.connect(test_db)
+            assert type(plain) is sqlite3.Connection
+            plain.execute("SELECT 1")
+            plain.close()
+        finally:
+            record = METRICS.finish(token, '/test', 'GET', 200)
+        assert record.statements == ['SELECT 1'] and record.sql_statements == 1
+    
+    def test_metrics_require_a_token_or_loopback(self, client, monkeypatch):
+        """Test /metrics is limited to loopback until a token is configured, then needs the token"""
+        remote = {'REMOTE_ADDR': '10.1.2.3'}
+        assert client.get('/metrics').status_code == 200
+        assert client.get('/metrics', environ_base=remote).status_code == 404
+        
+        monkeypatch.setenv('NUTRIFIT_METRICS_TOKEN', 'scrape-secret')
+        monkeypatch.setenv('NUTRIFIT_ADMIN_TOKEN', 'admin-secret')
+        assert client.get('/metrics').status_code == 404
+        assert client.get('/metrics', environ_base=remote,
+                          headers={'Authorization': 'Bearer wrong'}).status_code == 404
+        assert client.get('/metrics', environ_base=remote,
+                          headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+        assert client.get('/metrics', environ_base=remote,
+                          headers={'X-Admin-Token': 'admin-secret'}).status_code == 200
+    
+    def test_external_calls_are_counted(self, client, fake_fdc):
+        """Test USDA requests are attributed to the endpoint that made them"""
+        client.post('/api/search_food', data=json.dumps({'query': 'quinoa salad'}),
+                    content_type='application/json')
+        
+        text = client.get('/metrics').data.decode()
+        label = '{endpoint="/api/search_food"}'
+        calls = fake_fdc.requests['search'] + fake_fdc.requests['food']
+        assert calls > 0
+        assert self._sample(text, f'nutrifit_http_request_external_calls_sum{label}') == calls
+        assert self._sample(text, f'nutrifit_http_request_external_seconds_sum{label}') > 0
+    
+    def test_slow_request_log_lists_parameterized_sql(self, client, caplog):
+        """Test the slow-request log captures the queries without their values"""
+        from request_metrics import METRICS
+        
+        with patch.object(METRICS, 'slow_request_ms', 0.001):
+            client.post('/api/login', data=json.dumps({'username': 'nobody', 'password': 'hunter22'}),
+                        content_type='application/json')
+        
+        assert 'Slow request POST /api/login' in caplog.text
+        assert '?' in caplog.text and 'FROM users' in caplog.text
+        assert 'nobody' not in caplog.text
+        assert 'nutrifit_http_slow_requests_total{endpoint="/api/login"} 1' in client.get('/metrics').data.decode()
+
+class TestProfiling:
+    """Test the admin-gated request profiler and stack sampler"""
+    
+    def _signup(self, client):
+        response = client.post('/api/signup', data=json.dumps({'username': 'profiled', 'password': 'password123'}),
+                               content_type='application/json')
+        return json.loads(response.data)['user_id']
+    
+    def test_disabled_without_admin_token(self, client):
+        """Test profile flags are ignored unless the admin token is configured and sent"""
+        user_id = self._signup(client)
+        with patch.dict('os.environ', {'NUTRIFIT_ADMIN_TOKEN': ''}):
+            response = client.post('/api/get_dashboard_data?__profile=text',
+                                   data=json.dumps({'user_id': user_id}), content_type='application/json',
+                                   headers={'X-Admin-Token': ''})
+            assert response.is_json
+            assert client.get('/api/admin/stack_samples').status_code == 404
+        
+        with patch.dict('os.environ', {'NUTRIFIT_ADMIN_TOKEN': 'secret'}):
+            response = client.post('/api/get_dashboard_data', data=json.dumps({'user_id': user_id}),
+                                   content_type='application/json',
+                                   headers={'X-Profile': 'text', 'X-Admin-Token': 'wrong'})
+            assert response.is_json
+    
+    def test_profiles_request_as_text_or_file(self, client, tmp_path):
+        """Test an admin can get cProfile stats back or have them stored"""
+        import pstats
+        user_id = self._signup(client)
+        
+        with patch.dict('os.environ', {'NUTRIFIT_ADMIN_TOKEN': 'secret', 'NUTRIFIT_PROFILE_DIR': str(tmp_path)}):
+            response = client.post('/api/get_dashboard_data', data=json.dumps({'user_id': user_id}),
+                                   content_type='application/json',
+                                   headers={'X-Profile': 'text', 'X-Admin-Token': 'secret'})
+            assert response.mimetype == 'text/plain'
+            assert 'get_dashboard_data' in response.data.decode()
+            
+            response = client.post('/api/get_dashboard_data', data=json.dumps({'user_id': user_id}),
+                                   content_type='application/json',
+                                   headers={'X-Profile': 'store', 'X-Admin-Token': 'secret'})
+            assert response.is_json
+            stats = pstats.Stats(str(tmp_path / response.headers['X-Profile-File']))
+            assert any(name == 'get_dashboard_data' for _, _, name in stats.stats)
+    
+    def test_sampler_folds_thread_stacks(self, tmp_path):
+        """Test the sampler counts other threads' stacks and writes them in folded format"""
+        import threading
+        from profiling import StackSampler
+        
+        release = threading.Event()
+        def waiting_in_known_function():
+            release.wait()
+        worker = threading.Thread(target=waiting_in_known_function)
+        worker.start()
+        try:
+            sampler = StackSampler(output_dir=str(tmp_path))
+            for _ in range(3):
+                sampler.sample()
+        finally:
+            release.set()
+            worker.join()
+        
+        lines = [line for line in sampler.folded().splitlines() if 'waiting_in_known_function' in line]
+        assert len(lines) == 1 and lines[0].endswith(' 3')
+        assert lines[0].split(';')[0].startswith('_bootstrap')
+        
+        path = sampler.flush()
+        assert 'waiting_in_known_function' in open(path).read()
+        assert sampler.folded() == ''
+
+class TestResponseEncoding:
+    """Test the orjson provider, the compact schema and response compression"""
+    
+    def test_orjson_output_matches_stdlib(self):
+        """Test jsonify bytes are unchanged by the orjson provider for ASCII payloads, dates included"""
+        from datetime import datetime
+        from flask.json.provider import DefaultJSONProvider
+        from app import app
+        
+        payload = {'workouts': [{'name': 'Run', 'date': datetime(2026, 1, 2, 7, 30), 'duration': 30.5}],
+                   'totals': {'count': 1, 'notes': None, 'done': True}}
+        with app.test_request_context():
+            assert app.json.response(payload).get_data() == DefaultJSONProvider(app).response(payload).get_data()
+        assert app.json.loads(b'{"ids": [1, 2]}') == {'ids': [1, 2]}
+        
+        # Not byte-identical for non-ASCII or large floats, but the same JSON
+        payload = {'food': 'jalapeño', 'big': 1e16}
+        with app.test_request_context():
+            fast, stdlib = app.json.response(payload).get_data(), DefaultJSONProvider(app).response(payload).get_data()
+        assert fast != stdlib and json.loads(fast) == json.loads(stdlib) == payload
+    
+    def test_compact_schema_drops_duplicate_aliases(self):
+        """Test opting into the compact schema removes aliases only where they repeat the canonical key"""
+        from app import app
+        from flask import jsonify
+        
+        workout = {'type': 'cardio', 'workout_type': 'cardio', 'duration': 30, 'duration_minutes': 30,
+                   'calories_burned': 200, 'calories': 200, 'difficulty_level': 'easy', 'intensity': 'easy'}
+        food = {'name': 'Apple', 'calories': 95}
+        with app.test_request_context('/?schema=compact'):
+            compact = jsonify({'workouts': [workout], 'foods': [food]})
+        with app.test_request_context(headers={'X-Nutrifit-Schema': 'compact'}):
+            from_header = jsonify({'workouts': [workout], 'foods': [food]})
+        with app.test_request_context():
+            full = jsonify({'workouts': [workout], 'foods': [food]})
+        
+        assert json.loads(compact.data) == {
+            'workouts': [{'type': 'cardio', 'duration': 30, 'calories_burned': 200, 'difficulty_level': 'easy'}],
+            'foods': [food]
+        }
+        assert compact.headers['X-Nutrifit-Schema'] == 'compact'
+        assert from_header.data == compact.data
+        assert json.loads(full.data)['workouts'][0] == workout
+    
+    def test_large_responses_are_compressed(self, client):
+        """Test bodies over the threshold are gzipped when accepted, and sizes are counted per endpoint"""
+        import gzip
+        
+        response = client.get('/metrics', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert int(response.headers['Content-Length']) == len(response.data)
+        assert gzip.decompress(response.data).decode().startswith('# HELP')
+        
+        assert 'Content-Encoding' not in client.get('/metrics', headers={'Accept-Encoding': 'gzip;q=0'}).headers
+        assert 'Content-Encoding' not in client.get('/api/hello', headers={'Accept-Encoding': 'gzip'}).headers
+        
+        text = client.get('/metrics').data.decode()
+        assert 'nutrifit_http_response_sent_bytes_total{endpoint="/metrics",encoding="gzip"}' in text
+        assert 'nutrifit_http_response_sent_bytes_total{endpoint="/api/hello",encoding="identity"}' in text
+        assert 'nutrifit_http_response_encode_seconds_total{endpoint="/api/hello"}' in text
+    
+    def test_response_bench_measures_savings(self):
+        """Test the benchmark reports smaller compact and gzip sizes for an aliased payload"""
+        from app import app
+        from flask.json.provider import DefaultJSONProvider
+        from json_response import OrjsonProvider
+        from benchmarks.response_bench import measure
+        
+        workouts = [{'type': 'strength', 'workout_type': 'strength', 'duration': 45, 'duration_minutes': 45,
+                     'calories_burned': 300, 'calories': 300, 'notes': 'Leg day'} for _ in range(50)]
+        result = measure({'workouts': workouts}, OrjsonProvider(app), DefaultJSONProvider(app), rounds=3)
+        
+        assert result['compact_bytes'] < result['bytes']
+        assert result['gzip_bytes'] < result['bytes']
+        assert result['stdlib_ms'] >= 0 and result['orjson_ms'] >= 0
+
+class TestConditionalRequests:
+    """Test ETags on read endpoints backed by per-user data versions"""
+    
+    def _signup(self, client, username):
+        response = client.post('/api/signup', json={'username': username, 'password': 'password123'})
+        return response.get_json()['user_id']
+    
+    def test_unchanged_data_revalidates_with_304(self, client):
+        """Test a matching If-None-Match gets an empty 304 until the user adds a food"""
+        user_id = self._signup(client, 'etaguser')
+        
+        first = client.get(f'/api/get_custom_foods?user_id={user_id}')
+        assert first.status_code == 200
+        assert first.headers['Cache-Control'] == 'private, no-cache'
+        etag = first.headers['ETag']
+        
+        cached = client.get(f'/api/get_custom_foods?user_id={user_id}', headers={'If-None-Match': etag})
+        assert cached.status_code == 304
+        assert cached.data == b''
+        # POST callers can revalidate the same way
+        posted = client.post('/api/get_custom_foods', json={'user_id': user_id}, headers={'If-None-Match': etag})
+        assert posted.status_code == 304
+        
+        client.post('/api/add_custom_food', json={'user_id': user_id, 'name': 'Oat Bar', 'calories': 200,
+                                                  'protein': 8, 'carbohydrates': 30, 'fat': 6})
+        changed = client.get(f'/api/get_custom_foods?user_id={user_id}', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+        assert changed.get_json()[0]['name'] == 'Oat Bar'
+    
+    def test_etag_varies_with_schema_and_encoding(self, client):
+        """Test compact and gzipped responses get their own ETags, and each revalidates"""
+        user_id = self._signup(client, 'etagschema')
+        url = f'/api/get_profile?user_id={user_id}'
+        
+        full = client.get(url).headers['ETag']
+        compact = client.get(url, headers={'X-Nutrifit-Schema': 'compact'}).headers['ETag']
+        assert full != compact
+        assert client.get(url, headers={'If-None-Match': compact}).status_code == 200
+        
+        assert client.get(url, headers={'If-None-Match': f'{full[:-1]}-gzip"'}).status_code == 304
+        assert client.get(url, headers={'If-None-Match': f'"other", {full}'}).status_code == 304
+    
+    def test_profile_change_bumps_friends_lists(self, client):
+        """Test a friend's profile update invalidates the lists that show them"""
+        user_id = self._signup(client, 'etagfriend1')
+        friend_id = self._signup(client, 'etagfriend2')
+        client.post('/api/add_friend', json={'user_id': user_id, 'friend_id': friend_id})
+        
+        etag = client.get(f'/api/get_friends?user_id={user_id}').headers['ETag']
+        headers = {'If-None-Match': etag}
+        assert client.get(f'/api/get_friends?user_id={user_id}', headers=headers).status_code == 304
+        
+        client.post('/api/update_profile', json={'user_id': friend_id, 'name': 'Sam'})
+        assert client.get(f'/api/get_friends?user_id={user_id}', headers=headers).status_code == 200
+
+class TestSharedCaches:
+    """Test the dashboard and leaderboard caches and their invalidation"""
+    
+    def test_dashboard_cached_until_workout_logged(self, client):
+        """Test the fitness dashboard is served from cache and refreshed by a new workout"""
+        from datetime import date
+        import database
+        from app import DASHBOARD_CACHE
+        signup = client.post('/api/signup', json={'username': 'cacheuser', 'password': 'password123'})
+        user_id = signup.get_json()['user_id']
+        
+        first = client.post('/api/get_dashboard_data', json={'user_id': user_id}).get_json()
+        client.post('/api/get_dashboard_data', json={'user_id': user_id})
+        assert DASHBOARD_CACHE.stats()['hits'] == 1
+        assert first['fitness_data']['weekly_stats']['workouts'] == 0
+        
+        database.add_workout_session(user_id, {'name': 'Run', 'type': 'cardio', 'duration': 30,
+                                               'date_completed': date.today().isoformat()})
+        after = client.post('/api/get_dashboard_data', json={'user_id': user_id}).get_json()
+        assert after['fitness_data']['weekly_stats']['workouts'] == 1
+    
+    def test_leaderboard_refreshed_by_new_friend(self, client):
+        """Test adding a friend invalidates both users' cached leaderboards"""
+        ids = [client.post('/api/signup', json={'username': f'board{i}', 'password': 'password123'})
+               .get_json()['user_id'] for i in range(2)]
+        
+        assert client.post('/api/get_friends_leaderboard', json={'user_id': ids[0]}).get_json() == []
+        client.post('/api/add_friend', json={'user_id': ids[0], 'friend_id': ids[1]})
+        board = client.post('/api/get_friends_leaderboard', json={'user_id': ids[0]}).get_json()
+        assert [entry['id'] for entry in board] == [ids[1]]
+        
+        assert 'nutrifit_cache_hits{cache="leaderboard"}' in client.get('/metrics').data.decode()
 
 class TestFitnessEndpoints:
     """Test fitness tracking endpoints"""
@@ -196,6 +749,114 @@ class TestFitnessEndpoints:
         assert isinstance(data, list)
         assert len(data) > 0
 
+    def test_custom_workouts_feed_recommendations(self, client):
+        """Test custom workouts round-trip and only equipment-compatible ones are recommended"""
+        signup_response = client.post('/api/signup',
+                                    data=json.dumps({'username': 'testuser', 'password': 'password123'}),
+                                    content_type='application/json')
+        user_id = json.loads(signup_response.data)['user_id']
+        client.post('/api/complete_profile',
+                   data=json.dumps({'user_id': user_id, 'first_name': 'Test', 'last_name': 'User',
+                                    'date_of_birth': '1990-01-01', 'gender': 'male', 'height_cm': 175,
+                                    'weight_lb': 180, 'activity_level': 'moderately_active',
+                                    'fitness_experience': 'beginner', 'workout_frequency': 3,
+                                    'workout_duration': 30}),
+                   content_type='application/json')
+        
+        push_ups = {'name': 'Push-ups', 'sets': 3, 'reps': '10-12', 'rest': '60s', 'equipment': ['none']}
+        deadlift = {'name': 'Deadlift', 'sets': 5, 'reps': 5, 'rest': '120s', 'equipment': ['barbell']}
+        ids = {}
+        for name, exercise in (('Anywhere', push_ups), ('Barbell Day', deadlift)):
+            response = client.post('/api/create_custom_workout',
+                                  data=json.dumps({'user_id': user_id, 'workout_name': name,
+                                                   'exercises': [exercise]}),
+                                  content_type='application/json')
+            assert response.status_code == 200
+            ids[name] = json.loads(response.data)['plan_id']
+        
+        response = client.post('/api/get_user_custom_workouts',
+                             data=json.dumps({'user_id': user_id}),
+                             content_type='application/json')
+        workouts = {w['name']: w for w in json.loads(response.data)}
+        assert set(workouts) == {'Anywhere', 'Barbell Day'}
+        assert workouts['Anywhere']['workout_data']['exercises'] == [push_ups]
+        assert workouts['Barbell Day']['workout_data']['equipment'] == ['barbell']
+        
+        response = client.post('/api/get_workout_recommendations',
+                             data=json.dumps({'user_id': user_id}),
+                             content_type='application/json')
+        custom = [r['workout']['name'] for r in json.loads(response.data) if r.get('category') == 'custom']
+        assert custom == ['Anywhere']
+        
+        response = client.post('/api/delete_custom_workout',
+                             data=json.dumps({'user_id': user_id, 'workout_id': ids['Anywhere']}),
+                             content_type='application/json')
+        assert response.status_code == 200
+        response = client.post('/api/get_user_custom_workouts',
+                             data=json.dumps({'user_id': user_id}),
+                             content_type='application/json')
+        assert [w['name'] for w in json.loads(response.data)] == ['Barbell Day']
+
+    def test_workout_analytics_endpoint(self, client):
+        """Test weekly buckets over a range, refreshed when a workout is logged"""
+        from datetime import date, timedelta
+        signup_response = client.post('/api/signup',
+                                    data=json.dumps({'username': 'testuser', 'password': 'password123'}),
+                                    content_type='application/json')
+        user_id = json.loads(signup_response.data)['user_id']
+        
+        def analytics(**body):
+            return client.post('/api/get_workout_analytics', data=json.dumps(dict(body, user_id=user_id)),
+                               content_type='application/json')
+        
+        data = json.loads(analytics(bucket='week', days_back=28).data)
+        assert data['bucket'] == 'week' and data['end_date'] == date.today().isoformat()
+        assert data['totals']['workouts'] == 0 and len(data['buckets']) in (4, 5)
+        
+        import app as app_module
+        import database
+        with patch.object(app_module, 'DB_PATH', database.DB_PATH):
+            client.post('/api/complete_workout',
+                       data=json.dumps({'user_id': user_id, 'workout_data': {
+                           'name': 'Run', 'type': 'cardio', 'duration': 30, 'calories_burned': 250,
+                           'date_completed': date.today().isoformat()}}),
+                       content_type='application/json')
+        data = json.loads(analytics(bucket='week', days_back=28).data)
+        assert data['totals'] == {'workouts': 1, 'minutes': 30, 'calories': 250, 'types': {'cardio': 1},
+                                  'active_buckets': 1, 'most_common_type': 'cardio'}
+        assert data['buckets'][-1]['workouts'] == 1
+        
+        assert analytics(bucket='year').status_code == 400
+        assert analytics(start_date='2024-02-30').status_code == 400
+        assert analytics(start_date=(date.today() - timedelta(days=2000)).isoformat()).status_code == 400
+    
+    def test_fitness_dashboard_week_and_average(self, client):
+        """Test the dashboard's week is today and the 6 days before, with an unrounded average duration"""
+        from datetime import date, timedelta
+        import app as app_module
+        import database
+        signup_response = client.post('/api/signup',
+                                    data=json.dumps({'username': 'testuser', 'password': 'password123'}),
+                                    content_type='application/json')
+        user_id = json.loads(signup_response.data)['user_id']
+        
+        with patch.object(app_module, 'DB_PATH', database.DB_PATH):
+            for days_ago, duration in [(0, 30), (6, 45), (7, 20)]:
+                client.post('/api/complete_workout',
+                           data=json.dumps({'user_id': user_id, 'workout_data': {
+                               'name': 'Run', 'type': 'cardio', 'duration': duration, 'calories_burned': 250,
+                               'date_completed': (date.today() - timedelta(days=days_ago)).isoformat()}}),
+                           content_type='application/json')
+        response = client.post('/api/get_fitness_dashboard', data=json.dumps({'user_id': user_id}),
+                               content_type='application/json')
+        
+        data = json.loads(response.data)
+        assert data['weekly_stats'] == {'workouts': 2, 'total_duration': 75, 'total_calories': 500,
+                                        'avg_duration': 37.5}
+        assert data['workout_count_14_days'] == 3
+        assert [w['duration_minutes'] for w in data['all_workouts_14_days']] == [30, 45, 20]
+        assert data['all_workouts_14_days'][0]['date_completed'] == date.today().isoformat()
+
 class TestAPIEndpoints:
     """Test general API endpoints"""
     
@@ -204,4 +865,226 @@ class TestAPIEndpoints:
         response = client.get('/api/hello')
         assert response.status_code == 200
         data = json.loads(response.data)
-        assert data['message'] == 'Hello from Flask!'
\ No newline at end of file
+        assert data['message'] == 'Hello from Flask!'
+    
+    def test_export_endpoint_streams(self, client):
+        """Test /api/export streams NDJSON and zipped CSV downloads, uncompressed by the response hook"""
+        import io
+        import sqlite3
+        import zipfile
+        import database
+        
+        with sqlite3.connect(database.DB_PATH) as conn:
+            conn.executemany("""
+            INSERT INTO workout_sessions (user_id, workout_name, workout_type, duration_minutes, date_completed)
+            VALUES (?, ?, 'cardio', ?, ?)
+            """, [(user_id, f'Run {i}', 20 + i, f'2026-01-{i + 1:02d}') for user_id in ('u1', 'u2') for i in range(300)])
+            conn.execute("INSERT INTO vitals_data (user_id, metric_type, date_logged, value_data) "
+                         "VALUES ('u1', 'weight', '2026-01-01', '{\"weight\": 180}')")
+        
+        response = client.get('/api/export?user_id=u1', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200 and response.is_streamed
+        assert response.mimetype == 'application/x-ndjson' and 'Content-Encoding' not in response.headers
+        assert 'attachment; filename="nutrifit_export_' in response.headers['Content-Disposition']
+        records = [json.loads(line) for line in response.data.splitlines()]
+        assert [r['table'] for r in records] == ['workout_sessions'] * 300 + ['vitals_data']
+        assert records[0]['workout_name'] == 'Run 0' and records[-1]['value_data'] == '{"weight": 180}'
+        
+        response = client.post('/api/export', data=json.dumps({
+            'user_id': 'u2', 'format': 'csv', 'tables': ['workout_sessions', 'vitals_data'], 'zip': True}),
+            content_type='application/json')
+        assert response.mimetype == 'application/zip'
+        with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+            assert len(archive.read('workout_sessions.csv').decode().splitlines()) == 301
+            assert archive.read('vitals_data.csv').decode().splitlines() == [
+                'id,user_id,metric_type,date_logged,value_data,created_at']
+        
+        assert client.get('/api/export?user_id=u1&format=xml').status_code == 400
+        assert client.get('/api/export?user_id=u1&format=csv').status_code == 400
+        assert client.get('/api/export').status_code == 400
+        assert 'nutrifit_export_rows_total{table="workout_sessions",format="csv.zip"} 300' in \
+            client.get('/metrics').data.decode()
+
+class TestLoadTest:
+    """Test the HTTP load generator"""
+    
+    def test_journeys_run_without_errors(self, tmp_path):
+        """Test every page journey succeeds against the in-process server and is reported per endpoint"""
+        from benchmarks import load_test
+        
+        with patch.object(load_test, 'JOURNEY_WEIGHTS', {'nutrition': 1, 'fitness': 1, 'vitals': 1, 'friends': 1}):
+            report = load_test.run(users=3, duration=60, iterations=8, seed=2, data_dir=str(tmp_path),
+                                   usda_latency_ms=0)
+        
+        endpoints = report['endpoints']
+        assert report['overall']['errors'] == 0
+        assert report['overall']['requests'] == sum(e['requests'] for e in endpoints.values())
+        for path in ['/api/login', '/api/search_food_autocomplete', '/api/add_food_to_meal', '/get_meal_progress']:
+            assert endpoints[path]['requests'] > 0
+        assert endpoints['/api/login']['requests'] == 3
+        assert all(e['p50_ms'] <= e['p95_ms'] <= e['p99_ms'] for e in endpoints.values())
+
+class TestServing:
+    """Test the production serving setup"""
+    
+    def test_preloaded_wsgi_sets_up_schema_before_warming(self):
+        """Test wsgi.py, imported by the master before on_starting, creates the schema first"""
+        import os
+        import runpy
+        from unittest.mock import call
+        
+        steps = Mock()
+        with patch('app.init_database', steps.init_database), patch('app.warm_caches', steps.warm_caches), \
+             patch('gc.freeze'):
+            runpy.run_path(os.path.join(os.path.dirname(__file__), '..', 'wsgi.py'))
+        assert steps.mock_calls == [call.init_database(), call.warm_caches()]
+    
+    def test_init_database_runs_once_in_master(self, tmp_path):
+        """Test the gunicorn master sets up the schema and workers only check their connection"""
+        import os
+        import runpy
+        import sqlite3
+        import database
+        from unittest.mock import MagicMock
+        
+        config = runpy.run_path(os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py'))
+        assert config['preload_app'] and config['worker_class'] == 'gthread'
+        assert config['default_workers'](1) == 2 and config['default_workers'](64) == 8
+        
+        db_path = str(tmp_path / 'serving.db')
+        server = MagicMock()
+        with patch.object(database, 'DB_PATH', db_path), \
+             patch('app.init_db', wraps=database.init_db) as init_db:
+            config['on_starting'](server)
+            for pid in range(3):
+                config['post_fork'](server, MagicMock(pid=pid))
+            assert init_db.call_count == 1
+        
+        with sqlite3.connect(db_path) as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+class TestAsgiApp:
+    """Test the async food search routes and the Flask fallback in asgi.py"""
+    
+    def _request_all(self, requests):
+        """Send (method, path, payload) requests concurrently through the ASGI app"""
+        import asyncio
+        import httpx
+        from asgi import application
+        
+        async def run():
+            transport = httpx.ASGITransport(application)
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as http:
+                responses = await asyncio.gather(*(http.request(method, path, json=payload)
+                                                   for method, path, payload in requests))
+            await application.aclose()
+            return responses
+        return asyncio.run(run())
+    
+    def test_search_matches_flask_endpoints(self, client, fake_fdc):
+        """Test the async routes return what the Flask routes return, custom foods and warnings included"""
+        import nutrition_utils
+        
+        response = client.post('/api/signup', data=json.dumps({'username': 'asyncuser', 'password': 'password123'}),
+                               content_type='application/json')
+        user_id = json.loads(response.data)['user_id']
+        client.post('/api/update_profile', data=json.dumps({'user_id': user_id, 'dietary_restrictions': ['vegetarian']}),
+                    content_type='application/json')
+        client.post('/api/add_custom_food', data=json.dumps({
+            'user_id': user_id, 'name': 'Salmon Patty', 'calories': 210, 'protein': 18, 'carbohydrates': 6, 'fat': 12
+        }), content_type='application/json')
+        
+        requests = [
+            ('POST', '/api/search_food', {'user_id': user_id, 'query': 'salmon'}),
+            ('POST', '/api/search_food_autocomplete', {'user_id': user_id, 'query': 'salmon'}),
+            ('POST', '/api/search_food', {'query': ''})
+        ]
+        *async_responses, suggestions = self._request_all(
+            requests + [('POST', '/api/get_meal_suggestions', {'user_id': user_id, 'meal_type': 'lunch'})])
+        nutrition_utils.clear_usda_cache()
+        
+        for (method, path, payload), async_response in zip(requests, async_responses):
+            flask_response = client.post(path, data=json.dumps(payload), content_type='application/json')
+            assert async_response.status_code == flask_response.status_code
+            assert async_response.json() == json.loads(flask_response.data)
+        
+        results = async_responses[0].json()
+        assert results[0]['name'] == 'Salmon Patty'
+        assert results[0]['dietary_warning']
+        assert {food['source'] for food in results[1:]} == {'custom', 'usda'}
+        assert async_responses[0].headers['access-control-allow-origin'] == '*'
+        assert len(suggestions.json()) == 3  # sampled, so only the shape is comparable
+    
+    def test_usda_detail_lookups_run_concurrently(self, client, fake_fdc):
+        """Test a search's detail lookups overlap and are still counted against the route"""
+        import time
+        import nutrition_utils
+        from request_metrics import METRICS
+        fake_fdc.configure(latency_ms=100)
+        
+        with patch.object(nutrition_utils.USDA_BREAKER, 'slow_call_seconds', 10):
+            start = time.monotonic()
+            [response] = self._request_all([('POST', '/api/search_food', {'query': 'chicken'})])
+            elapsed = time.monotonic() - start
+        
+        assert response.status_code == 200
+        calls = fake_fdc.requests['search'] + fake_fdc.requests['food']
+        assert fake_fdc.requests['food'] >= 5
+        assert elapsed < 0.1 * calls / 2  # one after another would take 0.1s per call
+        assert nutrition_utils.get_usda_status()['cache_size'] == calls  # complete results are cached
+        assert f'nutrifit_http_request_external_calls_sum{{endpoint="/api/search_food"}} {calls}' in METRICS.render()
+    
+    def test_shared_usda_cache_is_read_off_the_event_loop(self, client, fake_fdc, tmp_path):
+        """Test a SQLite-backed USDA cache is read and written on executor threads, not the loop"""
+        import threading
+        import nutrition_utils
+        from app_cache import SqliteBackend
+
+        backend = SqliteBackend(str(tmp_path / 'cache.db'), 'usda')
+        threads = set()
+        for method in ('get', 'set'):
+            original = getattr(backend, method)
+            def traced(*args, original=original):
+                threads.add(threading.current_thread())
+                return original(*args)
+            setattr(backend, method, traced)
+
+        with patch.object(nutrition_utils.USDA_CACHE, 'backend', backend):
+            [first, second] = [self._request_all([('POST', '/api/search_food', {'query': 'chicken'})])[0]
+                               for _ in range(2)]
+
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json()
+        assert fake_fdc.requests['search'] == 1  # the second search was served from the cache
+        assert threads and threading.main_thread() not in threads
+
+    def test_export_streams_through_the_wsgi_executor(self, client):
+        """Test a multi-batch export survives its chunks being pulled on different executor threads"""
+        import sqlite3
+        import data_export
+        import database
+        
+        with sqlite3.connect(database.DB_PATH) as conn:
+            conn.executemany("""
+            INSERT INTO workout_sessions (user_id, workout_name, workout_type, duration_minutes, date_completed)
+            VALUES ('u1', ?, 'cardio', 30, ?)
+            """, [(f'Run {i}', f'2026-01-{i + 1:02d}') for i in range(9)])
+        
+        with patch.object(data_export, 'BATCH_ROWS', 2):
+            [response] = self._request_all([('GET', '/api/export?user_id=u1&tables=workout_sessions', None)])
+        
+        assert response.status_code == 200
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert [r['workout_name'] for r in records] == [f'Run {i}' for i in range(9)]
+    
+    def test_other_routes_fall_back_to_flask(self, client):
+        """Test routes without an async version are served by the Flask app"""
+        signup, hello, missing = self._request_all([
+            ('POST', '/api/signup', {'username': 'asgiflask', 'password': 'password123'}),
+            ('GET', '/api/hello', None),
+            ('GET', '/api/not_a_route', None)
+        ])
+        
+        assert signup.status_code == 200 and signup.json()['user_id']
+        assert hello.json() == {'message': 'Hello from Flask!'}
+        assert missing.status_code == 404
@@ -1,5 +1,11 @@
 import pytest
+import csv
+import io
 import json
+import sqlite3
+import zipfile
+import time
+import numpy as np
 from unittest.mock import patch
 from datetime import datetime, timedelta
 
@@ -8,8 +14,19 @@ from database import (
     create_user, authenticate_user, get_user_profile, update_user_profile,
     ensure_user_exists, add_food_to_current_meal, get_current_meal_items,
     get_daily_totals, reset_day, get_user_current_day, add_workout_session,
-    get_workout_history, save_workout_preference, get_user_workout_preferences
+    get_workout_history, save_workout_preference, get_user_workout_preferences,
+    get_user_streak, rebuild_user_streak, save_custom_workout, delete_custom_workout,
+    update_food_preference
 )
+from recommendation_cache import RecommendationCache, RECOMMENDATION_CACHE
+from meal_engine import FoodCatalog, MealSuggestionEngine, get_meal_budget
+from food_utils import filter_and_score_foods
+from dislike_matcher import DislikeMatcher, get_dislike_matcher, DISLIKE_MATCHERS
+from datagen import generate_dataset, user_id_for, DEFAULT_PASSWORD
+from benchmarks import db_bench
+from job_queue import JOBS, JobQueue
+import exercise_analytics
+import data_export
 
 class TestUserManagement:
     """Test user creation, authentication, and profile management"""
@@ -178,6 +195,882 @@ class TestFitnessTracking:
             assert len(preferences['liked']) == 2
             assert len(preferences['disliked']) == 1
 
+class TestCustomWorkouts:
+    """Test the normalized custom workout tables"""
+    
+    def test_migrates_json_plans(self, test_db):
+        """Test 'Custom:' workout plans move to the new tables with their ids and exercises"""
+        user_id, _ = create_user('planuser', 'password123')
+        plan = {'name': 'Old Favourite', 'type': 'strength', 'duration': 40, 'equipment': ['dumbbells'],
+                'created_by_user': True, 'exercises': [{'name': 'Curls', 'sets': 3, 'reps': 12, 'tempo': '2-0-2'}]}
+        with sqlite3.connect(test_db) as conn:
+            c = conn.cursor()
+            c.execute("INSERT INTO workout_plans (user_id, plan_name, plan_data) VALUES (?, ?, ?)",
+                      (user_id, 'Custom: Old Favourite', json.dumps(plan)))
+            plan_id = c.lastrowid
+            c.execute("INSERT INTO workout_plans (user_id, plan_name, plan_data) VALUES (?, ?, ?)",
+                      (user_id, 'Weekly Split', json.dumps({'days': 4})))
+        
+        database.init_fitness_tables()
+        database.init_fitness_tables()  # nothing left to move the second time
+        
+        workouts = database.get_user_custom_workouts(user_id)
+        assert [(w['id'], w['name']) for w in workouts] == [(plan_id, 'Old Favourite')]
+        assert workouts[0]['workout_data'] == plan
+        with sqlite3.connect(test_db) as conn:
+            assert [row[0] for row in conn.execute("SELECT plan_name FROM workout_plans")] == ['Weekly Split']
+    
+    def test_compatible_workouts_use_one_indexed_query(self, test_db):
+        """Test recommendations get only equipment-compatible workouts, newest first, from the index"""
+        user_id, _ = create_user('gearuser', 'password123')
+        for name, equipment in [('Bands', ['resistance_bands']), ('Anything', None),
+                                ('Bike', ['exercise_bike', 'none']), ('Barbell', ['barbell'])]:
+            workout = {'name': name, 'exercises': []}
+            if equipment is not None:
+                workout['equipment'] = equipment
+            save_custom_workout(user_id, workout)
+        
+        found = database.get_compatible_custom_workouts(user_id, {'bodyweight', 'resistance_bands'})
+        assert [w['name'] for w in found] == ['Bike', 'Anything', 'Bands']
+        assert [w['name'] for w in database.get_compatible_custom_workouts(user_id, set(), limit=1)] == ['Bike']
+        
+        with sqlite3.connect(test_db) as conn:
+            plan = ' '.join(row[3] for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM custom_workouts WHERE user_id = ? AND kind = 'custom' "
+                "ORDER BY created_at DESC", (user_id,)))
+        assert 'idx_custom_workouts_user_kind' in plan
+    
+    def test_delete_removes_exercises(self, test_db):
+        """Test deleting a custom workout removes its exercise rows and only the owner can delete"""
+        user_id, _ = create_user('deleteuser', 'password123')
+        workout_id = save_custom_workout(user_id, {'name': 'Core', 'exercises': [{'name': 'Plank'}]})
+        
+        assert not delete_custom_workout('someone-else', workout_id)
+        assert delete_custom_workout(user_id, workout_id)
+        with sqlite3.connect(test_db) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM custom_workout_exercises").fetchone()[0] == 0
+        assert database.get_user_custom_workouts(user_id) == []
+
+class TestWorkoutStreaks:
+    """Test incremental and rebuilt workout streaks"""
+    
+    def _log(self, user_id, day):
+        add_workout_session(user_id, {'name': 'Run', 'type': 'cardio', 'duration': 20,
+                                      'date_completed': day.strftime('%Y-%m-%d')})
+    
+    def test_streak_advances_and_tracks_best(self, test_db):
+        """Test consecutive days extend the streak and a gap resets it"""
+        with patch.object(database, 'DB_PATH', test_db):
+            user_id, _ = create_user("testuser", "password123")
+            today = datetime.now().date()
+            
+            assert get_user_streak(user_id)['current'] == 0
+            
+            for days_ago in [9, 8, 7, 1, 0, 0]:
+                self._log(user_id, today - timedelta(days=days_ago))
+            
+            streak = get_user_streak(user_id)
+            assert streak['current'] == 2
+            assert streak['best'] == 3
+            assert streak['last_active_date'] == today.isoformat()
+    
+    def test_backdated_session_rebuilds_streak(self, test_db):
+        """Test logging a missed day in the past joins the surrounding runs"""
+        with patch.object(database, 'DB_PATH', test_db):
+            user_id, _ = create_user("testuser", "password123")
+            today = datetime.now().date()
+            
+            for days_ago in [3, 2, 0]:
+                self._log(user_id, today - timedelta(days=days_ago))
+            assert get_user_streak(user_id)['current'] == 1
+            
+            self._log(user_id, today - timedelta(days=1))
+            streak = get_user_streak(user_id)
+            assert streak['current'] == 4
+            assert streak['best'] == 4
+            assert rebuild_user_streak(user_id)['current_streak'] == 4
+    
+    def test_stale_streak_reads_as_broken(self, test_db):
+        """Test a run that ended before yesterday no longer counts as current"""
+        with patch.object(database, 'DB_PATH', test_db):
+            user_id, _ = create_user("testuser", "password123")
+            today = datetime.now().date()
+            
+            for days_ago in [6, 5, 4]:
+                self._log(user_id, today - timedelta(days=days_ago))
+            
+            streak = get_user_streak(user_id)
+            assert streak['current'] == 0
+            assert streak['best'] == 3
+
+class TestRecommendationCache:
+    """Test the recommendation cache and its invalidation on writes"""
+    
+    def test_lru_eviction_and_hit_rate(self):
+        """Test the cache is bounded and counts hits and misses"""
+        cache = RecommendationCache(max_entries=2)
+        calls = []
+        
+        def compute(name):
+            return lambda: calls.append(name) or name
+        
+        profiles = [{'id': f'user{i}'} for i in range(3)]
+        assert cache.get_or_compute('recommendations', profiles[0], compute('a')) == 'a'
+        assert cache.get_or_compute('recommendations', profiles[0], compute('again')) == 'a'
+        cache.get_or_compute('recommendations', profiles[1], compute('b'))
+        cache.get_or_compute('recommendations', profiles[2], compute('c'))
+        
+        # user0 was least recently used and got evicted
+        cache.get_or_compute('recommendations', profiles[0], compute('a2'))
+        assert calls == ['a', 'b', 'c', 'a2']
+        
+        stats = cache.stats()
+        assert stats['size'] == 2
+        assert stats['hits'] == 1
+        assert stats['misses'] == 4
+        assert stats['evictions'] == 2
+        assert stats['hit_rate'] == 0.2
+    
+    def test_profile_change_misses(self):
+        """Test a different profile hashes to a different entry"""
+        cache = RecommendationCache()
+        cache.get_or_compute('plan', {'id': 'u', 'workout_duration': 30}, lambda: 'short', 3)
+        
+        assert cache.get_or_compute('plan', {'id': 'u', 'workout_duration': 60}, lambda: 'long', 3) == 'long'
+        assert cache.get_or_compute('plan', {'id': 'u', 'workout_duration': 30}, lambda: 'other', 4) == 'other'
+        assert cache.get_or_compute('plan', {'id': 'u', 'workout_duration': 30}, lambda: 'other', 3) == 'short'
+    
+    def test_writes_invalidate_user_entries(self, test_db):
+        """Test preference, profile and custom workout writes drop cached results"""
+        with patch.object(database, 'DB_PATH', test_db):
+            user_id, _ = create_user("testuser", "password123")
+            profile = {'id': user_id}
+            RECOMMENDATION_CACHE.clear()
+            
+            writes = [
+                lambda: save_workout_preference(user_id, "Morning Run", "disliked"),
+                lambda: update_user_profile(user_id, {'workout_duration': 45}, partial_update=True),
+                lambda: save_custom_workout(user_id, {'name': 'Leg Day', 'duration': 40}),
+                lambda: delete_custom_workout(user_id, 1),
+            ]
+            for write in writes:
+                RECOMMENDATION_CACHE.get_or_compute('recommendations', profile, lambda: 'cached')
+                write()
+                assert RECOMMENDATION_CACHE.get_or_compute('recommendations', profile, lambda: 'fresh') == 'fresh'
+                RECOMMENDATION_CACHE.invalidate(user_id)
+            
+            assert RECOMMENDATION_CACHE.stats()['invalidations'] >= len(writes)
+
+class TestAppCache:
+    """Test the application cache backends, tags and stampede protection"""
+    
+    def _shared_backends(self, kind, tmp_path, server=None):
+        from app_cache import SqliteBackend, RedisBackend, RespClient
+        if kind == 'sqlite':
+            return [SqliteBackend(str(tmp_path / 'cache.db'), 'test') for _ in range(2)]
+        return [RedisBackend(RespClient(server.url), 'test') for _ in range(2)]
+    
+    def test_memory_ttl_tags_and_lru(self):
+        """Test entries expire, tagged entries miss after invalidation and the LRU stays bounded"""
+        from app_cache import Cache, MemoryBackend
+        cache = Cache(MemoryBackend(max_entries=2))
+        
+        cache.set('short', 1, ttl=0.05)
+        cache.set('tagged', 'old', tags=['user:1'])
+        assert cache.get('short') == 1
+        time.sleep(0.06)
+        assert cache.get('short') is None
+        
+        cache.invalidate_tags('user:1')
+        assert cache.get('tagged') is None
+        assert cache.get_or_set('tagged', lambda: 'new', tags=['user:1']) == 'new'
+        
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        stats = cache.stats()
+        assert stats['size'] == 2
+        assert stats['evictions'] >= 1
+    
+    @pytest.mark.parametrize('kind', ['sqlite', 'redis'])
+    def test_shared_backends_span_workers(self, kind, tmp_path):
+        """Test two caches over one store (two workers) see each other's entries and invalidations"""
+        from app_cache import Cache, NoStore
+        from fake_redis import FakeRedisServer
+        
+        with FakeRedisServer() as server:
+            worker_a, worker_b = [Cache(backend, 'test') for backend in self._shared_backends(kind, tmp_path, server)]
+            
+            worker_a.set('dashboard:1', {'workouts': 3}, tags=['workouts:1'])
+            assert worker_b.get('dashboard:1') == {'workouts': 3}
+            worker_b.invalidate_tags('workouts:1')
+            assert worker_a.get('dashboard:1') is None
+            
+            assert worker_a.get_or_set('partial', lambda: NoStore([1])) == [1]
+            assert worker_b.get('partial') is None
+            worker_a.set('expiring', 'x', ttl=0.05)
+            time.sleep(0.06)
+            assert worker_b.get('expiring') is None
+            
+            worker_b.clear()
+            assert worker_a.get('missing', 'default') == 'default'
+    
+    def test_sqlite_tagged_hits_do_not_write(self, tmp_path):
+        """Test a tagged hit reads its tag tokens without taking the SQLite write lock"""
+        from app_cache import Cache, SqliteBackend
+        path = str(tmp_path / 'cache.db')
+        cache = Cache(SqliteBackend(path, 'test', timeout=0.2), 'test')
+        cache.set('dashboard:1', {'workouts': 3}, tags=['workouts:1'])
+        
+        writer = sqlite3.connect(path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")  # another worker mid-write
+        try:
+            assert cache.get('dashboard:1') == {'workouts': 3}
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+    
+    @pytest.mark.parametrize('kind', ['memory', 'sqlite', 'redis'])
+    def test_concurrent_misses_compute_once(self, kind, tmp_path):
+        """Test callers missing the same key at once wait for one computation, across workers too"""
+        import threading
+        from app_cache import Cache, MemoryBackend
+        from fake_redis import FakeRedisServer
+        
+        with FakeRedisServer() as server:
+            if kind == 'memory':
+                caches = [Cache(MemoryBackend())] * 2
+            else:
+                caches = [Cache(backend, 'test') for backend in self._shared_backends(kind, tmp_path, server)]
+            calls = []
+            
+            def compute():
+                calls.append(1)
+                time.sleep(0.2)
+                return 'leaderboard'
+            
+            results = []
+            threads = [threading.Thread(target=lambda cache=cache: results.append(cache.get_or_set('board', compute)))
+                       for cache in caches * 4]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            assert results == ['leaderboard'] * 8
+            assert len(calls) == 1
+    
+    def test_invalidation_during_compute_wins(self):
+        """Test a result computed across an invalidation isn't served afterwards"""
+        from app_cache import Cache, MemoryBackend
+        cache = Cache(MemoryBackend())
+        
+        def compute():
+            cache.invalidate_tags('user:1')  # e.g. a profile write landing meanwhile
+            return 'stale'
+        
+        assert cache.get_or_set('plan', compute, tags=['user:1']) == 'stale'
+        assert cache.get_or_set('plan', lambda: 'fresh', tags=['user:1']) == 'fresh'
+    
+    def test_unreachable_backend_behaves_as_empty(self):
+        """Test a cache whose server is down computes every time instead of failing"""
+        from app_cache import Cache, RedisBackend, RespClient
+        cache = Cache(RedisBackend(RespClient('redis://127.0.0.1:1/0', timeout=0.2), 'test'))
+        
+        assert cache.get_or_set('key', lambda: 'computed') == 'computed'
+        assert cache.stats()['errors'] > 0
+
+class TestMealSuggestionEngine:
+    """Test budget-aware meal suggestions"""
+    
+    FOODS = [
+        {'name': 'Grilled Chicken', 'calories': 300, 'protein': 45, 'carbohydrates': 0, 'fat': 12},
+        {'name': 'Brown Rice', 'calories': 220, 'protein': 5, 'carbohydrates': 46, 'fat': 2},
+        {'name': 'Large Pizza', 'calories': 2200, 'protein': 90, 'carbohydrates': 250, 'fat': 95},
+        {'name': 'Celery', 'calories': 10, 'protein': 0, 'carbohydrates': 2, 'fat': 0},
+        {'name': 'Beef Burrito', 'calories': 480, 'protein': 28, 'carbohydrates': 50, 'fat': 18},
+        {'name': 'Cafeteria Pasta', 'calories': 500, 'protein': 15, 'carbohydrates': 80, 'fat': 12}
+    ]
+    BUDGET = {'calories': 500, 'protein': 35, 'carbohydrates': 50, 'fat': 15}
+    
+    def test_meal_budget_tracks_eaten_food(self, test_db):
+        """Test the remaining budget shrinks by what was eaten in that meal"""
+        with patch.object(database, 'DB_PATH', test_db):
+            user_id, _ = create_user("testuser", "password123")
+            before = get_meal_budget(user_id, 'lunch')
+            
+            add_food_to_current_meal(user_id, 'lunch', {
+                'name': 'Grilled Chicken', 'calories': 300, 'protein': 45,
+                'carbohydrates': 0, 'fat': 12, 'quantity': 1, 'serving_size': '150g'
+            })
+            after = get_meal_budget(user_id, 'lunch')
+            
+            assert before['calories'] - after['calories'] == 300
+            assert before['protein'] - after['protein'] == pytest.approx(45)
+            assert after['carbohydrates'] == before['carbohydrates']
+            assert get_meal_budget(user_id, 'brunch') is None
+    
+    def test_ranks_foods_by_budget_fit(self):
+        """Test the closest fit wins and unwanted or disliked foods are dropped"""
+        engine = MealSuggestionEngine(FoodCatalog(self.FOODS))
+        
+        names = [food['name'] for food in engine.suggest(self.BUDGET, 'lunch', max_results=10)]
+        assert names[0] == 'Beef Burrito'
+        assert names.index('Large Pizza') > names.index('Brown Rice')
+        assert 'Cafeteria Pasta' not in names
+        
+        names = [food['name'] for food in engine.suggest(
+            self.BUDGET, 'lunch', max_results=10, disliked_foods=['beef burrito'])]
+        assert 'Beef Burrito' not in names
+        
+        vegetarian = engine.suggest(self.BUDGET, 'lunch', max_results=10, user_restrictions=['vegetarian'])
+        assert not any(food['name'] in ('Grilled Chicken', 'Beef Burrito') for food in vegetarian)
+    
+    def test_combinations_close_the_gap(self):
+        """Test food pairs are scored on their combined macros"""
+        engine = MealSuggestionEngine(FoodCatalog(self.FOODS))
+        
+        best = engine.suggest_combinations(self.BUDGET, 'lunch', max_results=1)[0]
+        assert {food['name'] for food in best['foods']} == {'Grilled Chicken', 'Brown Rice'}
+        assert best['totals']['calories'] == 520
+        assert best['remaining_after']['calories'] == -20
+    
+    def test_filter_and_score_foods(self, test_db):
+        """Test the food_utils wrapper honours the user's meal context"""
+        with patch.object(database, 'DB_PATH', test_db):
+            user_id, _ = create_user("testuser", "password123")
+            update_food_preference(user_id, 'lunch', 'Celery', True)
+            update_food_preference(user_id, 'lunch', 'Brown Rice', False)
+            
+            from user_utils import get_meal_context
+            context = get_meal_context({'id': user_id}, 'lunch')
+            foods = filter_and_score_foods([dict(food) for food in self.FOODS], context, 'lunch')
+            
+            names = [food['name'] for food in foods]
+            assert 'Brown Rice' not in names
+            assert 'Cafeteria Pasta' not in names
+            assert [food['score'] for food in foods] == sorted((food['score'] for food in foods), reverse=True)
+            assert context['remaining_calories'] == context['remaining']['calories']
+
+class TestDislikeMatcher:
+    """Test compiled disliked-food filtering"""
+    
+    def test_matches_like_substring_checks(self):
+        """Test the matcher agrees with checking every dislike against every name"""
+        dislikes = ['chicken', 'fried rice', 'Blue  Cheese', 'he', 'tofu scramble', 'ice']
+        names = ['Grilled Chicken', 'Rice', 'Fried Rice', 'Cheese', 'blue cheese dressing',
+                 'Oatmeal', 'Tofu', 'Apple', 'Spicy Tuna', 'Salmon']
+        matcher = DislikeMatcher(dislikes)
+        
+        normalized = [' '.join(d.lower().split()) for d in dislikes]
+        for name in names:
+            lowered = name.lower()
+            expected = any(d in lowered or lowered in d for d in normalized)
+            assert matcher.matches(name) == expected, name
+        
+        assert not DislikeMatcher([]).matches('Anything')
+        assert not DislikeMatcher(['', '  ']).matches('Anything')
+    
+    def test_filter_stops_at_limit(self):
+        """Test filtering keeps order and stops once enough foods pass"""
+        matcher = DislikeMatcher(['egg'])
+        foods = [{'name': n} for n in ['Scrambled Eggs', 'Toast', 'Egg Salad', 'Yogurt', 'Granola']]
+        assert [f['name'] for f in matcher.filter(foods, limit=2)] == ['Toast', 'Yogurt']
+        assert len(matcher.filter(foods)) == 3
+    
+    def test_cached_until_preferences_change(self, test_db):
+        """Test the compiled matcher is reused and rebuilt after a new dislike"""
+        with patch.object(database, 'DB_PATH', test_db):
+            user_id, _ = create_user("testuser", "password123")
+            update_food_preference(user_id, 'lunch', 'Tuna', False)
+            
+            matcher = get_dislike_matcher(user_id)
+            assert matcher.matches('Spicy Tuna Roll')
+            assert get_dislike_matcher(user_id) is matcher
+            
+            update_food_preference(user_id, 'dinner', 'Broccoli', False)
+            rebuilt = get_dislike_matcher(user_id)
+            assert rebuilt is not matcher
+            assert rebuilt.matches('Steamed Broccoli')
+            
+            update_food_preference(user_id, 'lunch', 'Tuna', True)
+            assert not get_dislike_matcher(user_id).matches('Spicy Tuna Roll')
+            assert DISLIKE_MATCHERS.stats()['hits'] >= 1
+
+class TestSyntheticData:
+    """Test the synthetic data generator"""
+    
+    def _snapshot(self, db_path):
+        with sqlite3.connect(db_path) as conn:
+            c = conn.cursor()
+            c.execute("SELECT user_id, day_number, meal_type, food_name, calories FROM meal_history ORDER BY id")
+            meals = c.fetchall()
+            c.execute("SELECT user_id, friend_id FROM friends ORDER BY user_id, friend_id")
+            friends = c.fetchall()
+            c.execute("SELECT user_id, metric_type, date_logged, value_data FROM vitals_data ORDER BY id")
+            vitals = c.fetchall()
+        return meals, friends, vitals
+    
+    def test_deterministic_for_seed(self, tmp_path):
+        """Test the same seed gives the same data regardless of chunking"""
+        end_date = datetime(2026, 1, 31).date()
+        first = generate_dataset(str(tmp_path / 'a.db'), users=12, days=20, seed=5, end_date=end_date, chunk_size=5)
+        second = generate_dataset(str(tmp_path / 'b.db'), users=12, days=20, seed=5, end_date=end_date)
+        other = generate_dataset(str(tmp_path / 'c.db'), users=12, days=20, seed=6, end_date=end_date)
+        
+        first.pop('seconds'), second.pop('seconds'), other.pop('seconds')
+        assert first == second
+        assert first['users'] == 12 and first['meal_history'] > 0 and first['workout_sessions'] > 0
+        assert self._snapshot(tmp_path / 'a.db') == self._snapshot(tmp_path / 'b.db')
+        assert self._snapshot(tmp_path / 'a.db') != self._snapshot(tmp_path / 'c.db')
+    
+    def test_rows_are_consistent(self, test_db):
+        """Test friends are mutual, totals match meals and regenerating replaces users"""
+        generate_dataset(test_db, users=15, days=14, seed=1)
+        counts = generate_dataset(test_db, users=15, days=14, seed=1)
+        
+        with sqlite3.connect(test_db) as conn:
+            c = conn.cursor()
+            c.execute("SELECT COUNT(*) FROM users")
+            assert c.fetchone()[0] == 15
+            c.execute("SELECT COUNT(*) FROM meal_history")
+            assert c.fetchone()[0] == counts['meal_history']
+            c.execute("""
+            SELECT COUNT(*) FROM friends f
+            LEFT JOIN friends r ON r.user_id = f.friend_id AND r.friend_id = f.user_id
+            WHERE r.user_id IS NULL
+            """)
+            assert c.fetchone()[0] == 0
+            c.execute("""
+            SELECT COUNT(*) FROM daily_nutrition d
+            JOIN (SELECT user_id, day_number, SUM(calories) AS calories FROM meal_history
+                  GROUP BY user_id, day_number) m USING (user_id, day_number)
+            WHERE ABS(d.total_calories - m.calories) > 0.01
+            """)
+            assert c.fetchone()[0] == 0
+            c.execute("SELECT COUNT(*) FROM exercise_performance e LEFT JOIN workout_sessions w "
+                      "ON w.id = e.workout_session_id WHERE w.id IS NULL")
+            assert c.fetchone()[0] == 0
+        
+        with patch.object(database, 'DB_PATH', test_db):
+            user_id, message = authenticate_user('synth_user_3', DEFAULT_PASSWORD)
+            assert user_id == user_id_for(3)
+    
+    def test_regenerating_moves_data_versions(self, test_db):
+        """Test regenerated users get new data versions, so old ETags stop matching"""
+        generate_dataset(test_db, users=2, days=3, seed=1)
+        before = [database.get_data_version(user_id_for(0), resource) for resource in ('profile', 'friends')]
+        generate_dataset(test_db, users=2, days=3, seed=1)
+        after = [database.get_data_version(user_id_for(0), resource) for resource in ('profile', 'friends')]
+        
+        assert all(before) and all(new != old for new, old in zip(after, before))
+    
+    def test_regenerating_clears_exercise_stats(self, test_db):
+        """Test regenerated users' exercise stats are rebuilt from the new sets, not left at the old high-water mark"""
+        generate_dataset(test_db, users=2, days=30, seed=1)
+        assert database.get_exercise_stats(user_id_for(0))
+        generate_dataset(test_db, users=2, days=30, seed=2)
+        
+        with sqlite3.connect(test_db) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM exercise_stats").fetchone()[0] == 0
+            logged = conn.execute("SELECT SUM(sets) FROM exercise_performance WHERE user_id = ? AND exercise_name != ''",
+                                  (user_id_for(0),)).fetchone()[0]
+        stats = database.get_exercise_stats(user_id_for(0))
+        assert logged and sum(exercise['total_sets'] for exercise in stats) == logged
+    
+    def test_regenerating_keeps_look_alike_users(self, test_db):
+        """Test clearing synthetic users doesn't treat '_' in the prefix as a wildcard"""
+        with sqlite3.connect(test_db) as conn:
+            conn.execute("INSERT INTO users (id, username, password_hash) VALUES ('synthia', 'synthia', 'x')")
+            conn.execute("INSERT INTO meal_history (user_id, day_number, food_name, calories) "
+                         "VALUES ('synthia', 1, 'Toast', 100)")
+            conn.execute("INSERT INTO daily_nutrition (user_id, day_number, total_calories) VALUES ('synthia', 1, 1800)")
+        generate_dataset(test_db, users=2, days=3, seed=1)
+        
+        with sqlite3.connect(test_db) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM users WHERE id = 'synthia'").fetchone()[0] == 1
+            assert conn.execute("SELECT COUNT(*) FROM meal_history WHERE user_id = 'synthia'").fetchone()[0] == 1
+            assert conn.execute("SELECT day_number, total_calories FROM daily_nutrition "
+                                "WHERE user_id = 'synthia'").fetchall() == [(1, 1800)]
+
+class TestDatabaseBenchmarks:
+    """Test the database benchmark harness"""
+    
+    def test_runs_every_target(self, tmp_path):
+        """Test a small run times every hot path and leaves the cached dataset untouched"""
+        report = db_bench.run(['1k'], rounds=2, data_dir=str(tmp_path))
+        result = report['scales']['1k']
+        
+        assert result['rows'] > 500
+        assert set(result['targets']) == {
+            'get_dashboard_data', 'get_meal_progress', 'add_food_to_current_meal', 'reset_day',
+            'get_vitals_chart_data', 'get_friends_leaderboard', 'get_friend_activities', 'get_user_badges',
+            'get_workout_recommendations', 'get_quick_workout_suggestions'
+        }
+        assert all(t['min_ms'] <= t['median_ms'] <= t['max_ms'] for t in result['targets'].values())
+        assert db_bench.count_rows(db_bench.dataset_path('1k', data_dir=str(tmp_path))) == result['rows']
+    
+    def test_compare_flags_regressions(self, tmp_path):
+        """Test only slowdowns past both the threshold and the noise floor are reported"""
+        def report(**medians):
+            return {'scales': {'1k': {'targets': {n: {'median_ms': ms} for n, ms in medians.items()}}}}
+        
+        baseline = report(fast=0.2, slow=10.0, steady=5.0)
+        current = report(fast=0.5, slow=14.0, steady=5.5, new=3.0)
+        assert db_bench.compare(current, baseline, threshold=0.25, min_delta_ms=0.5) == [('1k', 'slow', 10.0, 14.0)]
+        
+        path = tmp_path / 'baselines' / 'bench.json'
+        db_bench.save_baseline(baseline, str(path))
+        assert db_bench.compare(baseline, db_bench.load_baseline(str(path))) == []
+
+class TestDataVersions:
+    """Test the per-user data versions behind ETags"""
+    
+    def test_writes_bump_only_their_resource(self, test_db):
+        """Test each write moves its own resource's version forward and leaves the others"""
+        user_id, _ = create_user('versionuser', 'password123')
+        profile = database.get_data_version(user_id, 'profile')
+        assert database.get_data_version(user_id, 'custom_workouts') == 0
+        
+        save_custom_workout(user_id, {'name': 'Leg Day', 'exercises': []})
+        workouts = database.get_data_version(user_id, 'custom_workouts')
+        assert workouts > 0
+        
+        update_food_preference(user_id, 'breakfast', 'Oatmeal', True)
+        assert database.get_data_version(user_id, 'food_preferences') > 0
+        assert database.get_data_version(user_id, 'custom_workouts') == workouts
+        
+        update_user_profile(user_id, {'name': 'Alex'}, partial_update=True)
+        assert database.get_data_version(user_id, 'profile') > profile
+
+class TestWorkoutAnalytics:
+    """Test the time-bucketed workout analytics"""
+    
+    def _seed(self, test_db, user_id, sessions):
+        with sqlite3.connect(test_db) as conn:
+            conn.executemany("""
+            INSERT INTO workout_sessions
+            (user_id, workout_name, workout_type, duration_minutes, calories_burned, date_completed)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, [(user_id, t, t, minutes, minutes * 8, day.isoformat()) for day, t, minutes in sessions])
+    
+    def test_buckets_match_a_python_pass(self, test_db):
+        """Test day, week and month buckets agree with grouping the sessions in Python"""
+        rng = np.random.default_rng(3)
+        start = datetime(2024, 1, 1).date()
+        sessions = [(start + timedelta(days=int(d)), str(rng.choice(['cardio', 'strength', 'flexibility'])),
+                     int(rng.integers(10, 90))) for d in rng.integers(0, 120, 200)]
+        self._seed(test_db, 'u1', sessions)
+        self._seed(test_db, 'u2', sessions[:20])
+        end = start + timedelta(days=119)
+        
+        keys = {'day': lambda d: d, 'week': lambda d: d - timedelta(days=d.weekday()),
+                'month': lambda d: d.replace(day=1)}
+        for bucket, key in keys.items():
+            result = database.get_workout_analytics('u1', start, end, bucket)
+            expected = {}
+            for day, workout_type, minutes in sessions:
+                entry = expected.setdefault(key(day).isoformat(), {'workouts': 0, 'minutes': 0, 'types': {}})
+                entry['workouts'] += 1
+                entry['minutes'] += minutes
+                entry['types'][workout_type] = entry['types'].get(workout_type, 0) + 1
+            active = {b['start']: {k: b[k] for k in ('workouts', 'minutes', 'types')}
+                      for b in result['buckets'] if b['workouts']}
+            assert active == expected
+            assert result['totals']['workouts'] == 200
+        
+        assert len(database.get_workout_analytics('u1', start, end, 'day')['buckets']) == 120
+        assert [b['start'] for b in database.get_workout_analytics('u1', start, end, 'month')['buckets']] == \
+            ['2024-01-01', '2024-02-01', '2024-03-01', '2024-04-01']
+    
+    def test_rejects_bad_ranges(self, test_db):
+        """Test unknown buckets, reversed ranges and too many buckets are refused"""
+        today = datetime.now().date()
+        for args in [(today, today, 'year'), (today, today - timedelta(days=1), 'day'),
+                     (today - timedelta(days=5000), today, 'day')]:
+            with pytest.raises(ValueError):
+                database.get_workout_analytics('u1', *args)
+        assert len(database.workout_bucket_starts(today - timedelta(days=5000), today, 'month')) <= 166
+    
+    def test_dashboard_totals_in_one_pass(self, test_db):
+        """Test the dashboard's weekly and monthly totals and type mix from the grouped query"""
+        today = datetime.now().date()
+        # The week is today and the 6 days before it
+        self._seed(test_db, 'u1', [(today, 'cardio', 30), (today - timedelta(days=3), 'strength', 45),
+                                   (today - timedelta(days=6), 'cardio', 16),
+                                   (today - timedelta(days=7), 'strength', 25),
+                                   (today - timedelta(days=10), 'cardio', 20),
+                                   (today - timedelta(days=40), 'yoga', 60)])
+        dashboard = database.get_fitness_dashboard_data('u1')
+        assert dashboard['weekly_stats'] == {'workouts': 3, 'total_duration': 91, 'total_calories': 728,
+                                             'avg_duration': 30}
+        assert dashboard['monthly_stats'] == {'workouts': 5, 'total_duration': 136, 'total_calories': 1088}
+        assert dashboard['workout_types'] == [{'type': 'cardio', 'count': 3}, {'type': 'strength', 'count': 2}]
+    
+    def test_history_parses_each_date_once(self, test_db):
+        """Test the 14-day history behind the fitness dashboard parses each distinct day once"""
+        today = datetime.now().date()
+        self._seed(test_db, 'u1', [(today - timedelta(days=i % 3), 'cardio', 20 + i) for i in range(12)])
+        
+        with patch('database._parse_workout_date', wraps=database._parse_workout_date) as parse:
+            history = get_workout_history('u1', 14)
+        assert parse.call_count == 3
+        assert len(history) == 12
+        assert all(w['date'] == datetime.strptime(w['date_completed'], '%Y-%m-%d') for w in history)
+
+class TestExerciseAnalytics:
+    """Test the incremental per-exercise progression stats"""
+    
+    def _log(self, user_id, day, *exercises):
+        add_workout_session(user_id, {'name': 'Lift', 'type': 'strength', 'duration': 45,
+                                      'date_completed': day.isoformat(),
+                                      'exercises': [dict(e, rest='90s') for e in exercises]})
+    
+    def test_progress_and_records_from_logged_sets(self, test_db):
+        """Test 1RM, volume, records and a rising trend come out of logged workouts"""
+        user_id, _ = create_user('liftuser', 'password123')
+        start = datetime.now().date() - timedelta(days=12)
+        for i, weight in enumerate([135, 140, 145, 150, 155]):
+            self._log(user_id, start + timedelta(days=3 * i),
+                      {'name': 'Bench Press', 'sets': 3, 'reps': 5, 'weight_lb': weight},
+                      {'name': 'Push-ups', 'sets': 2, 'reps': 15 + i, 'weight_lb': 0})
+        
+        stats = {s['exercise_name']: s for s in database.get_exercise_stats(user_id)}
+        bench, push_ups = stats['Bench Press'], stats['Push-ups']
+        assert bench['best_e1rm_lb'] == round(155 * (1 + 5 / 30), 1)
+        assert bench['best_weight_lb'] == 155
+        assert bench['sessions'] == 5 and bench['total_volume_lb'] == 3 * 5 * (135 + 140 + 145 + 150 + 155)
+        assert bench['trend_days'] == 5 and bench['trend_per_week'] == pytest.approx(5 * 7 / 3 * (1 + 5 / 30), rel=1e-3)
+        assert push_ups['metric'] == 'reps' and push_ups['best_reps'] == 19
+        
+        with sqlite3.connect(test_db) as conn:
+            records = conn.execute(
+                "SELECT COUNT(*) FROM friend_activities WHERE user_id = ? AND type = 'record'", (user_id,)).fetchone()
+        assert records[0] == 4
+        
+        suggestions = {s['exercise_name']: s for s in exercise_analytics.progression_suggestions(stats.values())}
+        assert suggestions['Bench Press']['status'] == 'progressing'
+        assert suggestions['Bench Press']['next_weight_lb'] == 160
+        assert suggestions['Push-ups']['next_reps'] == 20
+    
+    def test_incremental_updates_match_a_full_pass(self, test_db):
+        """Test folding sets in batches gives the same stats as one pass over all of them"""
+        rng = np.random.default_rng(7)
+        start = datetime.now().date() - timedelta(days=200)
+        # Two exercises per session; a session is never split between batches
+        rows = [(session, int(day), name, int(rng.integers(1, 6)), int(rng.integers(1, 13)),
+                 float(rng.integers(0, 60)) * 5)
+                for session, day in enumerate(sorted(rng.integers(0, 200, 150)))
+                for name in rng.choice(['Squat', 'Row', 'Dip'], 2)]
+        
+        def load(user_id, batch):
+            with sqlite3.connect(test_db) as conn:
+                conn.executemany("""
+                INSERT INTO exercise_performance
+                (user_id, workout_session_id, exercise_name, sets, reps, weight_lb, date_performed)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, [(user_id, session, name, sets, reps, weight, (start + timedelta(days=day)).isoformat())
+                      for session, day, name, sets, reps, weight in batch])
+        
+        load('batched', rows[:250])
+        database.refresh_exercise_stats('batched')
+        load('batched', rows[250:])
+        database.refresh_exercise_stats('batched')
+        load('whole', rows)
+        database.refresh_exercise_stats('whole')
+        
+        with sqlite3.connect(test_db) as conn:
+            assert not exercise_analytics.has_new_sets(conn.cursor(), 'batched')
+        strip = lambda stats: [{k: v for k, v in s.items() if k != 'last_performance_id'} for s in stats]
+        assert strip(database.get_exercise_stats('batched')) == strip(database.get_exercise_stats('whole'))
+    
+    def test_unusable_sets_do_not_look_new(self, test_db):
+        """Test unnamed sets, which the stats skip, don't leave has_new_sets true after a refresh"""
+        user_id, _ = create_user('skipuser', 'password123')
+        today = datetime.now().date()
+        self._log(user_id, today, {'name': 'Squat', 'sets': 3, 'reps': 5, 'weight_lb': 225})
+        self._log(user_id, today, {'sets': 2, 'reps': 10, 'weight_lb': 95})
+        
+        database.get_exercise_stats(user_id)
+        with sqlite3.connect(test_db) as conn:
+            assert not exercise_analytics.has_new_sets(conn.cursor(), user_id)
+        
+        self._log(user_id, today, {'name': 'Squat', 'sets': 1, 'reps': 3, 'weight_lb': 245})
+        [squat] = database.get_exercise_stats(user_id)
+        assert squat['best_weight_lb'] == 245 and squat['total_sets'] == 4
+    
+    def test_tied_best_keeps_the_first_day_it_was_reached(self, test_db):
+        """Test a repeated best e1rm keeps its first date, whether it's folded in at once or in batches"""
+        start = datetime.now().date() - timedelta(days=30)
+        # (batch, day, weight): 200 lb first on day 3, matched on days 1 (back-dated), 10 and 20
+        sets = [(0, 3, 200), (0, 5, 190), (0, 10, 200), (1, 20, 200), (1, 15, 180), (2, 1, 200)]
+        
+        def load(user_id, batch):
+            with sqlite3.connect(test_db) as conn:
+                conn.executemany("""
+                INSERT INTO exercise_performance
+                (user_id, workout_session_id, exercise_name, sets, reps, weight_lb, date_performed)
+                VALUES (?, ?, 'Deadlift', 3, 5, ?, ?)
+                """, [(user_id, day, weight, (start + timedelta(days=day)).isoformat()) for _, day, weight in batch])
+        
+        for batch in range(3):
+            load('batched', [s for s in sets if s[0] == batch])
+            database.refresh_exercise_stats('batched')
+            if batch == 1:
+                [stats] = database.get_exercise_stats('batched')
+                assert stats['best_e1rm_date'] == (start + timedelta(days=3)).isoformat()
+        load('whole', sets)
+        database.refresh_exercise_stats('whole')
+        
+        [batched], [whole] = database.get_exercise_stats('batched'), database.get_exercise_stats('whole')
+        assert whole['best_e1rm_date'] == (start + timedelta(days=1)).isoformat()
+        assert {k: v for k, v in batched.items() if k != 'last_performance_id'} == \
+               {k: v for k, v in whole.items() if k != 'last_performance_id'}
+    
+    def test_group_slopes_and_suggestions(self):
+        """Test the vectorized per-group fit matches polyfit and flat or stale lifts get other advice"""
+        groups = np.array([0, 0, 0, 1, 1, 1, 1, 2])
+        x = np.array([0, 1, 2, 0, 1, 3, 4, 5], dtype=float)
+        y = np.array([100, 102, 104, 50, 49, 47, 46, 80], dtype=float)
+        slopes, _, counts = exercise_analytics.group_slopes(groups, x, y, 3)
+        assert slopes[:2] == pytest.approx([np.polyfit(x[:3], y[:3], 1)[0], np.polyfit(x[3:7], y[3:7], 1)[0]])
+        assert slopes[2] == 0 and list(counts) == [3, 4, 1]
+        
+        today = datetime.now().date()
+        base = {'metric': 'e1rm_lb', 'last_weight_lb': 200, 'last_reps': 5, 'best_e1rm_lb': 233.3,
+                'trend_percent_per_week': 0.1, 'trend_days': 6, 'last_performed': today.isoformat()}
+        flat, stale = exercise_analytics.progression_suggestions([
+            dict(base, exercise_name='Squat'),
+            dict(base, exercise_name='Deadlift', last_performed=(today - timedelta(days=40)).isoformat())
+        ], today)
+        assert (flat['status'], flat['next_weight_lb']) == ('plateau', 180)
+        assert (stale['status'], stale['days_since']) == ('returning', 40)
+
+class TestJobQueue:
+    """Test the SQLite-backed background job queue"""
+    
+    def _status(self, job_id):
+        with sqlite3.connect(database.DB_PATH) as conn:
+            return conn.execute("SELECT status, attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    
+    def test_workout_follow_ups_run_as_jobs(self, test_db):
+        """Test the activity entry and badges from a workout arrive through the queue"""
+        user_id, _ = create_user('jobuser', 'password123')
+        for _ in range(5):
+            add_workout_session(user_id, {'name': 'Run', 'type': 'cardio', 'duration': 30,
+                                          'calories_burned': 250})
+        
+        with sqlite3.connect(test_db) as conn:
+            badges = [row[0] for row in conn.execute(
+                "SELECT badge FROM friend_badges WHERE user_id = ?", (user_id,))]
+            activities = conn.execute(
+                "SELECT type, COUNT(*) FROM friend_activities WHERE user_id = ? GROUP BY type", (user_id,)).fetchall()
+        assert sorted(badges) == ['Calorie Burner', 'Workout Beginner']
+        assert dict(activities) == {'badge': 2, 'workout': 5}
+        assert database.award_workout_badges(user_id) == []
+        assert JOBS.stats()['counts']['done'] == 10
+    
+    def test_repeated_activity_job_adds_one_entry(self, test_db):
+        """Test the workout feed entry job can run again, e.g. after a lost lease, without duplicating it"""
+        user_id, _ = create_user('repeatjob', 'password123')
+        session_id = add_workout_session(user_id, {'name': 'Row', 'type': 'cardio', 'duration': 20})
+        with sqlite3.connect(test_db) as conn:
+            payload = json.loads(conn.execute(
+                "SELECT payload FROM jobs WHERE name = 'add_user_activity'").fetchone()[0])
+        assert payload['source_key'] == f"workout_session:{session_id}"
+        
+        database.add_user_activity(**payload)
+        database.add_user_activity(user_id, 'workout', 'completed a plan')
+        database.add_user_activity(user_id, 'workout', 'completed a plan')
+        
+        with sqlite3.connect(test_db) as conn:
+            descriptions = [row[0] for row in conn.execute(
+                "SELECT description FROM friend_activities WHERE user_id = ? AND type = 'workout' ORDER BY id",
+                (user_id,))]
+        assert descriptions == ['completed a 20-minute Row session', 'completed a plan', 'completed a plan']
+
+    def test_retries_with_backoff_then_fails(self, test_db):
+        """Test a failing job is retried after a growing delay and marked failed at max_attempts"""
+        queue = JobQueue(db_path=test_db)
+        calls = []
+        with patch.dict('job_queue.JOB_HANDLERS', {'flaky': lambda **_: calls.append(1) or 1 / 0}):
+            job_id = queue.enqueue('flaky', max_attempts=3)
+            now = time.time()
+            assert queue.run_pending(now=now) == 1
+            assert self._status(job_id) == ('queued', 1)
+            assert queue.run_pending(now=now + 1) == 0  # backing off for 2s
+            assert queue.run_pending(now=now + 3) == 1
+            assert queue.run_pending(now=now + 6) == 0  # then 4s
+            assert queue.run_pending(now=now + 8) == 1
+        
+        assert self._status(job_id) == ('failed', 3)
+        assert len(calls) == 3
+        assert queue.stats()['counts']['failed'] == 1
+    
+    def test_expired_lease_is_claimed_again(self, test_db):
+        """Test a job whose worker died is picked up after its lease, and the dead worker can't finish it"""
+        queue = JobQueue(db_path=test_db, lease_seconds=30)
+        with patch.dict('job_queue.JOB_HANDLERS', {'noop': lambda **_: None}):
+            job_id = queue.enqueue('noop')
+            now = time.time()
+            
+            abandoned = queue.claim(now=now)
+            assert abandoned[0] == job_id
+            assert queue.claim(now=now + 10) is None
+            
+            reclaimed = queue.claim(now=now + 31)
+            assert reclaimed[0] == job_id and reclaimed[3] == 2
+            assert queue.execute(reclaimed) == 'done'
+        assert queue.execute(abandoned) == 'lost'  # its lease token no longer matches
+        assert self._status(job_id) == ('done', 2)
+    
+    def test_expired_lease_on_last_attempt_fails(self, test_db):
+        """Test a job whose lease runs out on its final attempt is marked failed instead of run again"""
+        queue = JobQueue(db_path=test_db, lease_seconds=30)
+        with patch.dict('job_queue.JOB_HANDLERS', {'noop': lambda **_: None}):
+            job_id = queue.enqueue('noop', max_attempts=2)
+            now = time.time()
+            
+            assert queue.claim(now=now)[3] == 1
+            assert queue.claim(now=now + 31)[3] == 2
+            assert queue.claim(now=now + 62) is None
+            assert queue.claim(job_id=job_id, now=now + 93) is None
+        
+        assert self._status(job_id) == ('failed', 2)
+        assert 'nutrifit_jobs_processed_total{job="noop",outcome="failed"} 1' in queue.metric_lines()
+    
+    def test_unique_key_and_delay(self, test_db):
+        """Test a repeated unique_key returns the waiting job and delayed jobs wait their turn"""
+        queue = JobQueue(db_path=test_db)
+        seen = []
+        with patch.dict('job_queue.JOB_HANDLERS', {'record': lambda value: seen.append(value)}):
+            first = queue.enqueue('record', {'value': 1}, delay=60, unique_key='once')
+            assert queue.enqueue('record', {'value': 2}, unique_key='once') == first
+            with pytest.raises(ValueError):
+                queue.enqueue('no_such_job')
+            
+            assert queue.run_pending() == 0
+            assert queue.run_pending(now=time.time() + 61) == 1
+            assert seen == [1]
+            assert queue.enqueue('record', {'value': 3}, unique_key='once') != first
+    
+    def test_worker_threads_process_jobs(self, test_db):
+        """Test thread mode runs enqueued jobs in the background and reports them as metrics"""
+        queue = JobQueue(db_path=test_db, threads=2, poll_interval=0.05).start()
+        try:
+            ids = [queue.enqueue('add_user_activity', {'user_id': 'u1', 'activity_type': 'workout',
+                                                       'description': f'run {i}'}) for i in range(5)]
+            deadline = time.time() + 5
+            while queue.stats()['counts']['done'] < len(ids) and time.time() < deadline:
+                time.sleep(0.02)
+            assert queue.stats()['counts']['done'] == 5
+            assert queue.stats()['workers'] == 2
+        finally:
+            queue.stop(timeout=5)
+        
+        lines = queue.metric_lines()
+        assert 'nutrifit_jobs{status="done"} 5' in lines
+        assert 'nutrifit_jobs_processed_total{job="add_user_activity",outcome="done"} 5' in lines
+
 class TestUtilityFunctions:
     """Test utility functions"""
     
@@ -190,4 +1083,68 @@ class TestUtilityFunctions:
             assert ensure_user_exists(user_id) == True
             
             # Should return False for non-existing user
-            assert ensure_user_exists("fake_user_id") == False
\ No newline at end of file
+            assert ensure_user_exists("fake_user_id") == False
+
+
+class TestDataExport:
+    """Test the streaming history export"""
+    
+    def _dataset(self, tmp_path):
+        db_path = str(tmp_path / 'export.db')
+        generate_dataset(db_path, users=3, days=12, seed=4)
+        return db_path
+    
+    def _rows(self, db_path, table, user_id):
+        with sqlite3.connect(db_path) as conn:
+            cursor = conn.execute(f"SELECT * FROM {table} WHERE user_id = ? ORDER BY id", (user_id,))
+            columns = [description[0] for description in cursor.description]
+            return columns, cursor.fetchall()
+    
+    def test_ndjson_streams_every_row_in_batches(self, tmp_path):
+        """Test the NDJSON export holds exactly the user's rows, yielded one batch at a time"""
+        db_path = self._dataset(tmp_path)
+        user_id = user_id_for(1)
+        chunks = list(data_export.export_stream(db_path, user_id, 'ndjson', batch_rows=7))
+        records = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        
+        for table in data_export.EXPORT_TABLES:
+            columns, rows = self._rows(db_path, table, user_id)
+            exported = sorted((r for r in records if r['table'] == table), key=lambda r: r['id'])
+            assert rows and [tuple(r[c] for c in columns) for r in exported] == rows
+        assert max(len(chunk.splitlines()) for chunk in chunks) == 7
+        assert len(chunks) >= len(records) / 7
+        
+        lines = data_export.EXPORT_STATS.render()
+        assert f'nutrifit_export_rows_total{{table="meal_history",format="ndjson"}} ' \
+            f'{len(self._rows(db_path, "meal_history", user_id)[1])}' in lines
+    
+    def test_zipped_csv_has_one_file_per_table(self, tmp_path):
+        """Test a zipped CSV export, written to an unseekable stream, opens as one CSV per table"""
+        db_path = self._dataset(tmp_path)
+        user_id = user_id_for(0)
+        body = b''.join(data_export.export_stream(db_path, user_id, 'csv', 'workout_sessions,vitals_data',
+                                                  zipped=True, batch_rows=5))
+        
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            assert archive.namelist() == ['workout_sessions.csv', 'vitals_data.csv']
+            for table in ('workout_sessions', 'vitals_data'):
+                columns, rows = self._rows(db_path, table, user_id)
+                exported = list(csv.reader(io.TextIOWrapper(archive.open(f"{table}.csv"), newline='')))
+                assert exported[0] == columns
+                assert sorted(int(row[0]) for row in exported[1:]) == [row[0] for row in rows]
+    
+    def test_export_reads_in_index_order(self, test_db):
+        """Test no export query sorts the user's rows itself, so memory doesn't grow with history"""
+        with sqlite3.connect(test_db) as conn:
+            for table, order_by in data_export.EXPORT_TABLES.items():
+                plan = ' '.join(row[-1] for row in conn.execute(
+                    f"EXPLAIN QUERY PLAN SELECT * FROM {table} WHERE user_id = ? ORDER BY {order_by}", ('u1',)))
+                assert 'USING INDEX' in plan and 'TEMP B-TREE' not in plan, (table, plan)
+    
+    def test_invalid_exports_fail_before_reading(self, tmp_path):
+        """Test bad formats, tables and unzipped multi-table CSV raise before a connection is opened"""
+        missing = str(tmp_path / 'missing' / 'nothing.db')
+        for args in [('xml', None, False), ('ndjson', 'meal_history,passwords', False), ('csv', None, False)]:
+            with pytest.raises(ValueError):
+                data_export.export_stream(missing, 'u1', *args)
+        assert data_export.parse_tables(' vitals_data, vitals_data ') == ['vitals_data']
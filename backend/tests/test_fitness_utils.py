@@ -1,11 +1,20 @@
 import pytest
 from unittest.mock import patch, Mock
 
+import io
+import json
+
+import numpy as np
+
 import fitness_utils
+from workout_scoring import top_k
+from workout_catalog import compile_workout_catalog
+from log_utils import configure_logging
 from fitness_utils import (
     get_workout_recommendations, calculate_match_score, get_workout_plan,
     calculate_calories_burned, get_quick_workout_suggestions,
-    calculate_quick_workout_score, create_custom_workout, get_exercise_tips
+    calculate_quick_workout_score, create_custom_workout, get_exercise_tips,
+    generate_workout_stats
 )
 
 class TestWorkoutRecommendations:
@@ -129,6 +138,140 @@ class TestQuickWorkouts:
         assert isinstance(score, int)
         assert 0 <= score <= 100
 
+class TestWorkoutCatalog:
+    """Test the precompiled workout catalog"""
+    
+    def test_catalog_covers_all_workouts(self):
+        """Test every database workout is compiled into the catalog"""
+        catalog = fitness_utils.WORKOUT_CATALOG
+        quick_count = sum(len(w) for d in fitness_utils.QUICK_WORKOUT_DATABASE.values() for w in d.values())
+        main_count = sum(
+            sum(len(w) for w in level.values()) if isinstance(level, dict) else len(level)
+            for levels in fitness_utils.WORKOUT_DATABASE.values() for level in levels.values()
+        )
+        
+        assert len(catalog) == quick_count + main_count + len(fitness_utils.BASIC_UNIVERSAL_WORKOUTS)
+        entry = catalog.records[min(catalog.name_to_ids['Beginner Bodyweight Upper'])]
+        assert entry.workout['name'] == 'Beginner Bodyweight Upper'
+        
+        with pytest.raises(AttributeError):
+            entry.duration = 5
+    
+    def test_catalog_equipment_selection(self):
+        """Test equipment bitmask selection matches the workout equipment lists"""
+        catalog = fitness_utils.WORKOUT_CATALOG
+        
+        for entry in catalog.select(catalog.equipped(['dumbbells'])):
+            equipment = entry.workout.get('equipment', ['none'])
+            assert 'none' in equipment or 'dumbbells' in equipment
+        
+        no_equipment = catalog.select(catalog.equipped([]))
+        assert no_equipment
+        assert all('none' in entry.workout['equipment'] for entry in no_equipment)
+    
+    def test_catalog_duration_and_focus_index(self):
+        """Test duration buckets and focus muscle-group lookups"""
+        catalog = fitness_utils.WORKOUT_CATALOG
+        
+        for entry in catalog.select(catalog.within_duration('main', 30, 5)):
+            assert abs(entry.duration - 30) <= 5
+        
+        for entry in catalog.select(catalog.for_focus('lower_body')):
+            assert set(entry.workout['muscle_groups']) & {'quads', 'glutes', 'hamstrings', 'calves'}
+        
+        assert catalog.for_focus('full_body') is None
+    
+    def test_catalog_named_finds_every_workout_with_a_name(self):
+        """Test exclusion by name covers all workouts sharing that name"""
+        workout = {'name': 'Shared Name', 'duration': 20, 'equipment': ['none'], 'muscle_groups': ['core']}
+        catalog = compile_workout_catalog(
+            {'strength': {'beginner': [workout, dict(workout, duration=30)]}}, {},
+            [{'workout': dict(workout, name='Other'), 'type': 'cardio'}], {}, {})
+        
+        assert catalog.named(['Shared Name']) == {0, 1}
+        assert catalog.named(['Shared Name', 'Other', 'Missing']) == {0, 1, 2}
+        assert [r.id for r in catalog.select(exclude=catalog.named(['Shared Name']))] == [2]
+
+class TestWorkoutScoring:
+    """Test the vectorized workout scorer against the per-workout scorers"""
+    
+    PROFILES = [
+        {'fitness_experience': 'beginner', 'workout_duration': 20},
+        {'fitness_experience': 'intermediate', 'workout_duration': 45,
+         'training_styles': ['weightlifting', 'hiit', 'cycling'], 'fitness_goals': ['muscle_building', 'endurance']},
+        {'fitness_experience': 'advanced', 'workout_duration': 60,
+         'training_styles': ['yoga', 'bodyweight', 'cardio', 'running'],
+         'fitness_goals': ['weight_loss', 'flexibility', 'general_health']},
+    ]
+    
+    def test_match_scores_equivalent(self):
+        """Test batch match scores equal calculate_match_score with the same jitter"""
+        catalog = fitness_utils.WORKOUT_CATALOG
+        scorer = fitness_utils.WORKOUT_SCORER
+        available = {'bodyweight', 'dumbbells', 'gym_full', 'treadmill'}
+        
+        for profile in self.PROFILES:
+            scorer.reseed(7)
+            jitter = scorer.jitter(len(catalog))
+            scorer.reseed(7)
+            batch = scorer.match_scores(profile, available)
+            
+            with patch('random.randint', side_effect=[int(j) for j in jitter]):
+                expected = [calculate_match_score(r.workout, profile, available) for r in catalog.records]
+            assert batch.tolist() == expected
+    
+    def test_quick_scores_equivalent(self):
+        """Test batch quick scores equal calculate_quick_workout_score with the same jitter"""
+        catalog = fitness_utils.WORKOUT_CATALOG
+        scorer = fitness_utils.WORKOUT_SCORER
+        
+        for profile in self.PROFILES + [None]:
+            jitter = np.arange(len(catalog)) % 6
+            batch = scorer.quick_scores(profile, 15, jitter=jitter)
+            
+            with patch('random.randint', side_effect=[int(j) for j in jitter]):
+                expected = [calculate_quick_workout_score(r.workout, profile, 15) for r in catalog.records]
+            assert batch.tolist() == expected
+    
+    def test_top_k_matches_stable_sort(self):
+        """Test top_k returns the same order as a stable descending sort"""
+        scores = np.array([50, 80, 80, 20, 95, 80, 50])
+        expected = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        
+        for k in range(len(scores) + 2):
+            assert top_k(scores, k).tolist() == expected[:k]
+
+class TestRecommendationLogging:
+    """Test recommendation debug logging is level-gated, sampled and JSON formatted"""
+    
+    def test_debug_lines_disabled_at_info(self, sample_user_profile):
+        """Test nothing is written for debug lines at INFO level"""
+        stream = io.StringIO()
+        try:
+            configure_logging(level='INFO', fmt='json', stream=stream)
+            get_workout_recommendations(sample_user_profile)
+        finally:
+            configure_logging()
+        
+        assert stream.getvalue() == ''
+    
+    def test_per_workout_lines_are_sampled(self, sample_user_profile):
+        """Test per-candidate lines are sampled and emitted as JSON"""
+        stream = io.StringIO()
+        try:
+            configure_logging(level='DEBUG', fmt='json', sample_every=1000, stream=stream)
+            get_workout_recommendations(sample_user_profile)
+        finally:
+            configure_logging()
+        
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        added = [e for e in entries if e['message'].startswith('Added strength workout')]
+        
+        assert all(e['logger'] == 'nutrifit.fitness_utils' and e['level'] == 'DEBUG' for e in entries)
+        assert len(added) == 1
+        assert added[0]['sample_every'] == 1000
+        assert any(e['message'].startswith('Total final recommendations') for e in entries)
+
 class TestUtilityFunctions:
     """Test utility functions"""
     
@@ -174,3 +317,13 @@ class TestUtilityFunctions:
         unknown_tips = get_exercise_tips('unknown_exercise')
         assert 'form_tips' in unknown_tips
         assert 'safety' in unknown_tips
+    
+    def test_generate_workout_stats_most_common_type(self):
+        """Test the most common type is counted over the whole history"""
+        from datetime import datetime
+        workouts = [{'type': t, 'duration': 20, 'calories_burned': 100, 'date': datetime.now()} for t in
+                    ['cardio', 'strength', 'strength', 'yoga', 'strength', 'cardio']]
+        stats = generate_workout_stats(workouts)
+        
+        assert stats['most_common_type'] == 'Strength'
+        assert stats['total_workouts'] == 6
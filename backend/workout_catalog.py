@@ -0,0 +1,224 @@
+from bisect import bisect_left, bisect_right
+
+# The workout databases in fitness_utils are nested dicts that the recommenders
+# used to re-walk on every request. compile_workout_catalog flattens them once
+# into read-only records plus set indexes, so candidate selection is a handful
+# of frozenset intersections and equipment checks are bitmask tests.
+
+QUICK_SOURCE = 'quick'
+MAIN_SOURCE = 'main'
+BASIC_SOURCE = 'basic'
+
+
+class CatalogWorkout:
+    """Read-only flattened view of one workout from the workout databases"""
+
+    __slots__ = (
+        'id', 'name', 'source', 'workout_type', 'experience', 'category',
+        'bucket', 'duration', 'calories_burned', 'intensity', 'exercise_count',
+        'equipment_mask', 'needs_no_equipment', 'muscle_mask', 'workout'
+    )
+
+    def __init__(self, **fields):
+        for slot in self.__slots__:
+            object.__setattr__(self, slot, fields.get(slot))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Catalog workouts are read-only")
+
+    def __repr__(self):
+        return f"CatalogWorkout({self.id}, {self.name!r}, {self.source})"
+
+    def fits(self, equipment_mask):
+        """Check whether the workout can be done with the given equipment mask"""
+        return self.needs_no_equipment or bool(self.equipment_mask & equipment_mask)
+
+
+class WorkoutCatalog:
+    """Immutable index over every workout in the fitness databases"""
+
+    def __init__(self, records, equipment_bits, muscle_bits, focus_muscle_groups):
+        self.records = tuple(records)
+        self.equipment_bits = dict(equipment_bits)
+        self.muscle_bits = dict(muscle_bits)
+        names = {}
+        index = {}
+        by_equipment = {}
+        durations = {}
+        no_equipment = set()
+
+        for record in self.records:
+            names.setdefault(record.name, set()).add(record.id)
+            index.setdefault((record.source, record.workout_type, record.experience), set()).add(record.id)
+            index.setdefault((record.source, 'category', record.category), set()).add(record.id)
+            durations.setdefault(record.source, {}).setdefault(record.bucket, set()).add(record.id)
+            if record.needs_no_equipment:
+                no_equipment.add(record.id)
+            for bit, ids in _split_mask(record.equipment_mask, by_equipment):
+                ids.add(record.id)
+
+        # A name can belong to several workouts (e.g. in two sources); exclusions must hit all of them
+        self.name_to_ids = {name: frozenset(ids) for name, ids in names.items()}
+        self._index = {key: frozenset(ids) for key, ids in index.items()}
+        self._by_equipment = {bit: frozenset(ids) for bit, ids in by_equipment.items()}
+        self._no_equipment = frozenset(no_equipment)
+
+        # Duration-bucket index: sorted bucket keys per source, for range lookups
+        self._buckets = {}
+        for source, buckets in durations.items():
+            keys = sorted(buckets)
+            self._buckets[source] = (keys, [frozenset(buckets[key]) for key in keys])
+
+        # Focus areas resolve to the ids of workouts hitting any of their muscle groups
+        self._focus = {}
+        for focus, groups in focus_muscle_groups.items():
+            mask = self.muscle_mask(groups)
+            self._focus[focus] = frozenset(r.id for r in self.records if r.muscle_mask & mask)
+
+    def __len__(self):
+        return len(self.records)
+
+    def equipment_mask(self, equipment):
+        """Bitmask for a collection of equipment names; unknown names are ignored"""
+        mask = 0
+        for name in equipment or ():
+            mask |= self.equipment_bits.get(name, 0)
+        return mask
+
+    def muscle_mask(self, muscle_groups):
+        """Bitmask for a collection of muscle groups; unknown groups are ignored"""
+        mask = 0
+        for group in muscle_groups or ():
+            mask |= self.muscle_bits.get(group, 0)
+        return mask
+
+    def lookup(self, source, workout_type, experience):
+        """Ids of workouts from one source, type and experience level"""
+        return self._index.get((source, workout_type, experience), frozenset())
+
+    def in_categories(self, source, categories):
+        """Ids of workouts in any of the given categories (equipment type or quick focus)"""
+        ids = set()
+        for category in categories:
+            ids |= self._index.get((source, 'category', category), frozenset())
+        return ids
+
+    def within_duration(self, source, target, tolerance):
+        """Ids of workouts whose duration bucket is within tolerance minutes of target"""
+        keys, buckets = self._buckets.get(source, ((), ()))
+        start = bisect_left(keys, target - tolerance)
+        end = bisect_right(keys, target + tolerance)
+        ids = set()
+        for bucket in buckets[start:end]:
+            ids |= bucket
+        return ids
+
+    def equipped(self, equipment):
+        """Ids of workouts doable with the given equipment names (or needing none)"""
+        ids = set(self._no_equipment)
+        mask = self.equipment_mask(equipment)
+        for bit, bucket in self._by_equipment.items():
+            if bit & mask:
+                ids |= bucket
+        return ids
+
+    def for_focus(self, focus):
+        """Ids of workouts matching a quick-workout focus area, or None if it has no muscle filter"""
+        return self._focus.get(focus)
+
+    def named(self, names):
+        """Ids of the catalog workouts with any of the given names"""
+        ids = set()
+        for name in names:
+            ids |= self.name_to_ids.get(name, frozenset())
+        return ids
+
+    def select(self, *id_sets, exclude=None):
+        """Intersect id sets (None means unconstrained) and return records in catalog order"""
+        constraints = sorted((s for s in id_sets if s is not None), key=len)
+        if not constraints:
+            ids = set(range(len(self.records)))
+        else:
+            ids = set(constraints[0])
+            for other in constraints[1:]:
+                ids &= other
+        if exclude:
+            ids -= exclude
+        return [self.records[i] for i in sorted(ids)]
+
+
+def _split_mask(mask, by_bit):
+    """Yield (bit, id set) pairs for each bit set in mask"""
+    while mask:
+        bit = mask & -mask
+        yield bit, by_bit.setdefault(bit, set())
+        mask ^= bit
+
+
+def _bit_table(names):
+    """Assign one bit per distinct name, in first-seen order"""
+    bits = {}
+    for name in names:
+        if name not in bits:
+            bits[name] = 1 << len(bits)
+    return bits
+
+
+def compile_workout_catalog(workout_db, quick_db, basic_workouts, equipment_mapping, focus_muscle_groups):
+    """Flatten the workout databases into a WorkoutCatalog"""
+    entries = []
+
+    # Walk in the same order the recommenders used to, so catalog order matches it
+    for focus, durations in quick_db.items():
+        for duration_key, workouts in durations.items():
+            bucket = int(duration_key.split('_')[0])
+            for workout in workouts:
+                entries.append((QUICK_SOURCE, focus, None, focus, bucket, workout))
+
+    for workout_type, levels in workout_db.items():
+        for experience, workouts in levels.items():
+            if isinstance(workouts, dict):
+                for category, category_workouts in workouts.items():
+                    for workout in category_workouts:
+                        entries.append((MAIN_SOURCE, workout_type, experience, category, workout['duration'], workout))
+            else:
+                for workout in workouts:
+                    entries.append((MAIN_SOURCE, workout_type, experience, workout_type, workout['duration'], workout))
+
+    for rec in basic_workouts:
+        workout = rec['workout']
+        entries.append((BASIC_SOURCE, rec.get('type'), None, rec.get('category', BASIC_SOURCE), workout['duration'], workout))
+
+    equipment_names = [eq for entry in entries for eq in entry[5].get('equipment', ['none'])]
+    for equipment, workout_types in equipment_mapping.items():
+        equipment_names.append(equipment)
+        equipment_names.extend(workout_types)
+    equipment_bits = _bit_table(name for name in equipment_names if name != 'none')
+
+    muscle_names = [group for entry in entries for group in entry[5].get('muscle_groups', [])]
+    for groups in focus_muscle_groups.values():
+        muscle_names.extend(groups)
+    muscle_bits = _bit_table(muscle_names)
+
+    records = []
+    for workout_id, (source, workout_type, experience, category, bucket, workout) in enumerate(entries):
+        equipment = workout.get('equipment', ['none'])
+        records.append(CatalogWorkout(
+            id=workout_id,
+            name=workout['name'],
+            source=source,
+            workout_type=workout_type,
+            experience=experience,
+            category=category,
+            bucket=bucket,
+            duration=workout['duration'],
+            calories_burned=workout.get('calories_burned', 0),
+            intensity=workout.get('intensity', 'moderate'),
+            exercise_count=len(workout.get('exercises', [])),
+            equipment_mask=sum(equipment_bits[eq] for eq in set(equipment) if eq != 'none'),
+            needs_no_equipment='none' in equipment,
+            muscle_mask=sum(muscle_bits[group] for group in set(workout.get('muscle_groups', []))),
+            workout=workout
+        ))
+
+    return WorkoutCatalog(records, equipment_bits, muscle_bits, focus_muscle_groups)
@@ -0,0 +1,226 @@
+import numpy as np
+
+# Vectorized versions of fitness_utils.calculate_match_score and
+# calculate_quick_workout_score. Workout features are encoded once from the
+# compiled catalog; scoring a user's candidates is then a few array expressions
+# over those features instead of one branchy Python call per workout.
+
+JITTER_MAX = 5  # Same 0-5 variety bonus the scalar scorers add with random.randint
+
+INTENSITY_LEVELS = ['low', 'low-moderate', 'moderate', 'moderate-high', 'high', 'very_high']
+
+# Experience match points per intensity, for calculate_match_score
+MATCH_EXPERIENCE_POINTS = {
+    'beginner': {'low': 15, 'low-moderate': 15, 'moderate': 10, None: 5},
+    'intermediate': {'moderate': 15, 'moderate-high': 15, 'low-moderate': 10, 'high': 10, None: 5},
+    'advanced': {'high': 15, 'very_high': 15, 'moderate-high': 10, None: 5}
+}
+
+# Experience match points per intensity, for calculate_quick_workout_score
+QUICK_EXPERIENCE_POINTS = {
+    'beginner': {'low': 25, 'low-moderate': 25, 'moderate': 25, 'moderate-high': 15, None: 5},
+    'intermediate': {'moderate': 25, 'moderate-high': 25, 'low-moderate': 20, 'high': 20, None: 10},
+    'advanced': {'high': 25, 'very_high': 25, 'moderate-high': 20, None: 10}
+}
+
+
+def infer_workout_type(workout):
+    """Workout type as the match scorer sees it: explicit 'type', else inferred from its fields"""
+    workout_type = None
+    if hasattr(workout, 'get'):
+        workout_type = workout.get('type')
+
+    if not workout_type:
+        if 'exercises' in workout:
+            workout_type = 'strength'
+        elif 'instructions' in workout:
+            if any(word in workout.get('name', '').lower() for word in ['cardio', 'running', 'bike', 'hiit']):
+                workout_type = 'cardio'
+            else:
+                workout_type = 'flexibility'
+
+    return workout_type
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first, ties kept in original order"""
+    scores = np.asarray(scores)
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.array([], dtype=np.intp)
+    if k < n:
+        # argpartition finds the k-th best value; take everything above it plus
+        # the earliest ties so the result matches a stable descending sort
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        chosen = np.concatenate([above, ties])
+    else:
+        chosen = np.arange(n)
+    return chosen[np.lexsort((chosen, -scores[chosen]))]
+
+
+class WorkoutScorer:
+    """Batch scorer over the features of a compiled WorkoutCatalog"""
+
+    def __init__(self, catalog, seed=None):
+        self.catalog = catalog
+        self.reseed(seed)
+
+        records = catalog.records
+        workouts = [r.workout for r in records]
+        names = [w.get('name', '').lower() for w in workouts]
+        types = [infer_workout_type(w) for w in workouts]
+        intensities = [w.get('intensity', 'moderate') for w in workouts]
+
+        self.duration = np.array([r.duration for r in records])
+        self.calories = np.array([r.calories_burned for r in records])
+        self.exercise_count = np.array([r.exercise_count for r in records])
+        self.equipment_mask = np.array([r.equipment_mask for r in records], dtype=np.int64)
+        self.needs_no_equipment = np.array([r.needs_no_equipment for r in records], dtype=bool)
+        self.lists_none = np.array(['none' in w.get('equipment', []) for w in workouts], dtype=bool)
+        self.heavy_equipment = np.array(
+            [any(eq in ['barbell', 'cable_machine'] for eq in w.get('equipment', ['none'])) for w in workouts],
+            dtype=bool)
+        self.uses_dumbbells = np.array(['dumbbells' in w.get('equipment', ['none']) for w in workouts], dtype=bool)
+
+        self.is_strength = np.array([t == 'strength' for t in types], dtype=bool)
+        self.is_cardio = np.array([t == 'cardio' for t in types], dtype=bool)
+        self.is_flexibility = np.array([t == 'flexibility' for t in types], dtype=bool)
+        self.has_exercises = np.array(['exercises' in w for w in workouts], dtype=bool)
+        self.high_intensity = np.array(['high' in i for i in intensities], dtype=bool)
+
+        self.name_cardio = np.array(['cardio' in n for n in names], dtype=bool)
+        self.name_yoga = np.array(['yoga' in n for n in names], dtype=bool)
+        self.name_running = np.array(['running' in n for n in names], dtype=bool)
+        self.name_cycling = np.array([any(word in n for word in ['bike', 'cycling']) for n in names], dtype=bool)
+
+        self.intensity = np.array(
+            [INTENSITY_LEVELS.index(i) if i in INTENSITY_LEVELS else len(INTENSITY_LEVELS) for i in intensities])
+        self._match_experience = self._experience_tables(MATCH_EXPERIENCE_POINTS)
+        self._quick_experience = self._experience_tables(QUICK_EXPERIENCE_POINTS)
+
+    @staticmethod
+    def _experience_tables(points):
+        """Turn {experience: {intensity: points}} into per-experience lookup arrays by intensity level"""
+        tables = {}
+        for experience, by_intensity in points.items():
+            default = by_intensity[None]
+            tables[experience] = np.array(
+                [by_intensity.get(level, default) for level in INTENSITY_LEVELS] + [default])
+        return tables
+
+    def reseed(self, seed=None):
+        """Reset the jitter generator; a fixed seed makes jitter reproducible"""
+        self._rng = np.random.default_rng(seed)
+
+    def jitter(self, size):
+        """Vector of 0-JITTER_MAX variety points, one per candidate"""
+        return self._rng.integers(0, JITTER_MAX + 1, size=size)
+
+    def _ids(self, ids):
+        if ids is None:
+            return np.arange(len(self.catalog))
+        return np.asarray(ids, dtype=np.intp)
+
+    def match_scores(self, user_profile, available_equipment, ids=None, jitter=None):
+        """calculate_match_score for many catalog workouts at once"""
+        ids = self._ids(ids)
+        if jitter is None:
+            jitter = self.jitter(len(ids))
+
+        # Duration preference (max 30 points)
+        diff = np.abs(self.duration[ids] - user_profile.get('workout_duration', 30))
+        score = np.select(
+            [diff <= 5, diff <= 10, diff <= 15, diff <= 25],
+            [30, 25, 20, 15],
+            np.maximum(0, 10 - diff // 5))
+
+        # Equipment availability (max 25 points, +5 for a perfect match)
+        available_mask = self.catalog.equipment_mask(available_equipment)
+        equipped = self.needs_no_equipment[ids] | ((self.equipment_mask[ids] & available_mask) != 0)
+        if 'gym_full' in available_equipment:
+            bonus = self.heavy_equipment[ids]
+            if 'dumbbells' in available_equipment:
+                bonus = bonus | self.uses_dumbbells[ids]
+        elif 'dumbbells' in available_equipment:
+            bonus = self.uses_dumbbells[ids]
+        else:
+            bonus = np.zeros(len(ids), dtype=bool)
+        score = score + equipped * (25 + 5 * bonus)
+
+        strength_like = self.is_strength[ids] | self.has_exercises[ids]
+        calories = self.calories[ids]
+
+        # Training style alignment
+        training_styles = user_profile.get('training_styles', [])
+        if training_styles:
+            style_points = [
+                ('weightlifting', strength_like, 20),
+                ('bodyweight', self.lists_none[ids], 20),
+                ('cardio', self.is_cardio[ids] | self.name_cardio[ids], 20),
+                ('hiit', self.high_intensity[ids], 15),
+                ('yoga', self.is_flexibility[ids] | self.name_yoga[ids], 20),
+                ('running', self.name_running[ids], 20),
+                ('cycling', self.name_cycling[ids], 20)
+            ]
+            for style, matches, points in style_points:
+                if style in training_styles:
+                    score = score + matches * points
+        else:
+            score = score + 10
+
+        # Fitness goals alignment
+        fitness_goals = user_profile.get('fitness_goals', [])
+        if fitness_goals:
+            goal_points = [
+                ('weight_loss', calories > 150, 15),
+                ('muscle_building', strength_like, 15),
+                ('endurance', self.is_cardio[ids] | (calories > 200), 15),
+                ('flexibility', self.is_flexibility[ids], 15)
+            ]
+            for goal, matches, points in goal_points:
+                if goal in fitness_goals:
+                    score = score + matches * points
+            if 'general_health' in fitness_goals:
+                score = score + 8
+        else:
+            score = score + 5
+
+        # Experience level match (max 15 points)
+        table = self._match_experience.get(user_profile.get('fitness_experience', 'beginner'))
+        if table is not None:
+            score = score + table[self.intensity[ids]]
+
+        return np.minimum(score + jitter, 100)
+
+    def quick_scores(self, user_profile, target_duration, ids=None, jitter=None):
+        """calculate_quick_workout_score for many catalog workouts at once"""
+        ids = self._ids(ids)
+        if jitter is None:
+            jitter = self.jitter(len(ids))
+
+        # Duration match (max 40 points)
+        diff = np.abs(self.duration[ids] - target_duration)
+        score = np.select(
+            [diff == 0, diff <= 2, diff <= 5, diff <= 10],
+            [40, 35, 25, 15],
+            np.maximum(0, 5 - diff // 5))
+
+        # Experience level match (max 25 points)
+        if user_profile:
+            table = self._quick_experience.get(user_profile.get('fitness_experience', 'beginner'))
+            if table is not None:
+                score = score + table[self.intensity[ids]]
+        else:
+            score = score + 15
+
+        # Calorie burn (max 20 points)
+        calories = self.calories[ids]
+        score = score + np.select([calories >= 200, calories >= 150, calories >= 100], [20, 15, 10], 5)
+
+        # Variety bonus (max 10 points)
+        count = self.exercise_count[ids]
+        score = score + np.select([count >= 6, count >= 4, count >= 3], [10, 8, 6], 3)
+
+        return np.minimum(score + jitter, 100)
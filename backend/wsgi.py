@@ -0,0 +1,23 @@
+import gc
+
+from app import app, init_database, warm_caches
+
+# WSGI entry point for production servers:
+#
+#   cd backend && gunicorn -c gunicorn.conf.py
+#
+# gunicorn.conf.py preloads this module in the master process, so the meal
+# pool, food catalog and workout catalog below are built once and shared with
+# every forked worker copy-on-write. Preloading imports this module before the
+# config's on_starting hook runs, so the schema is set up here first (warming
+# queues jobs); both calls are idempotent.
+
+init_database()
+warm_caches()
+
+# Move everything loaded so far out of the collector's view so collections in
+# the workers don't touch (and un-share) these pages
+gc.collect()
+gc.freeze()
+
+application = app